@@ -0,0 +1,59 @@
+"""
+Benchmark of the streaming anomaly detection: readings per second that
+AnomalyDetector.observe analyses on one core, in batches of the
+ingestion size, and time of a watchdog pass over every sensor.
+
+Readings are generated beforehand like the ones of the simulator, so
+only the detector is measured.
+
+Usage:
+> python3 -m benchmarks.bench_anomaly --sensors 1000 10000 100000 --readings 1000000
+"""
+import argparse
+import logging
+import random
+import time
+
+from src.rabbitmq.anomaly import AnomalyDetector
+
+def make_readings(sensors: int, n: int) -> list[dict]:
+    types = ('humidity', 'temperature')
+    start = time.time()
+    return [{'id': i % sensors, 'type': types[i % 2], 'period': 1.0,
+             'value': round(random.uniform(20.0, 100.0), 2),
+             'timestamp': start + i // sensors}
+            for i in range(n)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sensors', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    parser.add_argument('--readings', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f"{'sensors':>8} {'readings/s':>11} {'ns/reading':>11} "
+          f"{'watchdog ms':>12} {'alerts':>7}")
+    for sensors in args.sensors:
+        readings = make_readings(sensors, args.readings)
+        batches = [readings[i:i + args.batch_size]
+                   for i in range(0, len(readings), args.batch_size)]
+        detector = AnomalyDetector(max_rate={'humidity': 1000,
+                                             'temperature': 1000})
+        start = time.perf_counter()
+        for batch in batches:
+            detector.observe(batch)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        detector.check_silent()
+        watchdog = time.perf_counter() - start
+        alerts = sum(detector.get_stats()['raised'].values())
+        print(f"{sensors:>8} {len(readings) / elapsed:>11.0f} "
+              f"{elapsed / len(readings) * 1e9:>11.0f} "
+              f"{watchdog * 1e3:>12.1f} {alerts:>7}")
+
+if __name__ == "__main__":
+    main()
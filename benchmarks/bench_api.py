@@ -0,0 +1,160 @@
+"""
+Load test of the query API: p50/p99 latency and requests/s of a mix of
+range, aggregate, latest and recent queries, with and without the result
+cache, optionally while readings are being ingested.
+
+The API runs with uvicorn in this process over a temporary database
+filled with simulated readings, and client threads send requests with
+httpx over a local socket.
+
+Usage:
+> python3 -m benchmarks.bench_api --sensors 100 --hours 6 --clients 8 --duration 10
+"""
+import argparse
+import logging
+import random
+import socket
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from src.fastapi.app.database import TimeSeriesDatabase
+from src.fastapi.app.main import create_app
+
+def fill_database(db: TimeSeriesDatabase, sensors: int, hours: float,
+                  period: float, end: float):
+    """
+    Writes readings of every sensor for the given hours before end.
+    """
+    start = end - hours * 3600
+    batch = []
+    for tick in range(int(hours * 3600 / period)):
+        for sensor in range(sensors):
+            batch.append({'id': sensor, 'type': 'temperature',
+                          'value': round(random.uniform(15, 30), 2),
+                          'timestamp': start + tick * period})
+        if len(batch) >= 10000:
+            db.write(batch)
+            batch = []
+    db.write(batch)
+    db.flush()
+
+def make_queries(sensors: int, end: float, n_queries: int) -> list[tuple]:
+    """
+    Builds a fixed set of queries, so repeated ones can be cached.
+    """
+    queries = [('/latest', {}), ('/recent', {'seconds': 300})]
+    for _ in range(n_queries):
+        sensor = random.randrange(sensors)
+        kind = random.choice(('readings', 'aggregates'))
+        if kind == 'readings':
+            queries.append(('/readings', {'sensor_id': sensor,
+                                          'start': end - 3600, 'end': end}))
+        else:
+            queries.append(('/aggregates', {'sensor_id': sensor,
+                                            'start': end - 6 * 3600, 'end': end,
+                                            'resolution': 60}))
+    return queries
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def run_scenario(db: TimeSeriesDatabase, cache_ttl: float, queries: list,
+                 clients: int, duration: float, ingest_rate: float,
+                 sensors: int) -> dict:
+    """
+    Serves the database and sends queries from several client threads.
+    """
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(db, cache_ttl=cache_ttl), host='127.0.0.1', port=port,
+        log_level='warning'))
+    server_thread = threading.Thread(target=server.run)
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    url = f'http://127.0.0.1:{port}'
+    latencies = []
+    stop = threading.Event()
+
+    def client():
+        with httpx.Client(base_url=url) as http:
+            local = []
+            while not stop.is_set():
+                path, params = random.choice(queries)
+                start = time.perf_counter()
+                http.get(path, params=params).raise_for_status()
+                local.append(time.perf_counter() - start)
+            latencies.extend(local)
+
+    def ingest():
+        # Readings of one random sensor at the current time, so only the
+        # windows that cover it are invalidated
+        with httpx.Client(base_url=url) as http:
+            while not stop.wait(1 / ingest_rate):
+                http.post('/readings', json=[{
+                    'id': random.randrange(sensors), 'type': 'temperature',
+                    'value': 20.0, 'timestamp': time.time()}])
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    if ingest_rate:
+        threads.append(threading.Thread(target=ingest))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    with httpx.Client(base_url=url) as http:
+        cache = http.get('/stats').json()['cache']
+    server.should_exit = True
+    server_thread.join()
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'rps': len(latencies) / duration,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'hit_ratio': cache['hits'] / max(1, cache['hits'] + cache['misses']),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--hours', type=float, default=6)
+    parser.add_argument('--period', type=float, default=10)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--ingest-rate', type=float, default=0,
+                        help="Ingest requests/s during the test")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    end = time.time()
+    with tempfile.TemporaryDirectory() as path:
+        db = TimeSeriesDatabase(path)
+        fill_database(db, args.sensors, args.hours, args.period, end)
+        queries = make_queries(args.sensors, end, args.queries)
+
+        print(f"{'cache':>6} {'requests':>9} {'req/s':>8} {'p50 ms':>8} "
+              f"{'p99 ms':>8} {'hits':>6}")
+        for name, ttl in (('off', 0), ('on', 60)):
+            r = run_scenario(db, ttl, queries, args.clients, args.duration,
+                             args.ingest_rate, args.sensors)
+            print(f"{name:>6} {r['requests']:>9} {r['rps']:>8.0f} "
+                  f"{r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+                  f"{r['hit_ratio']:>6.0%}")
+        db.close()
+
+if __name__ == "__main__":
+    main()
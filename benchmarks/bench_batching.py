@@ -0,0 +1,113 @@
+"""
+Throughput comparison of per-reading publishing against batched 
+publishing through an MQTT broker.
+
+For each batch size it publishes the same number of readings and waits
+for every acknowledgement (QoS 1), then reports messages/s and readings/s.
+A batch size of 1 is the per-reading mode of SensorSimulator.
+
+Without --broker it runs against the in-process broker of
+src.rabbitmq.mqtt_broker, so no RabbitMQ container is needed.
+
+Usage:
+> python3 -m benchmarks.bench_batching --readings 50000 --batch-sizes 1 10 100
+> python3 -m benchmarks.bench_batching --broker localhost --port 1883
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+
+from src.rabbitmq.mqtt_broker import MQTTBroker
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+from src.sensors.batching import encode_batch
+from src.sensors.sensor_simulator import SensorSimulator
+
+class AckCounterClient(MQTTClientBase):
+    """
+    MQTT client that counts acknowledgements instead of logging them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.acked = 0
+        self.all_acked = threading.Event()
+        self.expected = 0
+
+    def on_publish(self, client, userdata, mid):
+        self.acked += 1
+        if self.acked >= self.expected:
+            self.all_acked.set()
+
+def run_scenario(client: AckCounterClient, readings: list[dict], 
+                 batch_size: int, qos: int, topic: str) -> dict:
+    """
+    Publishes every reading with the given batch size and waits for acks.
+    """
+    n_messages = -(-len(readings) // batch_size)
+    client.acked = 0
+    client.expected = n_messages
+    client.all_acked.clear()
+
+    start = time.monotonic()
+    if batch_size == 1:
+        for reading in readings:
+            client.publish(topic, json.dumps(reading), qos)
+    else:
+        for i in range(0, len(readings), batch_size):
+            client.publish(topic, encode_batch(readings[i:i + batch_size]), qos)
+    if qos > 0:
+        client.all_acked.wait()
+    elapsed = time.monotonic() - start
+    return {
+        'batch_size': batch_size,
+        'messages': n_messages,
+        'messages_per_s': n_messages / elapsed,
+        'readings_per_s': len(readings) / elapsed,
+    }
+
+def run_benchmark(broker: str, port: int, readings: list[dict],
+                  args: argparse.Namespace):
+    """
+    Runs every batch size against a broker and prints their throughput.
+    """
+    client = AckCounterClient(broker, port, 'bench_batching')
+    client.connect()
+    time.sleep(1)
+
+    print(f"{'batch':>6} {'messages':>9} {'messages/s':>11} {'readings/s':>11}")
+    for batch_size in args.batch_sizes:
+        r = run_scenario(client, readings, batch_size, args.qos, args.topic)
+        print(f"{r['batch_size']:>6} {r['messages']:>9} "
+              f"{r['messages_per_s']:>11.0f} {r['readings_per_s']:>11.0f}")
+
+    client.loop_stop()
+    client.disconnect()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--broker', default=None,
+                        help="Broker address. Defaults to an in-process broker")
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--readings', type=int, default=20000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[1, 10, 100, 1000])
+    parser.add_argument('--qos', type=int, default=1)
+    parser.add_argument('--topic', default='simulated_sensors/')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    simulator = SensorSimulator([('temperature', 1)] * 1000)
+    readings = [simulator.generate_sensor_data('temperature', 1, i % 1000)
+                for i in range(args.readings)]
+    if args.broker is None:
+        with MQTTBroker() as broker:
+            run_benchmark(broker.host, broker.port, readings, args)
+    else:
+        run_benchmark(args.broker, args.port, readings, args)
+
+if __name__ == "__main__":
+    main()
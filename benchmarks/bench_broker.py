@@ -0,0 +1,82 @@
+"""
+Benchmark of the publish and consume path end to end through the
+in-process MQTT broker (src.rabbitmq.mqtt_broker), without RabbitMQ.
+
+For each number of sensors and QoS, a SensorSimulator publishes with the
+vectorized scheduler and an MQTTReadingSubscriber consumes every reading
+for a fixed duration. It reports the broker-side rates of messages
+received and delivered, the rate of readings decoded by the consumer and
+the messages dropped, optionally with injected latency and loss.
+
+Usage:
+> python3 -m benchmarks.bench_broker --sensors 100 1000 --period 0.01 --qos 0 1 --duration 5 --latency 0.002 --loss 0.01
+"""
+import argparse
+import itertools
+import logging
+import time
+
+from src.rabbitmq.mqtt_broker import MQTTBroker
+from src.rabbitmq.mqtt_subscriber import MQTTReadingSubscriber
+from src.sensors.sensor_simulator import SensorSimulator
+
+def run_scenario(broker: MQTTBroker, sensors: int, qos: int,
+                 args: argparse.Namespace) -> dict:
+    """
+    Runs one scenario against a started broker and returns its rates.
+    """
+    consumed = []
+    subscriber = MQTTReadingSubscriber(
+        broker.host, lambda readings: consumed.append(len(readings)),
+        qos=qos, port=broker.port, client_id=f"consumer_{sensors}_{qos}")
+    subscriber.connect()
+    subscriber.loop_start()
+    simulator = SensorSimulator(
+        [('temperature', args.period)] * sensors, 'mqtt',
+        f"simulator_{sensors}_{qos}", broker.host, broker.port,
+        scheduler='vectorized', qos=qos, reading_logs='off')
+    while not simulator.client.is_connected():
+        time.sleep(0.01)
+
+    broker.report()
+    stats = broker.get_stats()
+    simulator.run_threads()
+    time.sleep(args.duration)
+    rates = broker.report()
+    simulator.stop_threads()
+    simulator.disconnect()
+    subscriber.disconnect()
+    subscriber.loop_stop()
+    return {
+        'received_per_s': rates['received']['per_second'],
+        'delivered_per_s': rates['delivered']['per_second'],
+        'consumed_per_s': sum(consumed) / args.duration,
+        'dropped': broker.get_stats()['dropped'] - stats['dropped'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sensors', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--period', type=float, default=0.01)
+    parser.add_argument('--qos', type=int, nargs='+', default=[0, 1])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--loss', type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{'sensors':>8} {'qos':>4} {'received/s':>11} {'delivered/s':>12} "
+          f"{'consumed/s':>11} {'dropped':>8}")
+    with MQTTBroker(latency=args.latency, jitter=args.jitter,
+                    loss=args.loss) as broker:
+        for sensors, qos in itertools.product(args.sensors, args.qos):
+            result = run_scenario(broker, sensors, qos, args)
+            print(f"{sensors:>8} {qos:>4} {result['received_per_s']:>11.0f} "
+                  f"{result['delivered_per_s']:>12.0f} "
+                  f"{result['consumed_per_s']:>11.0f} {result['dropped']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark of the payload codecs: wire size and encode/decode time per 
+reading of json against the struct packed binary codec, both for single
+reading messages and for batches.
+
+Usage:
+> python3 -m benchmarks.bench_codecs --readings 100000 --batch-size 100
+"""
+import argparse
+import logging
+import time
+
+from src.sensors.codecs import BinaryCodec, JSONCodec
+from src.sensors.sensor_simulator import SensorSimulator
+
+def measure(codec, readings: list[dict], batch_size: int) -> dict:
+    """
+    Encodes and decodes every reading and returns size and timings.
+    """
+    if batch_size == 1:
+        groups = [[reading] for reading in readings]
+        encode = lambda group: codec.encode_reading(group[0])
+    else:
+        groups = [readings[i:i + batch_size]
+                  for i in range(0, len(readings), batch_size)]
+        encode = codec.encode_batch
+
+    start = time.perf_counter_ns()
+    payloads = [encode(group) for group in groups]
+    encode_ns = time.perf_counter_ns() - start
+
+    start = time.perf_counter_ns()
+    for payload in payloads:
+        codec.decode(payload)
+    decode_ns = time.perf_counter_ns() - start
+
+    size = sum(len(payload) for payload in payloads)
+    return {
+        'bytes_per_reading': size / len(readings),
+        'encode_ns_per_reading': encode_ns / len(readings),
+        'decode_ns_per_reading': decode_ns / len(readings),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--readings', type=int, default=100000)
+    parser.add_argument('--sensors', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    simulator = SensorSimulator([('temperature', 1)] * args.sensors)
+    readings = [simulator.generate_sensor_data('temperature', 1, 
+                                               i % args.sensors)
+                for i in range(args.readings)]
+
+    codecs = [
+        ('json', JSONCodec()),
+        ('binary', BinaryCodec()),
+        ('binary+ids', BinaryCodec(sensor_ids=list(range(args.sensors)))),
+    ]
+    print(f"{'codec':>11} {'batch':>6} {'bytes/rd':>9} "
+          f"{'enc ns/rd':>10} {'dec ns/rd':>10}")
+    for batch_size in (1, args.batch_size):
+        for name, codec in codecs:
+            r = measure(codec, readings, batch_size)
+            print(f"{name:>11} {batch_size:>6} {r['bytes_per_reading']:>9.1f} "
+                  f"{r['encode_ns_per_reading']:>10.0f} "
+                  f"{r['decode_ns_per_reading']:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Maximum number of concurrent WebSocket subscribers of the live readings
+at a fixed update rate.
+
+The API runs with uvicorn in this process over a temporary database.
+Readings of every sensor are written at a fixed rate and pushed to an
+increasing number of WebSocket clients, each subscribed to every sensor,
+until the p99 delivery lag exceeds the limit. Clients are asyncio tasks
+over local sockets, so the benchmark measures the server and the clients
+on the same host.
+
+Usage:
+> python3 -m benchmarks.bench_fanout --sensors 100 --rate 10 --subscribers 100 500 1000 2000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import socket
+import tempfile
+import threading
+import time
+
+import uvicorn
+import websockets
+
+from src.fastapi.app.database import TimeSeriesDatabase
+from src.fastapi.app.main import create_app
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+async def subscriber(url: str, lags: list, received: list, ready: asyncio.Event,
+                     stop: asyncio.Event, n_ready: list, total: int):
+    """
+    Receives batches until stop is set, recording the lag of each reading
+    from its timestamp.
+    """
+    async with websockets.connect(url, max_queue=None) as websocket:
+        n_ready[0] += 1
+        if n_ready[0] == total:
+            ready.set()
+        count = 0
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(websocket.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            now = time.time()
+            batch = json.loads(message)
+            count += len(batch)
+            lags.extend(now - r['timestamp'] for r in batch[::10])
+        received.append(count)
+
+def ingest(db: TimeSeriesDatabase, sensors: int, rate: float,
+           stop: threading.Event):
+    """
+    Writes one reading of every sensor rate times per second.
+    """
+    while not stop.wait(1 / rate):
+        now = time.time()
+        db.write([{'id': sensor, 'type': 'temperature', 'value': 20.0,
+                   'timestamp': now} for sensor in range(sensors)])
+
+async def run_clients(url: str, n: int, duration: float) -> tuple[list, list]:
+    lags, received, n_ready = [], [], [0]
+    ready, stop = asyncio.Event(), asyncio.Event()
+    tasks = [asyncio.create_task(
+        subscriber(url, lags, received, ready, stop, n_ready, n))
+        for _ in range(n)]
+    await asyncio.wait_for(ready.wait(), 60)
+    lags.clear()
+    await asyncio.sleep(duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return lags, received
+
+def run_scenario(path: str, sensors: int, rate: float, subscribers: int,
+                 duration: float) -> dict:
+    """
+    Serves a fresh database and measures the delivery to the subscribers.
+    """
+    db = TimeSeriesDatabase(path, max_head_points=10_000_000)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(db, index_window=0), host='127.0.0.1', port=port,
+        log_level='warning', ws_max_queue=1024))
+    server_thread = threading.Thread(target=server.run)
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    stop = threading.Event()
+    ingest_thread = threading.Thread(target=ingest,
+                                     args=(db, sensors, rate, stop))
+    ingest_thread.start()
+    lags, received = asyncio.run(run_clients(
+        f'ws://127.0.0.1:{port}/ws', subscribers, duration))
+    stop.set()
+    ingest_thread.join()
+    fanout = server.config.app.state.fanout.get_stats()
+    server.should_exit = True
+    server_thread.join()
+    db.close()
+
+    lags.sort()
+    expected = sensors * rate * duration
+    return {
+        'delivered': sum(received) / max(1, len(received)) / expected,
+        'p50_ms': lags[len(lags) // 2] * 1000 if lags else float('nan'),
+        'p99_ms': lags[int(len(lags) * 0.99)] * 1000 if lags else float('nan'),
+        'conflated': fanout['conflated'],
+        'dropped': fanout['dropped'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sensors', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=10,
+                        help="Readings per second of each sensor")
+    parser.add_argument('--subscribers', type=int, nargs='+',
+                        default=[100, 250, 500, 1000, 2000])
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--max-lag', type=float, default=250,
+                        help="p99 lag in ms above which the test stops")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    print(f"{'subscribers':>11} {'delivered':>10} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'conflated':>10} {'dropped':>8}")
+    for n in args.subscribers:
+        with tempfile.TemporaryDirectory() as path:
+            r = run_scenario(path, args.sensors, args.rate, n, args.duration)
+        print(f"{n:>11} {r['delivered']:>10.0%} {r['p50_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['conflated']:>10} {r['dropped']:>8}")
+        if not r['p99_ms'] <= args.max_lag:
+            print(f"Maximum subscribers with p99 lag under {args.max_lag} ms: "
+                  f"below {n}")
+            break
+
+if __name__ == "__main__":
+    main()
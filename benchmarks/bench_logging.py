@@ -0,0 +1,80 @@
+"""
+Benchmark of the logging cost per reading of the simulator in each
+reading logs mode, writing the logs to a file directly or through a
+QueueHandler, with several sensor threads logging at once.
+
+Readings are generated and logged as in the 'log' mode, without a
+broker, so the time per reading is the generation plus its logging.
+
+Usage:
+> python3 -m benchmarks.bench_logging --readings 20000 --threads 4
+"""
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from src.sensors.logs import start_queue_logging, stop_queue_logging
+from src.sensors.sensor_simulator import SensorSimulator
+
+def measure(simulator: SensorSimulator, readings: int, threads: int
+            ) -> tuple[float, float]:
+    """
+    Logs readings from several threads and returns the wall time per
+    reading and the p99 time of a single reading, in microseconds.
+    """
+    latencies = []
+
+    def run(first_id: int):
+        local = []
+        for i in range(readings):
+            start = time.perf_counter()
+            simulator.log_sensor_reading('temperature', 1, first_id + i % 100)
+            local.append(time.perf_counter() - start)
+        latencies.extend(local)
+
+    workers = [threading.Thread(target=run, args=(index * 100,))
+               for index in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return (elapsed / len(latencies) * 1e6,
+            latencies[int(len(latencies) * 0.99)] * 1e6)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--readings', type=int, default=20000,
+                        help="Readings per thread")
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    root = logging.getLogger()
+    with tempfile.TemporaryDirectory() as path:
+        handler = logging.FileHandler(os.path.join(path, 'bench.log'))
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s %(threadName)s %(message)s'))
+        root.handlers = [handler]
+        root.setLevel(logging.INFO)
+        simulator = SensorSimulator([('temperature', 1)])
+
+        print(f"{'reading logs':>12} {'handler':>8} {'us/reading':>11} "
+              f"{'p99 us':>8}")
+        for mode in SensorSimulator.reading_log_modes:
+            for queued in (False, True):
+                simulator.reading_logs = mode
+                listener = start_queue_logging() if queued else None
+                us, p99 = measure(simulator, args.readings, args.threads)
+                if listener is not None:
+                    stop_queue_logging(listener)
+                print(f"{mode:>12} {'queue' if queued else 'file':>8} "
+                      f"{us:>11.2f} {p99:>8.1f}")
+        handler.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark of the metrics overhead: cost of a counter increment and of a
+latency histogram record, and the extra time per publish and ack of an
+MQTTClientBase with metrics against one without, checked against a
+budget.
+
+paho is replaced by a stub that accepts every message, and each publish
+is acknowledged right away, so only the client code is measured.
+
+Usage:
+> python3 -m benchmarks.bench_metrics --messages 200000 --budget-ns 1000
+"""
+import argparse
+import logging
+import time
+from types import SimpleNamespace
+
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+from src.sensors.metrics import MetricsRegistry
+
+def per_call_ns(function, n: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(n):
+        function()
+    return (time.perf_counter_ns() - start) / n
+
+def publish_ns(client: MQTTClientBase, messages: int) -> float:
+    """
+    Publishes and acknowledges messages and returns the time per message.
+    """
+    mids = iter(range(1, messages + 1))
+    client.client.publish = lambda topic, payload, qos, retain: \
+        SimpleNamespace(rc=0, mid=next(mids))
+    start = time.perf_counter_ns()
+    for mid in range(1, messages + 1):
+        client.publish('sensors/temperature/1', b'payload', 1)
+        client._handle_publish(None, None, mid)
+    return (time.perf_counter_ns() - start) / messages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--budget-ns', type=float, default=1000,
+                        help="Maximum metrics overhead per publish")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    registry = MetricsRegistry()
+    counter = registry.counter('bench_total')
+    histogram = registry.histogram('bench_seconds')
+    print(f"counter inc:      {per_call_ns(counter.inc, args.messages):8.0f} ns")
+    print(f"histogram record: "
+          f"{per_call_ns(lambda: histogram.record_ns(1230000), args.messages):8.0f} ns")
+
+    # Best of several interleaved runs, to leave out scheduling noise
+    plain = MQTTClientBase('localhost', client_id='plain',
+                           max_inflight=args.messages)
+    instrumented = MQTTClientBase('localhost', client_id='instrumented',
+                                  max_inflight=args.messages, metrics=registry)
+    without = with_metrics = float('inf')
+    for _ in range(args.repeat):
+        without = min(without, publish_ns(plain, args.messages))
+        with_metrics = min(with_metrics,
+                           publish_ns(instrumented, args.messages))
+    overhead = with_metrics - without
+    print(f"publish + ack without metrics: {without:8.0f} ns")
+    print(f"publish + ack with metrics:    {with_metrics:8.0f} ns")
+    print(f"metrics overhead:              {overhead:8.0f} ns "
+          f"({'within' if overhead <= args.budget_ns else 'over'} the "
+          f"{args.budget_ns:.0f} ns budget)")
+
+if __name__ == "__main__":
+    main()
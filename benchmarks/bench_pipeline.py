@@ -0,0 +1,239 @@
+"""
+Benchmark suite of the SensorSimulator publish pipeline, with a results
+file and a comparison against a stored baseline.
+
+Every combination of the given sensor counts, periods, QoS levels,
+payload codecs and batch sizes is a scenario. Each scenario runs a
+SensorSimulator in mqtt mode for a fixed duration against a broker
+stand-in served from a thread of this process, which acknowledges the
+messages and decodes them to measure the latency from the timestamp of
+each reading to its arrival. The throughput, the CPU time and peak RSS
+of the process (simulator and stand-in), the latency percentiles, and
+the missed ticks and dropped messages of each scenario are written to a
+JSON results file.
+
+With --baseline, the results are compared against a previous results
+file, and the benchmark exits with status 1 if a metric of a scenario
+regressed by more than the tolerance, so it can gate a deploy.
+
+Usage:
+> python3 -m benchmarks.bench_pipeline --sensors 10 100 --periods 0.1 --qos 0 1 --codecs json binary --batch-sizes 0 50 --output results.json
+
+> python3 -m benchmarks.bench_pipeline --sensors 10 100 --periods 0.1 --baseline results.json --tolerance 0.15
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import time
+
+from src.rabbitmq.mqtt_broker import MQTTBroker
+from src.sensors.codecs import decode_payload
+from src.sensors.metrics import LatencyHistogram
+from src.sensors.sensor_simulator import SensorSimulator
+
+class StandInBroker(MQTTBroker):
+    """
+    MQTT broker of the benchmarks, served by an asyncio loop in a
+    background thread, that decodes every payload it receives to count
+    readings and their latency.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(host, port)
+        self.reset()
+
+    def reset(self):
+        """
+        Resets the counters, called at the start of each scenario.
+        """
+        self.messages = 0
+        self.readings = 0
+        self.reading_latency = LatencyHistogram()
+
+    def on_message(self, session, topic: str, payload: bytes, qos: int):
+        now = time.time()
+        readings = decode_payload(payload)
+        self.messages += 1
+        self.readings += len(readings)
+        for reading in readings:
+            self.reading_latency.record(now - reading['timestamp'])
+
+def rss_mb() -> float:
+    """
+    Current resident set size of the process in MB, from /proc on Linux
+    and the peak one elsewhere.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        scale = 2**20 if sys.platform == "darwin" else 2**10
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+def run_scenario(broker: StandInBroker, params: dict, duration: float,
+                 drain_timeout: float = 10.0) -> dict:
+    """
+    Runs a simulator with the parameters of a scenario against the broker
+    stand-in for duration seconds and waits for its messages to arrive.
+    """
+    sensors = [(sensor_type, params['period'])
+               for sensor_type in SensorSimulator.sensor_types
+               for _ in range(params['sensors'] // 2)]
+    simulator = SensorSimulator(
+        sensors, 'mqtt', f"bench_{params['name']}", broker.host, broker.port,
+        scheduler='heap', codec=params['codec'],
+        batch_size=params['batch_size'], reading_logs='off', qos=params['qos'])
+    deadline = time.monotonic() + 10
+    while not simulator.client.is_connected():
+        if time.monotonic() > deadline:
+            raise ConnectionError("Simulator could not connect to the stand-in.")
+        time.sleep(0.01)
+
+    broker.reset()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.monotonic()
+    peak_rss = rss_mb()
+    simulator.run_threads()
+    while time.monotonic() - start < duration:
+        time.sleep(0.1)
+        peak_rss = max(peak_rss, rss_mb())
+    simulator.stop_threads()
+    deadline = time.monotonic() + drain_timeout
+    while time.monotonic() < deadline:
+        stats = simulator.get_publish_stats()
+        if stats['inflight'] == 0 and stats['queue_depth'] == 0:
+            break
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = (end_usage.ru_utime - usage.ru_utime) + \
+        (end_usage.ru_stime - usage.ru_stime)
+    simulator.disconnect()
+    simulator.loop_stop()
+
+    latency = broker.reading_latency.get()
+    stats = simulator.get_publish_stats()
+    return {
+        'readings_per_s': broker.readings / elapsed,
+        'messages_per_s': broker.messages / elapsed,
+        'cpu_percent': cpu / elapsed * 100,
+        'cpu_us_per_reading': cpu / max(broker.readings, 1) * 1e6,
+        'peak_rss_mb': peak_rss,
+        'p50_ms': latency['p50_ms'],
+        'p99_ms': latency['p99_ms'],
+        'p999_ms': latency['p999_ms'],
+        'missed_ticks': sum(s['missed'] for s in
+                            simulator.get_sensor_stats().values()),
+        'dropped': stats['dropped'],
+    }
+
+def scenarios(args: argparse.Namespace) -> list[dict]:
+    """
+    Returns every combination of the scenario parameters.
+    """
+    return [{'name': f"s{sensors}_p{period:g}_q{qos}_{codec}_b{batch_size}",
+             'sensors': sensors, 'period': period, 'qos': qos,
+             'codec': codec, 'batch_size': batch_size}
+            for sensors, period, qos, codec, batch_size in itertools.product(
+                args.sensors, args.periods, args.qos, args.codecs,
+                args.batch_sizes)]
+
+# Metrics compared with the baseline, True if higher is better
+COMPARED = {
+    'readings_per_s': True,
+    'cpu_us_per_reading': False,
+    'peak_rss_mb': False,
+    'p50_ms': False,
+    'p99_ms': False,
+}
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compares the scenarios of a results file with the ones of the same
+    name in a baseline.
+
+    Returns:
+        Description of every metric worse than the baseline by more than
+        tolerance (a fraction)
+    """
+    previous = {s['name']: s['results'] for s in baseline['scenarios']}
+    regressions = []
+    for scenario in results['scenarios']:
+        before = previous.get(scenario['name'])
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before[metric], scenario['results'][metric]
+            if old <= 0:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{scenario['name']} {metric}: "
+                                   f"{old:.3g} -> {new:.3g} ({change:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sensors', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--periods', type=float, nargs='+', default=[0.1])
+    parser.add_argument('--qos', type=int, nargs='+', default=[1],
+                        choices=[0, 1])
+    parser.add_argument('--codecs', nargs='+', default=['json'],
+                        choices=['json', 'binary'])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[0])
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help="Seconds each scenario runs")
+    parser.add_argument('--output', default='bench_pipeline.json',
+                        help="Results file")
+    parser.add_argument('--baseline', default=None,
+                        help="Results file the results are compared against")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="Allowed relative regression of each metric")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    broker = StandInBroker()
+    broker.start()
+    results = {
+        'meta': {
+            'time': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'duration': args.duration,
+        },
+        'scenarios': [],
+    }
+    print(f"{'scenario':>28} {'readings/s':>11} {'cpu %':>6} {'us/read':>8} "
+          f"{'rss MB':>7} {'p50 ms':>7} {'p99 ms':>7} {'missed':>7}")
+    try:
+        for params in scenarios(args):
+            r = run_scenario(broker, params, args.duration)
+            results['scenarios'].append(dict(params, results=r))
+            print(f"{params['name']:>28} {r['readings_per_s']:>11.0f} "
+                  f"{r['cpu_percent']:>6.1f} {r['cpu_us_per_reading']:>8.1f} "
+                  f"{r['peak_rss_mb']:>7.1f} {r['p50_ms']:>7.2f} "
+                  f"{r['p99_ms']:>7.2f} {r['missed_ticks']:>7}")
+    finally:
+        broker.stop()
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression over {args.tolerance:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Throughput of a PublisherPool for different pool sizes through an MQTT
+broker.
+
+Several publisher threads send readings keyed by sensor id and the
+benchmark waits until every message is acknowledged (QoS 1), then
+reports the aggregate acknowledged messages/s.
+
+Without --broker it runs against the in-process broker of
+src.rabbitmq.mqtt_broker, so no RabbitMQ container is needed.
+
+Usage:
+> python3 -m benchmarks.bench_pool --messages 50000 --pool-sizes 1 2 4 8
+> python3 -m benchmarks.bench_pool --broker localhost --port 1883
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+
+from src.rabbitmq.mqtt_broker import MQTTBroker
+from src.rabbitmq.publisher_pool import PublisherPool
+
+def run_scenario(broker: str, port: int, size: int, messages: int,
+                 threads: int, qos: int, topic: str) -> dict:
+    """
+    Publishes the given number of messages through a pool and waits for
+    their acknowledgements.
+    """
+    pool = PublisherPool(broker, port, f"bench_pool_{size}", size,
+                         max_inflight=100, max_queued=messages,
+                         queue_policy='block', block_timeout=None)
+    pool.connect()
+    if not pool.wait_connected(10):
+        raise ConnectionError(f"Pool could not connect to {broker}:{port}")
+
+    def publisher(first: int):
+        for id in range(first, messages, threads):
+            payload = json.dumps({"id": id, "value": 42.0})
+            pool.publish(topic, payload, qos, key=id % 10000)
+
+    start = time.monotonic()
+    workers = [threading.Thread(target=publisher, args=(i,))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    while sum(s['acked'] for s in pool.get_stats()) < messages:
+        time.sleep(0.01)
+    elapsed = time.monotonic() - start
+    pool.disconnect()
+    return {'size': size, 'messages_per_s': messages / elapsed}
+
+def run_benchmark(broker: str, port: int, args: argparse.Namespace):
+    """
+    Runs every pool size against a broker and prints their throughput.
+    """
+    print(f"{'pool':>5} {'messages/s':>11}")
+    for size in args.pool_sizes:
+        r = run_scenario(broker, port, size, args.messages,
+                         args.threads, args.qos, args.topic)
+        print(f"{r['size']:>5} {r['messages_per_s']:>11.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--broker', default=None,
+                        help="Broker address. Defaults to an in-process broker")
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--pool-sizes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--qos', type=int, default=1)
+    parser.add_argument('--topic', default='simulated_sensors/')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.broker is None:
+        with MQTTBroker() as broker:
+            run_benchmark(broker.host, broker.port, args)
+    else:
+        run_benchmark(args.broker, args.port, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of the sensor registry: memory per sensor and time to build the
+sensors of a simulator, as the former list of dicts and as a
+SensorRegistry, from a list of tuples and from a sensors file, and
+memory per sensor of a started simulator with the heap and vectorized
+schedulers, once every sensor has ticked.
+
+Memory is the one allocated while building (or building, starting and
+running the simulator), measured with tracemalloc, without the input
+list of tuples.
+
+Usage:
+> python3 -m benchmarks.bench_registry --sensors 10000 100000 1000000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+import tracemalloc
+
+from src.sensors.registry import SensorRegistry
+from src.sensors.sensor_simulator import SensorSimulator
+
+def build_dicts(sensors: list[tuple[str, float]]) -> list[dict]:
+    return [{'id': i, 'type': sensor_type, 'period': period}
+            for i, (sensor_type, period) in enumerate(sensors)]
+
+def build_registry(sensors: list[tuple[str, float]]) -> SensorRegistry:
+    registry = SensorRegistry()
+    registry.extend(sensors)
+    return registry
+
+def load_registry(path: str) -> SensorRegistry:
+    registry = SensorRegistry()
+    registry.load(path)
+    return registry
+
+def start_simulator(sensors: list[tuple[str, float]], scheduler: str
+                    ) -> SensorSimulator:
+    """
+    Builds and starts a simulator in log mode, without reading logs, and
+    waits until every sensor has ticked once before stopping it.
+    """
+    simulator = SensorSimulator(sensors, scheduler=scheduler,
+                                reading_logs='off')
+    simulator.run_threads()
+    while simulator.readings_total < len(sensors):
+        time.sleep(0.05)
+    simulator.stop_threads()
+    return simulator
+
+def start_heap(sensors: list[tuple[str, float]]) -> SensorSimulator:
+    return start_simulator(sensors, 'heap')
+
+def start_vectorized(sensors: list[tuple[str, float]]) -> SensorSimulator:
+    return start_simulator(sensors, 'vectorized')
+
+def measure(build, arg) -> tuple[float, int]:
+    """
+    Returns the seconds and the bytes allocated to build the sensors.
+    """
+    start = time.perf_counter()
+    result = build(arg)
+    elapsed = time.perf_counter() - start
+    del result
+    tracemalloc.start()
+    result = build(arg)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, allocated
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sensors', type=int, nargs='+',
+                        default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    print(f"{'sensors':>8} {'storage':>18} {'bytes/sensor':>13} "
+          f"{'startup ms':>11} {'us/sensor':>10}")
+    for n in args.sensors:
+        sensors = [(('humidity', 'temperature')[i % 2], 1.0 + i % 10)
+                   for i in range(n)]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv',
+                                         delete=False) as f:
+            f.writelines(f"{t},{p}\n" for t, p in sensors)
+        try:
+            for name, build, arg in (('dicts', build_dicts, sensors),
+                                     ('registry', build_registry, sensors),
+                                     ('registry file', load_registry, f.name),
+                                     ('heap started', start_heap, sensors),
+                                     ('vectorized started', start_vectorized,
+                                      sensors)):
+                elapsed, allocated = measure(build, arg)
+                print(f"{n:>8} {name:>18} {allocated / n:>13.1f} "
+                      f"{elapsed * 1e3:>11.1f} {elapsed / n * 1e6:>10.2f}")
+        finally:
+            os.remove(f.name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Read throughput of capture files and memory used while replaying them.
+
+A capture file of the given number of readings is written to a temporary
+directory and read back through its memory map, as the 'replay' mode of
+SensorSimulator does, reporting readings/s and the RSS of the process
+before and after, which stays flat since the file is never loaded.
+
+Usage:
+> python3 -m benchmarks.bench_replay --readings 10000000
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from src.sensors.capture import CaptureReader, CaptureWriter
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--readings', type=int, default=2000000)
+    parser.add_argument('--chunk', type=int, default=10000,
+                        help="Readings written per write call")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as path:
+        path = os.path.join(path, 'bench.cap')
+        start = time.perf_counter()
+        with CaptureWriter(path) as writer:
+            for first in range(0, args.readings, args.chunk):
+                writer.write([
+                    {'id': i % 1000, 'type': 'temperature', 'period': 1.0,
+                     'value': 42.0, 'timestamp': 1700000000.0 + i / 1000}
+                    for i in range(first, min(first + args.chunk, args.readings))])
+        write_s = time.perf_counter() - start
+        size_mb = os.path.getsize(path) / 2**20
+
+        before = rss_mb()
+        start = time.perf_counter()
+        with CaptureReader(path) as reader:
+            count = sum(1 for _ in reader)
+        read_s = time.perf_counter() - start
+        after = rss_mb()
+
+    print(f"{'file MB':>8} {'write/s':>10} {'read/s':>10} "
+          f"{'rss before MB':>14} {'rss after MB':>13}")
+    print(f"{size_mb:>8.1f} {args.readings / write_s:>10.0f} "
+          f"{count / read_s:>10.0f} {before:>14.1f} {after:>13.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark of the sensor schedulers: one thread per sensor ('threads')
+against a single heap driven loop ('heap') and a single loop that 
+generates the readings of all due sensors at once ('vectorized').
+
+For each scheduler it reports the readings per second, the CPU time 
+spent per reading, the derived number of sensors a single core can drive
+and the scheduling jitter (deviation of each interval from the period).
+
+Usage:
+> python3 -m benchmarks.bench_scheduler --sensors 1000 5000 --duration 5
+"""
+import argparse
+import logging
+import time
+
+from src.sensors.sensor_simulator import SensorSimulator
+
+class BenchSensorSimulator(SensorSimulator):
+    """
+    Sensor simulator that records the emission time of each reading
+    instead of logging it, so only scheduling and generation are measured.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.last_seen = {}
+        self.intervals = []
+
+    def _log_reading(self, data: dict):
+        now = time.monotonic()
+        last = self.last_seen.get(data['id'])
+        if last is not None:
+            self.intervals.append(now - last - data['period'])
+        self.last_seen[data['id']] = now
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Returns the q-th percentile (0-100) of a list of values.
+    """
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+def run_scenario(scheduler: str, n_sensors: int, period: float,
+                 duration: float) -> dict:
+    """
+    Runs one simulator with the given scheduler and returns its stats.
+    """
+    sensors = [('temperature', period)] * n_sensors
+    simulator = BenchSensorSimulator(sensors, 'log', scheduler=scheduler)
+
+    cpu_start, wall_start = time.process_time(), time.monotonic()
+    simulator.run_threads()
+    time.sleep(duration)
+    simulator.stop_threads()
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+
+    readings = len(simulator.intervals) + len(simulator.last_seen)
+    jitter = [abs(x) * 1e3 for x in simulator.intervals]
+    cpu_per_reading = cpu / readings if readings else 0.0
+    # Sensors that one fully busy core could drive at the given period
+    sensors_per_core = period / cpu_per_reading if cpu_per_reading else 0.0
+    return {
+        'scheduler': scheduler,
+        'sensors': n_sensors,
+        'readings_per_s': readings / wall,
+        'cpu_us_per_reading': cpu_per_reading * 1e6,
+        'sensors_per_core': sensors_per_core,
+        'jitter_p50_ms': percentile(jitter, 50),
+        'jitter_p99_ms': percentile(jitter, 99),
+        'jitter_max_ms': max(jitter, default=0.0),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sensors', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--period', type=float, default=1.0)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--schedulers', nargs='+', 
+                        default=list(SensorSimulator.schedulers))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    header = (f"{'scheduler':>10} {'sensors':>8} {'readings/s':>11} "
+              f"{'cpu us/rd':>10} {'sensors/core':>13} {'jit p50 ms':>11} "
+              f"{'jit p99 ms':>11} {'jit max ms':>11}")
+    print(header)
+    for n_sensors in args.sensors:
+        for scheduler in args.schedulers:
+            r = run_scenario(scheduler, n_sensors, args.period, args.duration)
+            print(f"{r['scheduler']:>10} {r['sensors']:>8} "
+                  f"{r['readings_per_s']:>11.0f} "
+                  f"{r['cpu_us_per_reading']:>10.1f} "
+                  f"{r['sensors_per_core']:>13.0f} "
+                  f"{r['jitter_p50_ms']:>11.2f} {r['jitter_p99_ms']:>11.2f} "
+                  f"{r['jitter_max_ms']:>11.2f}")
+
+if __name__ == "__main__":
+    main()
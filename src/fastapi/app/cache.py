@@ -0,0 +1,137 @@
+import collections
+import math
+import threading
+import time
+from typing import Callable, Hashable
+
+class QueryCache:
+    """
+    LRU cache of query results with a time to live. Each result is
+    stored with the time window it covers, and ingesting readings into a
+    window invalidates the results that cover it.
+
+    A result computed while readings were ingested into its window is not
+    stored, so a query racing with an ingest cannot cache stale data.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 10.0,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_entries: Maximum number of results, the least recently
+                used is evicted first (default: 1024)
+            ttl: Seconds a result is valid, 0 disables the cache
+                (default: 10)
+            clock: Monotonic clock, in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._version = 0
+        # Recent invalidations as (version, start, end)
+        self._invalidations = collections.deque(maxlen=256)
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def normalize(name: str, **params) -> tuple:
+        """
+        Builds the key of a query, independent of the order of its
+        parameters and of the type of its numbers (1 and 1.0 are the same).
+
+        Args:
+            name: Name of the query
+            params: Parameters of the query
+        """
+        return (name,) + tuple(sorted(
+            (key, float(value) if isinstance(value, int) and
+             not isinstance(value, bool) else value)
+            for key, value in params.items()))
+
+    @property
+    def version(self) -> int:
+        """
+        Version of the cache, incremented by each invalidation. Take it
+        before computing a result and pass it to put().
+        """
+        return self._version
+
+    def get(self, key: Hashable):
+        """
+        Returns the cached result of a query, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def put(self, key: Hashable, value, start: float = None,
+            end: float = None, version: int = None):
+        """
+        Stores the result of a query.
+
+        Args:
+            key: Normalized query
+            value: Result
+            start (optional): Start of the window of the result
+            end (optional): End of the window of the result, exclusive
+            version (optional): Version of the cache when the result
+                started being computed. The result is not stored if its
+                window was invalidated since then
+        """
+        if self.ttl <= 0:
+            return
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        with self._lock:
+            if version is not None and version != self._version:
+                if len(self._invalidations) == self._invalidations.maxlen and \
+                        self._invalidations[0][0] > version + 1:
+                    return
+                if any(v > version and lo < end and hi >= start
+                       for v, lo, hi in self._invalidations):
+                    return
+            self._entries[key] = (self.clock() + self.ttl, start, end, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, start: float, end: float):
+        """
+        Invalidates the results whose window overlaps readings ingested
+        between start and end, both inclusive.
+        """
+        with self._lock:
+            self._version += 1
+            self._invalidations.append((self._version, start, end))
+            stale = [key for key, (_, lo, hi, _) in self._entries.items()
+                     if lo <= end and hi > start]
+            for key in stale:
+                del self._entries[key]
+            self.invalidated += len(stale)
+
+    def on_write(self, rows: list[tuple]):
+        """
+        Listener of TimeSeriesDatabase writes, invalidates the window of
+        the ingested (sensor_id, sensor_type, timestamp, value) rows.
+        """
+        timestamps = [row[2] for row in rows]
+        self.invalidate(min(timestamps), max(timestamps))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "invalidated": self.invalidated}
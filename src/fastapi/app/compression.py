@@ -0,0 +1,216 @@
+import struct
+
+class BitWriter:
+    """
+    Appends values of any number of bits to a byte buffer.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self._accumulator = 0
+        self._n_bits = 0
+
+    def write(self, value: int, n_bits: int):
+        """
+        Writes the n_bits least significant bits of a non negative value.
+        """
+        self._accumulator = (self._accumulator << n_bits) | \
+            (value & ((1 << n_bits) - 1))
+        self._n_bits += n_bits
+        while self._n_bits >= 8:
+            self._n_bits -= 8
+            self.buffer.append((self._accumulator >> self._n_bits) & 0xFF)
+        self._accumulator &= (1 << self._n_bits) - 1
+
+    def getvalue(self) -> bytes:
+        """
+        Returns the buffer, padding the last byte with zeros.
+        """
+        if self._n_bits:
+            return bytes(self.buffer) + bytes(
+                [(self._accumulator << (8 - self._n_bits)) & 0xFF])
+        return bytes(self.buffer)
+
+class BitReader:
+    """
+    Reads values of any number of bits from a byte buffer.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+
+    def read(self, n_bits: int) -> int:
+        start = self.position >> 3
+        end = (self.position + n_bits + 7) >> 3
+        window = int.from_bytes(self.data[start:end], 'big')
+        shift = end * 8 - self.position - n_bits
+        self.position += n_bits
+        return (window >> shift) & ((1 << n_bits) - 1)
+
+    def read_bit(self) -> int:
+        byte = self.data[self.position >> 3]
+        bit = (byte >> (7 - (self.position & 7))) & 1
+        self.position += 1
+        return bit
+
+def _zigzag(value: int) -> int:
+    return (value << 1) if value >= 0 else ((-value) << 1) - 1
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1)
+
+# Delta-of-delta buckets: (prefix, prefix bits, value bits). Timestamps are
+# microseconds, so buckets are wider than in the original Gorilla paper.
+_DOD_BUCKETS = (
+    (0b10, 2, 8),
+    (0b110, 3, 16),
+    (0b1110, 4, 24),
+    (0b11110, 5, 32),
+)
+
+def encode_timestamps(timestamps: list[float]) -> bytes:
+    """
+    Compresses timestamps with delta-of-delta encoding. Timestamps are
+    stored with microsecond precision. Regular series, where every delta
+    equals the previous one, take a single bit per timestamp.
+
+    Args:
+        timestamps: Epoch timestamps in seconds
+
+    Returns:
+        Compressed block
+    """
+    writer = BitWriter()
+    previous = previous_delta = 0
+    for i, timestamp in enumerate(timestamps):
+        value = round(timestamp * 1e6)
+        if i == 0:
+            writer.write(_zigzag(value), 64)
+        elif i == 1:
+            previous_delta = value - previous
+            writer.write(_zigzag(previous_delta), 64)
+        else:
+            delta = value - previous
+            dod = _zigzag(delta - previous_delta)
+            previous_delta = delta
+            if dod == 0:
+                writer.write(0, 1)
+            else:
+                for prefix, prefix_bits, value_bits in _DOD_BUCKETS:
+                    if dod < (1 << value_bits):
+                        writer.write(prefix, prefix_bits)
+                        writer.write(dod, value_bits)
+                        break
+                else:
+                    writer.write(0b11111, 5)
+                    writer.write(dod, 64)
+        previous = value
+    return writer.getvalue()
+
+def decode_timestamps(data: bytes, count: int) -> list[float]:
+    """
+    Decompresses a block produced by encode_timestamps.
+
+    Args:
+        data: Compressed block
+        count: Number of timestamps in the block
+
+    Returns:
+        Epoch timestamps in seconds
+    """
+    reader = BitReader(data)
+    values = []
+    previous = delta = 0
+    for i in range(count):
+        if i == 0:
+            value = _unzigzag(reader.read(64))
+        elif i == 1:
+            delta = _unzigzag(reader.read(64))
+            value = previous + delta
+        else:
+            if reader.read_bit():
+                for _, prefix_bits, value_bits in _DOD_BUCKETS:
+                    if not reader.read_bit():
+                        dod = reader.read(value_bits)
+                        break
+                else:
+                    dod = reader.read(64)
+                delta += _unzigzag(dod)
+            value = previous + delta
+        values.append(value)
+        previous = value
+    return [value / 1e6 for value in values]
+
+def _float_bits(value: float) -> int:
+    return struct.unpack('>Q', struct.pack('>d', value))[0]
+
+def _bits_float(bits: int) -> float:
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+def encode_values(values: list[float]) -> bytes:
+    """
+    Compresses float values with XOR encoding: each value is XORed with
+    the previous one and only the meaningful bits of the result are
+    stored. Repeated values take a single bit.
+
+    Args:
+        values: Float values
+
+    Returns:
+        Compressed block
+    """
+    writer = BitWriter()
+    previous = 0
+    leading = trailing = -1
+    for i, value in enumerate(values):
+        bits = _float_bits(float(value))
+        if i == 0:
+            writer.write(bits, 64)
+            previous = bits
+            continue
+        xor = bits ^ previous
+        previous = bits
+        if xor == 0:
+            writer.write(0, 1)
+            continue
+        new_leading = min(64 - xor.bit_length(), 31)
+        new_trailing = (xor & -xor).bit_length() - 1
+        if leading >= 0 and new_leading >= leading and new_trailing >= trailing:
+            writer.write(0b10, 2)
+            writer.write(xor >> trailing, 64 - leading - trailing)
+        else:
+            leading, trailing = new_leading, new_trailing
+            meaningful = 64 - leading - trailing
+            writer.write(0b11, 2)
+            writer.write(leading, 5)
+            writer.write(meaningful & 0x3F, 6)
+            writer.write(xor >> trailing, meaningful)
+    return writer.getvalue()
+
+def decode_values(data: bytes, count: int) -> list[float]:
+    """
+    Decompresses a block produced by encode_values.
+
+    Args:
+        data: Compressed block
+        count: Number of values in the block
+
+    Returns:
+        Float values
+    """
+    reader = BitReader(data)
+    values = []
+    previous = 0
+    leading = trailing = 0
+    for i in range(count):
+        if i == 0:
+            previous = reader.read(64)
+        elif reader.read_bit():
+            if reader.read_bit():
+                leading = reader.read(5)
+                meaningful = reader.read(6) or 64
+                trailing = 64 - leading - meaningful
+            previous ^= reader.read(64 - leading - trailing) << trailing
+        values.append(_bits_float(previous))
+    return values
@@ -0,0 +1,987 @@
+import bisect
+import glob
+import heapq
+import itertools
+import logging
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Callable, Iterable, Iterator
+
+from src.fastapi.app.compression import (decode_timestamps, decode_values,
+                                         encode_timestamps, encode_values)
+from src.fastapi.app.models import Rollup, Series
+from src.fastapi.app.rollups import (DAY, DEFAULT_TIERS, ROLLUP_COLUMNS,
+                                     Rollups, RollupTier, combine,
+                                     merge_rollups, to_rollup)
+
+# Segment file: header, compressed columns of each series and their index
+SEGMENT_MAGIC = b"TSDB"
+SEGMENT_VERSION = 2
+# magic, version, chunk start, chunk duration, series, index size. Version
+# 1 segments have a single value column and the index after the header
+_HEADER_V1 = struct.Struct("<4sHddII")
+# ..., value columns, first sequence number merged into the segment, index offset
+_HEADER = struct.Struct("<4sHddIIHIQ")
+# id, count, first ts, last ts, offset, ts size, then the size of each column
+_ENTRY = struct.Struct("<IIddQI")
+
+# Write-ahead log: records of (payload size, crc32) followed by the readings
+_WAL_RECORD = struct.Struct("<II")
+_WAL_READING = struct.Struct("<IddB")   # id, timestamp, value, type length
+
+class Segment:
+    """
+    Immutable file with the compressed series of one time chunk. Only the
+    header is read when the database is opened, the index of series is
+    read on the first scan of the chunk and blocks are read on demand.
+
+    A segment written by compaction replaces the segments of its chunk
+    with sequence numbers from first_seq up to its own.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.seq = int(os.path.basename(path).rsplit(".", 1)[0].rsplit("_", 1)[1])
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+        magic, version = struct.unpack_from("<4sH", header)
+        if magic != SEGMENT_MAGIC or version not in (1, SEGMENT_VERSION):
+            raise ValueError(f"{path} is not a segment file.")
+        if version == 1:
+            _, _, self.chunk_start, self.chunk_duration, self.n_series, \
+                self.index_size = _HEADER_V1.unpack_from(header)
+            self.index_offset, self.n_columns, self.first_seq = \
+                _HEADER_V1.size, 1, self.seq
+        else:
+            _, _, self.chunk_start, self.chunk_duration, self.n_series, \
+                self.index_size, self.n_columns, self.first_seq, \
+                self.index_offset = _HEADER.unpack_from(header)
+        self._column_sizes = struct.Struct(f"<{self.n_columns}I")
+        self._index = None
+
+    @property
+    def size(self) -> int:
+        return os.path.getsize(self.path)
+
+    def index(self) -> dict[tuple[int, str], tuple]:
+        """
+        Returns the index of the segment: (sensor id, sensor type) ->
+        (count, first timestamp, last timestamp, offset, timestamps size,
+        column sizes).
+        """
+        if self._index is None:
+            with open(self.path, "rb") as f:
+                f.seek(self.index_offset)
+                data = f.read(self.index_size)
+            index, position = {}, 0
+            for _ in range(self.n_series):
+                length = data[position]
+                sensor_type = data[position + 1:position + 1 + length].decode()
+                position += 1 + length
+                sensor_id, *entry = _ENTRY.unpack_from(data, position)
+                position += _ENTRY.size
+                entry.append(self._column_sizes.unpack_from(data, position))
+                position += self._column_sizes.size
+                index[(sensor_id, sensor_type)] = tuple(entry)
+            self._index = index
+        return self._index
+
+    def read(self, keys: list[tuple[int, str]]
+             ) -> Iterator[tuple[tuple[int, str], list[float], list[list[float]]]]:
+        """
+        Reads and decompresses the series of the given keys.
+
+        Yields:
+            (key, timestamps, value columns)
+        """
+        index = self.index()
+        with open(self.path, "rb") as f:
+            for key in keys:
+                count, _, _, offset, ts_size, column_sizes = index[key]
+                f.seek(offset)
+                data = f.read(ts_size + sum(column_sizes))
+                columns, position = [], ts_size
+                for size in column_sizes:
+                    columns.append(decode_values(data[position:position + size], count))
+                    position += size
+                yield key, decode_timestamps(data[:ts_size], count), columns
+
+    @staticmethod
+    def write(path: str, chunk_start: float, chunk_duration: float,
+              rows: Iterable[tuple[tuple[int, str], list[float], list[list[float]]]],
+              n_columns: int, first_seq: int) -> bool:
+        """
+        Writes a segment atomically. Rows are compressed and written one
+        by one and the index is written after them, so only one series is
+        held decompressed at a time.
+
+        Args:
+            path: Path of the segment
+            chunk_start: Start of its chunk
+            chunk_duration: Duration of its chunk
+            rows: (key, timestamps, value columns) of each series.
+                Timestamps must be sorted
+            n_columns: Number of value columns of every series
+            first_seq: First sequence number replaced by the segment
+
+        Returns:
+            False if there were no rows and nothing was written
+        """
+        column_sizes = struct.Struct(f"<{n_columns}I")
+        index = []
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(bytes(_HEADER.size))
+            offset = _HEADER.size
+            for (sensor_id, sensor_type), timestamps, columns in rows:
+                ts_block = encode_timestamps(timestamps)
+                column_blocks = [encode_values(column) for column in columns]
+                sensor_type = sensor_type.encode()
+                index.append(
+                    bytes([len(sensor_type)]) + sensor_type
+                    + _ENTRY.pack(sensor_id, len(timestamps), timestamps[0],
+                                  timestamps[-1], offset, len(ts_block))
+                    + column_sizes.pack(*(len(block) for block in column_blocks)))
+                block = ts_block + b"".join(column_blocks)
+                f.write(block)
+                offset += len(block)
+            if not index:
+                f.close()
+                os.remove(tmp_path)
+                return False
+            f.write(b"".join(index))
+            f.seek(0)
+            f.write(_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, chunk_start,
+                                 chunk_duration, len(index),
+                                 sum(len(entry) for entry in index),
+                                 n_columns, first_seq, offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return True
+
+class SegmentSet:
+    """
+    Segments of a directory, grouped by chunk. It is not thread safe,
+    TimeSeriesDatabase uses it under its lock.
+    """
+
+    def __init__(self, path: str, chunk_duration: float):
+        """
+        Loads the segments of a directory, deleting the ones replaced by
+        a compacted segment.
+
+        Args:
+            path: Directory of the segments
+            chunk_duration: Seconds of each time chunk
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.chunk_duration = chunk_duration
+        self._chunks = {}
+        segments = [Segment(p) for p in glob.glob(os.path.join(path, "chunk_*.tsc"))]
+        covered_from = {}
+        for segment in sorted(segments, key=lambda s: s.seq, reverse=True):
+            if segment.chunk_duration != chunk_duration:
+                raise ValueError(f"Chunk duration of {segment.path} is "
+                                 f"{segment.chunk_duration}, not {chunk_duration}.")
+            if segment.seq >= covered_from.get(segment.chunk_start, math.inf):
+                # Left behind by a compaction that did not finish
+                os.remove(segment.path)
+                continue
+            covered_from[segment.chunk_start] = min(
+                segment.first_seq, covered_from.get(segment.chunk_start, math.inf))
+            self._chunks.setdefault(segment.chunk_start, []).insert(0, segment)
+
+    @property
+    def max_seq(self) -> int:
+        return max((s.seq for s in self.all()), default=-1)
+
+    def write(self, chunk_start: float, seq: int, rows: Iterable,
+              n_columns: int, first_seq: int = None) -> str | None:
+        """
+        Writes a segment of the directory, see Segment.write().
+
+        Returns:
+            Path of the segment, None if there were no rows
+        """
+        path = os.path.join(self.path, f"chunk_{round(chunk_start * 1000)}_{seq:06d}.tsc")
+        if Segment.write(path, chunk_start, self.chunk_duration, rows, n_columns,
+                         seq if first_seq is None else first_seq):
+            return path
+        return None
+
+    def add(self, path: str) -> Segment:
+        segment = Segment(path)
+        chunk = self._chunks.setdefault(segment.chunk_start, [])
+        chunk[:] = [s for s in chunk if s.path != path] + [segment]
+        chunk.sort(key=lambda s: s.seq)
+        return segment
+
+    def remove(self, segments: list[Segment]):
+        """
+        Removes segments and deletes their files.
+        """
+        for segment in segments:
+            chunk = self._chunks.get(segment.chunk_start, [])
+            if segment in chunk:
+                chunk.remove(segment)
+            if not chunk:
+                self._chunks.pop(segment.chunk_start, None)
+            if os.path.exists(segment.path):
+                os.remove(segment.path)
+
+    def get(self, chunk_start: float) -> list[Segment]:
+        return list(self._chunks.get(chunk_start, []))
+
+    def chunks(self) -> list[float]:
+        return sorted(self._chunks)
+
+    def all(self) -> list[Segment]:
+        return [s for chunk in self._chunks.values() for s in chunk]
+
+    def expired(self, timestamp: float) -> list[Segment]:
+        """
+        Returns the segments of the chunks that end before a timestamp.
+        """
+        return [s for start, chunk in self._chunks.items()
+                if start + self.chunk_duration <= timestamp for s in chunk]
+
+def _merge(parts: list[tuple[list[float], list[float]]], start: float,
+           end: float) -> tuple[list[float], list[float]]:
+    """
+    Merges the parts of a series, oldest first, into sorted columns within
+    [start, end). Duplicated timestamps keep the last written value.
+    """
+    if len(parts) == 1:
+        timestamps, values = parts[0]
+        if all(a < b for a, b in zip(timestamps, timestamps[1:])):
+            first = bisect.bisect_left(timestamps, start)
+            last = bisect.bisect_left(timestamps, end)
+            return timestamps[first:last], values[first:last]
+    merged = {}
+    for timestamps, values in parts:
+        merged.update(zip(timestamps, values))
+    timestamps = sorted(t for t in merged if start <= t < end)
+    return timestamps, [merged[t] for t in timestamps]
+
+class TimeSeriesDatabase:
+    """
+    Embedded time-series store of sensor readings, keyed by sensor id,
+    sensor type and timestamp. It needs no database server.
+
+    Readings are appended to a write-ahead log and to an in-memory head.
+    When the head is full, it is flushed to immutable segment files, one
+    per time chunk, where each series is stored as compressed columns:
+    delta-of-delta timestamps and XOR encoded values. Range scans only
+    open the segments of the chunks that overlap the range, and only read
+    the blocks of the requested series.
+
+    Each ingested batch also updates rollups (min, max, avg, count and
+    last per bucket) of every rollup tier, flushed with the readings.
+    Aggregate queries read the coarsest tier that meets the requested
+    resolution. compact() drops the chunks past the retention of the raw
+    readings and of each tier, and merges the segments of each chunk.
+
+    Directory layout:
+        wal.log                  Readings not flushed yet
+        wal.<seq>.flushing       Readings of a flush in progress
+        chunk_<start>_<seq>.tsc  Segments, <start> in milliseconds
+        rollups/<tier>/          Segments of each rollup tier
+    """
+
+    def __init__(self, path: str, chunk_duration: float = 3600.0,
+                 max_head_points: int = 100_000, sync: bool = False,
+                 rollup_tiers: tuple[RollupTier, ...] = DEFAULT_TIERS,
+                 raw_retention: float | None = 7 * DAY):
+        """
+        Open or create a database. Readings left in the write-ahead log
+        are recovered into the head.
+
+        Args:
+            path: Directory of the database
+            chunk_duration: Seconds of each time chunk (default: 3600)
+            max_head_points: Readings kept in memory before flushing them
+                to segments (default: 100000)
+            sync: fsync the write-ahead log after each batch, so acknowledged
+                readings survive a power loss and not only a crash of the
+                process (default: False)
+            rollup_tiers: Rollup tiers to maintain, empty to disable the
+                rollups (default: 1m for 30 days, 1h for 365 days and 1d
+                forever)
+            raw_retention: Seconds the raw readings are kept by compact(),
+                None to keep them forever (default: 7 days)
+        """
+        if chunk_duration <= 0:
+            raise ValueError("Chunk duration must be greater than 0.")
+        self.path = path
+        self.chunk_duration = chunk_duration
+        self.max_head_points = max_head_points
+        self.sync = sync
+        self.raw_retention = raw_retention
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._head = {}
+        self._head_points = 0
+        self._flushing = {}
+        self.segments = SegmentSet(path, chunk_duration)
+        self.rollups = Rollups(os.path.join(path, "rollups"), rollup_tiers,
+                               SegmentSet) if rollup_tiers else None
+        self._next_seq = 1 + max(
+            [s.max_seq for s in self._segment_sets()], default=-1)
+        self._compaction_thread = None
+        self._compaction_stop = threading.Event()
+        self._listeners = []
+        # Timestamps of each series in the head and in the head being
+        # flushed, and the last one flushed to segments, so redelivered
+        # readings are only aggregated once by the rollups
+        self._seen = {}
+        self._flushing_seen = {}
+        self._high_water = {}
+
+        # Finish the flushes that were interrupted, with their own sequence
+        # number so their partial rollups are replaced and not added twice
+        self._wal_path = os.path.join(path, "wal.log")
+        recovered = 0
+        for wal_path in sorted(glob.glob(os.path.join(path, "wal.*.flushing"))):
+            seq = int(wal_path.rsplit(".", 2)[1])
+            self._next_seq = max(self._next_seq, seq + 1)
+            if self.rollups:
+                self.rollups.discard(seq)
+            for rows in self._read_wal(wal_path):
+                # The segments of the interrupted flush may hold these
+                # readings, which are not in its discarded rollups
+                self._append(rows, flushed=False)
+                recovered += len(rows)
+            self._rotate()
+            self._write_flushing(seq)
+        for rows in self._read_wal(self._wal_path):
+            self._append(rows)
+            recovered += len(rows)
+        if recovered:
+            logging.info(f"Recovered {recovered} readings from the write-ahead log.")
+        self._wal = open(self._wal_path, "ab")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _segment_sets(self) -> list[SegmentSet]:
+        sets = [self.segments]
+        if self.rollups:
+            sets.extend(self.rollups.segments.values())
+        return sets
+
+    def chunk_start(self, timestamp: float) -> float:
+        """
+        Returns the start of the chunk of a timestamp.
+        """
+        return timestamp // self.chunk_duration * self.chunk_duration
+
+    # Write-ahead log
+
+    @staticmethod
+    def _encode_wal(readings: list[tuple]) -> bytes:
+        payload = b"".join(
+            _WAL_READING.pack(sensor_id, timestamp, value, len(sensor_type))
+            + sensor_type
+            for sensor_id, sensor_type, timestamp, value in readings)
+        return _WAL_RECORD.pack(len(payload), zlib.crc32(payload)) + payload
+
+    @staticmethod
+    def _read_wal(path: str) -> Iterator[list[tuple]]:
+        """
+        Reads the batches of a write-ahead log, stopping at the first torn
+        or corrupted record, which is truncated.
+        """
+        if not os.path.exists(path):
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        position = 0
+        while position + _WAL_RECORD.size <= len(data):
+            size, crc = _WAL_RECORD.unpack_from(data, position)
+            payload = data[position + _WAL_RECORD.size:
+                           position + _WAL_RECORD.size + size]
+            if len(payload) < size or zlib.crc32(payload) != crc:
+                break
+            readings, offset = [], 0
+            while offset < size:
+                sensor_id, timestamp, value, length = \
+                    _WAL_READING.unpack_from(payload, offset)
+                offset += _WAL_READING.size
+                readings.append((sensor_id, payload[offset:offset + length].decode(),
+                                 timestamp, value))
+                offset += length
+            yield readings
+            position += _WAL_RECORD.size + size
+        if position < len(data):
+            logging.warning(f"Truncating {len(data) - position} bytes of an "
+                            f"incomplete record in {path}")
+            with open(path, "r+b") as f:
+                f.truncate(position)
+
+    # Ingestion
+
+    def _flushed_high_water(self, key: tuple[int, str]) -> float:
+        """
+        Returns the last timestamp of a series in the segments of the two
+        newest chunks, where redelivered readings are looked for.
+        """
+        high_water = self._high_water.get(key)
+        if high_water is None:
+            high_water = -math.inf
+            for chunk_start in self.segments.chunks()[-2:]:
+                for segment in self.segments.get(chunk_start):
+                    entry = segment.index().get(key)
+                    if entry is not None:
+                        high_water = max(high_water, entry[2])
+            self._high_water[key] = high_water
+        return high_water
+
+    def _append(self, readings: list[tuple], flushed: bool = True):
+        """
+        Adds rows to the head, and the ones not seen before to the
+        rollups. Raw scans drop duplicated timestamps when merging, but
+        rollups would count a redelivered reading twice. A reading is new
+        if its timestamp is not in the head of its series and, when
+        flushed is True, it is later than the last one flushed, so late
+        readings of a series already flushed are only in the raw readings.
+        """
+        fresh = []
+        for row in readings:
+            sensor_id, sensor_type, timestamp, value = row
+            key = (sensor_id, sensor_type)
+            chunk = self._head.setdefault(self.chunk_start(timestamp), {})
+            columns = chunk.get(key)
+            if columns is None:
+                columns = chunk[key] = ([], [])
+            columns[0].append(timestamp)
+            columns[1].append(value)
+            seen = self._seen.get(key)
+            if seen is None:
+                seen = self._seen[key] = set()
+            if timestamp in seen or \
+                    timestamp in self._flushing_seen.get(key, ()) or \
+                    (flushed and timestamp <= self._flushed_high_water(key)):
+                continue
+            seen.add(timestamp)
+            fresh.append(row)
+        self._head_points += len(readings)
+        if self.rollups and fresh:
+            self.rollups.update(fresh)
+
+    def write(self, readings: list[dict]):
+        """
+        Ingests a batch of readings. The batch is written to the
+        write-ahead log as a single record before being applied, so it is
+        recovered entirely or not at all. It can be used as the sink of
+        AMQPIngestionService.
+
+        Args:
+            readings: Readings with id, type, timestamp and value keys.
+                Other keys, like period, are not stored
+        """
+        try:
+            rows = [(int(r["id"]), str(r["type"]), float(r["timestamp"]),
+                     float(r["value"])) for r in readings]
+        except KeyError as e:
+            raise ValueError(f"Reading must contain id, type, timestamp and value, missing {e}.")
+        if not rows:
+            return
+        record = self._encode_wal(
+            [(i, t.encode(), ts, v) for i, t, ts, v in rows])
+        with self._lock:
+            self._wal.write(record)
+            self._wal.flush()
+            if self.sync:
+                os.fsync(self._wal.fileno())
+            self._append(rows)
+            full = self._head_points >= self.max_head_points
+        for listener in self._listeners:
+            listener(rows)
+        if full:
+            self.flush()
+
+    def add_listener(self, listener: Callable[[list[tuple]], None]):
+        """
+        Adds a function called after each ingested batch, once it is
+        visible to queries, with its (sensor_id, sensor_type, timestamp,
+        value) rows. It runs in the writer thread and must be fast.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[list[tuple]], None]):
+        self._listeners.remove(listener)
+
+    def _rotate(self):
+        """
+        Moves the head and the rollups in memory to the ones being flushed.
+        """
+        self._flushing = self._head
+        self._head, self._head_points = {}, 0
+        self._flushing_seen, self._seen = self._seen, {}
+        if self.rollups:
+            self.rollups.rotate()
+
+    def _write_flushing(self, seq: int):
+        """
+        Writes the readings and rollups being flushed to segments with
+        the sequence number of the flush and deletes its write-ahead log.
+        """
+        written = []
+        for chunk_start, chunk in sorted(self._flushing.items()):
+            rows = []
+            for key, columns in sorted(chunk.items()):
+                timestamps, values = _merge([columns], -math.inf, math.inf)
+                rows.append((key, timestamps, [values]))
+            written.append(self.segments.write(chunk_start, seq, rows, 1))
+        rollups = self.rollups.write_segments(seq) if self.rollups else []
+
+        with self._lock:
+            for path in written:
+                self.segments.add(path)
+            if self.rollups:
+                self.rollups.commit(rollups)
+            for key, seen in self._flushing_seen.items():
+                if seen:
+                    self._high_water[key] = max(
+                        self._high_water.get(key, -math.inf), max(seen))
+            n_series = sum(len(c) for c in self._flushing.values())
+            self._flushing = {}
+            self._flushing_seen = {}
+        wal_path = os.path.join(self.path, f"wal.{seq:06d}.flushing")
+        if os.path.exists(wal_path):
+            os.remove(wal_path)
+        if written:
+            logging.info(f"Flushed {n_series} series to {len(written)} segments.")
+
+    def flush(self):
+        """
+        Writes the head to a new segment per chunk and empties the
+        write-ahead log. Writes and scans go on while segments are
+        compressed, the head being flushed stays visible to scans.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._head:
+                    return
+                seq = self._next_seq
+                self._next_seq += 1
+                self._rotate()
+                self._wal.close()
+                os.replace(self._wal_path,
+                           os.path.join(self.path, f"wal.{seq:06d}.flushing"))
+                self._wal = open(self._wal_path, "ab")
+            self._write_flushing(seq)
+
+    def close(self):
+        """
+        Stops the compaction job, flushes the head and closes the
+        write-ahead log.
+        """
+        self.stop_compaction()
+        self.flush()
+        with self._lock:
+            self._wal.close()
+
+    # Queries
+
+    def chunks(self, start: float = None, end: float = None) -> list[float]:
+        """
+        Returns the start of the chunks that overlap [start, end).
+        """
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        with self._lock:
+            starts = set(self.segments.chunks()) | set(self._head) | \
+                set(self._flushing)
+        return sorted(c for c in starts
+                      if c < end and c + self.chunk_duration > start)
+
+    @staticmethod
+    def _matcher(sensor_id: int = None, sensor_type: str = None):
+        def matches(key):
+            return (sensor_id is None or key[0] == sensor_id) and \
+                (sensor_type is None or key[1] == sensor_type)
+        return matches
+
+    @staticmethod
+    def _read_segments(segments: list[Segment], start: float, end: float,
+                       matches) -> dict:
+        """
+        Reads the matching series of segments, oldest first, that have
+        data within [start, end).
+        """
+        parts = {}
+        for segment in segments:
+            keys = [key for key, entry in segment.index().items()
+                    if matches(key) and entry[1] < end and entry[2] >= start]
+            for key, timestamps, columns in segment.read(keys):
+                parts.setdefault(key, []).append((timestamps, columns))
+        return parts
+
+    def scan(self, start: float = None, end: float = None,
+             sensor_id: int = None, sensor_type: str = None
+             ) -> Iterator[Series]:
+        """
+        Scans the series within [start, end), chunk by chunk in time order.
+        A sensor is yielded once per chunk with data in the range.
+
+        Args:
+            start (optional): First timestamp, inclusive. Defaults to the
+                oldest reading
+            end (optional): Last timestamp, exclusive. Defaults to the
+                newest reading
+            sensor_id (optional): Only scan this sensor id
+            sensor_type (optional): Only scan this sensor type
+
+        Yields:
+            Series with sorted timestamps
+        """
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        matches = self._matcher(sensor_id, sensor_type)
+
+        for chunk_start in self.chunks(start, end):
+            for attempt in range(3):
+                # Snapshot the chunk, the lists of the head only grow
+                with self._lock:
+                    segments = self.segments.get(chunk_start)
+                    memory = [
+                        {key: (columns[0][:], columns[1][:])
+                         for key, columns in head.get(chunk_start, {}).items()
+                         if matches(key)}
+                        for head in (self._flushing, self._head)]
+                try:
+                    parts = {
+                        key: [(timestamps, columns[0]) for timestamps, columns in p]
+                        for key, p in self._read_segments(
+                            segments, start, end, matches).items()}
+                    break
+                except FileNotFoundError:
+                    # Segments replaced by a compaction, take a new snapshot
+                    if attempt == 2:
+                        raise
+            for head in memory:
+                for key, columns in head.items():
+                    parts.setdefault(key, []).append(columns)
+
+            for key in sorted(parts):
+                timestamps, values = _merge(parts[key], start, end)
+                if timestamps:
+                    yield Series(key[0], key[1], timestamps, values)
+
+    def query(self, start: float = None, end: float = None,
+              sensor_id: int = None, sensor_type: str = None) -> list[dict]:
+        """
+        Returns the readings within [start, end) sorted by timestamp. See
+        scan() for the arguments.
+        """
+        readings = []
+        for series in self.scan(start, end, sensor_id, sensor_type):
+            readings.extend(series.readings())
+        readings.sort(key=lambda r: (r["timestamp"], r["id"]))
+        return readings
+
+    def scan_rollups(self, tier: str | RollupTier, start: float = None,
+                     end: float = None, sensor_id: int = None,
+                     sensor_type: str = None) -> Iterator[Rollup]:
+        """
+        Scans the buckets of a rollup tier that start within [start, end),
+        chunk by chunk in time order, merging their partial aggregates.
+        See scan() for the other arguments.
+
+        Args:
+            tier: Rollup tier or its name
+        """
+        if not self.rollups:
+            raise ValueError("Rollups are disabled.")
+        if isinstance(tier, str):
+            tier = self.rollups.tier(tier)
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        matches = self._matcher(sensor_id, sensor_type)
+
+        with self._lock:
+            chunks = self.rollups.chunks(tier, start, end)
+        for chunk_start in chunks:
+            for attempt in range(3):
+                with self._lock:
+                    segments, memory = self.rollups.snapshot(tier, chunk_start, matches)
+                try:
+                    parts = {
+                        key: [Rollup(key[0], key[1], timestamps, *columns)
+                              for timestamps, columns in p]
+                        for key, p in self._read_segments(
+                            segments, start, end, matches).items()}
+                    break
+                except FileNotFoundError:
+                    if attempt == 2:
+                        raise
+            for head in memory:
+                for key, buckets in head.items():
+                    parts.setdefault(key, []).append(to_rollup(key, buckets))
+
+            for key in sorted(parts):
+                buckets = merge_rollups(parts[key], start, end)
+                if buckets:
+                    yield to_rollup(key, buckets)
+
+    def select_tier(self, start: float | None, resolution: float,
+                    now: float = None) -> RollupTier | None:
+        """
+        Selects the coarsest rollup tier that meets a resolution: its
+        buckets divide the requested ones and its retention covers the
+        start of the range, if there is one.
+
+        Args:
+            start: Start of the range, None for the oldest reading
+            resolution: Seconds of each requested bucket
+            now (optional): Current time. Defaults to time.time()
+
+        Returns:
+            The tier, or None if only the raw readings meet the resolution
+        """
+        if not self.rollups:
+            return None
+        now = time.time() if now is None else now
+        selected = None
+        for tier in self.rollups.tiers:
+            ratio = resolution / tier.resolution
+            if ratio < 1 or not math.isclose(ratio, round(ratio)):
+                continue
+            # Without a start, no tier is complete from the oldest
+            # reading, and the coarsest one is the fastest
+            if tier.retention is not None and start is not None and \
+                    start < now - tier.retention:
+                continue
+            selected = tier
+        return selected
+
+    groupings = ("sensor", "type")
+
+    def aggregate(self, start: float = None, end: float = None,
+                  resolution: float = 60.0, sensor_id: int = None,
+                  sensor_type: str = None, group_by: str = "sensor",
+                  now: float = None) -> list[dict]:
+        """
+        Returns min, max, avg, count and last per sensor (or sensor type)
+        and bucket of the given resolution, from the coarsest rollup tier
+        that meets it, or from the raw readings if none does.
+
+        Args:
+            start (optional): Start of the range, rounded down to the
+                resolution
+            end (optional): End of the range, exclusive
+            resolution: Seconds of each bucket (default: 60)
+            sensor_id (optional): Only aggregate this sensor id
+            sensor_type (optional): Only aggregate this sensor type
+            group_by: 'sensor' for a bucket per sensor id and type, or
+                'type' for a bucket per sensor type (default: 'sensor')
+            now (optional): Current time used to select the tier
+
+        Returns:
+            Buckets sorted by timestamp, with id (only grouping by
+            sensor), type, timestamp (start of the bucket), min, max,
+            avg, count and last keys
+        """
+        if resolution <= 0:
+            raise ValueError("Resolution must be greater than 0.")
+        if group_by not in self.groupings:
+            raise ValueError(f"Group by must be one of: {self.groupings}")
+        by_type = group_by == "type"
+        if start is not None:
+            start = start // resolution * resolution
+        tier = self.select_tier(start, resolution, now)
+        aggregates = {}
+        if tier is not None:
+            for rollup in self.scan_rollups(tier, start, end, sensor_id, sensor_type):
+                buckets = aggregates.setdefault(
+                    (None, rollup.sensor_type) if by_type else rollup.key, {})
+                for bucket, aggregate in merge_rollups(
+                        [rollup], -math.inf, math.inf).items():
+                    bucket = bucket // resolution * resolution
+                    if bucket in buckets:
+                        combine(buckets[bucket], aggregate)
+                    else:
+                        buckets[bucket] = aggregate
+        else:
+            for series in self.scan(start, end, sensor_id, sensor_type):
+                buckets = aggregates.setdefault(
+                    (None, series.sensor_type) if by_type else series.key, {})
+                for timestamp, value in zip(series.timestamps, series.values):
+                    bucket = timestamp // resolution * resolution
+                    aggregate = [value, value, value, 1, timestamp, value]
+                    if bucket in buckets:
+                        combine(buckets[bucket], aggregate)
+                    else:
+                        buckets[bucket] = aggregate
+        rows = []
+        for key, buckets in aggregates.items():
+            rows.extend(to_rollup(key, buckets).rows())
+        if by_type:
+            for row in rows:
+                del row["id"]
+            rows.sort(key=lambda r: (r["timestamp"], r["type"]))
+        else:
+            rows.sort(key=lambda r: (r["timestamp"], r["id"], r["type"]))
+        return rows
+
+    def latest(self, sensor_id: int = None, sensor_type: str = None,
+               lookback: float = DAY) -> list[dict]:
+        """
+        Returns the last reading of each sensor, scanning the chunks from
+        the newest one back to lookback seconds before it.
+
+        Args:
+            sensor_id (optional): Only this sensor id
+            sensor_type (optional): Only this sensor type
+            lookback: Seconds of chunks scanned (default: 1 day)
+
+        Returns:
+            Readings sorted by sensor id and type
+        """
+        chunks = self.chunks()
+        if not chunks:
+            return []
+        oldest = chunks[-1] - lookback
+        latest = {}
+        for chunk_start in reversed(chunks):
+            if chunk_start + self.chunk_duration <= oldest:
+                break
+            for series in self.scan(chunk_start, chunk_start + self.chunk_duration,
+                                    sensor_id, sensor_type):
+                if series.key not in latest:
+                    latest[series.key] = {
+                        "id": series.sensor_id, "type": series.sensor_type,
+                        "timestamp": series.timestamps[-1],
+                        "value": series.values[-1]}
+            if sensor_id is not None and sensor_type is not None and latest:
+                break
+        return [latest[key] for key in sorted(latest)]
+
+    # Compaction
+
+    def compact(self, now: float = None) -> dict:
+        """
+        Drops the chunks of raw readings and rollups past their retention
+        and merges the segments of each remaining chunk into one.
+
+        Args:
+            now (optional): Current time. Defaults to time.time()
+
+        Returns:
+            Number of segments dropped and merged
+        """
+        now = time.time() if now is None else now
+        result = {"dropped": 0, "merged": 0}
+        with self._flush_lock:
+            retentions = [(self.segments, self.raw_retention, False)]
+            if self.rollups:
+                retentions.extend(
+                    (self.rollups.segments[tier.name], tier.retention, True)
+                    for tier in self.rollups.tiers)
+            for segment_set, retention, is_rollup in retentions:
+                if retention is not None:
+                    with self._lock:
+                        expired = segment_set.expired(now - retention)
+                        segment_set.remove(expired)
+                    result["dropped"] += len(expired)
+                for chunk_start in segment_set.chunks():
+                    segments = segment_set.get(chunk_start)
+                    if len(segments) > 1:
+                        self._merge_segments(segment_set, segments, is_rollup)
+                        result["merged"] += len(segments)
+        if any(result.values()):
+            logging.info(f"Compaction dropped {result['dropped']} and merged "
+                         f"{result['merged']} segments.")
+        return result
+
+    def _merge_segments(self, segment_set: SegmentSet,
+                        segments: list[Segment], is_rollup: bool):
+        """
+        Replaces the segments of a chunk with a single one. Series are
+        merged one at a time, walking the segments in key order.
+        """
+        def rows():
+            streams = [
+                ((key, order, timestamps, columns)
+                 for key, timestamps, columns in segment.read(sorted(segment.index())))
+                for order, segment in enumerate(segments)]
+            for key, parts in itertools.groupby(heapq.merge(*streams),
+                                                key=lambda part: part[0]):
+                parts = [(timestamps, columns) for _, _, timestamps, columns in parts]
+                if is_rollup:
+                    rollup = to_rollup(key, merge_rollups(
+                        [Rollup(key[0], key[1], t, *c) for t, c in parts],
+                        -math.inf, math.inf))
+                    yield key, rollup.timestamps, [
+                        getattr(rollup, c) for c in ROLLUP_COLUMNS]
+                else:
+                    timestamps, values = _merge(
+                        [(t, c[0]) for t, c in parts], -math.inf, math.inf)
+                    yield key, timestamps, [values]
+
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+        path = segment_set.write(segments[0].chunk_start, seq, rows(),
+                                 segments[0].n_columns, first_seq=segments[0].seq)
+        with self._lock:
+            if path is not None:
+                segment_set.add(path)
+            segment_set.remove(segments)
+
+    def start_compaction(self, interval: float = 3600.0):
+        """
+        Starts a background thread that runs compact() every interval.
+
+        Args:
+            interval: Seconds between two compactions (default: 3600)
+        """
+        def run():
+            while not self._compaction_stop.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    logging.error(f"Error in compaction: {e}")
+
+        self._compaction_stop.clear()
+        self._compaction_thread = threading.Thread(target=run, daemon=True)
+        self._compaction_thread.start()
+
+    def stop_compaction(self):
+        """
+        Stops the background compaction thread.
+        """
+        if self._compaction_thread is not None:
+            self._compaction_stop.set()
+            self._compaction_thread.join()
+            self._compaction_thread = None
+
+    def get_stats(self) -> dict:
+        """
+        Returns the number of chunks, segments, readings in memory and
+        bytes on disk.
+        """
+        with self._lock:
+            segments = self.segments.all()
+            rollups = [s for segment_set in self._segment_sets()[1:]
+                       for s in segment_set.all()]
+            head_points = self._head_points
+        return {
+            "chunks": len(self.chunks()),
+            "segments": len(segments),
+            "head_points": head_points,
+            "disk_bytes": sum(s.size for s in segments),
+            "rollup_segments": len(rollups),
+            "rollup_disk_bytes": sum(s.size for s in rollups),
+        }
@@ -0,0 +1,215 @@
+import asyncio
+import collections
+import threading
+from typing import Iterable
+
+from src.sensors.topics import TopicScheme, topic_matches
+
+# Readings are matched by their topic in the default scheme of the
+# simulators, whatever the upstream source
+reading_topic = TopicScheme().topic
+
+class Subscription:
+    """
+    Subscription of one client to live readings, with a bounded queue of
+    pending readings.
+
+    Pending readings are conflated by sensor: a new reading of a sensor
+    that was not delivered yet replaces the pending one, so a slow client
+    receives the latest value of each sensor instead of falling behind.
+    If more than max_pending sensors are pending, the oldest is dropped.
+    Its methods must be called from the event loop of the hub.
+    """
+
+    def __init__(self, topics: Iterable[str] = None,
+                 sensor_ids: Iterable[int] = None, sensor_type: str = None,
+                 max_pending: int = 1000):
+        """
+        Args:
+            topics (optional): Topic patterns, with MQTT wildcards, matched
+                against simulated_sensors/<type>/<id>
+            sensor_ids (optional): Only these sensor ids
+            sensor_type (optional): Only this sensor type
+            max_pending: Maximum sensors with a pending reading
+                (default: 1000)
+        """
+        if not isinstance(max_pending, int) or max_pending < 1:
+            raise ValueError("Max pending must be an int greater than 0.")
+        self.topics = tuple(topics or ())
+        self.sensor_ids = frozenset(sensor_ids) if sensor_ids else None
+        self.sensor_type = sensor_type
+        self.max_pending = max_pending
+        self.closed = False
+        self.delivered = 0
+        self.conflated = 0
+        self.dropped = 0
+        self._pending = {}
+        self._event = asyncio.Event()
+        # Topic match results, bounded by the number of sensors
+        self._topic_matches = {}
+
+    def matches(self, reading: dict) -> bool:
+        if self.sensor_ids is not None and reading["id"] not in self.sensor_ids:
+            return False
+        if self.sensor_type is not None and reading["type"] != self.sensor_type:
+            return False
+        if not self.topics:
+            return True
+        topic = reading_topic(reading)
+        matched = self._topic_matches.get(topic)
+        if matched is None:
+            matched = any(topic_matches(p, topic) for p in self.topics)
+            self._topic_matches[topic] = matched
+        return matched
+
+    def put(self, reading: dict):
+        """
+        Adds a reading to the pending ones, conflating it with the
+        pending reading of the same sensor.
+        """
+        if self.closed:
+            return
+        key = (reading["id"], reading["type"])
+        if key in self._pending:
+            self.conflated += 1
+        elif len(self._pending) >= self.max_pending:
+            del self._pending[next(iter(self._pending))]
+            self.dropped += 1
+        self._pending[key] = reading
+        self._event.set()
+
+    async def get(self) -> list[dict]:
+        """
+        Waits for pending readings and returns them, in the order their
+        sensors became pending.
+
+        Returns:
+            Pending readings, an empty list once the subscription is closed
+        """
+        await self._event.wait()
+        self._event.clear()
+        if self.closed:
+            return []
+        batch = list(self._pending.values())
+        self._pending.clear()
+        self.delivered += len(batch)
+        return batch
+
+    def close(self):
+        """
+        Closes the subscription, waking up its pending get().
+        """
+        self.closed = True
+        self._pending.clear()
+        self._event.set()
+
+class FanoutHub:
+    """
+    Fans out the readings of a single upstream source (database writes
+    or an MQTT subscription) to every subscribed client.
+
+    publish() can be called from any thread; readings are dispatched in
+    the event loop the hub was started in. Subscriptions to sensor ids
+    are indexed by id, so a reading is only matched against the
+    subscriptions to its sensor and the ones without sensor ids.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._by_sensor = collections.defaultdict(set)
+        self._any_sensor = set()
+        self.published = 0
+        # Stats of the closed subscriptions
+        self._closed = collections.Counter()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """
+        Sets the event loop readings are dispatched in. Defaults to the
+        running loop.
+        """
+        self._loop = loop or asyncio.get_running_loop()
+
+    def subscribe(self, topics: Iterable[str] = None,
+                  sensor_ids: Iterable[int] = None, sensor_type: str = None,
+                  max_pending: int = 1000) -> Subscription:
+        """
+        Creates and registers a subscription, see Subscription.
+        """
+        subscription = Subscription(topics, sensor_ids, sensor_type,
+                                    max_pending)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if subscription.sensor_ids is None:
+                self._any_sensor.add(subscription)
+            for sensor_id in subscription.sensor_ids or ():
+                self._by_sensor[sensor_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """
+        Closes and unregisters a subscription.
+        """
+        subscription.close()
+        with self._lock:
+            if subscription not in self._subscriptions:
+                return
+            self._subscriptions.discard(subscription)
+            self._any_sensor.discard(subscription)
+            for sensor_id in subscription.sensor_ids or ():
+                self._by_sensor[sensor_id].discard(subscription)
+                if not self._by_sensor[sensor_id]:
+                    del self._by_sensor[sensor_id]
+            self._closed.update(delivered=subscription.delivered,
+                                conflated=subscription.conflated,
+                                dropped=subscription.dropped)
+
+    def publish(self, readings: list[dict]):
+        """
+        Dispatches readings to the matching subscriptions. Thread safe,
+        readings published before start() are discarded.
+        """
+        if self._loop is None or not readings:
+            return
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._dispatch, readings)
+
+    def on_write(self, rows: list[tuple]):
+        """
+        Listener of TimeSeriesDatabase writes, publishes the ingested
+        (sensor_id, sensor_type, timestamp, value) rows.
+        """
+        self.publish([{"id": sensor_id, "type": sensor_type,
+                       "timestamp": timestamp, "value": value}
+                      for sensor_id, sensor_type, timestamp, value in rows])
+
+    def _dispatch(self, readings: list[dict]):
+        self.published += len(readings)
+        any_sensor, by_sensor = self._any_sensor, self._by_sensor
+        for reading in readings:
+            for subscription in any_sensor:
+                if subscription.matches(reading):
+                    subscription.put(reading)
+            for subscription in by_sensor.get(reading["id"], ()):
+                if subscription.matches(reading):
+                    subscription.put(reading)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = collections.Counter(self._closed)
+            for subscription in self._subscriptions:
+                stats.update(delivered=subscription.delivered,
+                             conflated=subscription.conflated,
+                             dropped=subscription.dropped,
+                             pending=len(subscription._pending))
+            return {"subscribers": len(self._subscriptions),
+                    "published": self.published,
+                    "delivered": stats["delivered"],
+                    "conflated": stats["conflated"],
+                    "dropped": stats["dropped"],
+                    "pending": stats["pending"]}
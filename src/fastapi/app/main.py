@@ -0,0 +1,133 @@
+import argparse
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from src.fastapi.app.cache import QueryCache
+from src.fastapi.app.database import TimeSeriesDatabase
+from src.fastapi.app.fanout import FanoutHub
+from src.fastapi.app.ring_buffer import RingBufferIndex
+from src.fastapi.app.routes import router
+from src.sensors.tracing import Tracer
+
+def create_app(db: TimeSeriesDatabase = None, path: str = "data",
+               cache_size: int = 1024, cache_ttl: float = 10.0,
+               compaction_interval: float = 3600.0,
+               index_capacity: int = 600, index_max_sensors: int = 10000,
+               index_window: float = 600.0, amqp_host: str = None,
+               mqtt_broker: str = None,
+               mqtt_topic: str = "simulated_sensors/#",
+               tracer: Tracer = None) -> FastAPI:
+    """
+    Creates the API application.
+
+    Args:
+        db (optional): Database to serve. Defaults to opening the one at
+            path on startup and closing it on shutdown
+        path: Directory of the database (default: 'data')
+        cache_size: Maximum results in the query cache (default: 1024)
+        cache_ttl: Seconds a cached result is valid, 0 disables the cache
+            (default: 10)
+        compaction_interval: Seconds between two compactions of the
+            database opened by the app (default: 3600)
+        index_capacity: Readings kept in memory per sensor for latest
+            and recent queries (default: 600)
+        index_max_sensors: Maximum sensors kept in memory (default: 10000)
+        index_window: Seconds of readings loaded in memory from the
+            database on startup (default: 600)
+        amqp_host (optional): RabbitMQ host. If given, the app runs an
+            AMQPIngestionService that writes into the database
+        mqtt_broker (optional): MQTT broker address. If given, live
+            readings are pushed to the /ws and /events clients from a
+            single subscription to mqtt_topic instead of from the
+            database writes
+        mqtt_topic: Topic filter of the live readings
+            (default: 'simulated_sensors/#')
+        tracer (optional): Tracer that stamps the traced readings when
+            consumed and persisted by the AMQP ingestion, and when first
+            served by /latest, /ws or /events
+    """
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        database = db or TimeSeriesDatabase(path)
+        cache = QueryCache(cache_size, cache_ttl)
+        index = RingBufferIndex(index_capacity, index_max_sensors)
+        index.warm(database, index_window)
+        database.add_listener(cache.on_write)
+        database.add_listener(index.ingest)
+        fanout = FanoutHub()
+        fanout.start()
+        app.state.db, app.state.cache, app.state.index = database, cache, index
+        app.state.fanout = fanout
+        app.state.tracer = tracer
+        if db is None:
+            database.start_compaction(compaction_interval)
+        ingestion = None
+        if amqp_host:
+            # Imported here so the API does not need pika unless it ingests
+            from src.rabbitmq.amqp_consumer import AMQPIngestionService
+            ingestion = AMQPIngestionService(sink=database.write, host=amqp_host,
+                                             tracer=tracer)
+            ingestion.run_threads()
+        app.state.ingestion = ingestion
+        subscriber = None
+        if mqtt_broker:
+            from src.rabbitmq.mqtt_subscriber import MQTTReadingSubscriber
+            subscriber = MQTTReadingSubscriber(mqtt_broker, fanout.publish,
+                                               mqtt_topic)
+            subscriber.connect()
+        else:
+            database.add_listener(fanout.on_write)
+        yield
+        if subscriber is not None:
+            subscriber.disconnect()
+            subscriber.loop_stop()
+        else:
+            database.remove_listener(fanout.on_write)
+        if ingestion is not None:
+            ingestion.stop_threads()
+        database.remove_listener(cache.on_write)
+        database.remove_listener(index.ingest)
+        if db is None:
+            database.close()
+        if tracer is not None:
+            tracer.flush()
+
+    app = FastAPI(title="Monitoring system", lifespan=lifespan)
+    app.include_router(router)
+    return app
+
+app = create_app(path=os.environ.get("TSDB_PATH", "data"),
+                 amqp_host=os.environ.get("AMQP_HOST"),
+                 mqtt_broker=os.environ.get("MQTT_BROKER"))
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Monitoring system API")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--path', default='data')
+    parser.add_argument('--cache-size', type=int, default=1024)
+    parser.add_argument('--cache-ttl', type=float, default=10.0)
+    parser.add_argument('--amqp-host', default=None)
+    parser.add_argument('--mqtt-broker', default=None)
+    parser.add_argument('--mqtt-topic', default='simulated_sensors/#')
+    parser.add_argument('--trace-file', default=None,
+                        help="File where the stages of traced readings "
+                             "are stamped")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(create_app(path=args.path, cache_size=args.cache_size,
+                           cache_ttl=args.cache_ttl, amqp_host=args.amqp_host,
+                           mqtt_broker=args.mqtt_broker,
+                           mqtt_topic=args.mqtt_topic,
+                           tracer=Tracer(args.trace_file)
+                           if args.trace_file else None),
+                host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+from dataclasses import dataclass, field
+
+from pydantic import BaseModel
+
+@dataclass
+class Series:
+    """
+    Readings of one sensor (sensor id and type), stored as columns sorted
+    by timestamp.
+    """
+    sensor_id: int
+    sensor_type: str
+    timestamps: list[float] = field(default_factory=list)
+    values: list[float] = field(default_factory=list)
+
+    @property
+    def key(self) -> tuple[int, str]:
+        return (self.sensor_id, self.sensor_type)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def readings(self) -> list[dict]:
+        """
+        Returns the series as readings, like the ones the sensors publish.
+        """
+        return [
+            {"id": self.sensor_id, "type": self.sensor_type,
+             "timestamp": timestamp, "value": value}
+            for timestamp, value in zip(self.timestamps, self.values)
+        ]
+
+@dataclass
+class Rollup:
+    """
+    Aggregates of one sensor per time bucket, stored as columns sorted by
+    bucket start. last_timestamp is kept to merge the last values of
+    partial aggregates of the same bucket.
+    """
+    sensor_id: int
+    sensor_type: str
+    timestamps: list[float] = field(default_factory=list)
+    min: list[float] = field(default_factory=list)
+    max: list[float] = field(default_factory=list)
+    sum: list[float] = field(default_factory=list)
+    count: list[float] = field(default_factory=list)
+    last_timestamp: list[float] = field(default_factory=list)
+    last: list[float] = field(default_factory=list)
+
+    @property
+    def key(self) -> tuple[int, str]:
+        return (self.sensor_id, self.sensor_type)
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def rows(self) -> list[dict]:
+        """
+        Returns one dict per bucket with min, max, avg, count and last.
+        """
+        return [
+            {"id": self.sensor_id, "type": self.sensor_type,
+             "timestamp": self.timestamps[i], "min": self.min[i],
+             "max": self.max[i], "avg": self.sum[i] / self.count[i],
+             "count": int(self.count[i]), "last": self.last[i]}
+            for i in range(len(self))
+        ]
+
+class ReadingIn(BaseModel):
+    """
+    Reading posted to the API, as published by the sensors.
+    """
+    id: int
+    type: str
+    timestamp: float
+    value: float
+    period: float | None = None
@@ -0,0 +1,203 @@
+import threading
+
+import numpy as np
+
+from src.fastapi.app.models import Series
+
+class RingBufferIndex:
+    """
+    In-memory index of the most recent readings of each sensor, to serve
+    "current state" queries without reading the database.
+
+    Each sensor gets a row of two NumPy arrays (timestamps and values)
+    used as a fixed size ring buffer, and an entry of the latest value
+    table, so its last reading is read in O(1). Rows are allocated in
+    blocks as sensors appear, and memory is bounded by max_sensors x
+    capacity x 16 bytes.
+
+    It is fed by TimeSeriesDatabase.add_listener(index.ingest).
+    """
+
+    def __init__(self, capacity: int = 600, max_sensors: int = 10000):
+        """
+        Args:
+            capacity: Readings kept per sensor, e.g. 600 keeps the last
+                10 minutes of a sensor with a 1 second period
+                (default: 600)
+            max_sensors: Maximum number of sensors. Readings of further
+                sensors are dropped and counted (default: 10000)
+        """
+        if not isinstance(capacity, int) or capacity < 1:
+            raise ValueError("Capacity must be an int greater than 0.")
+        self.capacity = capacity
+        self.max_sensors = max_sensors
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._keys = []
+        self._heads = []
+        self._counts = []
+        self._timestamps = np.empty((0, capacity), dtype=np.float64)
+        self._values = np.empty((0, capacity), dtype=np.float64)
+        self._latest_timestamps = np.empty(0, dtype=np.float64)
+        self._latest_values = np.empty(0, dtype=np.float64)
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _add_sensor(self, key: tuple[int, str]) -> int | None:
+        """
+        Allocates the row of a new sensor, growing the arrays if needed.
+
+        Returns:
+            Row of the sensor, None if max_sensors was reached
+        """
+        row = len(self._keys)
+        if row >= self.max_sensors:
+            return None
+        if row == len(self._timestamps):
+            rows = min(self.max_sensors, max(64, 2 * row))
+            for name in ("_timestamps", "_values"):
+                grown = np.empty((rows, self.capacity), dtype=np.float64)
+                grown[:row] = getattr(self, name)
+                setattr(self, name, grown)
+            for name in ("_latest_timestamps", "_latest_values"):
+                grown = np.empty(rows, dtype=np.float64)
+                grown[:row] = getattr(self, name)
+                setattr(self, name, grown)
+        self._slots[key] = row
+        self._keys.append(key)
+        self._heads.append(0)
+        self._counts.append(0)
+        self._latest_timestamps[row] = -np.inf
+        return row
+
+    def ingest(self, rows: list[tuple]):
+        """
+        Adds a batch of (sensor_id, sensor_type, timestamp, value) rows,
+        overwriting the oldest readings of full buffers.
+        """
+        with self._lock:
+            slots, heads, counts = self._slots, self._heads, self._counts
+            timestamps, values = self._timestamps, self._values
+            capacity = self.capacity
+            for sensor_id, sensor_type, timestamp, value in rows:
+                row = slots.get((sensor_id, sensor_type))
+                if row is None:
+                    row = self._add_sensor((sensor_id, sensor_type))
+                    if row is None:
+                        self.dropped += 1
+                        continue
+                    timestamps, values = self._timestamps, self._values
+                head = heads[row]
+                timestamps[row, head] = timestamp
+                values[row, head] = value
+                heads[row] = (head + 1) % capacity
+                if counts[row] < capacity:
+                    counts[row] += 1
+                # Late readings go to the buffer but do not replace the latest
+                if timestamp >= self._latest_timestamps[row]:
+                    self._latest_timestamps[row] = timestamp
+                    self._latest_values[row] = value
+
+    def _rows(self, sensor_id: int = None, sensor_type: str = None) -> list[int]:
+        if sensor_id is not None and sensor_type is not None:
+            row = self._slots.get((sensor_id, sensor_type))
+            return [] if row is None else [row]
+        return [row for row, key in enumerate(self._keys)
+                if (sensor_id is None or key[0] == sensor_id)
+                and (sensor_type is None or key[1] == sensor_type)]
+
+    def latest(self, sensor_id: int = None, sensor_type: str = None
+               ) -> list[dict]:
+        """
+        Returns the last reading of each sensor, sorted by sensor id and
+        type.
+
+        Args:
+            sensor_id (optional): Only this sensor id
+            sensor_type (optional): Only this sensor type
+        """
+        with self._lock:
+            readings = [
+                {"id": self._keys[row][0], "type": self._keys[row][1],
+                 "timestamp": float(self._latest_timestamps[row]),
+                 "value": float(self._latest_values[row])}
+                for row in self._rows(sensor_id, sensor_type)]
+        readings.sort(key=lambda r: (r["id"], r["type"]))
+        return readings
+
+    def recent(self, seconds: float = None, sensor_id: int = None,
+               sensor_type: str = None, now: float = None) -> list[Series]:
+        """
+        Returns the buffered readings of each sensor within the last
+        seconds, sorted by timestamp. A window longer than a buffer holds
+        is truncated to its capacity.
+
+        Args:
+            seconds (optional): Length of the window. Defaults to every
+                buffered reading
+            sensor_id (optional): Only this sensor id
+            sensor_type (optional): Only this sensor type
+            now (optional): End of the window. Defaults to the newest
+                reading of the index
+
+        Returns:
+            Series sorted by sensor id and type
+        """
+        with self._lock:
+            rows = self._rows(sensor_id, sensor_type)
+            if not rows:
+                return []
+            if now is None:
+                now = float(self._latest_timestamps[:len(self._keys)].max())
+            since = -np.inf if seconds is None else now - seconds
+            series = []
+            for row in rows:
+                count = self._counts[row]
+                order = (self._heads[row] - count + np.arange(count)) % self.capacity
+                timestamps = self._timestamps[row, order]
+                values = self._values[row, order]
+                mask = timestamps >= since
+                timestamps, values = timestamps[mask], values[mask]
+                if len(timestamps) > 1 and np.any(np.diff(timestamps) < 0):
+                    order = np.argsort(timestamps, kind="stable")
+                    timestamps, values = timestamps[order], values[order]
+                key = self._keys[row]
+                series.append(Series(key[0], key[1], timestamps.tolist(),
+                                     values.tolist()))
+        series.sort(key=lambda s: s.key)
+        return series
+
+    def warm(self, db, seconds: float):
+        """
+        Loads the readings of the last seconds of a database, and the
+        latest reading of the sensors without readings in that window, as
+        far back as db.latest looks.
+
+        Args:
+            db: TimeSeriesDatabase
+            seconds: Length of the window
+        """
+        latest = db.latest()
+        if not latest:
+            return
+        start = max(r["timestamp"] for r in latest) - seconds
+        self.ingest([(r["id"], r["type"], r["timestamp"], r["value"])
+                     for r in latest if r["timestamp"] < start])
+        rows = [(s.sensor_id, s.sensor_type, t, v)
+                for s in db.scan(start=start)
+                for t, v in zip(s.timestamps, s.values)]
+        rows.sort(key=lambda row: row[2])
+        self.ingest(rows)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "sensors": len(self._keys),
+                "capacity": self.capacity,
+                "readings": sum(self._counts),
+                "dropped": self.dropped,
+                "memory_bytes": self._timestamps.nbytes + self._values.nbytes
+                + self._latest_timestamps.nbytes + self._latest_values.nbytes,
+            }
@@ -0,0 +1,207 @@
+import os
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+from src.fastapi.app.models import Rollup
+
+MINUTE = 60
+HOUR = 60 * MINUTE
+DAY = 24 * HOUR
+
+# Columns of a rollup segment, after the bucket start timestamps
+ROLLUP_COLUMNS = ("min", "max", "sum", "count", "last_timestamp", "last")
+
+@dataclass(frozen=True)
+class RollupTier:
+    """
+    Resolution and retention of a rollup tier.
+
+    Args:
+        name: Name of the tier, also its directory
+        resolution: Seconds of each bucket
+        retention: Seconds its buckets are kept, None to keep them forever
+    """
+    name: str
+    resolution: float
+    retention: float | None = None
+
+    @property
+    def chunk_duration(self) -> float:
+        """
+        Seconds of each chunk, 1440 buckets.
+        """
+        return self.resolution * 1440
+
+DEFAULT_TIERS = (
+    RollupTier("1m", MINUTE, 30 * DAY),
+    RollupTier("1h", HOUR, 365 * DAY),
+    RollupTier("1d", DAY, None),
+)
+
+def combine(aggregate: list[float], other: list[float]):
+    """
+    Merges a partial aggregate [min, max, sum, count, last_timestamp,
+    last] into another one, in place.
+    """
+    if other[0] < aggregate[0]:
+        aggregate[0] = other[0]
+    if other[1] > aggregate[1]:
+        aggregate[1] = other[1]
+    aggregate[2] += other[2]
+    aggregate[3] += other[3]
+    if other[4] >= aggregate[4]:
+        aggregate[4] = other[4]
+        aggregate[5] = other[5]
+
+def to_rollup(key: tuple[int, str], buckets: dict[float, list[float]]) -> Rollup:
+    """
+    Builds a Rollup from a dict of bucket start -> partial aggregate.
+    """
+    timestamps = sorted(buckets)
+    columns = list(zip(*(buckets[t] for t in timestamps))) or [()] * 6
+    return Rollup(key[0], key[1], timestamps, *(list(c) for c in columns))
+
+class Rollups:
+    """
+    Materialized rollups of a TimeSeriesDatabase. Each ingested batch
+    updates the partial aggregates of its buckets in memory, and each
+    flush writes them to segments of the tier, as the raw readings. A
+    bucket can then have several partial aggregates, one per flush that
+    touched it, which are merged when scanned and by compaction.
+
+    It is not thread safe: TimeSeriesDatabase calls it under its lock,
+    except write_segments(), which only reads the rollups being flushed.
+    """
+
+    def __init__(self, path: str, tiers: tuple[RollupTier, ...],
+                 segment_set: Callable):
+        """
+        Args:
+            path: Directory of the rollups, one subdirectory per tier
+            tiers: Tiers to maintain
+            segment_set: Factory of the SegmentSet of a tier directory,
+                called with the directory and the chunk duration
+        """
+        self.tiers = tuple(sorted(tiers, key=lambda t: t.resolution))
+        self.segments = {
+            tier.name: segment_set(os.path.join(path, tier.name),
+                                   tier.chunk_duration)
+            for tier in self.tiers}
+        self._head = {tier.name: {} for tier in self.tiers}
+        self._flushing = {tier.name: {} for tier in self.tiers}
+
+    def update(self, rows: list[tuple]):
+        """
+        Adds a batch of (sensor_id, sensor_type, timestamp, value) rows to
+        the partial aggregates of every tier.
+        """
+        for tier in self.tiers:
+            head = self._head[tier.name]
+            resolution, chunk_duration = tier.resolution, tier.chunk_duration
+            for sensor_id, sensor_type, timestamp, value in rows:
+                chunk = head.setdefault(
+                    timestamp // chunk_duration * chunk_duration, {})
+                buckets = chunk.get((sensor_id, sensor_type))
+                if buckets is None:
+                    buckets = chunk[(sensor_id, sensor_type)] = {}
+                bucket = timestamp // resolution * resolution
+                aggregate = buckets.get(bucket)
+                if aggregate is None:
+                    buckets[bucket] = [value, value, value, 1, timestamp, value]
+                else:
+                    combine(aggregate, [value, value, value, 1, timestamp, value])
+
+    def rotate(self):
+        """
+        Moves the partial aggregates in memory to the ones being flushed.
+        """
+        self._flushing, self._head = self._head, {
+            tier.name: {} for tier in self.tiers}
+
+    def write_segments(self, seq: int) -> list[tuple[str, str]]:
+        """
+        Writes the rollups being flushed, one segment per tier and chunk.
+
+        Args:
+            seq: Sequence number of the flush
+
+        Returns:
+            List of (tier name, segment path)
+        """
+        written = []
+        for tier in self.tiers:
+            segment_set = self.segments[tier.name]
+            for chunk_start, chunk in sorted(self._flushing[tier.name].items()):
+                rows = []
+                for key, buckets in sorted(chunk.items()):
+                    rollup = to_rollup(key, buckets)
+                    rows.append((key, rollup.timestamps,
+                                 [getattr(rollup, c) for c in ROLLUP_COLUMNS]))
+                written.append((tier.name, segment_set.write(
+                    chunk_start, seq, rows, len(ROLLUP_COLUMNS))))
+        return written
+
+    def commit(self, written: list[tuple[str, str]]):
+        """
+        Adds the segments written by a flush and empties the rollups being
+        flushed.
+        """
+        for name, path in written:
+            self.segments[name].add(path)
+        self._flushing = {tier.name: {} for tier in self.tiers}
+
+    def discard(self, seq: int):
+        """
+        Deletes the segments of an interrupted flush, whose readings are
+        recovered from the write-ahead log and aggregated again.
+        """
+        for segment_set in self.segments.values():
+            segment_set.remove([s for s in segment_set.all() if s.seq == seq])
+
+    def snapshot(self, tier: RollupTier, chunk_start: float, matches: Callable
+                 ) -> tuple[list, list[dict]]:
+        """
+        Returns the segments of a chunk of a tier and a copy of its
+        matching partial aggregates in memory.
+        """
+        memory = []
+        for head in (self._flushing[tier.name], self._head[tier.name]):
+            memory.append({
+                key: {bucket: list(aggregate) for bucket, aggregate in buckets.items()}
+                for key, buckets in head.get(chunk_start, {}).items()
+                if matches(key)})
+        return self.segments[tier.name].get(chunk_start), memory
+
+    def chunks(self, tier: RollupTier, start: float, end: float) -> list[float]:
+        """
+        Returns the chunks of a tier that overlap [start, end).
+        """
+        starts = set(self.segments[tier.name].chunks()) | \
+            set(self._head[tier.name]) | set(self._flushing[tier.name])
+        return sorted(c for c in starts
+                      if c < end and c + tier.chunk_duration > start)
+
+    def tier(self, name: str) -> RollupTier:
+        for tier in self.tiers:
+            if tier.name == name:
+                return tier
+        raise ValueError(f"Tier must be one of: {', '.join(t.name for t in self.tiers)}")
+
+def merge_rollups(parts: Iterator[Rollup], start: float, end: float
+                  ) -> dict[float, list[float]]:
+    """
+    Merges partial rollups of one sensor into a dict of bucket start ->
+    aggregate, keeping the buckets within [start, end).
+    """
+    merged = {}
+    for rollup in parts:
+        columns = [getattr(rollup, c) for c in ROLLUP_COLUMNS]
+        for i, bucket in enumerate(rollup.timestamps):
+            if not start <= bucket < end:
+                continue
+            aggregate = [column[i] for column in columns]
+            if bucket in merged:
+                combine(merged[bucket], aggregate)
+            else:
+                merged[bucket] = aggregate
+    return merged
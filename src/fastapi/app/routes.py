@@ -0,0 +1,288 @@
+import asyncio
+import json
+import struct
+from typing import AsyncIterator, Callable, Iterator
+
+from fastapi import (APIRouter, HTTPException, Query, Request, WebSocket,
+                     WebSocketDisconnect)
+from fastapi.responses import Response, StreamingResponse
+
+from src.fastapi.app.fanout import FanoutHub, Subscription
+from src.fastapi.app.models import ReadingIn, Series
+
+router = APIRouter()
+
+formats = ("json", "ndjson", "binary")
+
+# Binary rows: a header per series followed by its (timestamp, value) rows
+BINARY_SERIES = struct.Struct("<IBI")   # sensor id, type length, rows
+BINARY_ROW = struct.Struct("<dd")       # timestamp, value
+
+def _check_format(format: str, allowed: tuple[str, ...] = formats):
+    if format not in allowed:
+        raise HTTPException(400, f"Format must be one of: {allowed}")
+
+def _cached(request: Request, name: str, compute: Callable[[], list],
+            start: float = None, end: float = None, **params) -> Response:
+    """
+    Returns the JSON result of a query from the cache, computing and
+    caching it on a miss. The serialized body is cached, so hits skip the
+    query and the serialization.
+
+    Args:
+        request: Request, its app holds the database and the cache
+        name: Name of the query
+        compute: Function that runs the query
+        start (optional): Start of the window of the result
+        end (optional): End of the window of the result
+        params: Other parameters of the query
+    """
+    cache = request.app.state.cache
+    key = cache.normalize(name, start=start, end=end, **params)
+    body = cache.get(key)
+    status = "hit"
+    if body is None:
+        status = "miss"
+        version = cache.version
+        try:
+            body = json.dumps(compute()).encode()
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        cache.put(key, body, start, end, version)
+    return Response(body, media_type="application/json",
+                    headers={"X-Cache": status})
+
+def ndjson_lines(rows: Iterator[list[dict]]) -> Iterator[bytes]:
+    """
+    Serializes groups of rows as newline delimited JSON, one chunk per
+    group.
+    """
+    for group in rows:
+        if group:
+            yield "".join(json.dumps(row) + "\n" for row in group).encode()
+
+def binary_frames(series: Iterator[Series]) -> Iterator[bytes]:
+    """
+    Serializes series as binary rows, one chunk per series: a header with
+    the sensor id (uint32), the length of the sensor type (uint8) and the
+    number of rows (uint32), the sensor type, and the rows as timestamp
+    and value (float64 each), all little endian.
+    """
+    for s in series:
+        sensor_type = s.sensor_type.encode()
+        rows = bytearray(BINARY_ROW.size * len(s))
+        for i, row in enumerate(zip(s.timestamps, s.values)):
+            BINARY_ROW.pack_into(rows, i * BINARY_ROW.size, *row)
+        yield BINARY_SERIES.pack(s.sensor_id, len(sensor_type), len(s)) + \
+            sensor_type + bytes(rows)
+
+def decode_binary_frames(data: bytes) -> list[dict]:
+    """
+    Decodes the binary rows of a /readings response into readings.
+    """
+    readings, position = [], 0
+    while position < len(data):
+        sensor_id, length, count = BINARY_SERIES.unpack_from(data, position)
+        position += BINARY_SERIES.size
+        sensor_type = data[position:position + length].decode()
+        position += length
+        for timestamp, value in BINARY_ROW.iter_unpack(
+                data[position:position + count * BINARY_ROW.size]):
+            readings.append({"id": sensor_id, "type": sensor_type,
+                             "timestamp": timestamp, "value": value})
+        position += count * BINARY_ROW.size
+    return readings
+
+@router.get("/readings")
+def get_readings(request: Request, start: float = None, end: float = None,
+                 sensor_id: int = None, sensor_type: str = None,
+                 format: str = "json"):
+    """
+    Readings within [start, end), as a JSON list sorted by timestamp, or
+    streamed as NDJSON or binary rows (see binary_frames), sensor by
+    sensor and chunk by chunk in time order, without building the whole
+    response in memory. Only JSON responses are cached.
+    """
+    _check_format(format)
+    db = request.app.state.db
+    if format == "ndjson":
+        return StreamingResponse(
+            ndjson_lines(s.readings() for s in
+                         db.scan(start, end, sensor_id, sensor_type)),
+            media_type="application/x-ndjson")
+    if format == "binary":
+        return StreamingResponse(
+            binary_frames(db.scan(start, end, sensor_id, sensor_type)),
+            media_type="application/octet-stream")
+    return _cached(request, "readings",
+                   lambda: db.query(start, end, sensor_id, sensor_type),
+                   start, end, sensor_id=sensor_id, sensor_type=sensor_type)
+
+@router.get("/aggregates")
+def get_aggregates(request: Request, start: float = None, end: float = None,
+                   resolution: float = 60.0, sensor_id: int = None,
+                   sensor_type: str = None, group_by: str = "sensor",
+                   format: str = "json"):
+    """
+    Min, max, avg, count and last per sensor (or sensor type) and bucket
+    of resolution seconds, from the coarsest rollup tier that meets the
+    resolution.
+    """
+    _check_format(format, ("json", "ndjson"))
+    db = request.app.state.db
+    compute = lambda: db.aggregate(start, end, resolution, sensor_id,
+                                   sensor_type, group_by)
+    if format == "ndjson":
+        try:
+            rows = compute()
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        return StreamingResponse(
+            ndjson_lines(rows[i:i + 1000] for i in range(0, len(rows), 1000)),
+            media_type="application/x-ndjson")
+    window_start = None if start is None or resolution <= 0 else \
+        start // resolution * resolution
+    return _cached(request, "aggregates", compute, window_start, end,
+                   resolution=resolution, sensor_id=sensor_id,
+                   sensor_type=sensor_type, group_by=group_by)
+
+@router.get("/latest")
+def get_latest(request: Request, sensor_id: int = None,
+               sensor_type: str = None):
+    """
+    Last reading of each sensor, from the in-memory index. Sensors the
+    index does not hold, beyond its max_sensors or not warmed up, are read
+    from the database.
+    """
+    index = request.app.state.index
+    readings = index.latest(sensor_id, sensor_type)
+    if index.dropped or (sensor_id is not None and not readings):
+        held = {(r["id"], r["type"]) for r in readings}
+        readings += [r for r in request.app.state.db.latest(sensor_id,
+                                                            sensor_type)
+                     if (r["id"], r["type"]) not in held]
+        readings.sort(key=lambda r: (r["id"], r["type"]))
+    _served(request.app, readings)
+    return readings
+
+@router.get("/recent")
+def get_recent(request: Request, seconds: float = None, sensor_id: int = None,
+               sensor_type: str = None):
+    """
+    Readings of the last seconds of each sensor, from the in-memory index,
+    as one object per sensor with id, type, timestamps and values lists.
+    """
+    return [{"id": s.sensor_id, "type": s.sensor_type,
+             "timestamps": s.timestamps, "values": s.values}
+            for s in request.app.state.index.recent(seconds, sensor_id, sensor_type)]
+
+def _served(app, readings: list[dict]):
+    tracer = getattr(app.state, "tracer", None)
+    if tracer is not None and readings:
+        tracer.served(readings)
+
+def _subscribe(hub: FanoutHub, topic: list[str], sensor_id: list[int],
+               sensor_type: str, max_pending: int) -> Subscription:
+    try:
+        return hub.subscribe(topic, sensor_id, sensor_type, max_pending)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+async def sse_events(hub: FanoutHub, subscription: Subscription,
+                     keepalive: float = 15.0,
+                     served: Callable[[list[dict]], None] = None
+                     ) -> AsyncIterator[bytes]:
+    """
+    Serializes the batches of a subscription as server-sent events, one
+    event per batch with a JSON list of readings, and sends a comment
+    every keepalive seconds without readings. The subscription is closed
+    when the client disconnects. served is called with each batch.
+    """
+    try:
+        while True:
+            try:
+                batch = await asyncio.wait_for(subscription.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if not batch:
+                return
+            yield f"data: {json.dumps(batch)}\n\n".encode()
+            if served is not None:
+                served(batch)
+    finally:
+        hub.unsubscribe(subscription)
+
+@router.websocket("/ws")
+async def stream_websocket(websocket: WebSocket,
+                           topic: list[str] = Query(None),
+                           sensor_id: list[int] = Query(None),
+                           sensor_type: str = None, max_pending: int = 1000):
+    """
+    Pushes live readings matching topic patterns (MQTT wildcards matched
+    against simulated_sensors/<type>/<id>), sensor ids or a sensor type, as JSON
+    lists of readings. A slow client gets the latest reading of each
+    sensor instead of a backlog, see Subscription.
+    """
+    hub = websocket.app.state.fanout
+    try:
+        subscription = hub.subscribe(topic, sensor_id, sensor_type, max_pending)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    await websocket.accept()
+
+    async def receive():
+        # Only waits for the disconnection, client messages are ignored
+        try:
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        finally:
+            hub.unsubscribe(subscription)
+
+    receiver = asyncio.create_task(receive())
+    try:
+        while batch := await subscription.get():
+            await websocket.send_text(json.dumps(batch))
+            _served(websocket.app, batch)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        hub.unsubscribe(subscription)
+
+@router.get("/events")
+async def stream_events(request: Request, topic: list[str] = Query(None),
+                        sensor_id: list[int] = Query(None),
+                        sensor_type: str = None, max_pending: int = 1000):
+    """
+    Same as /ws, as server-sent events.
+    """
+    hub = request.app.state.fanout
+    subscription = _subscribe(hub, topic, sensor_id, sensor_type, max_pending)
+    served = lambda batch: _served(request.app, batch)
+    return StreamingResponse(sse_events(hub, subscription, served=served),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@router.post("/readings")
+def post_readings(request: Request, readings: list[ReadingIn]):
+    """
+    Ingests a batch of readings.
+    """
+    request.app.state.db.write([reading.model_dump() for reading in readings])
+    return {"written": len(readings)}
+
+@router.get("/stats")
+def get_stats(request: Request):
+    """
+    Storage, cache, in-memory index and live subscribers stats, and the
+    AMQP ingestion ones when the API ingests.
+    """
+    stats = {"database": request.app.state.db.get_stats(),
+             "cache": request.app.state.cache.get_stats(),
+             "index": request.app.state.index.get_stats(),
+             "fanout": request.app.state.fanout.get_stats()}
+    if request.app.state.ingestion is not None:
+        stats["ingestion"] = request.app.state.ingestion.stats.snapshot()
+    return stats
@@ -1,18 +1,126 @@
+import argparse
 import time
 import logging
 
+from src.rabbitmq.outbox import Outbox
+from src.sensors.launcher import ShardedLauncher
+from src.sensors.logs import start_queue_logging, stop_queue_logging
+from src.sensors.metrics import REGISTRY
+from src.sensors.registry import SensorRegistry
 from src.sensors.sensor_simulator import SensorSimulator
+from src.sensors.tracing import Tracer
 
 logging.basicConfig(level=logging.INFO)
 
 # Temporal solution for running code from cli: 
 # export PYTHONPATH=$(pwd):$PYTHONPATH
 
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Sensor simulator")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of worker processes sharing the sensors")
+    parser.add_argument('--sensors', type=int, default=0,
+                        help="Number of sensors of each type to simulate. "
+                             "Defaults to one humidity and one temperature")
+    parser.add_argument('--period', type=float, default=1.0,
+                        help="Period of the sensors created with --sensors")
+    parser.add_argument('--sensors-file', default=None,
+                        help="CSV file with one 'type,period' line per "
+                             "sensor, instead of --sensors")
+    parser.add_argument('--mode', default='mqtt',
+                        choices=['log', 'mqtt', 'replay'])
+    parser.add_argument('--replay-file', default=None,
+                        help="Capture file published in replay mode, see "
+                             "src.sensors.capture")
+    parser.add_argument('--replay-speed', type=float, default=1.0,
+                        help="Replay speed relative to the capture, 0 "
+                             "replays as fast as possible")
+    parser.add_argument('--scheduler', default='threads',
+                        choices=SensorSimulator.schedulers)
+    parser.add_argument('--broker', default='localhost')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--client-id', default='simulator_client')
+    parser.add_argument('--topic-scheme', default='simulated_sensors/{type}/{id}',
+                        help="Topic template of the readings, with {type} "
+                             "and {id} fields")
+    parser.add_argument('--reading-logs', default='sampled',
+                        choices=SensorSimulator.reading_log_modes,
+                        help="How each reading is logged")
+    parser.add_argument('--log-rate', type=float, default=1.0,
+                        help="Readings logged per second with --reading-logs sampled")
+    parser.add_argument('--summary-interval', type=float, default=10.0,
+                        help="Seconds between two logs of readings/s and "
+                             "acks/s, 0 disables them")
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help="Port of the Prometheus metrics endpoint, 0 "
+                             "disables it. Worker i uses port + i")
+    parser.add_argument('--metrics-interval', type=float, default=0,
+                        help="Seconds between two logs of the metrics, 0 "
+                             "disables them")
+    parser.add_argument('--trace-file', default=None,
+                        help="File where the stages of traced readings are "
+                             "stamped. Worker i uses <file>.<i>")
+    parser.add_argument('--trace-sample', type=float, default=0.01,
+                        help="Fraction of the readings traced")
+    parser.add_argument('--outbox-dir', default=None,
+                        help="Directory where readings are stored while the "
+                             "broker is unreachable. Worker i uses <dir>/<i>")
+    parser.add_argument('--outbox-rate', type=float, default=0,
+                        help="Messages per second sent from the outbox once "
+                             "reconnected, 0 for no limit")
+    args = parser.parse_args()
+    if args.mode == 'replay' and (args.replay_file is None or args.workers > 1):
+        parser.error("Replay mode needs --replay-file and a single worker.")
+    return args
+
 def main():
 
-    sensors = [('humidity', 3), ('temperature', 1)]
-    sensor_simulator = SensorSimulator(sensors, 'mqtt', 'simulator_client')
+    args = parse_args()
+    if args.sensors_file:
+        sensors = args.sensors_file
+        if args.workers > 1:
+            # Workers get their shard as tuples
+            registry = SensorRegistry(SensorSimulator.sensor_types)
+            registry.load(args.sensors_file)
+            sensors = [(s['type'], s['period']) for s in registry]
+    elif args.sensors:
+        sensors = [(sensor_type, args.period) 
+                   for sensor_type in SensorSimulator.sensor_types
+                   for _ in range(args.sensors)]
+    else:
+        sensors = [('humidity', 3), ('temperature', 1)]
+
+    if args.workers > 1:
+        launcher = ShardedLauncher(
+            sensors, args.workers, mode=args.mode, client_id=args.client_id,
+            broker=args.broker, port=args.port, scheduler=args.scheduler,
+            topic_scheme=args.topic_scheme, reading_logs=args.reading_logs,
+            log_rate=args.log_rate, summary_interval=args.summary_interval,
+            metrics_port=args.metrics_port,
+            metrics_interval=args.metrics_interval,
+            trace_file=args.trace_file, trace_sample=args.trace_sample,
+            outbox_dir=args.outbox_dir, outbox_rate=args.outbox_rate)
+        launcher.run()
+        return
+
+    sensor_simulator = SensorSimulator(
+        sensors, args.mode, args.client_id, args.broker, args.port,
+        scheduler=args.scheduler, topic_scheme=args.topic_scheme,
+        reading_logs=args.reading_logs, log_rate=args.log_rate,
+        summary_interval=args.summary_interval,
+        metrics=REGISTRY if args.metrics_port or args.metrics_interval else None,
+        tracer=Tracer(args.trace_file, args.trace_sample)
+        if args.trace_file else None,
+        replay_file=args.replay_file, replay_speed=args.replay_speed,
+        outbox=Outbox(args.outbox_dir) if args.outbox_dir else None,
+        outbox_rate=args.outbox_rate)
+    if args.metrics_port:
+        REGISTRY.serve(args.metrics_port)
+    if args.metrics_interval:
+        REGISTRY.start_snapshots(args.metrics_interval)
 
+    # Log records are written by a background thread, not by the sensors
+    listener = start_queue_logging()
     try:
         sensor_simulator.run_threads()
         while True:
@@ -22,6 +130,10 @@ def main():
         logging.info("Simulation stopped.")
         logging.info("Stopping all threads...")
         sensor_simulator.stop_threads()
+    finally:
+        REGISTRY.stop_serving()
+        REGISTRY.stop_snapshots()
+        stop_queue_logging(listener)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
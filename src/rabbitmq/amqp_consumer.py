@@ -0,0 +1,375 @@
+import argparse
+import logging
+import threading
+import time
+from typing import Callable
+
+import pika
+
+from src.sensors.codecs import decode_payload
+from src.sensors.timing import Histogram
+from src.sensors.topics import to_routing_key
+from src.sensors.tracing import Tracer
+
+class IngestionStats:
+    """
+    Counters shared by the consumers of an ingestion service: messages,
+    readings and batches ingested, reconnections, and end-to-end lag
+    between the timestamp of each reading and its persistence.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.readings = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.decode_errors = 0
+        self.reconnects = 0
+        self.lag = Histogram()
+
+    def record_batch(self, messages: int, readings: list[dict], now: float):
+        with self.lock:
+            self.messages += messages
+            self.readings += len(readings)
+            self.batches += 1
+            for reading in readings:
+                self.lag.record(now - reading['timestamp'])
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'messages': self.messages,
+                'readings': self.readings,
+                'batches': self.batches,
+                'failed_batches': self.failed_batches,
+                'decode_errors': self.decode_errors,
+                'reconnects': self.reconnects,
+                'lag': self.lag.summary(),
+            }
+
+class BatchConsumer:
+    """
+    Consumer of one AMQP channel. Messages are gathered in batches, every
+    batch is decoded and handed to the sink at once, and the whole batch
+    is acknowledged with a single basic_ack(multiple=True) once the sink
+    returns, so messages are never acknowledged before being persisted.
+    If the sink fails the batch is rejected and requeued.
+    """
+
+    def __init__(self, channel, sink: Callable[[list[dict]], None],
+                 stats: IngestionStats, batch_size: int = 500,
+                 batch_timeout: float = 0.5, tracer: Tracer = None,
+                 analytics: Callable[[list[dict]], None] = None):
+        """
+        Args:
+            channel: pika channel the messages are consumed from
+            sink: Function that persists a list of decoded readings
+            stats: Stats shared by every consumer
+            batch_size: Messages per batch
+            batch_timeout: Maximum seconds a message waits in the batch
+            tracer (optional): Tracer that stamps the traced readings
+                when consumed and persisted
+            analytics (optional): Function that receives every persisted
+                batch of readings after its ack, e.g. 
+                AnomalyDetector.observe. Its errors are only logged
+        """
+        self.channel = channel
+        self.sink = sink
+        self.stats = stats
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.tracer = tracer
+        self.analytics = analytics
+        self._bodies = []
+        self._last_tag = None
+        self._oldest = None
+
+    def on_message(self, channel, method, properties, body: bytes):
+        """
+        pika callback that adds a message to the current batch.
+        """
+        if not self._bodies:
+            self._oldest = time.monotonic()
+        self._bodies.append(body)
+        self._last_tag = method.delivery_tag
+        if len(self._bodies) >= self.batch_size:
+            self.flush()
+
+    def flush_if_expired(self):
+        """
+        Flushes the current batch if its oldest message exceeded the
+        batch timeout.
+        """
+        if self._bodies and \
+                time.monotonic() - self._oldest >= self.batch_timeout:
+            self.flush()
+
+    def flush(self):
+        """
+        Decodes, persists and acknowledges the current batch.
+        """
+        if not self._bodies:
+            return
+        bodies, last_tag = self._bodies, self._last_tag
+        self._bodies, self._last_tag, self._oldest = [], None, None
+
+        readings = []
+        for body in bodies:
+            try:
+                readings.extend(decode_payload(body))
+            except Exception as e:
+                # Undecodable messages are dropped, requeuing them would
+                # only deliver them again
+                with self.stats.lock:
+                    self.stats.decode_errors += 1
+                logging.error(f"Error decoding message: {e}")
+        if self.tracer is not None:
+            self.tracer.stamp_readings(readings, 'consumed')
+        try:
+            if readings:
+                self.sink(readings)
+        except Exception as e:
+            with self.stats.lock:
+                self.stats.failed_batches += 1
+            logging.error(f"Error persisting batch of {len(readings)} "
+                          f"readings, requeuing it: {e}")
+            self.channel.basic_nack(delivery_tag=last_tag, multiple=True,
+                                    requeue=True)
+            return
+        if self.tracer is not None:
+            self.tracer.stamp_readings(readings, 'persisted')
+            self.tracer.remember(readings)
+        self.channel.basic_ack(delivery_tag=last_tag, multiple=True)
+        self.stats.record_batch(len(bodies), readings, time.time())
+        if self.analytics is not None and readings:
+            try:
+                self.analytics(readings)
+            except Exception as e:
+                logging.error(f"Error in the analytics of a batch of "
+                              f"{len(readings)} readings: {e}")
+
+class AMQPIngestionService:
+    """
+    Ingestion service that consumes the queue where RabbitMQ routes the
+    MQTT messages of the simulated sensors (see rabbitmq_configuration.py).
+
+    It runs several consumers, each with its own connection and channel
+    in its own thread, with a configurable basic_qos prefetch. Messages
+    are decoded and persisted in batches and acknowledged per batch.
+    Consumers reconnect with exponential backoff when RabbitMQ is not up
+    yet or the connection or channel is lost.
+    """
+
+    def __init__(self, sink: Callable[[list[dict]], None],
+                 host: str = "localhost", port: int = 5672,
+                 queue: str = "mqtt_queue", exchange: str = "amq.topic",
+                 routing_key: str | list[str] = "simulated_sensors.#",
+                 consumers: int = 4, prefetch: int = 1000,
+                 batch_size: int = 500, batch_timeout: float = 0.5,
+                 tracer: Tracer = None,
+                 analytics: Callable[[list[dict]], None] = None,
+                 min_reconnect_delay: float = 1,
+                 max_reconnect_delay: float = 60):
+        """
+        Args:
+            sink: Function that persists a list of decoded readings.
+                Batches are only acknowledged once it returns, e.g.
+                TimeSeriesDatabase.write
+            host: RabbitMQ host
+            port: RabbitMQ AMQP port
+            queue: Queue to consume
+            exchange: Exchange the queue is bound to
+            routing_key: Routing key of the binding, or a list of them to
+                bind the queue once per key. Build them from MQTT topic
+                filters with topics.to_routing_key, e.g. 
+                'simulated_sensors.temperature.*' only ingests the 
+                temperature sensors
+            consumers: Number of consumer channels, each in its own thread
+            prefetch: Maximum unacknowledged messages per channel. It must
+                be at least batch_size so batches can fill up
+            batch_size: Messages per batch
+            batch_timeout: Maximum seconds a message waits in a batch
+            tracer (optional): Tracer of the traced readings, see
+                BatchConsumer
+            analytics (optional): Streaming stage that receives the
+                persisted readings, see BatchConsumer
+            min_reconnect_delay: First reconnection delay in seconds. It
+                doubles on each failed attempt
+            max_reconnect_delay: Maximum reconnection delay in seconds
+        """
+        if prefetch < batch_size:
+            raise ValueError("Prefetch must be greater or equal than batch size.")
+        if sink is None:
+            raise ValueError("A sink is needed to persist the readings "
+                             "before acknowledging them.")
+        self.sink = sink
+        self.host = host
+        self.port = port
+        self.queue = queue
+        self.exchange = exchange
+        self.routing_keys = [routing_key] if isinstance(routing_key, str) \
+            else list(routing_key)
+        self.n_consumers = consumers
+        self.prefetch = prefetch
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.tracer = tracer
+        self.analytics = analytics
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.stats = IngestionStats()
+        self.stop_event = threading.Event()
+        self.consumers_threads = []
+
+    def _declare(self, channel):
+        """
+        Declares the queue and binds it, as rabbitmq_configuration.py.
+        """
+        channel.queue_declare(queue=self.queue, durable=True)
+        for routing_key in self.routing_keys:
+            channel.queue_bind(exchange=self.exchange, queue=self.queue,
+                               routing_key=routing_key)
+
+    def run_consumer(self, index: int):
+        """
+        Runs one consumer until the stop event is set, reconnecting with
+        exponential backoff after any connection or channel error.
+
+        Args:
+            index: Consumer index
+        """
+        delay = self.min_reconnect_delay
+        while not self.stop_event.is_set():
+            connection = None
+            try:
+                connection = pika.BlockingConnection(
+                    pika.ConnectionParameters(host=self.host, port=self.port))
+                channel = connection.channel()
+                self._declare(channel)
+                channel.basic_qos(prefetch_count=self.prefetch)
+                consumer = BatchConsumer(channel, self.sink, self.stats,
+                                         self.batch_size, self.batch_timeout,
+                                         self.tracer, self.analytics)
+                channel.basic_consume(queue=self.queue,
+                                      on_message_callback=consumer.on_message)
+                delay = self.min_reconnect_delay
+                while not self.stop_event.is_set():
+                    connection.process_data_events(
+                        time_limit=min(self.batch_timeout, 0.1))
+                    consumer.flush_if_expired()
+                consumer.flush()
+                connection.close()
+                logging.info(f"Consumer {index} stopped.")
+                return
+            except Exception as e:
+                # The unacknowledged batch is dropped, RabbitMQ delivers it
+                # again and the database ignores the readings it holds
+                logging.error(f"Error in consumer {index}, reconnecting in "
+                              f"{delay:.1f} s: {e}")
+                if connection is not None and connection.is_open:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+            if self.stop_event.wait(delay):
+                return
+            delay = min(delay * 2, self.max_reconnect_delay)
+            with self.stats.lock:
+                self.stats.reconnects += 1
+
+    def run_threads(self):
+        """
+        Creates and starts a thread for each consumer.
+        """
+        self.stop_event.clear()
+        for index in range(self.n_consumers):
+            thread = threading.Thread(target=self.run_consumer, args=(index,))
+            self.consumers_threads.append(thread)
+            thread.start()
+
+    def stop_threads(self):
+        """
+        Stops the consumers after flushing their pending batches.
+        """
+        self.stop_event.set()
+        for thread in self.consumers_threads:
+            thread.join()
+        self.consumers_threads.clear()
+        if self.tracer is not None:
+            self.tracer.flush()
+        logging.info("All consumers stopped.")
+
+def main():
+    parser = argparse.ArgumentParser(description="AMQP ingestion service")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5672)
+    parser.add_argument('--queue', default='mqtt_queue')
+    parser.add_argument('--path', default='data',
+                        help="Directory of the TimeSeriesDatabase where the "
+                             "readings are persisted, as the API")
+    parser.add_argument('--topic', action='append',
+                        help="MQTT topic filter bound to the queue, can be "
+                             "repeated. Defaults to simulated_sensors/#")
+    parser.add_argument('--consumers', type=int, default=4)
+    parser.add_argument('--prefetch', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--batch-timeout', type=float, default=0.5)
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    parser.add_argument('--trace-file', default=None,
+                        help="File where the stages of traced readings "
+                             "are stamped")
+    parser.add_argument('--alerts-broker', default=None,
+                        help="MQTT broker where the alerts of the anomaly "
+                             "detection are published. Without it, readings "
+                             "are not analysed")
+    parser.add_argument('--alerts-topic', default='alerts')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Imported here so the consumers do not need the API dependencies
+    from src.fastapi.app.database import TimeSeriesDatabase
+
+    database = TimeSeriesDatabase(args.path)
+    detector = publisher = None
+    if args.alerts_broker:
+        # Imported here so ingesting does not need paho
+        from src.rabbitmq.anomaly import AlertPublisher, AnomalyDetector
+
+        publisher = AlertPublisher(args.alerts_broker, args.alerts_topic,
+                                   client_id='anomaly_alerts')
+        publisher.connect()
+        detector = AnomalyDetector(publisher.publish_alert)
+        detector.start()
+    service = AMQPIngestionService(
+        database.write, host=args.host, port=args.port, queue=args.queue,
+        routing_key=[to_routing_key(topic) for topic in
+                     args.topic or ['simulated_sensors/#']],
+        consumers=args.consumers, prefetch=args.prefetch,
+        batch_size=args.batch_size, batch_timeout=args.batch_timeout,
+        tracer=Tracer(args.trace_file) if args.trace_file else None,
+        analytics=detector.observe if detector is not None else None)
+    service.run_threads()
+    last = service.stats.snapshot()
+    try:
+        while True:
+            time.sleep(args.report_interval)
+            stats = service.stats.snapshot()
+            rate = (stats['readings'] - last['readings']) / args.report_interval
+            logging.info(f"Ingest rate: {rate:.0f} readings/s, "
+                         f"messages: {stats['messages']}, "
+                         f"reconnects: {stats['reconnects']}, "
+                         f"lag p50: {stats['lag']['p50_ms']:.1f} ms, "
+                         f"p99: {stats['lag']['p99_ms']:.1f} ms")
+            last = stats
+    except KeyboardInterrupt:
+        logging.info("Stopping all consumers...")
+        service.stop_threads()
+        database.close()
+        if detector is not None:
+            detector.stop()
+            publisher.disconnect()
+            publisher.loop_stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import collections
+import json
+import logging
+import math
+import threading
+import time
+from typing import Callable
+
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+
+class SensorState:
+    """
+    Incremental statistics of one sensor, updated in O(1) per reading:
+    running mean and variance (Welford), exponentially weighted moving
+    average, last value for the rate of change and repeats, time of the
+    last reading for the watchdog, and active alerts as a bit mask.
+    """
+
+    __slots__ = ('type', 'period', 'count', 'mean', 'm2', 'ewma',
+                 'last_value', 'last_timestamp', 'repeats', 'seen', 'active')
+
+    def __init__(self, sensor_type: str, period: float):
+        self.type = sensor_type
+        self.period = period
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = 0.0
+        self.last_value = None
+        self.last_timestamp = -math.inf
+        self.repeats = 0
+        self.seen = 0.0
+        self.active = 0
+
+    @property
+    def std(self) -> float:
+        """
+        Sample standard deviation of the values seen.
+        """
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+class AnomalyDetector:
+    """
+    Streaming anomaly detection over the readings of the ingestion path,
+    without queries to the storage. Each sensor keeps a SensorState and
+    raises an alert when:
+        outlier: a value is more than z_threshold standard deviations
+            away from the mean of the sensor
+        drift: the EWMA of the sensor is more than drift_threshold
+            standard deviations away from its long-run mean
+        rate: the value changes faster than max_rate of its type per
+            second
+        stuck: the same value is repeated stuck_readings times in a row
+        silent: no reading arrived in silent_periods times the period
+            of the sensor (checked by the watchdog, see start)
+
+    An alert is raised once when its condition starts, and again only
+    after it has cleared. Outlier and drift alerts need min_readings
+    readings of the sensor first.
+
+    Readings may be observed from several consumer threads. Readings
+    older than the last one of their sensor only update its mean and
+    variance, so batches consumed out of order do not look like jumps.
+    """
+
+    kinds = ('outlier', 'drift', 'rate', 'stuck', 'silent')
+
+    def __init__(self, alert: Callable[[dict], None] = None,
+                 z_threshold: float = 4.0, ewma_alpha: float = 0.1,
+                 drift_threshold: float = 1.5,
+                 max_rate: dict[str, float] = None, stuck_readings: int = 10,
+                 silent_periods: float = 3.0, min_readings: int = 30,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            alert (optional): Function called with each alert, a dict with
+                the id, type, kind, value, timestamp and detail of the
+                reading that raised it. Defaults to logging them only
+            z_threshold: Standard deviations of an outlier (default: 4)
+            ewma_alpha: Weight of each reading in the EWMA (default: 0.1)
+            drift_threshold: Standard deviations between the EWMA and
+                the mean of a drift (default: 1.5)
+            max_rate (optional): Maximum change per second of each sensor
+                type, e.g. {'temperature': 5}. Defaults to no rate alerts
+            stuck_readings: Identical readings of a stuck sensor, 0
+                disables stuck alerts (default: 10)
+            silent_periods: Periods without readings of a silent sensor
+                (default: 3)
+            min_readings: Readings of a sensor before outlier and drift
+                alerts (default: 30)
+            clock: Clock of the arrival times, in seconds
+        """
+        if not 0 < ewma_alpha <= 1:
+            raise ValueError("EWMA alpha must be between 0 and 1.")
+        self.alert = alert
+        self.z_threshold = z_threshold
+        self.ewma_alpha = ewma_alpha
+        self.drift_threshold = drift_threshold
+        self.max_rate = max_rate or {}
+        self.stuck_readings = stuck_readings
+        self.silent_periods = silent_periods
+        self.min_readings = max(min_readings, 2)
+        self.clock = clock
+        self.sensors = {}
+        self.alert_counts = collections.Counter()
+        self._bits = {kind: 1 << i for i, kind in enumerate(self.kinds)}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._watchdog = None
+
+    def observe(self, readings: list[dict]):
+        """
+        Updates the state of the sensors with a batch of readings and
+        raises the alerts they trigger. It can be used as the analytics
+        stage of AMQPIngestionService.
+        """
+        now = self.clock()
+        sensors = self.sensors
+        z_threshold, drift_threshold = self.z_threshold, self.drift_threshold
+        alpha, min_readings = self.ewma_alpha, self.min_readings
+        max_rate, stuck_readings = self.max_rate, self.stuck_readings
+        outlier, drift, rate, stuck, silent = (
+            self._bits[kind] for kind in self.kinds)
+        alerts = []
+        with self._lock:
+            for reading in readings:
+                id = reading['id']
+                value = reading['value']
+                state = sensors.get(id)
+                if state is None:
+                    state = sensors[id] = SensorState(reading['type'],
+                                                      reading['period'])
+                state.period = reading['period']
+                state.seen = now
+                active = state.active & ~silent
+
+                # Outlier against the stats before the value, drift of the
+                # EWMA after it
+                n, mean = state.count, state.mean
+                ewma = value if n == 0 else \
+                    state.ewma + alpha * (value - state.ewma)
+                if n >= min_readings:
+                    std = math.sqrt(state.m2 / (n - 1))
+                    if std > 0 and abs(value - mean) > z_threshold * std:
+                        if not active & outlier:
+                            active |= outlier
+                            alerts.append((reading, 'outlier',
+                                           f"{abs(value - mean) / std:.1f} "
+                                           f"standard deviations from the "
+                                           f"mean {mean:.2f}"))
+                    else:
+                        active &= ~outlier
+                    if std > 0 and abs(ewma - mean) > drift_threshold * std:
+                        if not active & drift:
+                            active |= drift
+                            alerts.append((reading, 'drift',
+                                           f"EWMA {ewma:.2f} away from the "
+                                           f"mean {mean:.2f}"))
+                    else:
+                        active &= ~drift
+
+                # Welford update
+                n += 1
+                delta = value - mean
+                mean += delta / n
+                state.m2 += delta * (value - mean)
+                state.count, state.mean, state.ewma = n, mean, ewma
+
+                timestamp = reading['timestamp']
+                if timestamp > state.last_timestamp:
+                    last_value = state.last_value
+                    limit = max_rate.get(state.type)
+                    if limit is not None and last_value is not None:
+                        change = abs(value - last_value) / \
+                            (timestamp - state.last_timestamp)
+                        if change > limit:
+                            if not active & rate:
+                                active |= rate
+                                alerts.append((reading, 'rate',
+                                               f"changed {change:.2f}/s"))
+                        else:
+                            active &= ~rate
+                    if value == last_value:
+                        state.repeats += 1
+                        if stuck_readings and \
+                                state.repeats + 1 >= stuck_readings \
+                                and not active & stuck:
+                            active |= stuck
+                            alerts.append((reading, 'stuck',
+                                           f"same value {state.repeats + 1} "
+                                           f"times"))
+                    else:
+                        state.repeats = 0
+                        active &= ~stuck
+                    state.last_value, state.last_timestamp = value, timestamp
+                state.active = active
+        for reading, kind, detail in alerts:
+            self._raise(reading['id'], reading['type'], kind, reading['value'],
+                        reading['timestamp'], detail)
+
+    def check_silent(self):
+        """
+        Raises a silent alert for every sensor without readings in
+        silent_periods of its period. A silent sensor is cleared by its
+        next reading.
+        """
+        now = self.clock()
+        silent = self._bits['silent']
+        alerts = []
+        with self._lock:
+            for id, state in self.sensors.items():
+                if not state.active & silent and \
+                        now - state.seen > self.silent_periods * state.period:
+                    state.active |= silent
+                    alerts.append((id, state, now - state.seen))
+        for id, state, elapsed in alerts:
+            self._raise(id, state.type, 'silent', state.last_value,
+                        state.last_timestamp,
+                        f"no readings for {elapsed:.1f} s")
+
+    def _raise(self, id: int, sensor_type: str, kind: str, value: float,
+               timestamp: float, detail: str):
+        self.alert_counts[kind] += 1
+        alert = {'id': id, 'type': sensor_type, 'kind': kind, 'value': value,
+                 'timestamp': timestamp, 'detail': detail}
+        logging.warning(f"Sensor {id} {kind} alert: {detail}")
+        if self.alert is not None:
+            try:
+                self.alert(alert)
+            except Exception as e:
+                logging.error(f"Error sending {kind} alert of sensor {id}: {e}")
+
+    def get_stats(self) -> dict:
+        """
+        Returns the number of sensors tracked, of active alerts and of
+        alerts raised of each kind.
+        """
+        with self._lock:
+            active = collections.Counter(
+                kind for state in self.sensors.values()
+                for kind, bit in self._bits.items() if state.active & bit)
+            return {'sensors': len(self.sensors),
+                    'active': {kind: active[kind] for kind in self.kinds},
+                    'raised': {kind: self.alert_counts[kind]
+                               for kind in self.kinds}}
+
+    def _run_watchdog(self, interval: float):
+        while not self._stop_event.wait(interval):
+            self.check_silent()
+
+    def start(self, interval: float = 1.0):
+        """
+        Starts the watchdog thread that checks for silent sensors.
+
+        Args:
+            interval: Seconds between two checks (default: 1)
+        """
+        self._stop_event.clear()
+        self._watchdog = threading.Thread(
+            target=self._run_watchdog, args=(interval,), daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+class AlertPublisher(MQTTClientBase):
+    """
+    MQTT client that publishes the alerts of an AnomalyDetector as JSON
+    to '<topic>/<kind>/<sensor id>'.
+    """
+
+    def __init__(self, broker: str, topic: str = "alerts", qos: int = 1,
+                 **kwargs):
+        """
+        Args:
+            broker: MQTT broker address
+            topic: Prefix of the alert topics (default: 'alerts')
+            qos: QoS of the alerts (default: 1)
+            kwargs: Other arguments of MQTTClientBase
+        """
+        super().__init__(broker, **kwargs)
+        self.topic = topic
+        self.qos = qos
+
+    def on_publish(self, client, userdata, mid):
+        pass
+
+    def publish_alert(self, alert: dict):
+        self.publish(f"{self.topic}/{alert['kind']}/{alert['id']}",
+                     json.dumps(alert), self.qos)
@@ -0,0 +1,356 @@
+import asyncio
+import collections
+import logging
+import time
+
+import paho.mqtt.client as mqtt
+
+class AsyncMQTTClientBase:
+    """
+    asyncio version of MQTTClientBase. The paho client is driven by the
+    running event loop through its socket callbacks instead of a
+    loop_start() background thread, so publish acknowledgements can be
+    awaited and the number of in-flight messages is bounded.
+
+    When the connection is lost, it reconnects with exponential backoff
+    and subscribes again to its topics. Publishing while disconnected
+    fails right away, so nothing is queued in paho during an outage.
+
+    The callbacks (on_connect, on_disconnect, on_message, on_subscribe,
+    on_publish) have the same signatures as in MQTTClientBase and are
+    called from the event loop.
+    """
+
+    def __init__(self, broker: str, port: int = 1883, client_id: str = None,
+                 keepalive: int = 60, max_inflight: int = 100,
+                 max_received: int = 1000, min_reconnect_delay: float = 1,
+                 max_reconnect_delay: float = 60):
+        """
+        Initialize the asyncio MQTT client.
+
+        Args:
+            broker: MQTT broker address
+            port: MQTT broker port (default: 1883)
+            client_id: Unique client ID (default: None - auto-generated)
+            keepalive: Keepalive interval in seconds (default: 60)
+            max_inflight: Maximum number of published messages waiting for
+                acknowledgement. Publishing beyond it waits (default: 100)
+            max_received: Maximum number of received messages buffered for
+                async iteration. Reading from the socket is paused while
+                the buffer is full. Messages are only buffered while a
+                messages() iterator is active (default: 1000)
+            min_reconnect_delay: First reconnection delay in seconds. It
+                doubles on each failed attempt (default: 1)
+            max_reconnect_delay: Maximum reconnection delay in seconds
+                (default: 60)
+        """
+        self.broker = broker
+        self.port = port
+        self.client_id = client_id or f"mqtt_client_{int(time.time())}"
+        self.keepalive = keepalive
+        self.max_inflight = max_inflight
+        self.max_received = max_received
+        self.min_reconnect_delay = min_reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.reconnects = 0
+
+        self.client = mqtt.Client(
+            callback_api_version    = mqtt.CallbackAPIVersion.VERSION1,
+            client_id               = self.client_id,
+            clean_session           = True,
+            userdata                = None,
+            protocol                = mqtt.MQTTv311,
+            transport               = 'tcp',
+            )
+        self.client.max_inflight_messages_set(max_inflight)
+
+        self.client.on_connect = self._handle_connect
+        self.client.on_disconnect = self._handle_disconnect
+        self.client.on_message = self._handle_message
+        self.client.on_subscribe = self.on_subscribe
+        self.client.on_publish = self._handle_publish
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        self._loop = None
+        self._misc_task = None
+        self._connected = None
+        self._inflight = asyncio.Semaphore(max_inflight)
+        self._pending = {}
+        self._early_acks = set()
+        self._received = collections.deque()
+        self._received_event = asyncio.Event()
+        self._reading_paused = False
+        self._iterators = 0
+        self._socket = None
+        self._subscriptions = {}
+        self._connect_timeout = 10.0
+        self._reconnect_task = None
+        self._closing = False
+
+        logging.basicConfig(level=logging.INFO)
+        self.logger = logging.getLogger(__name__)
+
+    # Callback surface, same as MQTTClientBase
+
+    def on_connect(self, client, userdata, flags, rc):
+        """
+        Callback when the client connects to the broker.
+        """
+        if rc == 0:
+            self.logger.info("Connected to MQTT Broker successfully.")
+        else:
+            self.logger.error(f"Failed to connect, return code {rc}")
+
+    def on_disconnect(self, client, userdata, rc):
+        """
+        Callback when the client disconnects from the broker.
+        """
+        self.logger.info("Disconnected from MQTT Broker.")
+
+    def on_message(self, client, userdata, message):
+        """
+        Callback when a message is received.
+        """
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(f"Received message on {message.topic}: {message.payload.decode()}")
+
+    def on_subscribe(self, client, userdata, mid, granted_qos):
+        """
+        Callback when a subscription is successful.
+        """
+        self.logger.info(f"Subscribed successfully, MID: {mid}, QoS: {granted_qos}")
+
+    def on_publish(self, client, userdata, mid):
+        """
+        Callback when a message is published. Acks are logged at DEBUG.
+        """
+        self.logger.debug("Message published successfully, MID: %s", mid)
+
+    # Internal paho callbacks
+
+    def _handle_connect(self, client, userdata, flags, rc):
+        if self._connected is not None and not self._connected.done():
+            if rc == 0:
+                self._connected.set_result(True)
+            else:
+                self._connected.set_exception(
+                    ConnectionError(f"Failed to connect, return code {rc}"))
+        self.on_connect(client, userdata, flags, rc)
+
+    def _handle_disconnect(self, client, userdata, rc):
+        error = ConnectionError("Disconnected before acknowledgement.")
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        # Mids are reused after a reconnection, and paho must not send
+        # again the messages whose publish already failed
+        self._early_acks.clear()
+        with client._out_message_mutex:
+            client._out_messages.clear()
+        self.on_disconnect(client, userdata, rc)
+
+    def _handle_publish(self, client, userdata, mid):
+        future = self._pending.pop(mid, None)
+        if future is None:
+            self._early_acks.add(mid)
+        elif not future.done():
+            future.set_result(mid)
+        self.on_publish(client, userdata, mid)
+
+    def _handle_message(self, client, userdata, message):
+        # Without an iterator nothing drains the buffer, and pausing the
+        # reads would also stop the publish acknowledgements
+        if self._iterators:
+            self._received.append(message)
+            self._received_event.set()
+            if len(self._received) >= self.max_received and \
+                    not self._reading_paused:
+                self._loop.remove_reader(self._socket)
+                self._reading_paused = True
+        self.on_message(client, userdata, message)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._socket = sock
+        self._loop.add_reader(sock, client.loop_read)
+        self._misc_task = self._loop.create_task(self._misc_loop())
+
+    def _resume_reading(self):
+        if self._reading_paused:
+            self._reading_paused = False
+            if self._socket is not None:
+                self._loop.add_reader(self._socket, self.client.loop_read)
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._loop.remove_reader(sock)
+        self._loop.remove_writer(sock)
+        self._reading_paused = False
+        self._socket = None
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+        if not self._closing and (self._reconnect_task is None
+                                  or self._reconnect_task.done()):
+            self._reconnect_task = self._loop.create_task(
+                self._reconnect_loop())
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._loop.add_writer(sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._loop.remove_writer(sock)
+
+    async def _misc_loop(self):
+        """
+        Runs paho periodic tasks (keepalive pings and retries).
+        """
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    async def _reconnect_loop(self):
+        """
+        Reconnects with exponential backoff until connected or closed,
+        and subscribes again to the topics of the lost session.
+        """
+        delay = self.min_reconnect_delay
+        while not self._closing:
+            await asyncio.sleep(delay)
+            if self._closing:
+                return
+            self._connected = self._loop.create_future()
+            try:
+                self.client.reconnect()
+                await asyncio.wait_for(self._connected,
+                                       self._connect_timeout)
+            except (OSError, ConnectionError, asyncio.TimeoutError) as e:
+                self.logger.warning(
+                    f"Reconnection to {self.broker}:{self.port} failed, "
+                    f"retrying in {delay:.1f} s: {e}")
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            self.reconnects += 1
+            for topic, qos in self._subscriptions.items():
+                self.client.subscribe(topic, qos)
+            return
+
+    # Public API
+
+    @property
+    def inflight(self) -> int:
+        """
+        Number of published messages waiting for acknowledgement.
+        """
+        return len(self._pending)
+
+    async def connect(self, timeout: float = 10.0):
+        """
+        Connect to the MQTT broker and wait for the connection
+        acknowledgement.
+
+        Args:
+            timeout: Seconds to wait for the connection acknowledgement
+        """
+        self._loop = asyncio.get_running_loop()
+        self._closing = False
+        self._connect_timeout = timeout
+        self._connected = self._loop.create_future()
+        self.client.connect(self.broker, self.port, self.keepalive)
+        logging.info(f"Connecting to broker...")
+        logging.info(f"Broker: {self.broker}, Port: {self.port}, Client_id: {self.client_id}, Keepalive: {self.keepalive}")
+        await asyncio.wait_for(self._connected, timeout)
+
+    async def disconnect(self):
+        """
+        Disconnect from the MQTT broker and stop reconnecting.
+        """
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        self.client.disconnect()
+        await asyncio.sleep(0)
+
+    def subscribe(self, topic: str, qos: int = 0):
+        """
+        Subscribe to a topic, again after every reconnection.
+        """
+        self._subscriptions[topic] = qos
+        self.client.subscribe(topic, qos)
+
+    def unsubscribe(self, topic: str):
+        """
+        Unsubscribe from a topic.
+        """
+        self._subscriptions.pop(topic, None)
+        self.client.unsubscribe(topic)
+
+    async def publish(self, topic: str, payload: str | bytes, qos: int = 0,
+                      retain: bool = False) -> int:
+        """
+        Publish a message to a topic and wait until it is acknowledged by
+        the broker (QoS 1 and 2) or written to the socket (QoS 0). Waits
+        first for a free slot when max_inflight messages are pending.
+
+        Returns:
+            Message id of the published message
+        """
+        async with self._inflight:
+            future = self.publish_nowait(topic, payload, qos, retain)
+            return await future
+
+    def publish_nowait(self, topic: str, payload: str | bytes,
+                             qos: int = 0, retain: bool = False
+                             ) -> asyncio.Future:
+        """
+        Publish a message to a topic without waiting for the
+        acknowledgement. The in-flight window is not applied. It fails
+        with ConnectionError while disconnected.
+
+        Returns:
+            Future that resolves to the message id when acknowledged
+        """
+        future = asyncio.get_running_loop().create_future()
+        if not self.client.is_connected():
+            future.set_exception(ConnectionError(
+                "Publish failed: not connected to the broker."))
+            return future
+        info = self.client.publish(topic, payload, qos, retain)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            future.set_exception(ConnectionError(
+                f"Publish failed: {mqtt.error_string(info.rc)}"))
+        elif info.mid in self._early_acks:
+            self._early_acks.discard(info.mid)
+            future.set_result(info.mid)
+        else:
+            self._pending[info.mid] = future
+        return future
+
+    async def messages(self):
+        """
+        Async iterator over received messages:
+        > async for message in client.messages(): ...
+
+        Messages received while no iterator is active are only passed to
+        on_message.
+        """
+        self._iterators += 1
+        try:
+            while True:
+                while not self._received:
+                    self._received_event.clear()
+                    await self._received_event.wait()
+                message = self._received.popleft()
+                if len(self._received) < self.max_received:
+                    self._resume_reading()
+                yield message
+        finally:
+            self._iterators -= 1
+            if not self._iterators:
+                self._received.clear()
+                self._resume_reading()
+
+    def __aiter__(self):
+        return self.messages()
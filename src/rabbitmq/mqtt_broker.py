@@ -0,0 +1,447 @@
+"""
+Lightweight MQTT 3.1.1 broker served by an asyncio loop, to run the
+simulator and the MQTT consumers end to end without RabbitMQ, e.g. in
+integration and performance tests.
+
+Usage:
+> python3 -m src.rabbitmq.mqtt_broker --port 1883 --latency 0.005 --loss 0.01
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import struct
+import threading
+import time
+
+from src.rabbitmq.topic_router import TopicRouter
+from src.sensors.logs import RateSummary
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+def encode_length(length: int) -> bytes:
+    """
+    Encodes the remaining length of an MQTT packet.
+    """
+    encoded = bytearray()
+    while True:
+        length, byte = divmod(length, 128)
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+def _string(data: bytes, offset: int) -> tuple[str, int]:
+    length = struct.unpack_from("!H", data, offset)[0]
+    offset += 2
+    return data[offset:offset + length].decode(), offset + length
+
+class Session:
+    """
+    Connection of a client to the broker: its writer, subscriptions and
+    the packet ids of the messages delivered to it with QoS 1.
+    """
+
+    __slots__ = ('client_id', 'writer', 'subscriptions', 'packet_ids')
+
+    def __init__(self, client_id: str, writer: asyncio.StreamWriter):
+        self.client_id = client_id
+        self.writer = writer
+        self.subscriptions = {}
+        self.packet_ids = itertools.cycle(range(1, 65536))
+
+    def send(self, packet: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(packet)
+
+class MQTTBroker:
+    """
+    Minimal MQTT 3.1.1 broker: connections, QoS 0 and 1 publications,
+    subscriptions with '+' and '#' wildcards, unsubscriptions and pings.
+    A message is delivered once to each subscribed client, with the
+    highest QoS of its matching subscriptions, limited to the QoS of the
+    publication.
+
+    Sessions are not persistent, retained messages are not stored and
+    QoS 1 deliveries are not retried. QoS 2 publications close the
+    connection, and QoS 2 subscriptions are granted QoS 1.
+
+    Latency and loss can be injected: every acknowledgement of a
+    publication and every delivery is delayed by latency plus a uniform
+    jitter, and each delivery is dropped with the loss probability.
+    With jitter, messages may be delivered out of order.
+    Messages received, delivered and dropped are counted per client id
+    by a RateSummary, which reports the broker-side rates.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 latency: float = 0.0, jitter: float = 0.0,
+                 loss: float = 0.0, report_interval: float = 0,
+                 seed: int = None):
+        """
+        Args:
+            host: Address the broker listens on (default: 127.0.0.1)
+            port: Port the broker listens on, 0 for a free one
+            latency: Seconds added to acknowledgements and deliveries
+            jitter: Maximum random seconds added to the latency
+            loss: Probability of dropping each delivery, between 0 and 1
+            report_interval: Seconds between two logs of the message
+                rates, 0 to only report them with report()
+            seed (optional): Seed of the random latency and loss
+        """
+        if latency < 0 or jitter < 0:
+            raise ValueError("Latency and jitter must be greater or equal "
+                             "than 0.")
+        if not 0 <= loss <= 1:
+            raise ValueError("Loss must be between 0 and 1.")
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.report_interval = report_interval
+        self.summary = RateSummary(("received", "delivered", "dropped"),
+                                   interval=report_interval)
+        self.sessions = {}
+        self.router = TopicRouter()
+        self.received = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.bytes_received = 0
+        self._random = random.Random(seed)
+        self._client_ids = itertools.count(1)
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def on_message(self, session: Session, topic: str, payload: bytes,
+                   qos: int):
+        """
+        Called with every publication received, before it is delivered.
+        Subclasses can override it, e.g. to decode or record payloads.
+        """
+        pass
+
+    def _delay(self) -> float:
+        if self.jitter:
+            return self.latency + self._random.uniform(0, self.jitter)
+        return self.latency
+
+    def _send(self, session: Session, packet: bytes):
+        delay = self._delay()
+        if delay:
+            self._loop.call_later(delay, session.send, packet)
+        else:
+            session.send(packet)
+
+    def _publish(self, sender: Session, topic: str, payload: bytes, qos: int):
+        self.received += 1
+        self.bytes_received += len(payload)
+        self.summary.count("received", sender.client_id)
+        self.on_message(sender, topic, payload, qos)
+        # A client with overlapping subscriptions gets one copy, with the
+        # highest QoS
+        targets = {}
+        for session, sub_qos in self.router.match(topic):
+            if sub_qos >= targets.get(session, 0):
+                targets[session] = sub_qos
+        encoded_topic = topic.encode()
+        for session, sub_qos in targets.items():
+            if self.loss and self._random.random() < self.loss:
+                self.dropped += 1
+                self.summary.count("dropped", session.client_id)
+                continue
+            out_qos = min(qos, sub_qos)
+            body = struct.pack("!H", len(encoded_topic)) + encoded_topic
+            if out_qos:
+                body += struct.pack("!H", next(session.packet_ids))
+            body += payload
+            self._send(session, bytes([PUBLISH << 4 | out_qos << 1])
+                       + encode_length(len(body)) + body)
+            self.delivered += 1
+            self.summary.count("delivered", session.client_id)
+
+    def _connect(self, body: bytes, writer: asyncio.StreamWriter
+                 ) -> Session | None:
+        protocol, offset = _string(body, 0)
+        level = body[offset]
+        if protocol not in ("MQTT", "MQIsdp") or level not in (3, 4):
+            # Unacceptable protocol version
+            writer.write(bytes([CONNACK << 4, 2, 0, 1]))
+            return None
+        client_id, _ = _string(body, offset + 4)
+        if not client_id:
+            client_id = f"auto-{next(self._client_ids)}"
+        previous = self.sessions.get(client_id)
+        if previous is not None:
+            # Takeover: the previous connection of the client id is closed
+            logging.info(f"Client {client_id} connected again, closing "
+                         f"its previous connection")
+            self._close(previous)
+        session = self.sessions[client_id] = Session(client_id, writer)
+        writer.write(bytes([CONNACK << 4, 2, 0, 0]))
+        logging.debug(f"Client {client_id} connected")
+        return session
+
+    def _subscribe(self, session: Session, body: bytes):
+        packet_id, offset = body[:2], 2
+        granted = bytearray()
+        while offset < len(body):
+            topic_filter, offset = _string(body, offset)
+            qos = min(body[offset] & 0x03, 1)
+            offset += 1
+            if topic_filter in session.subscriptions:
+                self.router.remove(topic_filter, session.subscriptions[
+                    topic_filter])
+            try:
+                self.router.add(topic_filter, (session, qos))
+            except ValueError:
+                session.subscriptions.pop(topic_filter, None)
+                granted.append(0x80)
+                continue
+            session.subscriptions[topic_filter] = (session, qos)
+            granted.append(qos)
+        session.send(bytes([SUBACK << 4]) + encode_length(2 + len(granted))
+                     + packet_id + granted)
+
+    def _unsubscribe(self, session: Session, body: bytes):
+        offset = 2
+        while offset < len(body):
+            topic_filter, offset = _string(body, offset)
+            handler = session.subscriptions.pop(topic_filter, None)
+            if handler is not None:
+                self.router.remove(topic_filter, handler)
+        session.send(bytes([UNSUBACK << 4, 2]) + body[:2])
+
+    def _close(self, session: Session):
+        for topic_filter, handler in session.subscriptions.items():
+            self.router.remove(topic_filter, handler)
+        session.subscriptions.clear()
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+        session.writer.close()
+
+    def _handle_packet(self, session: Session | None, header: int,
+                       body: bytes, writer: asyncio.StreamWriter
+                       ) -> Session | None:
+        """
+        Handles one packet of a connection.
+
+        Returns:
+            Session of the connection, None to close it
+        """
+        kind = header >> 4
+        if session is None:
+            return self._connect(body, writer) if kind == CONNECT else None
+        if kind == PUBLISH:
+            qos = (header >> 1) & 0x03
+            topic, offset = _string(body, 0)
+            if qos == 1:
+                self._send(session, bytes([PUBACK << 4, 2])
+                           + body[offset:offset + 2])
+                offset += 2
+            elif qos:
+                logging.warning(f"Client {session.client_id} published with "
+                                f"QoS {qos}, closing its connection")
+                return None
+            self._publish(session, topic, body[offset:], qos)
+        elif kind == PUBACK:
+            pass
+        elif kind == SUBSCRIBE:
+            self._subscribe(session, body)
+        elif kind == UNSUBSCRIBE:
+            self._unsubscribe(session, body)
+        elif kind == PINGREQ:
+            session.send(bytes([PINGRESP << 4, 0]))
+        elif kind == DISCONNECT:
+            return None
+        else:
+            logging.warning(f"Unexpected packet type {kind} from client "
+                            f"{session.client_id}, closing its connection")
+            return None
+        return session
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter):
+        """
+        Reads the packets of a connection in chunks and handles every
+        complete packet of a chunk before waiting for the next one.
+        """
+        session = None
+        buffer = bytearray()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer += data
+                offset = 0
+                while True:
+                    # Fixed header: type and flags, then 1 to 4 bytes of
+                    # remaining length
+                    start = offset + 1
+                    length, shift, end = 0, 0, start
+                    while end < len(buffer) and end - start < 4:
+                        byte = buffer[end]
+                        length |= (byte & 0x7F) << shift
+                        shift += 7
+                        end += 1
+                        if not byte & 0x80:
+                            break
+                    else:
+                        break
+                    if end + length > len(buffer):
+                        break
+                    handled = self._handle_packet(
+                        session, buffer[offset], bytes(buffer[end:end + length]),
+                        writer)
+                    if handled is None:
+                        return
+                    session = handled
+                    offset = end + length
+                del buffer[:offset]
+                await writer.drain()
+        except (ConnectionError, UnicodeDecodeError, IndexError,
+                struct.error) as e:
+            logging.info(f"Connection of client "
+                            f"{session.client_id if session else None} "
+                            f"closed: {e!r}")
+        finally:
+            if session is not None:
+                self._close(session)
+            else:
+                writer.close()
+
+    def get_stats(self) -> dict:
+        """
+        Returns the connected clients, subscriptions and the messages
+        received, delivered and dropped since the broker started.
+        """
+        return {
+            'clients': len(self.sessions),
+            'subscriptions': len(self.router),
+            'received': self.received,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'bytes_received': self.bytes_received,
+        }
+
+    def report(self) -> dict:
+        """
+        Logs and returns the rates of messages received, delivered and
+        dropped since the previous report, see RateSummary.report.
+        """
+        return self.summary.report()
+
+    async def start_async(self) -> int:
+        """
+        Starts serving on the running event loop, e.g. next to an
+        AsyncSensorSimulator or inside an asyncio test. Stop it with
+        stop_async.
+
+        Returns:
+            Port the broker listens on
+        """
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host,
+                                                  self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.report_interval:
+            self.summary.start()
+        logging.info(f"MQTT broker listening on {self.host}:{self.port}")
+        return self.port
+
+    async def stop_async(self):
+        """
+        Closes every connection and stops serving, when started with
+        start_async.
+        """
+        if self._loop is None:
+            return
+        self.summary.stop()
+        await self._shutdown()
+        self._loop = None
+
+    async def _shutdown(self):
+        self._server.close()
+        for session in list(self.sessions.values()):
+            self._close(session)
+        await self._server.wait_closed()
+
+    def start(self) -> int:
+        """
+        Starts serving in a background thread, with its own event loop.
+
+        Returns:
+            Port the broker listens on
+        """
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(self.start_async())
+        self._thread = threading.Thread(target=loop.run_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self.port
+
+    def stop(self):
+        """
+        Closes every connection and stops serving, when started with start.
+        """
+        if self._loop is None:
+            return
+        if self._thread is None:
+            raise RuntimeError(
+                "Broker started with start_async, stop it with stop_async.")
+        self.summary.stop()
+        loop = self._loop
+        asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join()
+        self._thread = None
+        loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    async def __aenter__(self):
+        await self.start_async()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop_async()
+
+def main():
+    parser = argparse.ArgumentParser(description="Lightweight MQTT broker")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds added to acknowledgements and "
+                             "deliveries")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Maximum random seconds added to the latency")
+    parser.add_argument('--loss', type=float, default=0.0,
+                        help="Probability of dropping each delivery")
+    parser.add_argument('--report-interval', type=float, default=5.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    broker = MQTTBroker(args.host, args.port, args.latency, args.jitter,
+                        args.loss, args.report_interval)
+    broker.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.stop()
+        logging.info(f"Broker stats: {broker.get_stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,13 @@
 import paho.mqtt.client as mqtt
+import collections
 import logging
+import threading
 import time
+from typing import Callable
+
+from src.rabbitmq.outbox import Outbox
+from src.rabbitmq.topic_router import TopicRouter
+from src.sensors.metrics import MetricsRegistry
 
 class MQTTClientBase:
     """
@@ -8,7 +15,13 @@ class MQTTClientBase:
     This class can be inherited by other classes to extend its functionality.
     """
 
-    def __init__(self, broker: str, port: int = 1883, client_id: str = None, keepalive: int = 60):
+    queue_policies = ('block', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, broker: str, port: int = 1883, client_id: str = None, keepalive: int = 60,
+                 max_inflight: int = 20, max_queued: int = 1000,
+                 queue_policy: str = "block", block_timeout: float = 1.0,
+                 metrics: MetricsRegistry = None, outbox: Outbox = None,
+                 outbox_rate: float = 0):
         """
         Initialize the MQTT client.
 
@@ -17,36 +30,90 @@ class MQTTClientBase:
             port: MQTT broker port (default: 1883)
             client_id: Unique client ID (default: None - auto-generated)
             keepalive: Keepalive interval in seconds (default: 60)
+            max_inflight: Maximum number of published messages waiting for
+                acknowledgement (default: 20)
+            max_queued: Maximum number of messages waiting for a free 
+                in-flight slot (default: 1000)
+            queue_policy: What publish does when the outbound queue is 
+                full: 'block' waits for a free slot up to block_timeout
+                and then drops the new message, 'drop_oldest' discards
+                the oldest queued message and 'drop_newest' discards the
+                new message (default: 'block')
+            block_timeout: Seconds publish waits with the 'block' policy.
+                None waits forever (default: 1.0)
+            metrics (optional): Registry where the client records its
+                metrics, labelled with its client id: publish counters,
+                in-flight and queue depth, connections, and publish and
+                ack latency histograms. Defaults to no metrics
+            outbox (optional): Outbox where messages are stored while the
+                client is not connected, see _drain_outbox. Defaults to
+                no outbox: messages wait in the outbound queue and paho
+            outbox_rate (optional): Maximum messages per second sent from
+                the outbox once reconnected. Defaults to 0, as fast as
+                the in-flight window allows
         """
+        if queue_policy not in self.queue_policies:
+            raise ValueError(
+                f"Queue policy must be one of: {self.queue_policies}")
         self.broker = broker
         self.port = port
         self.client_id = client_id or f"mqtt_client_{int(time.time())}"
         self.keepalive = keepalive
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.queue_policy = queue_policy
+        self.block_timeout = block_timeout
+
+        self._outbound = collections.deque()
+        self._outbound_condition = threading.Condition()
+        self._inflight = 0
+        self._was_connected = False
+        self.publish_stats = {
+            'published': 0, 'queued': 0, 'acked': 0, 'dropped': 0, 'retried': 0,
+            'spilled': 0, 'drained': 0}
+        self.router = TopicRouter()
+        # Optional src.sensors.logs.RateSummary that counts acks per topic
+        self.summary = None
+        # Optional src.sensors.tracing.Tracer that stamps the acks of
+        # traced messages
+        self.tracer = None
+        # Topic, send time and trace ids of the messages waiting for their
+        # ack, and ack time of the ones acked before _send recorded them
+        self._sent = {}
+        self._early_acks = {}
+        self.outbox = outbox
+        self.outbox_rate = outbox_rate
+        # Publish stores messages in the outbox while disconnected, and
+        # until the outbox is drained so the order is kept
+        self._online = False
+        self._spilling = outbox is not None
+        self._spill_lock = threading.Lock()
+        self._drain_wake = threading.Event()
+        self._drain_stop = threading.Event()
+        self.metrics = metrics
+        self._publish_latency = None
+        self._ack_latency = None
+        if metrics is not None:
+            self._register_metrics(metrics)
         
-        self.client = mqtt.Client(
-            callback_api_version    = mqtt.CallbackAPIVersion.VERSION1,
-            client_id               = self.client_id, 
-            clean_session           = True,
-            userdata                = None,
-            protocol                = mqtt.MQTTv311,
-            transport               = 'tcp',
-            )
-        
-        self.client.on_connect = self.on_connect
-        self.client.on_disconnect = self.on_disconnect
-        self.client.on_message = self.on_message
-        self.client.on_subscribe = self.on_subscribe
-        self.client.on_publish = self.on_publish
+        self.client = self._create_client()
 
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
+
+        self._drainer = None
+        if outbox is not None:
+            self._drainer = threading.Thread(
+                target=self._drain_outbox, name=f"{self.client_id}_outbox",
+                daemon=True)
+            self._drainer.start()
     
     def on_connect(self, client, userdata, flags, rc):
         """
         Callback when the client connects to the broker.
         """
         if rc == 0:
-            self.logger.info("Connected to MQTT Broker successfully.\n")
+            self.logger.info("Connected to MQTT Broker successfully.")
         else:
             self.logger.error(f"Failed to connect, return code {rc}")
 
@@ -60,7 +127,8 @@ class MQTTClientBase:
         """
         Callback when a message is received.
         """
-        self.logger.info(f"Received message on {message.topic}: {message.payload.decode()}")
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(f"Received message on {message.topic}: {message.payload.decode()}")
 
     def on_subscribe(self, client, userdata, mid, granted_qos):
         """
@@ -70,10 +138,200 @@ class MQTTClientBase:
 
     def on_publish(self, client, userdata, mid):
         """
-        Callback when a message is published.
+        Callback when a message is published. Acks are logged at DEBUG,
+        use a RateSummary for their rates.
         """
-        self.logger.info(f"Message published successfully, MID: {mid}")
+        self.logger.debug("Message published successfully, MID: %s", mid)
     
+    def _create_client(self) -> mqtt.Client:
+        """
+        Creates the paho client of this connection.
+        """
+        client = mqtt.Client(
+            callback_api_version    = mqtt.CallbackAPIVersion.VERSION1,
+            client_id               = self.client_id, 
+            clean_session           = True,
+            userdata                = None,
+            protocol                = mqtt.MQTTv311,
+            transport               = 'tcp',
+            )
+        # Messages are bounded by the outbound queue, not by paho
+        client.max_inflight_messages_set(self.max_inflight)
+        client.max_queued_messages_set(0)
+        
+        client.on_connect = self._handle_connect
+        client.on_disconnect = self._handle_disconnect
+        client.on_message = self._handle_message
+        client.on_subscribe = self.on_subscribe
+        client.on_publish = self._handle_publish
+        return client
+
+    def _register_metrics(self, metrics: MetricsRegistry):
+        """
+        Registers the metrics of the client. Publish counters, in-flight
+        and queue depth are read from the client when collected, so only
+        the latency histograms cost time on publish.
+        """
+        client = self.client_id
+        stats = self.publish_stats
+        for name, help in (
+                ('published', "Messages handed to paho"),
+                ('queued', "Messages queued waiting for an in-flight slot"),
+                ('acked', "Messages acknowledged by the broker"),
+                ('dropped', "Messages dropped by the queue policy or lost"),
+                ('retried', "In-flight messages sent again after a reconnection"),
+                ('spilled', "Messages stored in the outbox"),
+                ('drained', "Messages sent from the outbox")):
+            metrics.counter(f"mqtt_{name}_total", help,
+                            function=lambda name=name: stats[name], client=client)
+        metrics.gauge("mqtt_inflight", "Messages waiting for their ack",
+                      function=lambda: self._inflight, client=client)
+        metrics.gauge("mqtt_queue_depth", "Messages in the outbound queue",
+                      function=lambda: len(self._outbound), client=client)
+        if self.outbox is not None:
+            metrics.gauge("mqtt_outbox_depth", "Messages in the outbox",
+                          function=lambda: len(self.outbox), client=client)
+        self._connected = metrics.gauge(
+            "mqtt_connected", "1 if the client is connected", client=client)
+        self._connects = metrics.counter(
+            "mqtt_connects_total", "Successful connections", client=client)
+        self._disconnects = metrics.counter(
+            "mqtt_disconnects_total", "Disconnections", client=client)
+        self._publish_latency = metrics.histogram(
+            "mqtt_publish_seconds", "Time spent in publish, including the "
+            "wait for an outbound queue slot", client=client)
+        self._ack_latency = metrics.histogram(
+            "mqtt_ack_seconds", "Time from sending a message to its ack",
+            client=client)
+
+    def _handle_connect(self, client, userdata, flags, rc):
+        """
+        Counts the in-flight messages that paho sends again after a 
+        reconnection and calls on_connect.
+        """
+        if rc == 0:
+            with self._outbound_condition:
+                if self._was_connected:
+                    self.publish_stats['retried'] += self._inflight
+                self._was_connected = True
+            if self.metrics is not None:
+                self._connects.inc()
+                self._connected.set(1)
+            self._online = True
+            self._drain_wake.set()
+        self.on_connect(client, userdata, flags, rc)
+
+    def _handle_disconnect(self, client, userdata, rc):
+        """
+        Records the disconnection and calls on_disconnect. With an
+        outbox, the next messages are stored in it.
+        """
+        self._online = False
+        if self.outbox is not None:
+            self._spilling = True
+        if self.metrics is not None:
+            self._disconnects.inc()
+            self._connected.set(0)
+        self.on_disconnect(client, userdata, rc)
+
+    def _handle_message(self, client, userdata, message):
+        """
+        Dispatches a message to the handlers of the filters matching its
+        topic, or to on_message if there is none.
+        """
+        handlers = self.router.match(message.topic)
+        if not handlers:
+            self.on_message(client, userdata, message)
+        for handler in handlers:
+            handler(client, userdata, message)
+
+    def _handle_publish(self, client, userdata, mid):
+        """
+        Releases the in-flight slot of an acknowledged message and calls
+        on_publish.
+        """
+        if not self._tracks_acks():
+            self._release_slot('acked')
+        else:
+            now = time.perf_counter_ns()
+            sent = self._release_slot('acked', mid, now)
+            if sent is not None:
+                self._record_ack(sent[0], now - sent[1], sent[2])
+        self.on_publish(client, userdata, mid)
+
+    def _tracks_acks(self) -> bool:
+        return self.summary is not None or self._ack_latency is not None \
+            or self.tracer is not None
+
+    def _record_ack(self, topic: str, latency_ns: int, trace=None):
+        if self.summary is not None:
+            self.summary.count('acks', topic)
+        if self._ack_latency is not None:
+            self._ack_latency.record_ns(latency_ns)
+        if trace is not None and self.tracer is not None:
+            self.tracer.stamp(trace, 'acked')
+
+    def _release_slot(self, counter: str, mid: int = None, now: int = None
+                      ) -> tuple | None:
+        """
+        Releases an in-flight slot, counting why, and sends the next 
+        queued message with it.
+
+        Args:
+            counter: Publish stat counted
+            mid (optional): Message id of an ack to match with its send,
+                under the same lock
+            now (optional): Ack time, in perf_counter_ns
+
+        Returns:
+            Topic, send time and trace of the acked message, None if it
+            was acked before _send recorded it
+        """
+        sent = None
+        with self._outbound_condition:
+            self.publish_stats[counter] += 1
+            if mid is not None:
+                sent = self._sent.pop(mid, None)
+                if sent is None:
+                    self._early_acks[mid] = now
+            message = self._outbound.popleft() if self._outbound else None
+            if message is None:
+                self._inflight -= 1
+            self._outbound_condition.notify()
+        if message is not None:
+            self._send(*message)
+        return sent
+
+    def _send(self, topic: str, payload: str | bytes, qos: int, retain: bool,
+              trace=None, sent: int = None):
+        """
+        Sends a message that already holds an in-flight slot. It must be
+        called without holding the outbound lock, since paho callbacks 
+        take it while holding paho internal locks.
+
+        Args:
+            trace (optional): Trace id or ids of the message, see publish
+            sent (optional): Send time in perf_counter_ns, when the caller
+                already read the clock
+        """
+        tracked = self._tracks_acks()
+        if tracked and sent is None:
+            sent = time.perf_counter_ns()
+        info = self.client.publish(topic, payload, qos, retain)
+        # QoS 0 messages are lost without connection and never acked
+        lost = info.rc == mqtt.MQTT_ERR_NO_CONN and qos == 0
+        acked = None
+        with self._outbound_condition:
+            self.publish_stats['published'] += 1
+            if tracked and not lost:
+                acked = self._early_acks.pop(info.mid, None)
+                if acked is None:
+                    self._sent[info.mid] = (topic, sent, trace)
+        if acked is not None:
+            self._record_ack(topic, max(acked - sent, 0), trace)
+        if lost:
+            self._release_slot('dropped')
+
     def connect(self):
         """
         Connect to the MQTT broker.
@@ -86,31 +344,190 @@ class MQTTClientBase:
 
         except Exception as e:
             logging.error(f"Broker connection failed. {type(e)}, {e}")
+            if self.outbox is not None:
+                # Messages go to the outbox while paho keeps retrying
+                self.client.connect_async(self.broker, self.port, self.keepalive)
+                self.client.loop_start()
 
     
     def disconnect(self):
         """
-        Disconnect from the MQTT broker.
+        Disconnect from the MQTT broker. The outbox, if any, is closed
+        and keeps its messages for the next run.
         """
         self.client.disconnect()
+        if self._drainer is not None:
+            self._drain_stop.set()
+            self._drain_wake.set()
+            self._drainer.join(5)
+            self._drainer = None
+            with self._spill_lock:
+                self.outbox.close()
     
-    def subscribe(self, topic: str, qos: int = 0):
+    def subscribe(self, topic: str, qos: int = 0, handler: Callable = None):
         """
         Subscribe to a topic.
+
+        Args:
+            topic: Topic filter, MQTT wildcards are allowed
+            qos: Subscription QoS (default: 0)
+            handler (optional): Function called as on_message with the
+                messages matching the filter, see add_handler
         """
+        if handler is not None:
+            self.add_handler(topic, handler)
         self.client.subscribe(topic, qos)
     
     def unsubscribe(self, topic: str):
         """
-        Unsubscribe from a topic.
+        Unsubscribe from a topic, removing its handlers.
         """
+        self.router.remove(topic)
         self.client.unsubscribe(topic)
+
+    def add_handler(self, topic: str, handler: Callable):
+        """
+        Routes the messages whose topic matches a filter to a handler,
+        called with (client, userdata, message) instead of on_message.
+        A message matching several filters is passed to each handler.
+        """
+        self.router.add(topic, handler)
+
+    def remove_handler(self, topic: str, handler: Callable = None):
+        """
+        Removes a handler of a filter, or all of them if none is given.
+        """
+        self.router.remove(topic, handler)
     
-    def publish(self, topic: str, payload: str, qos: int = 0, retain: bool = False):
+    def publish(self, topic: str, payload: str | bytes, qos: int = 0,
+                retain: bool = False, trace=None) -> bool:
+        """
+        Publish a message to a topic. The message is sent when there is a
+        free in-flight slot, otherwise it waits in the outbound queue. 
+        When the queue is full the queue policy is applied. With an
+        outbox, messages are stored in it instead while the client is
+        disconnected or the outbox is not drained yet. Their traces are
+        not stamped as acked.
+
+        Args:
+            trace (optional): Trace id, or list of them for a batch, of 
+                the readings of the message, stamped as acked by the
+                tracer
+
+        Returns:
+            False if the message was dropped, True otherwise
+        """
+        if self._publish_latency is None:
+            return self._publish(topic, payload, qos, retain, trace)
+        start = time.perf_counter_ns()
+        result = self._publish(topic, payload, qos, retain, trace, start)
+        self._publish_latency.record_ns(time.perf_counter_ns() - start)
+        return result
+
+    def _publish(self, topic: str, payload: str | bytes, qos: int,
+                 retain: bool, trace=None, start: int = None) -> bool:
+        if self._spilling:
+            with self._spill_lock:
+                if self._spilling:
+                    return self._spill(topic, payload, qos, retain)
+        return self._enqueue((topic, payload, qos, retain, trace), start)
+
+    def _spill(self, topic: str, payload: str | bytes, qos: int,
+               retain: bool) -> bool:
+        stored = self.outbox.append(topic, payload, qos, retain)
+        with self._outbound_condition:
+            self.publish_stats['spilled' if stored else 'dropped'] += 1
+        return stored
+
+    def _enqueue(self, message: tuple, start: int = None,
+                 policy: str = None, timeout: float = -1) -> bool:
+        """
+        Sends a message if there is a free in-flight slot, or queues it.
+
+        Args:
+            policy (optional): Queue policy, defaults to queue_policy
+            timeout (optional): Seconds waited with the 'block' policy,
+                defaults to block_timeout
+        """
+        policy = policy or self.queue_policy
+        if timeout == -1:
+            timeout = self.block_timeout
+        with self._outbound_condition:
+            if policy == 'block':
+                self._outbound_condition.wait_for(
+                    lambda: len(self._outbound) < self.max_queued, timeout)
+            if self._inflight < self.max_inflight and not self._outbound:
+                self._inflight += 1
+            elif len(self._outbound) < self.max_queued:
+                self._outbound.append(message)
+                self.publish_stats['queued'] += 1
+                return True
+            elif policy == 'drop_oldest':
+                self._outbound.popleft()
+                self._outbound.append(message)
+                self.publish_stats['queued'] += 1
+                self.publish_stats['dropped'] += 1
+                return True
+            else:
+                self.publish_stats['dropped'] += 1
+                return False
+        self._send(*message, start)
+        return True
+
+    def _drain_outbox(self):
+        """
+        Sends the messages of the outbox while connected, in order and at
+        most outbox_rate per second, and switches publish back to the
+        outbound queue once it is empty.
+
+        Messages are read in chunks of one in-flight window and queue. A
+        chunk is committed once all its messages are acked, so messages
+        are sent again after a crash rather than lost (at least once). If
+        the connection drops in the middle of a chunk, paho sends its
+        in-flight messages again on reconnection.
+        """
+        chunk = self.max_inflight + self.max_queued
+        next_send = time.monotonic()
+        while not self._drain_stop.is_set():
+            self._drain_wake.clear()
+            if not (self._spilling and self._online):
+                self._drain_wake.wait(1)
+                continue
+            messages = self.outbox.read(chunk)
+            if not messages:
+                with self._spill_lock:
+                    if not len(self.outbox):
+                        self._spilling = False
+                        self.logger.info("Outbox drained.")
+                continue
+            for topic, payload, qos, retain in messages:
+                if self.outbox_rate:
+                    next_send = max(next_send + 1 / self.outbox_rate,
+                                    time.monotonic())
+                    if self._drain_stop.wait(next_send - time.monotonic()):
+                        return
+                self._enqueue((topic, payload, qos, retain, None),
+                              policy='block', timeout=None)
+            with self._outbound_condition:
+                self.publish_stats['drained'] += len(messages)
+                while self._inflight or self._outbound:
+                    if self._drain_stop.is_set():
+                        return
+                    self._outbound_condition.wait(0.1)
+            self.outbox.commit()
+
+    def get_publish_stats(self) -> dict:
         """
-        Publish a message to a topic.
+        Returns the outbound counters: messages published to paho, queued,
+        acknowledged, dropped, retried after a reconnection, stored in the
+        outbox and sent from it, and the current number of in-flight, 
+        queued and outbox messages.
         """
-        self.client.publish(topic, payload, qos, retain)
+        with self._outbound_condition:
+            return dict(self.publish_stats, inflight=self._inflight,
+                        queue_depth=len(self._outbound),
+                        outbox_depth=len(self.outbox)
+                        if self.outbox is not None else 0)
     
     def loop_start(self):
         """
@@ -0,0 +1,46 @@
+from typing import Callable
+
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+from src.sensors.codecs import decode_payload
+
+class MQTTReadingSubscriber(MQTTClientBase):
+    """
+    MQTT client that subscribes to the sensor topics and hands each
+    decoded message to a sink, e.g. FanoutHub.publish to push live
+    readings to the API clients through a single upstream subscription.
+    """
+
+    def __init__(self, broker: str, sink: Callable[[list[dict]], None],
+                 topic: str = "simulated_sensors/#", qos: int = 0, **kwargs):
+        """
+        Args:
+            broker: MQTT broker address
+            sink: Function that receives the decoded readings of a message
+            topic: Topic filter subscribed to (default: 'simulated_sensors/#')
+            qos: Subscription QoS (default: 0)
+            kwargs: Other arguments of MQTTClientBase
+        """
+        super().__init__(broker, **kwargs)
+        self.sink = sink
+        self.topic = topic
+        self.qos = qos
+
+    def on_connect(self, client, userdata, flags, rc):
+        """
+        Subscribes on every connection, since sessions are not persistent.
+        """
+        super().on_connect(client, userdata, flags, rc)
+        if rc == 0:
+            self.subscribe(self.topic, self.qos)
+
+    def on_message(self, client, userdata, message):
+        """
+        Decodes a message and hands its readings to the sink, without
+        logging every payload.
+        """
+        try:
+            readings = decode_payload(message.payload)
+        except Exception as e:
+            self.logger.warning(f"Dropped undecodable message on {message.topic}: {e}")
+            return
+        self.sink(readings)
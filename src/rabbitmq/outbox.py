@@ -0,0 +1,236 @@
+import os
+import struct
+import threading
+
+class Outbox:
+    """
+    Durable FIFO queue of MQTT messages on disk, where an MQTTClientBase
+    stores its messages while the broker is unreachable.
+
+    Messages are appended to segment files of the directory, named by
+    their sequence number ('00000000000000000001.seg', ...), and read in
+    the same order. What has been delivered is recorded by commit() in a
+    cursor file, so after a restart reading resumes from the first message
+    not committed: messages read but not committed are read again, which
+    gives at-least-once delivery. Fully committed segments are deleted.
+
+    Only the open segments and the messages of a read() are held in
+    memory, whatever the number of messages stored.
+
+    A record is a header with the payload length (I), topic length (H),
+    QoS (B) and flags (B), followed by the topic and the payload. A
+    record left incomplete by a crash is truncated when the outbox is
+    opened.
+    """
+
+    record = struct.Struct("<IHBB")
+    flag_retain = 0x01
+    flag_text = 0x02
+
+    def __init__(self, directory: str, segment_size: int = 16 * 2**20,
+                 max_bytes: int = None, sync: bool = False):
+        """
+        Args:
+            directory: Directory of the segment files, created if missing.
+                It must be used by a single Outbox at a time
+            segment_size: Size in bytes past which a new segment is
+                started (default: 16 MB)
+            max_bytes (optional): Maximum size of the messages not
+                committed. Appends beyond it are rejected. Defaults to no
+                limit
+            sync: Whether every append and commit is fsynced, so messages
+                survive a power loss and not only a crash of the process
+                (default: False)
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_bytes = max_bytes
+        self.sync = sync
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        segments = sorted(int(name[:-4]) for name in os.listdir(directory)
+                          if name.endswith(".seg"))
+        segment, offset = self._load_cursor()
+        if segment is None or segment not in segments:
+            segment, offset = (segments[0] if segments else 1), 0
+        for old in segments:
+            if old < segment:
+                os.remove(self._segment_path(old))
+        segments = [s for s in segments if s >= segment]
+
+        # Committed position, and position of the next read
+        self._committed = (segment, offset)
+        self._read_segment, self._read_offset = segment, offset
+        self._reader = None
+        self._read_count = 0
+        self._read_bytes = 0
+        self.count = 0
+        self.size = 0
+        for s in segments:
+            count, size = self._scan(s, offset if s == segment else 0)
+            self.count += count
+            self.size += size
+
+        self._write_segment = segments[-1] if segments else segment
+        self._writer = open(self._segment_path(self._write_segment), "ab")
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:020d}.seg")
+
+    def _cursor_path(self) -> str:
+        return os.path.join(self.directory, "cursor")
+
+    def _load_cursor(self) -> tuple[int, int] | tuple[None, None]:
+        try:
+            with open(self._cursor_path()) as f:
+                segment, offset = f.read().split()
+            return int(segment), int(offset)
+        except (OSError, ValueError):
+            return None, None
+
+    def _scan(self, segment: int, offset: int) -> tuple[int, int]:
+        """
+        Counts the records of a segment from an offset, and truncates an
+        incomplete record at its end.
+
+        Returns:
+            Number of records and their size in bytes
+        """
+        count, end = 0, offset
+        with open(self._segment_path(segment), "r+b") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(self.record.size)
+                if len(header) < self.record.size:
+                    break
+                length, topic_length, _, _ = self.record.unpack(header)
+                body = length + topic_length
+                if f.seek(body, os.SEEK_CUR) > os.fstat(f.fileno()).st_size:
+                    break
+                count += 1
+                end += self.record.size + body
+            if f.seek(0, os.SEEK_END) > end:
+                f.truncate(end)
+        return count, end - offset
+
+    def __len__(self) -> int:
+        """
+        Number of messages not committed yet.
+        """
+        return self.count
+
+    def append(self, topic: str, payload: str | bytes, qos: int,
+               retain: bool = False) -> bool:
+        """
+        Appends a message to the last segment.
+
+        Returns:
+            False if it was rejected because the outbox is full
+        """
+        flags = self.flag_retain if retain else 0
+        if isinstance(payload, str):
+            payload = payload.encode()
+            flags |= self.flag_text
+        topic = topic.encode()
+        record = self.record.pack(len(payload), len(topic), qos, flags) \
+            + topic + payload
+        with self._lock:
+            if self._writer is None:
+                raise ValueError("Outbox is closed.")
+            if self.max_bytes is not None and \
+                    self.size + len(record) > self.max_bytes:
+                return False
+            if self._writer.tell() >= self.segment_size:
+                self._writer.close()
+                self._write_segment += 1
+                self._writer = open(
+                    self._segment_path(self._write_segment), "ab")
+            self._writer.write(record)
+            self._writer.flush()
+            if self.sync:
+                os.fsync(self._writer.fileno())
+            self.count += 1
+            self.size += len(record)
+        return True
+
+    def read(self, n: int) -> list[tuple[str, str | bytes, int, bool]]:
+        """
+        Reads the next messages after the ones already read, without
+        committing them.
+
+        Args:
+            n: Maximum number of messages
+
+        Returns:
+            Topic, payload, QoS and retain flag of each message
+        """
+        messages = []
+        with self._lock:
+            while len(messages) < n:
+                if self._reader is None:
+                    self._reader = open(
+                        self._segment_path(self._read_segment), "rb")
+                    self._reader.seek(self._read_offset)
+                header = self._reader.read(self.record.size)
+                if not header:
+                    if self._read_segment == self._write_segment:
+                        break
+                    self._reader.close()
+                    self._reader = None
+                    self._read_segment += 1
+                    self._read_offset = 0
+                    continue
+                length, topic_length, qos, flags = self.record.unpack(header)
+                topic = self._reader.read(topic_length).decode()
+                payload = self._reader.read(length)
+                if flags & self.flag_text:
+                    payload = payload.decode()
+                messages.append((topic, payload, qos,
+                                 bool(flags & self.flag_retain)))
+                size = self.record.size + topic_length + length
+                self._read_offset += size
+                self._read_count += 1
+                self._read_bytes += size
+        return messages
+
+    def commit(self):
+        """
+        Records the messages read so far as delivered and deletes the
+        segments left behind.
+        """
+        with self._lock:
+            if not self._read_count:
+                return
+            position = (self._read_segment, self._read_offset)
+            temporary = self._cursor_path() + ".tmp"
+            with open(temporary, "w") as f:
+                f.write(f"{position[0]} {position[1]}\n")
+                if self.sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temporary, self._cursor_path())
+            for segment in range(self._committed[0], position[0]):
+                try:
+                    os.remove(self._segment_path(segment))
+                except FileNotFoundError:
+                    pass
+            self._committed = position
+            self.count -= self._read_count
+            self.size -= self._read_bytes
+            self._read_count = self._read_bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def __enter__(self) -> "Outbox":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,173 @@
+import logging
+import threading
+import zlib
+from typing import Hashable
+
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+
+class PooledClient(MQTTClientBase):
+    """
+    MQTT client of a PublisherPool. It tracks the health of its connection
+    and does not log every acknowledgement.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.connected = threading.Event()
+        self.reconnects = 0
+        self.disconnects = 0
+        self.last_error = None
+
+    def on_connect(self, client, userdata, flags, rc):
+        super().on_connect(client, userdata, flags, rc)
+        if rc == 0:
+            if self.disconnects:
+                self.reconnects += 1
+            self.connected.set()
+        else:
+            self.last_error = f"Connection refused, return code {rc}"
+
+    def on_disconnect(self, client, userdata, rc):
+        super().on_disconnect(client, userdata, rc)
+        self.connected.clear()
+        self.disconnects += 1
+        if rc != 0:
+            self.last_error = f"Unexpected disconnection, return code {rc}"
+
+    def on_publish(self, client, userdata, mid):
+        pass
+
+    @property
+    def load(self) -> int:
+        """
+        Number of messages in flight or queued in this connection.
+        """
+        return self._inflight + len(self._outbound)
+
+class PublisherPool:
+    """
+    Pool of MQTT connections used to publish in parallel. Each connection
+    has its own socket and paho network thread, so the aggregate publish
+    throughput is not capped by a single connection.
+
+    Messages with a key (e.g. a sensor id) are hashed onto a connection,
+    which keeps the order of each sensor. When that connection is down
+    they fail over to the least loaded healthy connection. Messages
+    without a key always go to the least loaded healthy connection.
+    Connections reconnect on their own with exponential backoff.
+    """
+
+    def __init__(self, broker: str, port: int = 1883,
+                 client_id: str = "publisher", size: int = 4,
+                 keepalive: int = 60, min_reconnect_delay: float = 1,
+                 max_reconnect_delay: float = 60, **client_kwargs):
+        """
+        Args:
+            broker: MQTT broker address
+            port: MQTT broker port (default: 1883)
+            client_id: Prefix of the client ids, each connection gets
+                '<client_id>_<index>' (default: 'publisher')
+            size: Number of connections (default: 4)
+            keepalive: Keepalive interval in seconds (default: 60)
+            min_reconnect_delay: First reconnection delay in seconds. It
+                doubles on each failed attempt (default: 1)
+            max_reconnect_delay: Maximum reconnection delay in seconds
+                (default: 60)
+            client_kwargs: Outbound queue arguments of MQTTClientBase
+                (max_inflight, max_queued, queue_policy, block_timeout)
+        """
+        if not isinstance(size, int) or size < 1:
+            raise ValueError("Pool size must be an int greater than 0.")
+        self.broker = broker
+        self.port = port
+        self.connections = []
+        for index in range(size):
+            connection = PooledClient(broker, port, f"{client_id}_{index}",
+                                      keepalive, **client_kwargs)
+            connection.client.reconnect_delay_set(
+                min_reconnect_delay, max_reconnect_delay)
+            self.connections.append(connection)
+
+    def __len__(self) -> int:
+        return len(self.connections)
+
+    def connect(self):
+        """
+        Starts connecting every connection in the background. Connections
+        that cannot reach the broker keep retrying with backoff.
+        """
+        for connection in self.connections:
+            connection.client.connect_async(
+                self.broker, self.port, connection.keepalive)
+            connection.client.loop_start()
+        logging.info(f"Publisher pool connecting {len(self)} clients to "
+                     f"{self.broker}:{self.port}")
+
+    def wait_connected(self, timeout: float = None) -> bool:
+        """
+        Waits until every connection is connected.
+
+        Returns:
+            True if all connections are connected
+        """
+        return all(connection.connected.wait(timeout)
+                   for connection in self.connections)
+
+    def disconnect(self):
+        """
+        Disconnects every connection and stops their network threads.
+        """
+        for connection in self.connections:
+            connection.disconnect()
+            connection.loop_stop()
+
+    def connection_for(self, key: Hashable = None) -> PooledClient:
+        """
+        Selects the connection of a message.
+
+        Args:
+            key (optional): Key hashed onto a connection, e.g. a sensor id
+
+        Returns:
+            The hashed connection if it is healthy, otherwise the least
+            loaded healthy connection. If no connection is healthy, the
+            hashed one (or the first one), whose queue will hold the
+            message until it reconnects
+        """
+        if key is not None:
+            index = zlib.crc32(str(key).encode()) % len(self.connections)
+            connection = self.connections[index]
+            if connection.connected.is_set():
+                return connection
+        else:
+            connection = self.connections[0]
+        healthy = [c for c in self.connections if c.connected.is_set()]
+        if not healthy:
+            return connection
+        return min(healthy, key=lambda c: c.load)
+
+    def publish(self, topic: str, payload: str | bytes, qos: int = 0,
+                retain: bool = False, key: Hashable = None,
+                trace=None) -> bool:
+        """
+        Publishes a message through the connection selected for its key.
+        See MQTTClientBase.publish for trace.
+
+        Returns:
+            False if the message was dropped, True otherwise
+        """
+        return self.connection_for(key).publish(topic, payload, qos, retain,
+                                                trace)
+
+    def get_stats(self) -> list[dict]:
+        """
+        Returns the health and publish counters of each connection.
+        """
+        return [
+            dict(connection.get_publish_stats(),
+                 client_id=connection.client_id,
+                 connected=connection.connected.is_set(),
+                 reconnects=connection.reconnects,
+                 last_error=connection.last_error)
+            for connection in self.connections
+        ]
@@ -1,24 +1,49 @@
 """
-NOT WORKING!! PENDING TO FIX THI SCRIPT.
+Declares the queue of the MQTT messages and binds it to the amq.topic
+exchange, one binding per topic filter of the sensors to ingest.
+
+The RabbitMQ MQTT plugin publishes MQTT messages to amq.topic with the
+'/' of their topic replaced by '.', so the filters are translated with
+topics.to_routing_key.
+
+Usage:
+> python3 -m src.rabbitmq.rabbitmq_configuration --topic "simulated_sensors/temperature/+"
 """
-import pika
+import argparse
 import logging
 
-# Connect to RabbitMQ using AMQP
-connection = pika.BlockingConnection(pika.ConnectionParameters(host="localhost"))
-channel = connection.channel()
+import pika
+
+from src.sensors.topics import TopicScheme, to_routing_key
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--exchange', default='amq.topic')
+    parser.add_argument('--queue', default='mqtt_queue')
+    parser.add_argument('--topic', action='append',
+                        help="MQTT topic filter to bind, can be repeated. "
+                             "Defaults to every reading and batch")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    topics = args.topic or [TopicScheme().filter()]
 
-exchange = "amq.topic"
-queue = "mqtt_queue"
-routing_key = "simulated_sensors/"
+    # Connect to RabbitMQ using AMQP
+    connection = pika.BlockingConnection(pika.ConnectionParameters(host=args.host))
+    channel = connection.channel()
 
-# Create the queue
-channel.queue_declare(queue=queue, durable=True)
+    # Create the queue
+    channel.queue_declare(queue=args.queue, durable=True)
 
-# Bind the queue to the amq.topic exchange
-channel.queue_bind(exchange=exchange, queue=queue, routing_key=routing_key)
+    # Bind the queue to the amq.topic exchange
+    for topic in topics:
+        routing_key = to_routing_key(topic)
+        channel.queue_bind(exchange=args.exchange, queue=args.queue,
+                           routing_key=routing_key)
+        logging.info(f"Mqtt queue created and binded. Exchange = {args.exchange}, Queue = {args.queue}, Routing_key = {routing_key}")
 
-logging.info(f"Mqtt queue created and binded. Exchange = {exchange}, Queue = {queue}, Routing_key = {routing_key}")
+    connection.close()
 
-# Cerrar conexión
-connection.close()
+if __name__ == "__main__":
+    main()
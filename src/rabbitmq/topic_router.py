@@ -0,0 +1,103 @@
+from typing import Callable
+
+class _Node:
+    __slots__ = ("children", "handlers")
+
+    def __init__(self):
+        self.children = {}
+        self.handlers = []
+
+class TopicRouter:
+    """
+    Trie of MQTT topic filters, one level per node, mapping each filter
+    to its handlers.
+
+    A topic is matched by walking its levels down the trie following the
+    exact level, '+' and '#' children only, so the cost depends on the
+    number of levels and wildcards on the way, not on the number of
+    filters. Topics starting with '$' are not matched by filters starting
+    with a wildcard, as in MQTT.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, topic_filter: str, handler: Callable):
+        """
+        Adds a handler of the messages whose topic matches a filter.
+        """
+        levels = topic_filter.split("/")
+        if "#" in levels[:-1] or any(
+                level != wildcard and wildcard in level
+                for level in levels for wildcard in "+#"):
+            raise ValueError(f"Invalid topic filter: {topic_filter}")
+        node = self._root
+        for level in levels:
+            node = node.children.setdefault(level, _Node())
+        node.handlers.append(handler)
+        self._size += 1
+
+    def remove(self, topic_filter: str, handler: Callable = None):
+        """
+        Removes a handler of a filter, or every handler of the filter if
+        none is given.
+        """
+        path = [self._root]
+        for level in topic_filter.split("/"):
+            node = path[-1].children.get(level)
+            if node is None:
+                return
+            path.append(node)
+        node = path[-1]
+        if handler is None:
+            self._size -= len(node.handlers)
+            node.handlers.clear()
+        elif handler in node.handlers:
+            node.handlers.remove(handler)
+            self._size -= 1
+        # Prunes the nodes left without handlers nor children
+        for level, (parent, node) in zip(reversed(topic_filter.split("/")),
+                                         reversed(list(zip(path, path[1:])))):
+            if node.handlers or node.children:
+                break
+            del parent.children[level]
+
+    def match(self, topic: str) -> list[Callable]:
+        """
+        Returns the handlers of every filter that matches a topic.
+        """
+        levels = topic.split("/")
+        handlers = []
+        nodes = [self._root]
+        for i, level in enumerate(levels):
+            following = []
+            for node in nodes:
+                if not node.children:
+                    continue
+                # Wildcards do not match topics starting with '$'
+                wildcards = not (i == 0 and level.startswith("$"))
+                if wildcards:
+                    multi = node.children.get("#")
+                    if multi is not None:
+                        handlers.extend(multi.handlers)
+                child = node.children.get(level)
+                if child is not None:
+                    following.append(child)
+                if wildcards:
+                    child = node.children.get("+")
+                    if child is not None:
+                        following.append(child)
+            if not following:
+                return handlers
+            nodes = following
+        for node in nodes:
+            handlers.extend(node.handlers)
+            # 'a/#' also matches 'a'
+            multi = node.children.get("#")
+            if multi is not None:
+                handlers.extend(multi.handlers)
+        return handlers
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+
+from src.rabbitmq.async_mqtt_client_base import AsyncMQTTClientBase
+from src.sensors.codecs import BinaryCodec, JSONCodec, get_codec
+from src.sensors.logs import LazyJSON, SampledLogger
+from src.sensors.sensor_simulator import SensorSimulator
+from src.sensors.timing import PeriodicTimer
+from src.sensors.topics import TopicScheme
+
+class AsyncSensorSimulator(AsyncMQTTClientBase):
+    """
+    asyncio version of SensorSimulator. Each sensor runs as a task instead
+    of a thread, and in mqtt mode every reading waits for its publish
+    acknowledgement, so a slow broker shows up as sensor lateness and
+    missed ticks instead of growing queues.
+    """
+
+    sensor_types = SensorSimulator.sensor_types
+    _validate_sensors = SensorSimulator._validate_sensors
+    _init_sensors = SensorSimulator._init_sensors
+    generate_sensor_data = SensorSimulator.generate_sensor_data
+    get_sensor_stats = SensorSimulator.get_sensor_stats
+    reading_log_modes = SensorSimulator.reading_log_modes
+    _log_event = SensorSimulator._log_event
+
+    def __init__(self,
+                 sensors: list[tuple[str, float]],
+                 mode: str = "log",
+                 client_id: str = None,
+                 broker: str = "localhost",
+                 port: int = 1883,
+                 keepalive: int = 60,
+                 missed_tick_policy: str = "coalesce",
+                 codec: str | JSONCodec | BinaryCodec = "json",
+                 max_inflight: int = 100,
+                 topic_scheme: str | TopicScheme = "simulated_sensors/{type}/{id}",
+                 reading_logs: str = "all",
+                 log_rate: float = 1.0):
+        """
+        Args:
+            sensors: List of sensors to simulate, as in SensorSimulator:
+                [(sensor_type (str), sensor_period (int | float))]
+            mode: Mode to publish simulated sensors. Modes are ['log', 'mqtt']
+            client_id: String with the client_id in case of using mqtt
+            broker: Broker IP in case of using mqtt
+            missed_tick_policy: Policies are ['catch_up', 'coalesce', 'skip']
+            codec (optional): Payload codec name ['json', 'binary'] or a 
+                codec instance. Defaults to 'json'
+            max_inflight: Maximum number of readings waiting for their
+                publish acknowledgement
+            topic_scheme (optional): Template of the topic of each 
+                reading, as in SensorSimulator
+            reading_logs (optional): How each reading is logged: 'all'
+                logs every one, 'sampled' at most log_rate per second and
+                'off' none of them. Defaults to 'all'
+            log_rate (optional): Readings logged per second with
+                'sampled'. Defaults to 1
+        """
+        super().__init__(broker, port, client_id, keepalive, max_inflight)
+        if missed_tick_policy not in PeriodicTimer.policies:
+            raise ValueError(
+                f"Missed tick policy must be one of: {PeriodicTimer.policies}")
+        if reading_logs not in self.reading_log_modes:
+            raise ValueError(
+                f"Reading logs must be one of: {self.reading_log_modes}")
+        self.sensors = self._init_sensors(sensors)
+        self.mode = mode
+        self.missed_tick_policy = missed_tick_policy
+        self.codec = get_codec(codec) if isinstance(codec, str) else codec
+        self.topic_scheme = TopicScheme(topic_scheme) \
+            if isinstance(topic_scheme, str) else topic_scheme
+        self.sensor_stats = {}
+        self.sensors_tasks = []
+        self.reading_logs = reading_logs
+        self._sampled_log = SampledLogger(rate=log_rate)
+        # Failed publications of every sensor, e.g. during a broker
+        # outage, are logged at most once per second
+        self._error_log = SampledLogger(rate=1.0)
+        logging.info(f"Async sensor simulator running in '{mode}' mode")
+
+    async def run_sensor(self, sensor_type: str, period: float, id: int,
+                         topic: str = None, qos: int = 1,
+                         retain: bool = False):
+        """
+        Gets and publishes sensor data at a given period until cancelled.
+
+        Args:
+            sensor_type: Type of sensor ['temperature', 'humididy']
+            period: Period in seconds to get and publish the data
+            id: Sensor id
+            topic (optional): MQTT topic to publish data. Defaults to the
+                topic of the sensor in the topic scheme
+            qos (optional): Quality of Service level. Defaults to 1
+            retain (optional): Whether to retain the message. Defaults to False
+        """
+        if topic is None:
+            topic = self.topic_scheme.topic({"type": sensor_type, "id": id})
+        timer = PeriodicTimer(period, self.missed_tick_policy)
+        self.sensor_stats[id] = timer.stats
+        try:
+            while True:
+                delay = timer.due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if not timer.tick():
+                    continue
+                data = self.generate_sensor_data(sensor_type, period, id)
+                if self.mode == 'mqtt':
+                    try:
+                        await self.publish(
+                            topic, self.codec.encode_reading(data), qos,
+                            retain)
+                    except ConnectionError as e:
+                        # The reading is lost, the sensor goes on with its
+                        # next tick
+                        self._error_log.log(
+                            logging.ERROR, "Error publishing reading of "
+                            "sensor %s: %s", id, e)
+                        continue
+                    self._log_event('data published: %s', LazyJSON(data))
+                else:
+                    self._log_event('data received: %s', LazyJSON(data))
+        except asyncio.CancelledError:
+            logging.info(f"Task for sensor {id} stopped.")
+            raise
+        except Exception as e:
+            logging.error(f"Error in task for sensor {id}: {e}")
+
+    def run_tasks(self, mode: str = None):
+        """
+        Creates and starts a task for each simulated sensor in the running
+        event loop.
+
+        Args:
+            mode (optional): Overrides the mode given at init
+        """
+        if mode is not None:
+            self.mode = mode
+        for sensor in self.sensors:
+            self.sensors_tasks.append(asyncio.create_task(self.run_sensor(
+                sensor['type'], sensor['period'], sensor['id'])))
+
+    async def stop_tasks(self):
+        """
+        Cancels and waits for the running tasks of simulated sensors.
+        """
+        for task in self.sensors_tasks:
+            task.cancel()
+        await asyncio.gather(*self.sensors_tasks, return_exceptions=True)
+        self.sensors_tasks.clear()
+        logging.info("All tasks stopped.")
@@ -0,0 +1,167 @@
+import json
+import logging
+import threading
+import time
+from typing import Callable
+
+BATCH_SCHEMA = {
+    "name": "sensor_readings",
+    "version": 1,
+    "fields": ["id", "type", "period", "value", "timestamp"],
+}
+
+def encode_batch(readings: list[dict]) -> str:
+    """
+    Encodes a list of readings as one batch message. The schema header
+    lists the fields once and every reading is sent as a row of values,
+    so keys are not repeated per reading.
+
+    Args:
+        readings: List of readings as returned by generate_sensor_data
+
+    Returns:
+        Batch message in json format. Readings with a trace id (see
+        src.sensors.tracing) add the trace_id field to the schema
+    """
+    schema = BATCH_SCHEMA
+    if readings and "trace_id" in readings[0]:
+        schema = dict(BATCH_SCHEMA, fields=BATCH_SCHEMA["fields"] + ["trace_id"])
+    fields = schema["fields"]
+    return json.dumps({
+        "schema": schema,
+        "count": len(readings),
+        "readings": [[reading.get(field) for field in fields]
+                     for reading in readings],
+    })
+
+def decode_batch(payload: str | bytes) -> list[dict]:
+    """
+    Decodes a batch message into a list of readings.
+
+    Args:
+        payload: Batch message as produced by encode_batch
+
+    Returns:
+        List of readings in dictionary format
+    """
+    batch = json.loads(payload)
+    schema = batch.get("schema", {})
+    if schema.get("name") != BATCH_SCHEMA["name"]:
+        raise ValueError("Payload is not a sensor readings batch.")
+    if schema.get("version") != BATCH_SCHEMA["version"]:
+        raise ValueError(
+            f"Unsupported batch schema version: {schema.get('version')}")
+    fields = schema["fields"]
+    readings = [dict(zip(fields, row)) for row in batch["readings"]]
+    if "trace_id" in fields:
+        for reading in readings:
+            if reading["trace_id"] is None:
+                del reading["trace_id"]
+    return readings
+
+class ReadingBatcher:
+    """
+    Gathers readings from many sensors and flushes them as a single
+    message, either when the batch reaches a given size or when its oldest
+    reading has waited a given linger time.
+    """
+
+    def __init__(self, flush: Callable[[list[dict]], None],
+                 batch_size: int = 100, linger: float = 0.1):
+        """
+        Args:
+            flush: Function called with the list of readings of each batch
+            batch_size: Maximum number of readings per batch
+            linger: Maximum time in seconds a reading waits in the batch
+        """
+        if not isinstance(batch_size, int) or batch_size < 1:
+            raise ValueError("Batch size must be an int greater than 0.")
+        if linger <= 0:
+            raise ValueError("Batch linger must be greater than 0.")
+        self.flush_callback = flush
+        self.batch_size = batch_size
+        self.linger = linger
+        self._readings = []
+        self._oldest = None
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def add(self, reading: dict):
+        """
+        Adds a reading to the current batch, flushing it if it is full.
+
+        Args:
+            reading: Reading to add
+        """
+        with self._condition:
+            if not self._readings:
+                self._oldest = time.monotonic()
+                self._condition.notify()
+            self._readings.append(reading)
+            if len(self._readings) < self.batch_size:
+                return
+            batch = self._take()
+        self._flush(batch)
+
+    def _take(self) -> list[dict]:
+        """
+        Takes the current batch. Must be called holding the condition lock.
+        """
+        batch, self._readings = self._readings, []
+        self._oldest = None
+        return batch
+
+    def _flush(self, batch: list[dict]):
+        if not batch:
+            return
+        try:
+            self.flush_callback(batch)
+        except Exception as e:
+            logging.error(f"Error flushing batch of {len(batch)} readings: {e}")
+
+    def flush(self):
+        """
+        Flushes the current batch immediately.
+        """
+        with self._condition:
+            batch = self._take()
+        self._flush(batch)
+
+    def _run(self):
+        """
+        Flushes batches whose oldest reading exceeded the linger time.
+        """
+        while True:
+            with self._condition:
+                if self._stopped:
+                    break
+                if self._oldest is None:
+                    self._condition.wait()
+                    continue
+                delay = self._oldest + self.linger - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                batch = self._take()
+            self._flush(batch)
+
+    def start(self):
+        """
+        Starts the linger flusher thread.
+        """
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the linger flusher thread and flushes pending readings.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
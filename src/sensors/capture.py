@@ -0,0 +1,199 @@
+import argparse
+import logging
+import mmap
+import struct
+import threading
+import time
+from typing import Iterator
+
+class CaptureWriter:
+    """
+    Writer of capture files, compact binary recordings of readings to
+    replay them later (see SensorSimulator 'replay' mode).
+
+    A capture file is a header followed by one fixed size record per
+    reading, in the order they were written:
+        header: magic (4s), version (B), types length (H), types
+            dictionary as newline separated names
+        record: timestamp (d), sensor id (I), type index (B), period (f),
+            value (d)
+
+    Types missing from the dictionary are added to it on the fly,
+    rewriting the header.
+    """
+
+    magic = b"SCAP"
+    version = 1
+    header = struct.Struct("<4sBH")
+    record = struct.Struct("<dIBfd")
+    # Room reserved for the types dictionary, so it can grow in place
+    types_size = 1024
+
+    def __init__(self, path: str,
+                 types: tuple[str, ...] = ('humidity', 'temperature')):
+        """
+        Args:
+            path: File to create, overwritten if it exists
+            types: Initial dictionary of sensor types
+        """
+        self.path = path
+        self.types = list(types)
+        self.type_index = {t: i for i, t in enumerate(self.types)}
+        self.count = 0
+        self._file = open(path, "wb")
+        self._lock = threading.Lock()
+        self._write_header()
+
+    def _write_header(self):
+        types = "\n".join(self.types).encode()
+        if len(types) > self.types_size or len(self.types) > 255:
+            raise ValueError("Capture types dictionary is full.")
+        self._file.seek(0)
+        self._file.write(self.header.pack(self.magic, self.version, len(types))
+                         + types.ljust(self.types_size, b"\0"))
+
+    def _add_type(self, sensor_type: str) -> int:
+        self.types.append(sensor_type)
+        self.type_index[sensor_type] = len(self.types) - 1
+        end = self._file.tell()
+        self._write_header()
+        self._file.seek(end)
+        return self.type_index[sensor_type]
+
+    def write(self, readings: list[dict]):
+        """
+        Appends readings to the file. It can be used as the sink of
+        MQTTReadingSubscriber or AMQPIngestionService.
+        """
+        with self._lock:
+            records = bytearray(self.record.size * len(readings))
+            for offset, reading in zip(
+                    range(0, len(records), self.record.size), readings):
+                type_index = self.type_index.get(reading["type"])
+                if type_index is None:
+                    type_index = self._add_type(reading["type"])
+                self.record.pack_into(
+                    records, offset, reading["timestamp"], reading["id"],
+                    type_index, reading.get("period", 0.0), reading["value"])
+            self._file.write(records)
+            self.count += len(readings)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class CaptureReader:
+    """
+    Reader of a capture file written by CaptureWriter. The file is
+    memory-mapped and records are decoded as they are iterated, so files
+    larger than the memory can be read: the OS pages the file in and out.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(self._mmap, "madvise"):
+            self._mmap.madvise(mmap.MADV_SEQUENTIAL)
+        magic, version, types_length = CaptureWriter.header.unpack_from(self._mmap)
+        if magic != CaptureWriter.magic:
+            raise ValueError("File is not a capture of sensor readings.")
+        if version != CaptureWriter.version:
+            raise ValueError(f"Unsupported capture version: {version}")
+        start = CaptureWriter.header.size
+        self.types = tuple(
+            bytes(self._mmap[start:start + types_length]).decode().split("\n"))
+        self.offset = start + CaptureWriter.types_size
+        self.count = (len(self._mmap) - self.offset) // CaptureWriter.record.size
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.readings()
+
+    def readings(self, start: int = 0) -> Iterator[dict]:
+        """
+        Yields the readings of the file from the given record.
+        """
+        end = self.offset + self.count * CaptureWriter.record.size
+        types = self.types
+        view = memoryview(self._mmap)[
+            self.offset + start * CaptureWriter.record.size:end]
+        try:
+            for timestamp, id, type, period, value in \
+                    CaptureWriter.record.iter_unpack(view):
+                yield {"id": id, "type": types[type], "period": period,
+                       "value": value, "timestamp": timestamp}
+        finally:
+            view.release()
+
+    def span(self) -> tuple[float, float]:
+        """
+        Returns the timestamps of the first and the last readings.
+        """
+        if not self.count:
+            return 0.0, 0.0
+        last = self.count - 1
+        return (CaptureWriter.record.unpack_from(self._mmap, self.offset)[0],
+                CaptureWriter.record.unpack_from(
+                    self._mmap, self.offset + last * CaptureWriter.record.size)[0])
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Records readings into a capture file, or describes one")
+    parser.add_argument('path', help="Capture file")
+    parser.add_argument('--broker', default=None,
+                        help="MQTT broker the readings are recorded from. "
+                             "Without it, the capture file is described")
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--topic', default='simulated_sensors/#')
+    parser.add_argument('--duration', type=float, default=None,
+                        help="Seconds to record. Defaults to until Ctrl+C")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.broker is None:
+        with CaptureReader(args.path) as reader:
+            first, last = reader.span()
+            print(f"{len(reader)} readings over {last - first:.1f} s, "
+                  f"types: {', '.join(reader.types)}")
+        return
+
+    # Imported here so reading captures does not need paho
+    from src.rabbitmq.mqtt_subscriber import MQTTReadingSubscriber
+
+    with CaptureWriter(args.path) as writer:
+        subscriber = MQTTReadingSubscriber(args.broker, writer.write,
+                                           args.topic, qos=1, port=args.port)
+        subscriber.connect()
+        start = time.monotonic()
+        try:
+            while args.duration is None or \
+                    time.monotonic() - start < args.duration:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            subscriber.disconnect()
+            subscriber.loop_stop()
+        logging.info(f"Recorded {writer.count} readings in {args.path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import json
+import struct
+
+from src.sensors.batching import encode_batch, decode_batch
+
+class JSONCodec:
+    """
+    Codec that encodes a single reading as a json object and a batch of
+    readings with the schema header format of src.sensors.batching.
+    """
+
+    name = "json"
+
+    def encode_reading(self, reading: dict) -> str:
+        return json.dumps(reading)
+
+    def encode_batch(self, readings: list[dict]) -> str:
+        return encode_batch(readings)
+
+    def decode(self, payload: str | bytes) -> list[dict]:
+        """
+        Decodes a single reading or a batch of readings.
+
+        Returns:
+            List of readings in dictionary format
+        """
+        message = json.loads(payload)
+        if "schema" in message:
+            return decode_batch(payload)
+        return [message]
+
+class BinaryCodec:
+    """
+    Codec with a fixed layout struct packed binary format.
+
+    A message is a header followed by one fixed size record per reading:
+        header: magic (2s), version (B), flags (B), count (H),
+            base timestamp (d)
+        record: sensor id (I, or H index with an id dictionary),
+            type index (B), period (f), value (i, fixed point),
+            timestamp delta from the previous record in microseconds (i),
+            and the trace id (Q) when the traced flag is set
+
+    Sensor types are always sent as an index in the types dictionary.
+    Sensor ids are sent as an index in the sensor ids dictionary when one
+    is given. Both dictionaries must be the same in encoder and decoder.
+    """
+
+    name = "binary"
+    magic = b"SR"
+    version = 1
+    flag_id_dictionary = 0x01
+    flag_traced = 0x02
+    header = struct.Struct("<2sBBHd")
+
+    def __init__(self, types: tuple[str, ...] = ('humidity', 'temperature'),
+                 sensor_ids: list[int] = None, value_scale: int = 100):
+        """
+        Args:
+            types: Dictionary of sensor types, sent by index
+            sensor_ids (optional): Dictionary of sensor ids, sent by index.
+                Defaults to None, which sends raw ids
+            value_scale: Fixed point scale of the values. Defaults to 100,
+                which keeps the 2 decimals of generate_sensor_data
+        """
+        if len(types) > 255:
+            raise ValueError("Types dictionary must have at most 255 types.")
+        if sensor_ids is not None and len(sensor_ids) > 65535:
+            raise ValueError(
+                "Sensor ids dictionary must have at most 65535 ids.")
+        self.types = tuple(types)
+        self.type_index = {t: i for i, t in enumerate(self.types)}
+        self.sensor_ids = list(sensor_ids) if sensor_ids is not None else None
+        self.id_index = ({id: i for i, id in enumerate(self.sensor_ids)}
+                         if self.sensor_ids is not None else None)
+        self.value_scale = value_scale
+        self.flags = self.flag_id_dictionary if self.id_index else 0
+        self.record = struct.Struct("<HBfii" if self.id_index else "<IBfii")
+        self.traced_record = struct.Struct(self.record.format + "Q")
+
+    def encode_reading(self, reading: dict) -> bytes:
+        return self.encode_batch([reading])
+
+    def encode_batch(self, readings: list[dict]) -> bytes:
+        """
+        Encodes a list of readings in one binary message.
+
+        Returns:
+            Binary message
+        """
+        if len(readings) > 65535:
+            raise ValueError("A binary message holds at most 65535 readings.")
+        base = readings[0]["timestamp"] if readings else 0.0
+        # Trace ids (see src.sensors.tracing) are only sent when the
+        # first reading has one, untraced readings then send 0
+        traced = bool(readings) and "trace_id" in readings[0]
+        record = self.traced_record if traced else self.record
+        out = bytearray(self.header.size + record.size * len(readings))
+        self.header.pack_into(
+            out, 0, self.magic, self.version,
+            self.flags | (self.flag_traced if traced else 0),
+            len(readings), base)
+        pack_into, offset, size = (record.pack_into, self.header.size,
+                                   record.size)
+        id_index, type_index, scale = (self.id_index, self.type_index,
+                                       self.value_scale)
+        previous = round(base * 1e6)
+        for reading in readings:
+            id = reading["id"]
+            timestamp = round(reading["timestamp"] * 1e6)
+            fields = (id_index[id] if id_index else id,
+                      type_index[reading["type"]],
+                      reading["period"],
+                      round(reading["value"] * scale),
+                      timestamp - previous)
+            if traced:
+                fields += (reading.get("trace_id", 0),)
+            pack_into(out, offset, *fields)
+            previous = timestamp
+            offset += size
+        return bytes(out)
+
+    def decode(self, payload: bytes) -> list[dict]:
+        """
+        Decodes a binary message into a list of readings.
+
+        Returns:
+            List of readings in dictionary format
+        """
+        magic, version, flags, count, base = self.header.unpack_from(payload)
+        if magic != self.magic:
+            raise ValueError("Payload is not a binary sensor readings message.")
+        if version != self.version:
+            raise ValueError(f"Unsupported binary codec version: {version}")
+        if flags & ~self.flag_traced != self.flags:
+            raise ValueError(
+                "Sensor ids dictionary does not match the encoder.")
+        traced = bool(flags & self.flag_traced)
+        record = self.traced_record if traced else self.record
+        readings = []
+        sensor_ids, types, scale = self.sensor_ids, self.types, self.value_scale
+        timestamp = round(base * 1e6)
+        for id, type, period, value, delta, *trace in record.iter_unpack(
+                memoryview(payload)[self.header.size:
+                                    self.header.size + count * record.size]):
+            timestamp += delta
+            reading = {
+                "id": sensor_ids[id] if sensor_ids else id,
+                "type": types[type],
+                "period": round(period, 6),
+                "value": value / scale,
+                "timestamp": timestamp / 1e6,
+            }
+            if trace and trace[0]:
+                reading["trace_id"] = trace[0]
+            readings.append(reading)
+        return readings
+
+codecs = {codec.name: codec for codec in (JSONCodec, BinaryCodec)}
+
+def get_codec(name: str, **kwargs) -> JSONCodec | BinaryCodec:
+    """
+    Returns an instance of the codec with the given name.
+
+    Args:
+        name: Codec name ['json', 'binary']
+        kwargs: Arguments passed to the codec constructor
+    """
+    if name not in codecs:
+        raise ValueError(f"Codec must be one of: {tuple(codecs)}")
+    return codecs[name](**kwargs)
+
+def decode_payload(payload: str | bytes,
+                   codec: BinaryCodec = None) -> list[dict]:
+    """
+    Decodes a payload of any codec, detecting the binary format by its
+    magic bytes.
+
+    Args:
+        payload: Received message payload
+        codec (optional): Binary codec with the dictionaries used by the
+            publisher. Defaults to a binary codec without id dictionary
+
+    Returns:
+        List of readings in dictionary format
+    """
+    if isinstance(payload, (bytes, bytearray)) and \
+            payload[:2] == BinaryCodec.magic:
+        return (codec or BinaryCodec()).decode(payload)
+    return JSONCodec().decode(payload)
@@ -0,0 +1,234 @@
+import time
+
+import numpy as np
+
+from src.sensors.registry import SensorRegistry
+
+class SensorTable:
+    """
+    Struct of arrays table of sensors. Each column is a NumPy array with
+    one entry per sensor, so the sensors due on a tick can be selected and
+    rescheduled with vectorized operations instead of per-sensor dicts.
+    """
+
+    def __init__(self, sensors: list[dict] | SensorRegistry,
+                 types: tuple[str, ...] = ('humidity', 'temperature'),
+                 start: float = None):
+        """
+        Args:
+            sensors: List of sensors as dictionaries, or a SensorRegistry
+                whose rows are its slots, copied from its arrays. Removed
+                sensors of the registry are never due
+            types: Dictionary of sensor types, stored by index. The types
+                of the registry are used for a registry
+            start (optional): Monotonic time of the first deadline of
+                every sensor. Defaults to now
+        """
+        start = time.monotonic() if start is None else start
+        if isinstance(sensors, SensorRegistry):
+            type_codes, periods = sensors.columns()
+            self.types = sensors.types
+            self.ids = np.arange(sensors.first_id,
+                                 sensors.first_id + len(type_codes),
+                                 dtype=np.int64)
+            self.type_codes = np.array(type_codes, dtype=np.uint8)
+            self.periods = np.array(periods, dtype=np.float64)
+            self.next_due = np.full(len(self.ids), start, dtype=np.float64)
+            self.next_due[self.type_codes == SensorRegistry.removed] = np.inf
+            return
+        type_index = {t: i for i, t in enumerate(types)}
+        self.types = tuple(types)
+        self.ids = np.array([s['id'] for s in sensors], dtype=np.int64)
+        self.type_codes = np.array([type_index[s['type']] for s in sensors],
+                                   dtype=np.uint8)
+        self.periods = np.array([s['period'] for s in sensors],
+                                dtype=np.float64)
+        self.next_due = np.full(len(sensors), start, dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, ids: np.ndarray, type_codes: np.ndarray,
+               periods: np.ndarray, start: float = None):
+        """
+        Adds rows to the table, first due at start (defaults to now).
+        """
+        start = time.monotonic() if start is None else start
+        self.ids = np.concatenate((self.ids, ids))
+        self.type_codes = np.concatenate((self.type_codes, type_codes))
+        self.periods = np.concatenate((self.periods, periods))
+        self.next_due = np.concatenate(
+            (self.next_due, np.full(len(ids), start, dtype=np.float64)))
+
+    def disable(self, indices: int | np.ndarray):
+        """
+        Stops the sensors of the given rows from being due, keeping their
+        rows so the indices of the others do not change.
+        """
+        self.next_due[indices] = np.inf
+
+    def next_deadline(self) -> float:
+        """
+        Returns the monotonic time of the earliest deadline.
+        """
+        return float(self.next_due.min()) if len(self) else float('inf')
+
+    def pop_due(self, now: float) -> np.ndarray:
+        """
+        Selects every sensor whose deadline has been reached and moves its
+        deadline to the next point of its period grid after now. Missed
+        periods are coalesced into a single reading.
+
+        Args:
+            now: Current monotonic time
+
+        Returns:
+            Array with the indices of the due sensors
+        """
+        indices = np.flatnonzero(self.next_due <= now)
+        if len(indices):
+            periods = self.periods[indices]
+            due = self.next_due[indices]
+            self.next_due[indices] = due + periods * (
+                np.floor((now - due) / periods) + 1)
+        return indices
+
+class FleetGenerator:
+    """
+    Vectorized generator of readings for a SensorTable. Values of every
+    due sensor are generated at once with one of these models:
+        - 'uniform': uniform values between low and high, as
+            generate_sensor_data.
+        - 'random_walk': each sensor moves a normal step from its previous
+            value, bounded by low and high.
+        - 'diurnal': daily sine wave between low and high, with a random
+            phase per sensor, plus noise.
+        - 'noise': normal noise around the middle of low and high.
+
+    Any model can be combined with stuck-at faults: on each reading a
+    healthy sensor gets stuck at its last value with stuck_probability and
+    a stuck sensor recovers with recover_probability.
+    """
+
+    models = ('uniform', 'random_walk', 'diurnal', 'noise')
+
+    def __init__(self, table: SensorTable, model: str = "uniform",
+                 low: float = 20.0, high: float = 100.0, step: float = 0.5,
+                 noise: float = 1.0, day: float = 86400.0,
+                 stuck_probability: float = 0.0,
+                 recover_probability: float = 0.01,
+                 seed: int = None):
+        """
+        Args:
+            table: Table of sensors to generate readings for
+            model: Value model ['uniform', 'random_walk', 'diurnal', 'noise']
+            low: Lower bound of the values
+            high: Upper bound of the values
+            step: Standard deviation of a random walk step
+            noise: Standard deviation of the noise
+            day: Period in seconds of the diurnal wave
+            stuck_probability: Probability per reading of a stuck-at fault
+            recover_probability: Probability per reading of recovering
+                from a stuck-at fault
+            seed (optional): Seed of the random generator
+        """
+        if model not in self.models:
+            raise ValueError(f"Value model must be one of: {self.models}")
+        self.table = table
+        self.model = model
+        self.low = low
+        self.high = high
+        self.step = step
+        self.noise = noise
+        self.day = day
+        self.stuck_probability = stuck_probability
+        self.recover_probability = recover_probability
+        self.rng = np.random.default_rng(seed)
+
+        n = len(table)
+        self.last_values = self.rng.uniform(low, high, n)
+        self.phases = self.rng.uniform(0.0, 2 * np.pi, n)
+        self.stuck = np.zeros(n, dtype=bool)
+
+    def extend(self, registry: SensorRegistry, slots: range):
+        """
+        Adds the sensors of the given slots of a registry, the next rows
+        of the table, with a fresh state.
+        """
+        type_codes, periods = registry.columns(slots.start, slots.stop)
+        self.table.append(
+            np.arange(registry.first_id + slots.start,
+                      registry.first_id + slots.stop, dtype=np.int64),
+            np.array(type_codes, dtype=np.uint8),
+            np.array(periods, dtype=np.float64))
+        n = len(slots)
+        self.last_values = np.concatenate(
+            (self.last_values, self.rng.uniform(self.low, self.high, n)))
+        self.phases = np.concatenate(
+            (self.phases, self.rng.uniform(0.0, 2 * np.pi, n)))
+        self.stuck = np.concatenate((self.stuck, np.zeros(n, dtype=bool)))
+
+    def _model_values(self, indices: np.ndarray,
+                      timestamps: np.ndarray) -> np.ndarray:
+        n = len(indices)
+        middle = (self.low + self.high) / 2
+        if self.model == 'uniform':
+            return self.rng.uniform(self.low, self.high, n)
+        if self.model == 'random_walk':
+            values = self.last_values[indices] + self.rng.normal(0, self.step, n)
+            return np.clip(values, self.low, self.high)
+        if self.model == 'diurnal':
+            amplitude = (self.high - self.low) / 2
+            angle = 2 * np.pi * (timestamps % self.day) / self.day
+            return (middle + amplitude * np.sin(angle + self.phases[indices])
+                    + self.rng.normal(0, self.noise, n))
+        return middle + self.rng.normal(0, self.noise, n)
+
+    def generate(self, indices: np.ndarray, timestamp: float = None
+                 ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Generates one reading for each of the given sensors.
+
+        Args:
+            indices: Indices of the sensors in the table
+            timestamp (optional): Epoch timestamp of the readings.
+                Defaults to time.time()
+
+        Returns:
+            Tuple with the column of values and the column of timestamps
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        timestamps = np.full(len(indices), timestamp, dtype=np.float64)
+        values = self._model_values(indices, timestamps)
+
+        if self.stuck_probability:
+            stuck = self.stuck[indices]
+            draws = self.rng.random(len(indices))
+            stuck = np.where(stuck, draws >= self.recover_probability,
+                             draws < self.stuck_probability)
+            self.stuck[indices] = stuck
+            values = np.where(stuck, self.last_values[indices], values)
+
+        values = np.round(values, 2)
+        self.last_values[indices] = values
+        return values, timestamps
+
+    def readings(self, indices: np.ndarray, values: np.ndarray,
+                 timestamps: np.ndarray) -> list[dict]:
+        """
+        Converts generated columns into readings in the dictionary format
+        of generate_sensor_data, for the publish path.
+
+        Returns:
+            List of readings
+        """
+        types = self.table.types
+        return [
+            {"id": id, "type": types[code], "period": period,
+             "value": value, "timestamp": ts}
+            for id, code, period, value, ts in zip(
+                self.table.ids[indices].tolist(),
+                self.table.type_codes[indices].tolist(),
+                self.table.periods[indices].tolist(),
+                values.tolist(), timestamps.tolist())
+        ]
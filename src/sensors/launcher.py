@@ -0,0 +1,365 @@
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import time
+
+from src.rabbitmq.outbox import Outbox
+from src.sensors.logs import start_queue_logging, stop_queue_logging
+from src.sensors.metrics import REGISTRY
+from src.sensors.sensor_simulator import SensorSimulator
+from src.sensors.tracing import Tracer
+
+def split_sensors(sensors: list[tuple[str, float]], n_workers: int
+                  ) -> list[tuple[int, list[tuple[str, float]]]]:
+    """
+    Splits a list of sensors in contiguous shards of similar size.
+
+    Args:
+        sensors: List of sensors as tuples (sensor_type, sensor_period)
+        n_workers: Number of shards
+
+    Returns:
+        List of (first_id, sensors) tuples, one per non empty shard
+    """
+    shard_size, remainder = divmod(len(sensors), n_workers)
+    shards, start = [], 0
+    for index in range(n_workers):
+        end = start + shard_size + (1 if index < remainder else 0)
+        if end > start:
+            shards.append((start, sensors[start:end]))
+        start = end
+    return shards
+
+def run_worker(index: int, first_id: int, sensors: list[tuple[str, float]],
+               options: dict, pipe, stats_interval: float,
+               metrics_port: int = 0, metrics_interval: float = 0,
+               trace_file: str = None, trace_sample: float = 1.0,
+               outbox_dir: str = None):
+    """
+    Entry point of a worker process. Runs a SensorSimulator over its shard
+    of sensors and reports its stats until the launcher sends 'stop'.
+
+    Args:
+        index: Worker index
+        first_id: Id of the first sensor of the shard
+        sensors: Shard of sensors
+        options: SensorSimulator arguments. The client_id gets the suffix
+            '_<index>' so every worker has its own connection
+        pipe: Connection with the launcher. The worker sends ready and 
+            stats messages and receives 'start' and 'stop' commands
+        stats_interval: Seconds between two stats messages
+        metrics_port (optional): The worker serves its metrics on
+            metrics_port + index. Defaults to 0, no metrics
+        metrics_interval (optional): Seconds between two metrics logs,
+            0 disables them
+        trace_file (optional): The worker stamps its traced readings in
+            '<trace_file>.<index>'. Defaults to no tracing
+        trace_sample (optional): Fraction of the readings traced
+        outbox_dir (optional): The worker stores its messages while the
+            broker is unreachable in the outbox '<outbox_dir>/<index>'.
+            Defaults to no outbox
+    """
+    # Only the launcher handles Ctrl+C, workers stop with its command
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    options = dict(options)
+    if options.get('client_id'):
+        options['client_id'] = f"{options['client_id']}_{index}"
+    if metrics_port or metrics_interval:
+        options['metrics'] = REGISTRY
+    if trace_file:
+        options['tracer'] = Tracer(f"{trace_file}.{index}", trace_sample)
+    if outbox_dir:
+        options['outbox'] = Outbox(os.path.join(outbox_dir, str(index)))
+    simulator = SensorSimulator(sensors, first_id=first_id, **options)
+    pipe.send(('ready', index, None))
+    if pipe.recv() != 'start':
+        return
+
+    listener = start_queue_logging()
+    if metrics_port:
+        REGISTRY.serve(metrics_port + index)
+    if metrics_interval:
+        REGISTRY.start_snapshots(metrics_interval)
+    simulator.run_threads()
+    try:
+        while not pipe.poll(stats_interval):
+            pipe.send(('stats', index, worker_stats(simulator)))
+    except (EOFError, OSError):
+        pass
+    finally:
+        simulator.stop_threads()
+        if simulator.mode == 'mqtt':
+            simulator.disconnect()
+        try:
+            pipe.send(('stats', index, worker_stats(simulator)))
+        except OSError:
+            pass
+        REGISTRY.stop_serving()
+        REGISTRY.stop_snapshots()
+        stop_queue_logging(listener)
+
+def worker_stats(simulator: SensorSimulator) -> dict:
+    """
+    Returns the stats of the simulator of a worker.
+    """
+    sensor_stats = simulator.sensor_stats.values()
+    stats = {
+        'sensors': len(simulator.sensors),
+        'readings': simulator.readings_total,
+        'missed': sum(s.missed for s in sensor_stats),
+        'time': time.monotonic(),
+    }
+    if simulator.mode == 'mqtt':
+        stats['publish'] = simulator.get_publish_stats()
+    return stats
+
+class ShardedLauncher:
+    """
+    Runs a large list of sensors split across worker processes, each one
+    with its own SensorSimulator, MQTT connection and range of sensor ids,
+    so the simulation is not limited by the GIL of a single process.
+
+    Workers start publishing together once all of them are ready, stop
+    together on shutdown, report their stats periodically and are
+    restarted if they crash.
+    """
+
+    def __init__(self, sensors: list[tuple[str, float]], n_workers: int,
+                 stats_interval: float = 5.0, max_restarts: int = 5,
+                 restart_delay: float = 1.0, metrics_port: int = 0,
+                 metrics_interval: float = 0, trace_file: str = None,
+                 trace_sample: float = 1.0, outbox_dir: str = None,
+                 **options):
+        """
+        Args:
+            sensors: List of sensors as tuples (sensor_type, sensor_period)
+            n_workers: Number of worker processes
+            stats_interval: Seconds between two stats reports
+            max_restarts: Maximum restarts of each worker
+            restart_delay: Seconds to wait before restarting a worker
+            metrics_port (optional): First port of the metrics endpoints,
+                worker i serves its metrics on metrics_port + i. Defaults
+                to 0, no endpoints
+            metrics_interval (optional): Seconds between two metrics logs
+                of each worker, 0 disables them
+            trace_file (optional): Prefix of the trace files, worker i
+                stamps its traced readings in '<trace_file>.<i>'
+            trace_sample (optional): Fraction of the readings traced
+            outbox_dir (optional): Directory of the outboxes, worker i
+                stores its messages while the broker is unreachable in
+                '<outbox_dir>/<i>'
+            options: SensorSimulator arguments (mode, client_id, broker,
+                port, scheduler, ...)
+        """
+        if not isinstance(n_workers, int) or n_workers < 1:
+            raise ValueError("Number of workers must be an int greater than 0.")
+        self.shards = split_sensors(sensors, n_workers)
+        self.options = options
+        self.stats_interval = stats_interval
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.metrics_port = metrics_port
+        self.metrics_interval = metrics_interval
+        self.trace_file = trace_file
+        self.trace_sample = trace_sample
+        self.outbox_dir = outbox_dir
+
+        self._context = multiprocessing.get_context("spawn")
+        # One pipe per worker instead of shared queues and events, so a 
+        # killed worker cannot leave a lock held for the others
+        self._pipes = {}
+        self._started = False
+        self._stopping = False
+        self.processes = {}
+        self.restarts = {index: 0 for index in range(len(self.shards))}
+        self.stats = {}
+        self.retired_readings = 0
+        self._last_report = None
+
+    def _start_worker(self, index: int):
+        first_id, sensors = self.shards[index]
+        pipe, worker_pipe = self._context.Pipe()
+        process = self._context.Process(
+            target = run_worker,
+            args = (index, first_id, sensors, self.options, worker_pipe,
+                    self.stats_interval, self.metrics_port,
+                    self.metrics_interval, self.trace_file, self.trace_sample,
+                    self.outbox_dir),
+            name = f"sensor_worker_{index}",
+            daemon = True,
+        )
+        process.start()
+        worker_pipe.close()
+        if index in self._pipes:
+            self._pipes[index].close()
+        self.processes[index] = process
+        self._pipes[index] = pipe
+        if self._started:
+            self._send(index, 'start')
+
+    def _send(self, index: int, command: str):
+        try:
+            self._pipes[index].send(command)
+        except OSError:
+            # The worker exited, supervise() restarts it
+            pass
+
+    def _drain_events(self, timeout: float = 0) -> list[tuple]:
+        """
+        Receives the pending ready and stats messages of every worker.
+
+        Args:
+            timeout: Seconds to wait for the first message
+        """
+        events = []
+        for receiver in multiprocessing.connection.wait(
+                list(self._pipes.values()), timeout):
+            try:
+                while receiver.poll():
+                    events.append(receiver.recv())
+            except (EOFError, OSError):
+                # The worker exited, supervise() restarts it
+                pass
+        for kind, index, stats in events:
+            if kind == 'stats':
+                self.stats[index] = stats
+        return events
+
+    def start(self, timeout: float = 60.0):
+        """
+        Starts every worker and releases them together once all of them
+        are ready.
+
+        Args:
+            timeout: Seconds to wait for the workers to be ready
+        """
+        self._started = self._stopping = False
+        for index in range(len(self.shards)):
+            self._start_worker(index)
+
+        ready = set()
+        deadline = time.monotonic() + timeout
+        while len(ready) < len(self.shards):
+            if time.monotonic() > deadline:
+                self.stop()
+                raise TimeoutError(
+                    f"Only {len(ready)} of {len(self.shards)} workers are ready.")
+            for kind, index, _ in self._drain_events(timeout=0.1):
+                if kind == 'ready':
+                    ready.add(index)
+        self._started = True
+        for index in self.processes:
+            self._send(index, 'start')
+        logging.info(f"{len(self.shards)} workers started.")
+
+    def supervise(self):
+        """
+        Restarts the workers that exited before stop() and
+        collects their stats. Called periodically by run().
+        """
+        self._drain_events()
+        if self._stopping:
+            return
+        for index, process in list(self.processes.items()):
+            if process.is_alive():
+                continue
+            if self.restarts[index] >= self.max_restarts:
+                logging.error(f"Worker {index} exited with code "
+                              f"{process.exitcode}, not restarting it.")
+                del self.processes[index]
+                continue
+            self.restarts[index] += 1
+            # Keep the readings of the crashed worker in the totals
+            self.retired_readings += self.stats.pop(index, {}).get('readings', 0)
+            logging.warning(f"Worker {index} exited with code "
+                            f"{process.exitcode}, restarting it "
+                            f"({self.restarts[index]}/{self.max_restarts}).")
+            time.sleep(self.restart_delay)
+            self._start_worker(index)
+
+    def get_stats(self) -> dict:
+        """
+        Returns the aggregated stats of every worker and the per-worker
+        stats.
+        """
+        workers = dict(sorted(self.stats.items()))
+        return {
+            'workers': len(self.processes),
+            'sensors': sum(s['sensors'] for s in workers.values()),
+            'readings': self.retired_readings + sum(
+                s['readings'] for s in workers.values()),
+            'missed': sum(s['missed'] for s in workers.values()),
+            'restarts': sum(self.restarts.values()),
+            'per_worker': workers,
+        }
+
+    def _report(self):
+        """
+        Logs the aggregated stats and readings/s every stats_interval.
+        """
+        now = time.monotonic()
+        if self._last_report is not None and \
+                now - self._last_report[0] < self.stats_interval:
+            return
+        stats = self.get_stats()
+        if self._last_report is not None:
+            last_time, last_readings = self._last_report
+            rate = (stats['readings'] - last_readings) / (now - last_time)
+            logging.info(f"Workers: {stats['workers']}, sensors: "
+                         f"{stats['sensors']}, readings: {stats['readings']}"
+                         f" ({rate:.0f}/s), missed: {stats['missed']}, "
+                         f"restarts: {stats['restarts']}")
+        self._last_report = (now, stats['readings'])
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Signals every worker to stop and waits for them, terminating the
+        ones that do not exit in time.
+
+        Args:
+            timeout: Seconds to wait for each worker
+        """
+        self._stopping = True
+        for index in self.processes:
+            self._send(index, 'stop')
+        for process in self.processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self._drain_events()
+        for pipe in self._pipes.values():
+            pipe.close()
+        self._pipes.clear()
+        self.processes.clear()
+        logging.info("All workers stopped.")
+
+    def run(self, duration: float = None):
+        """
+        Starts the workers and supervises them until Ctrl+C, SIGTERM or
+        the given duration, then stops them.
+
+        Args:
+            duration (optional): Seconds to run. Defaults to forever
+        """
+        stop_requested = []
+        previous = signal.signal(
+            signal.SIGTERM, lambda *args: stop_requested.append(True))
+        end = None if duration is None else time.monotonic() + duration
+        self.start()
+        try:
+            while not stop_requested and (end is None or time.monotonic() < end):
+                time.sleep(min(1.0, self.stats_interval))
+                self.supervise()
+                self._report()
+        except KeyboardInterrupt:
+            logging.info("Simulation stopped.")
+        finally:
+            logging.info("Stopping all workers...")
+            # A second Ctrl+C must not interrupt the coordinated shutdown
+            previous_sigint = signal.signal(signal.SIGINT, signal.SIG_IGN)
+            self.stop()
+            signal.signal(signal.SIGINT, previous_sigint)
+            signal.signal(signal.SIGTERM, previous)
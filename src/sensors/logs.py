@@ -0,0 +1,208 @@
+import collections
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from typing import Callable
+
+class LazyJSON:
+    """
+    Log argument serialized to JSON only if the message is formatted:
+    logging.info("data: %s", LazyJSON(data)).
+    """
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self) -> str:
+        return json.dumps(self.data)
+
+class SampledLogger:
+    """
+    Rate limited logger of per message events (readings, acks). At most
+    rate messages per second are logged, with bursts of up to burst
+    messages, and the next logged message tells how many were suppressed.
+
+    Messages use the lazy %-style arguments of logging, and nothing is
+    formatted when the level is disabled or the message is suppressed.
+    """
+
+    def __init__(self, logger: logging.Logger = None, rate: float = 1.0,
+                 burst: int = 1, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            logger (optional): Logger the messages go to. Defaults to the
+                root logger
+            rate: Messages logged per second, 0 suppresses every message
+                (default: 1)
+            burst: Messages that can be logged at once (default: 1)
+            clock: Monotonic clock, in seconds
+        """
+        if rate < 0:
+            raise ValueError("Rate must be greater or equal than 0.")
+        self.logger = logger or logging.getLogger()
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.suppressed = 0
+        self._tokens = float(burst)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def log(self, level: int, msg: str, *args):
+        """
+        Logs a message if the rate allows it.
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens < 1:
+                self.suppressed += 1
+                return
+            self._tokens -= 1
+            suppressed, self.suppressed = self.suppressed, 0
+        if suppressed:
+            msg += " (%d similar messages suppressed)"
+            args += (suppressed,)
+        self.logger.log(level, msg, *args)
+
+    def info(self, msg: str, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def debug(self, msg: str, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+class RateSummary:
+    """
+    Counts events (e.g. readings and acks) per key (e.g. sensor) and
+    periodically logs their rates, as one aggregated line instead of a
+    line per event.
+    """
+
+    def __init__(self, names: tuple[str, ...] = ("readings", "acks"),
+                 interval: float = 10.0, logger: logging.Logger = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            names: Names of the counted events (default: readings, acks)
+            interval: Seconds between two reports of the background
+                thread (default: 10)
+            logger (optional): Logger of the reports. Defaults to the
+                root logger
+            clock: Monotonic clock, in seconds
+        """
+        self.names = names
+        self.interval = interval
+        self.logger = logger or logging.getLogger()
+        self.clock = clock
+        self._counts = {name: collections.Counter() for name in names}
+        self._lock = threading.Lock()
+        self._since = clock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def count(self, name: str, key=None, n: int = 1):
+        """
+        Counts n events of a key.
+        """
+        with self._lock:
+            self._counts[name][key] += n
+
+    def report(self) -> dict:
+        """
+        Logs the rates since the previous report at INFO, and the rate of
+        each key at DEBUG, and resets the counters.
+
+        Returns:
+            Rates of each event name: total per second, number of keys,
+            and minimum and maximum per second of a key
+        """
+        with self._lock:
+            counts = self._counts
+            self._counts = {name: collections.Counter() for name in self.names}
+            now = self.clock()
+            elapsed, self._since = max(now - self._since, 1e-9), now
+        rates = {}
+        for name, counter in counts.items():
+            per_key = [count / elapsed for count in counter.values()]
+            rates[name] = {
+                "per_second": sum(per_key),
+                "keys": len(per_key),
+                "min_per_second": min(per_key, default=0.0),
+                "max_per_second": max(per_key, default=0.0),
+            }
+        self.logger.info(
+            "Last %.1f s: %s", elapsed, ", ".join(
+                f"{name} {r['per_second']:.1f}/s over {r['keys']} keys "
+                f"(min {r['min_per_second']:.2f}/s, max {r['max_per_second']:.2f}/s)"
+                for name, r in rates.items()))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            for name, counter in counts.items():
+                self.logger.debug("%s per key: %s", name, {
+                    key: round(count / elapsed, 2)
+                    for key, count in sorted(counter.items(), key=str)})
+        return rates
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()
+
+    def start(self):
+        """
+        Starts reporting every interval seconds in a background thread.
+        """
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        with self._lock:
+            self._since = self.clock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread.
+        """
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+def start_queue_logging(level: int = None) -> logging.handlers.QueueListener:
+    """
+    Moves the log I/O of every thread to a background thread: the handlers
+    of the root logger are replaced by a QueueHandler, and a QueueListener
+    hands the queued records to the original handlers (a StreamHandler if
+    there was none).
+
+    Args:
+        level (optional): Level set on the root logger
+
+    Returns:
+        Started listener, pass it to stop_queue_logging
+    """
+    root = logging.getLogger()
+    if level is not None:
+        root.setLevel(level)
+    handlers = root.handlers[:] or [logging.StreamHandler()]
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        records, *handlers, respect_handler_level=True)
+    root.handlers = [logging.handlers.QueueHandler(records)]
+    listener.start()
+    return listener
+
+def stop_queue_logging(listener: logging.handlers.QueueListener):
+    """
+    Flushes the queued records and restores the original handlers.
+    """
+    listener.stop()
+    logging.getLogger().handlers = list(listener.handlers)
@@ -0,0 +1,323 @@
+import http.server
+import json
+import logging
+import math
+import threading
+from typing import Callable
+
+class Counter:
+    """
+    Monotonic counter. It is either incremented, or read from a function
+    at collection time, which costs nothing on the hot path.
+
+    Increments take no lock: the GIL does not switch threads inside an
+    in-place add of an int, and a lock would triple the cost of inc().
+    """
+    kind = "counter"
+
+    def __init__(self, function: Callable[[], float] = None):
+        self.value = 0
+        self.function = function
+
+    def inc(self, n: float = 1):
+        self.value += n
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+class Gauge(Counter):
+    """
+    Value that goes up and down, set or read from a function at
+    collection time (e.g. a queue depth).
+    """
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.value = value
+
+    def dec(self, n: float = 1):
+        self.inc(-n)
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of durations: nanoseconds are counted in buckets
+    of 32 linear sub-buckets per power of two, so any value is recorded
+    with a relative error under 3.2% in O(1) and fixed memory, from
+    nanoseconds to centuries.
+
+    As in Counter, records take no lock, and readers copy the buckets.
+    """
+    kind = "histogram"
+
+    sub_bits = 5
+    n_buckets = 64 << sub_bits
+    # Buckets exported to Prometheus, from 1 us to 34 s
+    exported_bounds = tuple(2 ** k for k in range(10, 36))
+
+    def __init__(self):
+        self.counts = [0] * self.n_buckets
+        self.total = 0
+        self.max = 0
+
+    @classmethod
+    def index(cls, ns: int) -> int:
+        """
+        Bucket of a duration in nanoseconds.
+        """
+        shift = ns.bit_length() - cls.sub_bits - 1
+        if shift <= 0:
+            return ns
+        return (shift << cls.sub_bits) + (ns >> shift)
+
+    @classmethod
+    def lower_bound(cls, index: int) -> int:
+        """
+        Smallest duration in nanoseconds of a bucket.
+        """
+        shift = (index >> cls.sub_bits) - 1
+        if shift <= 0:
+            return index
+        return (index - (shift << cls.sub_bits)) << shift
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def record_ns(self, ns: int):
+        """
+        Records a duration in nanoseconds, e.g. a difference of
+        time.perf_counter_ns(). It must be greater or equal than 0 and
+        under 2**64.
+        """
+        # index() inlined, it is half the cost of a record
+        shift = ns.bit_length() - 6
+        self.counts[ns if shift <= 0 else (shift << 5) + (ns >> shift)] += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+
+    def record(self, seconds: float):
+        """
+        Records a duration in seconds. Negative values are recorded as 0.
+        """
+        self.record_ns(int(seconds * 1e9) if seconds > 0 else 0)
+
+    def percentile(self, q: float) -> float:
+        """
+        Returns an upper bound of the q-th percentile (0-100) in seconds.
+        """
+        counts, maximum = self.counts[:], self.max
+        count = sum(counts)
+        if count == 0:
+            return 0.0
+        target = max(1, math.ceil(q / 100 * count))
+        seen = 0
+        for index, n in enumerate(counts):
+            seen += n
+            if seen >= target:
+                return min(self.lower_bound(index + 1) - 1, maximum) / 1e9
+        return maximum / 1e9
+
+    def cumulative(self, bounds: tuple[int, ...]) -> list[int]:
+        """
+        Returns the number of values under each bound in nanoseconds,
+        rounded to the bucket boundaries.
+        """
+        counts = self.counts[:]
+        result, seen, start = [], 0, 0
+        for bound in bounds:
+            end = self.index(bound)
+            seen += sum(counts[start:end])
+            start = end
+            result.append(seen)
+        return result
+
+    def get(self) -> dict:
+        count = self.count
+        return {
+            "count": count,
+            "mean_ms": self.total / count / 1e6 if count else 0.0,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+            "p999_ms": self.percentile(99.9) * 1e3,
+            "max_ms": self.max / 1e6,
+        }
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+def _labels(labels: tuple, extra: str = None) -> str:
+    pairs = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class MetricsRegistry:
+    """
+    Registry of the counters, gauges and latency histograms of a process,
+    each one identified by its name and labels. It renders them in the
+    Prometheus text format, serves them over HTTP and logs snapshots.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # name -> (kind, help, {labels: metric})
+        self._families = {}
+        self._server = None
+        self._snapshot_stop = threading.Event()
+        self._snapshot_thread = None
+
+    def _get(self, cls, name: str, help: str, labels: dict, **kwargs):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = (cls.kind, help, {})
+            elif family[0] != cls.kind:
+                raise ValueError(f"Metric {name} is a {family[0]}.")
+            metric = family[2].get(key)
+            if metric is None or kwargs.get("function") is not None:
+                metric = family[2][key] = cls(**kwargs)
+            return metric
+
+    def counter(self, name: str, help: str = "",
+                function: Callable[[], float] = None, **labels) -> Counter:
+        """
+        Returns the counter of a name and labels, creating it if needed.
+
+        Args:
+            name: Metric name, e.g. 'mqtt_published_total'
+            help: Description of the metric
+            function (optional): Function read at collection time
+            labels: Label values, e.g. client='simulator'
+        """
+        return self._get(Counter, name, help, labels, function=function)
+
+    def gauge(self, name: str, help: str = "",
+              function: Callable[[], float] = None, **labels) -> Gauge:
+        """
+        Returns the gauge of a name and labels, see counter().
+        """
+        return self._get(Gauge, name, help, labels, function=function)
+
+    def histogram(self, name: str, help: str = "", **labels
+                  ) -> LatencyHistogram:
+        """
+        Returns the latency histogram of a name and labels, see counter().
+        """
+        return self._get(LatencyHistogram, name, help, labels)
+
+    def unregister(self, **labels):
+        """
+        Removes the metrics with the given labels, e.g. of a closed client.
+        """
+        key = set(labels.items())
+        with self._lock:
+            for _, _, metrics in self._families.values():
+                for labelset in [k for k in metrics if key <= set(k)]:
+                    del metrics[labelset]
+
+    def _collect(self) -> list[tuple]:
+        with self._lock:
+            return [(name, kind, help, list(metrics.items()))
+                    for name, (kind, help, metrics) in self._families.items()]
+
+    def to_prometheus(self) -> str:
+        """
+        Renders every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, kind, help, metrics in self._collect():
+            if not metrics:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                if kind != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {metric.get()}")
+                    continue
+                bounds = metric.exported_bounds
+                for bound, count in zip(bounds, metric.cumulative(bounds)):
+                    le = 'le="%g"' % (bound / 1e9)
+                    lines.append(f"{name}_bucket{_labels(labels, le)} {count}")
+                count, le = metric.count, 'le="+Inf"'
+                lines.append(f"{name}_bucket{_labels(labels, le)} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {metric.total / 1e9}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """
+        Returns the value of every metric, and count, mean, p50, p99,
+        p99.9 and max of every histogram, keyed by 'name{labels}'.
+        """
+        return {f"{name}{_labels(labels)}": metric.get()
+                for name, _, _, metrics in self._collect()
+                for labels, metric in metrics}
+
+    def serve(self, port: int = 9100, host: str = "0.0.0.0"
+              ) -> http.server.ThreadingHTTPServer:
+        """
+        Serves the metrics at http://host:port/metrics in a background
+        thread.
+
+        Returns:
+            Server, stopped with stop_serving()
+        """
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        logging.info(f"Serving metrics on http://{host}:{self._server.server_port}/metrics")
+        return self._server
+
+    def stop_serving(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _log_snapshots(self, interval: float, logger: logging.Logger):
+        while not self._snapshot_stop.wait(interval):
+            logger.info("Metrics: %s", json.dumps(self.snapshot()))
+
+    def start_snapshots(self, interval: float = 60.0,
+                        logger: logging.Logger = None):
+        """
+        Logs a snapshot of the metrics every interval seconds from a
+        background thread.
+        """
+        if self._snapshot_thread is not None:
+            return
+        self._snapshot_stop.clear()
+        self._snapshot_thread = threading.Thread(
+            target=self._log_snapshots,
+            args=(interval, logger or logging.getLogger()), daemon=True)
+        self._snapshot_thread.start()
+
+    def stop_snapshots(self):
+        if self._snapshot_thread is None:
+            return
+        self._snapshot_stop.set()
+        self._snapshot_thread.join()
+        self._snapshot_thread = None
+
+# Registry used by default by MQTTClientBase and SensorSimulator
+REGISTRY = MetricsRegistry()
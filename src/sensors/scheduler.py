@@ -0,0 +1,134 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Hashable
+
+from src.sensors.timing import Histogram, PeriodicTimer, TickStats
+
+class SensorScheduler:
+    """
+    Single-threaded scheduler that drives many periodic sensors from one
+    loop. Sensors are kept in a binary heap keyed by their next due time,
+    so each tick costs O(log n) regardless of how many sensors are
+    registered, and no thread is needed per sensor.
+
+    Sensors keep their own tick and missed tick counters, but share the
+    lateness and jitter histograms of the scheduler, so the memory per
+    sensor stays small with millions of sensors.
+    """
+
+    def __init__(self, callback: Callable[[Hashable], None],
+                 policy: str = "coalesce",
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            callback: Function called with the sensor key every time a
+                sensor is due
+            policy: Missed tick policy of the sensor timers
+                ['catch_up', 'coalesce', 'skip']
+            clock: Monotonic clock used to compute due times
+        """
+        self.callback = callback
+        self.policy = policy
+        self.clock = clock
+        self._heap = []
+        self._timers = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self.lateness = Histogram()
+        self.jitter = Histogram()
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def add(self, key: Hashable, period: float, first_due: float = None
+            ) -> PeriodicTimer:
+        """
+        Registers a sensor in the scheduler.
+
+        Args:
+            key: Unique key passed to the callback when the sensor is due
+            period: Period in seconds between two consecutive ticks
+            first_due (optional): Monotonic time of the first tick.
+                Defaults to now
+
+        Returns:
+            Timer of the sensor, which holds its timing statistics
+        """
+        timer = PeriodicTimer(period, self.policy, first_due, self.clock,
+                              TickStats(self.lateness, self.jitter))
+        with self._condition:
+            self._timers[key] = timer
+            heapq.heappush(self._heap, (timer.due, next(self._counter), key))
+            self._condition.notify()
+        return timer
+
+    def remove(self, key: Hashable):
+        """
+        Unregisters a sensor. Its pending heap entry is discarded lazily
+        the next time it reaches the top of the heap.
+
+        Args:
+            key: Key of the sensor to remove
+        """
+        with self._condition:
+            self._timers.pop(key, None)
+
+    def stop(self):
+        """
+        Signals the loop to finish and wakes it up if it is waiting.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def _pop_due(self, now: float) -> list[Hashable]:
+        """
+        Pops every entry whose due time has been reached and reschedules
+        it at the next deadline computed by its timer.
+
+        Returns:
+            List of keys ready to be dispatched
+        """
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, key = heapq.heappop(self._heap)
+            timer = self._timers.get(key)
+            if timer is None:
+                continue
+            if timer.tick(now):
+                ready.append(key)
+            heapq.heappush(self._heap, (timer.due, next(self._counter), key))
+        return ready
+
+    def run(self, stop_event: threading.Event = None):
+        """
+        Runs the scheduling loop until stop() is called or the given
+        stop_event is set. Blocks the calling thread.
+
+        Args:
+            stop_event (optional): Event that also terminates the loop
+        """
+        with self._condition:
+            self._stopped = False
+        while True:
+            with self._condition:
+                if self._stopped or (stop_event and stop_event.is_set()):
+                    break
+                now = self.clock()
+                ready = self._pop_due(now)
+                if not ready:
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    # Bound the wait so an external stop_event is noticed
+                    if stop_event is not None:
+                        timeout = 0.1 if timeout is None else min(timeout, 0.1)
+                    self._condition.wait(timeout)
+                    continue
+            for key in ready:
+                try:
+                    self.callback(key)
+                except Exception as e:
+                    logging.error(f"Error in scheduler for sensor {key}: {e}")
@@ -1,45 +1,210 @@
+import collections
 import random
 import time
 import threading
 import logging
-import json
 
 from src.rabbitmq.mqtt_client_base import MQTTClientBase
+from src.rabbitmq.outbox import Outbox
+from src.rabbitmq.publisher_pool import PublisherPool
+from src.sensors.batching import ReadingBatcher
+from src.sensors.capture import CaptureReader
+from src.sensors.codecs import BinaryCodec, JSONCodec, get_codec
+from src.sensors.logs import LazyJSON, RateSummary, SampledLogger
+from src.sensors.metrics import MetricsRegistry
+from src.sensors.registry import SensorRegistry
+from src.sensors.scheduler import SensorScheduler
+from src.sensors.timing import PeriodicTimer
+from src.sensors.topics import TopicScheme
+from src.sensors.tracing import Tracer
 
 class SensorSimulator(MQTTClientBase):
 
     sensor_types = ('humidity', 'temperature')
-    sensors_threads = []
-    stop_event = threading.Event()
+    schedulers = ('threads', 'heap', 'vectorized')
+    reading_log_modes = ('all', 'sampled', 'off')
 
     def __init__(self, 
-                 sensors: list[tuple[str, int]],
+                 sensors: list[tuple[str, float]] | str,
                  mode: str = "log",
                  client_id: str = None,
                  broker: str = "localhost",
                  port: int = 1883,
-                 keepalive: int = 60):
-        super().__init__(broker, port, client_id, keepalive)
+                 keepalive: int = 60,
+                 scheduler: str = "threads",
+                 missed_tick_policy: str = "coalesce",
+                 batch_size: int = 0,
+                 batch_linger: float = 0.1,
+                 batch_topic: str = "simulated_sensors/",
+                 codec: str | JSONCodec | BinaryCodec = "json",
+                 value_model: str = "uniform",
+                 pool_size: int = 1,
+                 first_id: int = 0,
+                 topic_scheme: str | TopicScheme = "simulated_sensors/{type}/{id}",
+                 reading_logs: str = "all",
+                 log_rate: float = 1.0,
+                 summary_interval: float = 0,
+                 metrics: MetricsRegistry = None,
+                 tracer: Tracer = None,
+                 qos: int = 1,
+                 replay_file: str = None,
+                 replay_speed: float = 1.0,
+                 replay_retime: bool = True,
+                 outbox: Outbox = None,
+                 outbox_rate: float = 0):
+        if outbox is not None and pool_size > 1:
+            raise ValueError("Outbox needs a single connection, pool_size 1.")
+        # Read by _create_client, a pool publishes through its own clients
+        self.pool_size = pool_size
+        super().__init__(broker, port, client_id, keepalive, metrics=metrics,
+                         outbox=outbox, outbox_rate=outbox_rate)
         """
         Args:
             sensors: List of sensors to simulate, in which each sensor
                 is represented by a tuple with the sensor type and the 
-                sensor period: [(sensor_type (str), sensor_period (int))]
-            mode: Mode to publish simulated sensors. Modes are ['log', 'mqtt']
+                sensor period in seconds, which can be fractional for 
+                high rate sensors:
+                [(sensor_type (str), sensor_period (int | float))]
+                or the path of a sensors file, see SensorRegistry.load
+            mode: Mode to publish simulated sensors. Modes are ['log', 
+                'mqtt', 'replay']. 'replay' publishes the readings of a
+                capture file with mqtt instead of simulated ones
             broker: Broker IP in case of using mqtt
             client_id: String with the client_id in case of using mqtt
+            scheduler: How sensors are driven. 'threads' starts one thread
+                per sensor, 'heap' drives every sensor from a single
+                thread using a heap keyed by next due time, 'vectorized'
+                drives every sensor from a single thread and generates 
+                the values of all the sensors due on a tick at once with
+                NumPy (per-sensor timing stats are not recorded)
+            missed_tick_policy: What to do when a sensor misses one or 
+                more periods. Policies are ['catch_up', 'coalesce', 'skip'].
+                The 'vectorized' scheduler only supports 'coalesce'
+            batch_size (optional): In mqtt mode, number of readings packed
+                in one message. Defaults to 0, which publishes each 
+                reading on its own
+            batch_linger (optional): Maximum time in seconds a reading 
+                waits before its batch is flushed. Defaults to 0.1
+            batch_topic (optional): MQTT topic where batches are published
+            codec (optional): Payload codec name ['json', 'binary'] or a 
+                codec instance, e.g. a BinaryCodec with a sensor ids 
+                dictionary. Defaults to 'json'
+            value_model (optional): Value model of the 'vectorized' 
+                scheduler ['uniform', 'random_walk', 'diurnal', 'noise'].
+                Defaults to 'uniform'
+            pool_size (optional): Number of mqtt connections. With more
+                than one, sensors are hashed onto a PublisherPool of 
+                connections with ids '<client_id>_<index>'. Defaults to 1
+            first_id (optional): Id of the first sensor, the others get
+                consecutive ids. Defaults to 0
+            topic_scheme (optional): Template of the topic of each 
+                reading, with its {type} and {id}, or a TopicScheme. 
+                Defaults to 'simulated_sensors/{type}/{id}'
+            reading_logs (optional): How each reading (and batch) is
+                logged: 'all' logs every one, 'sampled' at most log_rate
+                per second and 'off' none of them. Defaults to 'all'
+            log_rate (optional): Readings logged per second with 
+                'sampled'. Defaults to 1
+            summary_interval (optional): Seconds between two logs of the
+                readings/s and acks/s, counted per sensor. Defaults to 0,
+                which disables them
+            metrics (optional): Registry of the simulator metrics 
+                (readings, missed ticks, lateness) and of the mqtt client
+                metrics, see MQTTClientBase. Defaults to no metrics
+            tracer (optional): Tracer that gives a trace id to the
+                readings and stamps them when generated, published and
+                acked. Defaults to no tracing
+            qos (optional): Quality of Service level of the readings and
+                batches published. Defaults to 1
+            replay_file (optional): Capture file replayed in 'replay' mode,
+                see src.sensors.capture
+            replay_speed (optional): Replay speed relative to the capture,
+                e.g. 10 replays 10 times faster and 0 as fast as possible.
+                Defaults to 1
+            replay_retime (optional): Whether replayed readings get the 
+                time they are published as timestamp, so the ingestion
+                path sees them as live readings, instead of their original
+                timestamp. Defaults to True
+            outbox (optional): Outbox where readings are stored while the
+                broker is unreachable, and sent from in order once 
+                reconnected, see MQTTClientBase. Defaults to no outbox
+            outbox_rate (optional): Maximum messages per second sent from
+                the outbox. Defaults to 0, no limit
 
         An example input to init the class is:
-        sensors = [('humidity', 5), ('temperature', 1), ('temperature', 3)]
+        sensors = [('humidity', 5), ('temperature', 1), ('temperature', 0.5)]
         """
-        self.sensors = self._init_sensors(sensors)
+        if scheduler not in self.schedulers:
+            raise ValueError(
+                f"Scheduler must be one of: {self.schedulers}")
+        if missed_tick_policy not in PeriodicTimer.policies:
+            raise ValueError(
+                f"Missed tick policy must be one of: {PeriodicTimer.policies}")
+        if scheduler == 'vectorized' and missed_tick_policy != 'coalesce':
+            raise ValueError(
+                "The vectorized scheduler only supports the 'coalesce' "
+                "missed tick policy.")
+        if mode == 'replay' and replay_file is None:
+            raise ValueError("Replay mode needs a replay file.")
+        if replay_speed < 0:
+            raise ValueError("Replay speed must be greater or equal than 0.")
+        if qos not in (0, 1, 2):
+            raise ValueError("QoS must be one of: (0, 1, 2)")
+        if reading_logs not in self.reading_log_modes:
+            raise ValueError(
+                f"Reading logs must be one of: {self.reading_log_modes}")
+        self.sensors = self._init_sensors(sensors, first_id)
+        self.sensors_threads = []
+        self.stop_event = threading.Event()
+        self._running = False
+        # Serializes the sensors added or removed at runtime with the
+        # start and stop of the threads
+        self._sensors_lock = threading.RLock()
+        # Sensors added or removed since the vectorized table was built,
+        # applied by its thread
+        self._fleet_changes = collections.deque()
+        self._fleet_wake = threading.Event()
         self.mode = mode
-        if mode == "mqtt":
+        self.scheduler = scheduler
+        self.missed_tick_policy = missed_tick_policy
+        self.sensor_stats = {}
+        self._scheduler = None
+        self._batcher = None
+        if batch_size:
+            self._batcher = ReadingBatcher(
+                self._publish_batch, batch_size, batch_linger)
+        self.batch_topic = batch_topic
+        self.codec = get_codec(codec) if isinstance(codec, str) else codec
+        self.topic_scheme = TopicScheme(topic_scheme) \
+            if isinstance(topic_scheme, str) else topic_scheme
+        self.reading_logs = reading_logs
+        self._sampled_log = SampledLogger(rate=log_rate)
+        if summary_interval:
+            self.summary = RateSummary(interval=summary_interval)
+        self.tracer = tracer
+        self.qos = qos
+        self.replay_file = replay_file
+        self.replay_speed = replay_speed
+        self.replay_retime = replay_retime
+        self._readings = None
+        # Readings generated by every scheduler and mode, see _count_reading
+        self.readings_total = 0
+        self._readings_lock = threading.Lock()
+        if metrics is not None:
+            self._register_simulator_metrics(metrics)
+        self.pool = None
+        self.fleet = None
+        if scheduler == 'vectorized':
+            # NumPy is only required by the vectorized scheduler
+            from src.sensors.fleet import FleetGenerator, SensorTable
+            self.fleet = FleetGenerator(
+                SensorTable(self.sensors), value_model)
+        if mode in ("mqtt", "replay"):
             self._init_mqtt_client(broker, port, client_id, keepalive)
         logging.info(f"Sensor simulator running in '{mode}' mode")
             
-    def _validate_sensors(self, sensors: list[tuple[str, int]]
-            ) -> list[tuple[str, int]]:
+    def _validate_sensors(self, sensors: list[tuple[str, float]]
+            ) -> list[tuple[str, float]]:
         """
         Validates that sensors input data is correct for sensors 
         definition.
@@ -58,44 +223,76 @@ class SensorSimulator(MQTTClientBase):
                 raise ValueError(
                     "Each sensor must be a tuple of 2 values."
                 )
-            if not isinstance(item[0], str) or not isinstance(item[1], int):
+            if (not isinstance(item[0], str) 
+                    or not isinstance(item[1], (int, float))
+                    or isinstance(item[1], bool)):
                 raise ValueError(
-                    "Each tuple must contain a sensor type (string) and sensor period (int)."
+                    "Each tuple must contain a sensor type (string) and sensor period (int or float)."
                 )
+            if item[1] <= 0:
+                raise ValueError("Sensor period must be greater than 0.")
             if item[0] not in self.sensor_types:
                 raise ValueError(
                     f"Sensor type must be one of: {self.sensor_types}")
 
         return sensors
 
-    def _init_sensors(self, input_sensors: list[tuple[str, int]]
-            ) -> list[dict[int, str, int]]:
+    def _init_sensors(self, input_sensors: list[tuple[str, float]] | str,
+                      first_id: int = 0) -> SensorRegistry:
         """
-        Validates input sensors and returns them as a list of dictionaries.
+        Validates input sensors and registers them.
 
         Args:
             input_sensors: List of sensors as tuples
                 Example: [sensor1, sensor2, ...]
                 sensor (tuple): (sensor_type, sensor_period)
+                or the path of a sensors file
+            first_id: Id of the first sensor
         
         Returns:
-            output_sensors: List of sensors as dictionaries
-                Example: [sensor1, sensor2, ...]
-                sensor (dict): {id: int, sensor_type: str, sensor_period: int}
+            Registry of the sensors, iterated as dictionaries
+                sensor (dict): {id: int, type: str, period: float}
         """
-        output_sensors = []
-        sensors = self._validate_sensors(input_sensors)
-        
-        for i, sensor in enumerate(sensors):
-            output_sensor = {
-                'id': i,
-                'type': sensor[0],
-                'period': sensor[1]
-            }
-            output_sensors.append(output_sensor)
-            logging.info(f"Sensors successfully initialized: {json.dumps(output_sensor)}")
+        registry = SensorRegistry(self.sensor_types, first_id)
+        if isinstance(input_sensors, str):
+            registry.load(input_sensors)
+        else:
+            registry.extend(self._validate_sensors(input_sensors))
+        logging.info(f"Sensors successfully initialized: {len(registry)} "
+                     f"sensors with ids from {first_id}")
+        return registry
+
+    def _create_client(self):
+        """
+        Creates the paho client, unless the simulator publishes through
+        a PublisherPool.
+        """
+        if self.pool_size > 1:
+            return None
+        return super()._create_client()
 
-        return output_sensors
+    def disconnect(self):
+        """
+        Disconnects from the MQTT broker, every connection of the pool
+        when publishing through one.
+        """
+        if self.pool is not None:
+            self.pool.disconnect()
+        else:
+            super().disconnect()
+
+    def get_publish_stats(self) -> dict:
+        """
+        Returns the outbound counters, see MQTTClientBase, summed over the
+        connections of the pool when publishing through one.
+        """
+        if self.pool is None:
+            return super().get_publish_stats()
+        totals = {}
+        for connection in self.pool.connections:
+            for name, value in connection.get_publish_stats().items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
 
     def _init_mqtt_client(self, broker: str, port: int, client_id: str, 
                           keepalive: int):
@@ -126,10 +323,18 @@ class SensorSimulator(MQTTClientBase):
             raise TypeError(
                 "Keepalive must be a valid value in int format."
             )
-        self.connect()
-        # self.loop_start()
+        if self.pool_size > 1:
+            self.pool = PublisherPool(broker, port, client_id, 
+                                      self.pool_size, keepalive,
+                                      metrics=self.metrics)
+            for connection in self.pool.connections:
+                connection.summary = self.summary
+                connection.tracer = self.tracer
+            self.pool.connect()
+        else:
+            self.connect()
 
-    def generate_sensor_data(self, sensor_type: str, period: int, id: int
+    def generate_sensor_data(self, sensor_type: str, period: float, id: int
                              ) -> dict:
         """
         Generates simulated sensor data.
@@ -148,7 +353,131 @@ class SensorSimulator(MQTTClientBase):
             "value": round(random.uniform(20.0, 100.0), 2),
             "timestamp": time.time()}
 
-    def print_log_sensor(self, sensor_type: str, period: int, id: int,
+    def log_sensor_reading(self, sensor_type: str, period: float, id: int):
+        """
+        Gets and publishes a single sensor reading using logs.
+
+        Args:
+            sensor_type: Type of sensor ['temperature', 'humididy']
+            period: Period in seconds of the sensor
+            id: Sensor id
+        """
+        self._log_reading(self.generate_sensor_data(sensor_type, period, id))
+
+    def _register_simulator_metrics(self, metrics: MetricsRegistry):
+        """
+        Registers the metrics of the simulator. Ticks and lateness are
+        read from the sensor stats when collected.
+        """
+        client = self.client_id
+        stats = lambda: list(self.sensor_stats.values())
+        self._readings = metrics.counter(
+            "simulator_readings_total", "Readings generated", client=client)
+        metrics.gauge("simulator_sensors", "Simulated sensors",
+                      function=lambda: len(self.sensors), client=client)
+        metrics.counter("simulator_missed_ticks_total",
+                        "Periods missed by the sensors",
+                        function=lambda: sum(s.missed for s in stats()),
+                        client=client)
+        metrics.gauge("simulator_lateness_p99_seconds",
+                      "Highest p99 lateness of a sensor tick",
+                      function=lambda: max(
+                          (h.percentile(99) for h in
+                           {id(s.lateness): s.lateness
+                            for s in stats()}.values()), default=0.0),
+                      client=client)
+
+    def _count_reading(self, data: dict):
+        with self._readings_lock:
+            self.readings_total += 1
+        if self.tracer is not None:
+            self.tracer.start(data)
+        if self.summary is not None:
+            self.summary.count('readings', data['id'])
+        if self._readings is not None:
+            self._readings.inc()
+
+    def _log_reading(self, data: dict):
+        self._count_reading(data)
+        self._log_event('data received: %s', LazyJSON(data))
+
+    def _log_event(self, msg: str, *args):
+        """
+        Logs a per reading message as the reading logs mode says, only
+        formatting it if it is logged.
+        """
+        if self.reading_logs == 'all':
+            logging.info(msg, *args)
+        elif self.reading_logs == 'sampled':
+            self._sampled_log.info(msg, *args)
+
+    def publish_sensor_reading(self, sensor_type: str, period: float, id: int,
+                               topic: str = None, qos: int = None, 
+                               retain: bool = False):
+        """
+        Gets and publishes a single sensor reading in a given mqtt topic.
+
+        Args:
+            sensor_type: Type of sensor ['temperature', 'humididy']
+            period: Period in seconds of the sensor
+            id: Sensor id
+            topic (optional): MQTT topic to publish data. Defaults to the
+                topic of the reading in the topic scheme
+            qos (optional): Quality of Service level. Defaults to the qos
+                of the simulator
+            retain (optional): Whether to retain the message. Defaults to False
+        """
+        self._publish_reading(
+            self.generate_sensor_data(sensor_type, period, id), 
+            topic, qos, retain)
+
+    def _publish_reading(self, data: dict, topic: str = None,
+                         qos: int = None, retain: bool = False):
+        if qos is None:
+            qos = self.qos
+        self._count_reading(data)
+        if self._batcher is not None:
+            self._batcher.add(data)
+            return
+        if topic is None:
+            topic = self.topic_scheme.topic(data)
+        payload = self.codec.encode_reading(data)
+        trace = {}
+        if 'trace_id' in data:
+            trace['trace'] = data['trace_id']
+            self.tracer.stamp(data['trace_id'], 'published')
+        if self.pool is not None:
+            self.pool.publish(topic, payload, qos, retain, key=data['id'],
+                              **trace)
+        else:
+            self.publish(topic, payload, qos, retain, **trace)
+        self._log_event('data published: %s', LazyJSON(data))
+
+    def _publish_batch(self, readings: list[dict], qos: int = None):
+        """
+        Publishes a batch of readings as one mqtt message.
+
+        Args:
+            readings: Readings gathered by the batcher
+            qos (optional): Quality of Service level. Defaults to the qos
+                of the simulator
+        """
+        if qos is None:
+            qos = self.qos
+        payload = self.codec.encode_batch(readings)
+        trace = {}
+        if self.tracer is not None:
+            trace_ids = [r['trace_id'] for r in readings if 'trace_id' in r]
+            if trace_ids:
+                trace['trace'] = trace_ids
+                self.tracer.stamp(trace_ids, 'published')
+        if self.pool is not None:
+            self.pool.publish(self.batch_topic, payload, qos, **trace)
+        else:
+            self.publish(self.batch_topic, payload, qos, **trace)
+        self._log_event('batch published: %d readings', len(readings))
+
+    def print_log_sensor(self, sensor_type: str, period: float, id: int,
                         stop_event: threading.Event):
         """
         Gets and publishes sensor data using logs.
@@ -160,20 +489,22 @@ class SensorSimulator(MQTTClientBase):
             stop_event: Event to signal thread termination
 
         Returns:
-            Publishes sensor data at a given period (freq = 1/period)
+            Publishes sensor data at a given period (freq = 1/period).
+            Deadlines are absolute, so generation time does not add drift
         """
+        timer = PeriodicTimer(period, self.missed_tick_policy)
+        self.sensor_stats[id] = timer.stats
         try:
-            while not stop_event.is_set():
-                data = self.generate_sensor_data(sensor_type, period, id)
-                logging.info(f'data received: {json.dumps(data)}')
-                time.sleep(period)
+            while timer.wait(stop_event) and id in self.sensors:
+                if timer.tick():
+                    self.log_sensor_reading(sensor_type, period, id)
             logging.info(f"Thread for sensor {id} stopped.")
         except Exception as e:
             logging.error(f"Error in thread for sensor {id}: {e}")
 
-    def publish_mqtt_sensor(self, sensor_type: str, period: int, id: int,
+    def publish_mqtt_sensor(self, sensor_type: str, period: float, id: int,
                             stop_event: threading.Event,
-                            topic: str = "simulated_sensors/", qos: int = 1, 
+                            topic: str = None, qos: int = None, 
                             retain: bool = False):
         """
         Gets and publishes sensor data in a given mqtt topic.
@@ -183,46 +514,272 @@ class SensorSimulator(MQTTClientBase):
             period: Period in seconds to get and publish the data
             id: Sensor id
             stop_event: Event to signal thread termination
-            topic: MQTT topic to publish data
-            qos (optional): Quality of Service level. Defaults to 1
+            topic (optional): MQTT topic to publish data. Defaults to the
+                topic of the reading in the topic scheme
+            qos (optional): Quality of Service level. Defaults to the qos
+                of the simulator
             retain (optional): Whether to retain the message. Defaults to False
         """
-        # topic += str(id)
+        timer = PeriodicTimer(period, self.missed_tick_policy)
+        self.sensor_stats[id] = timer.stats
         try:
-            while not stop_event.is_set():
-                data = self.generate_sensor_data(sensor_type, period, id)
-                time.sleep(period)
-                self.publish(topic, json.dumps(data), qos, retain)
-                logging.info(f'data published: {json.dumps(data)}')
+            while timer.wait(stop_event) and id in self.sensors:
+                if timer.tick():
+                    self.publish_sensor_reading(
+                        sensor_type, period, id, topic, qos, retain)
         except Exception as e:
             logging.error(f"Error in thread for sensor {id}: {e}")
 
-    def run_threads(self):
+    def _run_scheduled_sensor(self, key: int):
         """
-        Creates and starts a different thread for each simulated sensor 
-        to publish simulated data. The data can be published using logs
-        or using mqtt.
+        Scheduler callback that emits one reading of the given sensor.
+
+        Args:
+            key: Slot of the sensor in self.sensors
         """
-        if   self.mode == 'log' : target=self.print_log_sensor
-        elif self.mode == 'mqtt': target=self.publish_mqtt_sensor
+        sensor = self.sensors[key]
+        if self.mode == 'log':
+            self.log_sensor_reading(
+                sensor['type'], sensor['period'], sensor['id'])
+        elif self.mode == 'mqtt':
+            self.publish_sensor_reading(
+                sensor['type'], sensor['period'], sensor['id'])
 
-        for sensor in self.sensors:
-            thread = threading.Thread(
-                target = target,
-                args = (sensor['type'], sensor['period'], sensor['id'], 
-                        self.stop_event)
-            )
-            self.sensors_threads.append(thread)
+    def run_vectorized_sensors(self, stop_event: threading.Event):
+        """
+        Drives every sensor of the fleet table from one loop. On each tick
+        the values and timestamps of all the due sensors are generated as
+        whole columns and then published using logs or using mqtt. Sensors
+        added or removed since the last tick are applied to the table
+        first.
+
+        Args:
+            stop_event: Event to signal thread termination
+        """
+        table = self.fleet.table
+        emit = self._log_reading if self.mode == 'log' else self._publish_reading
+        try:
+            while not stop_event.is_set():
+                self._fleet_wake.clear()
+                self._apply_fleet_changes()
+                now = time.monotonic()
+                delay = table.next_deadline() - now
+                if delay > 0:
+                    # Bounded so the stop event is noticed
+                    self._fleet_wake.wait(min(delay, 0.1))
+                    continue
+                indices = table.pop_due(now)
+                values, timestamps = self.fleet.generate(indices)
+                for data in self.fleet.readings(indices, values, timestamps):
+                    emit(data)
+            logging.info("Vectorized sensors thread stopped.")
+        except Exception as e:
+            logging.error(f"Error in vectorized sensors thread: {e}")
+
+    def _apply_fleet_changes(self):
+        while self._fleet_changes:
+            change, slots = self._fleet_changes.popleft()
+            if change == 'add':
+                self.fleet.extend(self.sensors, slots)
+            else:
+                self.fleet.table.disable(slots)
+
+    def run_replay(self, stop_event: threading.Event):
+        """
+        Publishes the readings of the replay file with mqtt, spaced as in
+        the capture divided by the replay speed, or back to back with a
+        speed of 0. The file is memory-mapped and read as it is replayed,
+        so it is never loaded in memory.
+
+        Args:
+            stop_event: Event to signal thread termination
+        """
+        speed = self.replay_speed
+        replayed = 0
+        try:
+            with CaptureReader(self.replay_file) as reader:
+                start, first = time.monotonic(), None
+                for data in reader:
+                    if stop_event.is_set():
+                        break
+                    if speed:
+                        if first is None:
+                            first = data['timestamp']
+                        delay = start + (data['timestamp'] - first) / speed \
+                            - time.monotonic()
+                        if delay > 0 and stop_event.wait(delay):
+                            break
+                    if self.replay_retime:
+                        data['timestamp'] = time.time()
+                    self._publish_reading(data)
+                    replayed += 1
+            logging.info(f"Replay of {self.replay_file} stopped after "
+                         f"{replayed} readings.")
+        except Exception as e:
+            logging.error(f"Error in replay thread: {e}")
+
+    def run_threads(self, mode: str = None):
+        """
+        Starts publishing simulated data for every sensor. The data can 
+        be published using logs or using mqtt. In 'replay' mode a single
+        thread publishes the readings of the replay file instead.
+
+        With the 'threads' scheduler a different thread is created for 
+        each simulated sensor. With the 'heap' and 'vectorized' schedulers
+        a single thread drives every sensor. Sensors can be added and
+        removed while running, see add_sensors.
+
+        Args:
+            mode (optional): Overrides the mode given at init
+        """
+        with self._sensors_lock:
+            self._start_threads(mode)
+
+    def _start_threads(self, mode: str = None):
+        if mode is not None:
+            self.mode = mode
+        self.stop_event.clear()
+        if self._batcher is not None:
+            self._batcher.start()
+        if self.summary is not None:
+            self.summary.start()
+
+        if self.mode == 'replay':
+            self.sensors_threads.append(threading.Thread(
+                target = self.run_replay,
+                args = (self.stop_event,)
+            ))
+        elif self.scheduler == 'heap':
+            self._scheduler = SensorScheduler(
+                self._run_scheduled_sensor, self.missed_tick_policy)
+            self._schedule_sensors(self.sensors.items())
+            self.sensors_threads.append(threading.Thread(
+                target = self._scheduler.run,
+                args = (self.stop_event,)
+            ))
+        elif self.scheduler == 'vectorized':
+            self.sensors_threads.append(threading.Thread(
+                target = self.run_vectorized_sensors,
+                args = (self.stop_event,)
+            ))
+        else:
+            self.sensors_threads.extend(
+                self._sensor_threads(self.sensors.items()))
 
         for thread in self.sensors_threads:
             thread.start()
+        self._running = True
+
+    def _schedule_sensors(self, sensors):
+        """
+        Adds (slot, sensor) pairs to the heap scheduler.
+        """
+        for slot, sensor in sensors:
+            timer = self._scheduler.add(slot, sensor['period'])
+            self.sensor_stats[sensor['id']] = timer.stats
+
+    def _sensor_threads(self, sensors) -> list[threading.Thread]:
+        """
+        Creates the threads of (slot, sensor) pairs with the 'threads'
+        scheduler.
+        """
+        if   self.mode == 'log' : target=self.print_log_sensor
+        elif self.mode == 'mqtt': target=self.publish_mqtt_sensor
+        return [threading.Thread(
+                    target = target,
+                    args = (sensor['type'], sensor['period'], sensor['id'], 
+                            self.stop_event)
+                ) for _, sensor in sensors]
+
+    def add_sensors(self, sensors: list[tuple[str, float]]) -> list[int]:
+        """
+        Adds sensors to the simulation. If it is running, they start
+        publishing right away without restarting the running threads.
+
+        Args:
+            sensors: List of sensors as tuples (sensor_type, sensor_period)
+
+        Returns:
+            Ids of the new sensors
+        """
+        return self._add_slots(
+            self.sensors.extend(self._validate_sensors(sensors)))
+
+    def load_sensors(self, path: str) -> list[int]:
+        """
+        Adds the sensors of a sensors file, see SensorRegistry.load, as
+        add_sensors.
+
+        Returns:
+            Ids of the new sensors
+        """
+        return self._add_slots(self.sensors.load(path))
+
+    def _add_slots(self, slots: range) -> list[int]:
+        with self._sensors_lock:
+            if self.fleet is not None:
+                self._fleet_changes.append(('add', slots))
+                self._fleet_wake.set()
+            if self._running and self.mode != 'replay':
+                if self.scheduler == 'heap':
+                    self._schedule_sensors(self.sensors.items(slots))
+                elif self.scheduler == 'threads':
+                    threads = self._sensor_threads(self.sensors.items(slots))
+                    self.sensors_threads.extend(threads)
+                    for thread in threads:
+                        thread.start()
+        logging.info(f"Added {len(slots)} sensors.")
+        return [self.sensors.first_id + slot for slot in slots]
+
+    def remove_sensors(self, ids: list[int]):
+        """
+        Removes sensors from the simulation. If it is running, they stop
+        publishing: right away with the 'heap' and 'vectorized' 
+        schedulers, and on their next tick with 'threads'.
+
+        Args:
+            ids: Ids of the sensors to remove
+        """
+        with self._sensors_lock:
+            for id in ids:
+                slot = self.sensors.remove(id)
+                self.sensor_stats.pop(id, None)
+                if self.fleet is not None:
+                    self._fleet_changes.append(('remove', slot))
+                    self._fleet_wake.set()
+                if self._scheduler is not None:
+                    self._scheduler.remove(slot)
+        logging.info(f"Removed {len(ids)} sensors.")
     
+    def get_sensor_stats(self) -> dict[int, dict]:
+        """
+        Returns the timing statistics of every running sensor: emitted
+        ticks, missed ticks, and lateness and jitter histograms summaries.
+        With the 'heap' scheduler the histograms are shared by all the
+        sensors, see SensorScheduler.
+
+        Returns:
+            Dictionary with the sensor id as key and its statistics
+        """
+        return {id: stats.summary() for id, stats in self.sensor_stats.items()}
+
     def stop_threads(self):
         """
         Stops and deletes the running threads of simulated sensors. 
         """
+        with self._sensors_lock:
+            self._running = False
         self.stop_event.set()
+        if self._scheduler is not None:
+            self._scheduler.stop()
         for thread in self.sensors_threads:
             thread.join()
         self.sensors_threads.clear()
+        self._scheduler = None
+        if self._batcher is not None:
+            self._batcher.stop()
+        if self.summary is not None:
+            self.summary.stop()
+        if self.tracer is not None:
+            self.tracer.flush()
         logging.info("All threads stopped.")
@@ -0,0 +1,199 @@
+import math
+import threading
+import time
+from typing import Callable
+
+class Histogram:
+    """
+    Fixed size histogram of durations with power of two buckets in
+    microseconds. Recording a value is O(1) and memory does not grow with
+    the number of samples.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    n_buckets = 32
+
+    def __init__(self):
+        self.counts = [0] * self.n_buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float):
+        """
+        Records a duration.
+
+        Args:
+            value: Duration in seconds. Negative values are recorded as 0
+        """
+        value = max(value, 0.0)
+        index = min(int(value * 1e6).bit_length(), self.n_buckets - 1)
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """
+        Returns an upper bound of the q-th percentile (0-100) in seconds.
+        """
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(q / 100 * self.count))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min((1 << index) / 1e6, self.max)
+        return self.max
+
+    def mean(self) -> float:
+        """
+        Returns the mean of the recorded values in seconds.
+        """
+        return self.total / self.count if self.count else 0.0
+
+    def summary(self) -> dict:
+        """
+        Returns the main statistics of the histogram in milliseconds.
+        """
+        return {
+            'count': self.count,
+            'mean_ms': self.mean() * 1e3,
+            'p50_ms': self.percentile(50) * 1e3,
+            'p99_ms': self.percentile(99) * 1e3,
+            'max_ms': self.max * 1e3,
+        }
+
+class TickStats:
+    """
+    Timing statistics of a periodic sensor. Missed ticks are the ones
+    dropped by the 'coalesce' and 'skip' policies, and with 'catch_up'
+    the ones emitted a full period or more late.
+
+    Lateness and jitter histograms can be shared by the stats of many
+    sensors, so their memory does not grow with the number of sensors.
+    """
+
+    __slots__ = ('ticks', 'missed', 'lateness', 'jitter')
+
+    def __init__(self, lateness: Histogram = None, jitter: Histogram = None):
+        """
+        Args:
+            lateness (optional): Histogram of the tick lateness. Defaults
+                to a histogram of its own
+            jitter (optional): Histogram of the tick jitter. Defaults to
+                a histogram of its own
+        """
+        self.ticks = 0
+        self.missed = 0
+        self.lateness = Histogram() if lateness is None else lateness
+        self.jitter = Histogram() if jitter is None else jitter
+
+    def summary(self) -> dict:
+        return {
+            'ticks': self.ticks,
+            'missed': self.missed,
+            'lateness': self.lateness.summary(),
+            'jitter': self.jitter.summary(),
+        }
+
+class PeriodicTimer:
+    """
+    Absolute deadline timer based on a monotonic clock. Deadlines are
+    computed from the start time and the period, never from the time the
+    previous tick finished, so the time spent generating and publishing a
+    reading does not accumulate as drift.
+
+    When a tick is late by a full period or more, the missed tick policy
+    decides what happens:
+        - 'catch_up': every missed tick is emitted back to back.
+        - 'coalesce': a single tick is emitted for all the missed ones and
+            the timer resumes on the original grid.
+        - 'skip': missed ticks are dropped and the timer resumes on the
+            original grid.
+    """
+
+    policies = ('catch_up', 'coalesce', 'skip')
+
+    __slots__ = ('period', 'policy', 'clock', 'due', 'stats', '_last_tick')
+
+    def __init__(self, period: float, policy: str = "coalesce",
+                 start: float = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 stats: TickStats = None):
+        """
+        Args:
+            period: Period in seconds
+            policy: Missed tick policy ['catch_up', 'coalesce', 'skip']
+            start (optional): Monotonic time of the first deadline.
+                Defaults to now
+            clock: Monotonic clock
+            stats (optional): Stats where the ticks are recorded, e.g.
+                with shared histograms. Defaults to stats of its own
+        """
+        if period <= 0:
+            raise ValueError("Sensor period must be greater than 0.")
+        if policy not in self.policies:
+            raise ValueError(
+                f"Missed tick policy must be one of: {self.policies}")
+        self.period = period
+        self.policy = policy
+        self.clock = clock
+        self.due = clock() if start is None else start
+        self.stats = TickStats() if stats is None else stats
+        self._last_tick = None
+
+    def wait(self, stop_event: threading.Event) -> bool:
+        """
+        Blocks until the next deadline.
+
+        Args:
+            stop_event: Event that interrupts the wait
+
+        Returns:
+            False if stop_event was set, True otherwise
+        """
+        delay = self.due - self.clock()
+        if delay > 0:
+            return not stop_event.wait(delay)
+        return not stop_event.is_set()
+
+    def tick(self, now: float = None) -> int:
+        """
+        Consumes the current deadline, records its lateness and jitter and
+        computes the next deadline.
+
+        Args:
+            now (optional): Current monotonic time. Defaults to clock()
+
+        Returns:
+            Number of readings to emit for this deadline (0 or 1)
+        """
+        now = self.clock() if now is None else now
+        lateness = now - self.due
+        self.stats.lateness.record(lateness)
+
+        if lateness < self.period:
+            self.due += self.period
+            emit = 1
+        elif self.policy == 'catch_up':
+            # Emitted back to back once its next deadline has passed
+            self.due += self.period
+            emit = 1
+            self.stats.missed += 1
+        else:
+            missed = int(lateness // self.period)
+            self.due += (missed + 1) * self.period
+            emit = 0 if self.policy == 'skip' else 1
+            self.stats.missed += missed + 1 - emit
+
+        if emit:
+            if self._last_tick is not None:
+                self.stats.jitter.record(
+                    abs(now - self._last_tick - self.period))
+            self._last_tick = now
+            self.stats.ticks += 1
+        return emit
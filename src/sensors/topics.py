@@ -0,0 +1,79 @@
+class TopicScheme:
+    """
+    Scheme of the MQTT topics readings are published to, a template with
+    the {type} and {id} fields of the reading, e.g.
+    'simulated_sensors/{type}/{id}'. Subscribers build their filters and
+    RabbitMQ bindings from the same scheme, so each consumer only
+    receives the sensors it needs.
+    """
+
+    fields = ('type', 'id')
+
+    def __init__(self, template: str = "simulated_sensors/{type}/{id}"):
+        """
+        Args:
+            template: Topic template, whose levels are literals or one of
+                the {type} and {id} fields
+                (default: 'simulated_sensors/{type}/{id}')
+        """
+        self.levels = template.split("/")
+        for level in self.levels:
+            if level.startswith("{") and level.strip("{}") not in self.fields:
+                raise ValueError(
+                    f"Topic fields must be one of: {self.fields}")
+            if "+" in level or "#" in level:
+                raise ValueError("Topic template can not contain wildcards.")
+        self.template = template
+
+    def __repr__(self) -> str:
+        return f"TopicScheme({self.template!r})"
+
+    def topic(self, reading: dict) -> str:
+        """
+        Returns the topic of a reading.
+        """
+        return self.template.format(type=reading["type"], id=reading["id"])
+
+    def filter(self, sensor_type: str = None, sensor_id: int = None) -> str:
+        """
+        Returns the topic filter of the readings of a sensor type and/or
+        id, with a '+' wildcard for the fields not given. A trailing run
+        of wildcards becomes '#'.
+        """
+        values = {"type": sensor_type, "id": sensor_id}
+        levels = []
+        for level in self.levels:
+            field = level.strip("{}") if level.startswith("{") else None
+            if field is None:
+                levels.append(level)
+            elif values[field] is None:
+                levels.append("+")
+            else:
+                levels.append(str(values[field]))
+        if len(levels) > 1 and levels[-1] == "+":
+            while len(levels) > 1 and levels[-1] == "+":
+                levels.pop()
+            levels.append("#")
+        return "/".join(levels)
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """
+    Returns whether a topic matches an MQTT topic filter, where '+'
+    matches one level and a trailing '#' matches any number of levels.
+    """
+    levels = topic.split("/")
+    for i, level in enumerate(pattern.split("/")):
+        if level == "#":
+            return True
+        if i >= len(levels) or (level != "+" and level != levels[i]):
+            return False
+    return len(levels) == i + 1
+
+def to_routing_key(topic_filter: str) -> str:
+    """
+    Translates an MQTT topic filter into the routing key of a binding to
+    the amq.topic exchange. The RabbitMQ MQTT plugin replaces the '/' of
+    topics with '.', and '+' becomes the AMQP single word wildcard '*'.
+    """
+    return ".".join("*" if level == "+" else level
+                    for level in topic_filter.split("/"))
@@ -0,0 +1,190 @@
+import argparse
+import collections
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Iterable
+
+from src.sensors.metrics import LatencyHistogram
+
+# Stages of a reading, in pipeline order
+STAGES = ('generated', 'published', 'acked', 'consumed', 'persisted', 'served')
+
+# Latencies of the report. Acks and consumption both follow the publish,
+# in any order, so they are measured from it
+SEGMENTS = (
+    ('generated', 'published'),
+    ('published', 'acked'),
+    ('published', 'consumed'),
+    ('consumed', 'persisted'),
+    ('persisted', 'served'),
+    ('generated', 'persisted'),
+    ('generated', 'served'),
+)
+
+class Tracer:
+    """
+    Stamps the stages of sampled readings across the pipeline. A traced
+    reading carries a 'trace_id' field from the simulator to the
+    consumer, and every process records (trace_id, stage, time) stamps to
+    its own JSON lines file, joined afterwards by report().
+
+    Stamps are time.monotonic_ns(), which is the same clock in every
+    process of a host, so the stages of a trace must run on one host.
+    """
+
+    def __init__(self, path: str, sample: float = 1.0,
+                 flush_size: int = 1000, max_keys: int = 100000,
+                 clock: Callable[[], int] = time.monotonic_ns):
+        """
+        Args:
+            path: File the stamps are appended to
+            sample: Fraction of the readings traced (default: 1)
+            flush_size: Stamps buffered before writing them (default: 1000)
+            max_keys: Persisted readings remembered to stamp them when
+                served (default: 100000)
+            clock: Monotonic clock, in nanoseconds
+        """
+        if not 0 <= sample <= 1:
+            raise ValueError("Sample must be between 0 and 1.")
+        self.path = path
+        self.sample = sample
+        self.flush_size = flush_size
+        self.max_keys = max_keys
+        self.clock = clock
+        # Random prefix, so ids of several processes do not collide
+        self._prefix = random.getrandbits(31) << 32
+        self._ids = itertools.count(1)
+        self._stamps = []
+        self._keys = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def start(self, reading: dict):
+        """
+        Gives a trace id to a reading if it is sampled, and stamps it as
+        generated.
+        """
+        if self.sample < 1 and random.random() >= self.sample:
+            return
+        reading['trace_id'] = self._prefix | next(self._ids)
+        self.stamp(reading['trace_id'], 'generated')
+
+    def stamp(self, trace_ids: int | Iterable[int], stage: str):
+        """
+        Records the time a stage of one or several traces is reached.
+        """
+        now = self.clock()
+        if isinstance(trace_ids, int):
+            trace_ids = (trace_ids,)
+        with self._lock:
+            self._stamps.extend((trace_id, stage, now) for trace_id in trace_ids)
+            full = len(self._stamps) >= self.flush_size
+        if full:
+            self.flush()
+
+    def stamp_readings(self, readings: list[dict], stage: str):
+        """
+        Stamps a stage of the traced readings of a list.
+        """
+        trace_ids = [r['trace_id'] for r in readings if 'trace_id' in r]
+        if trace_ids:
+            self.stamp(trace_ids, stage)
+
+    def remember(self, readings: list[dict]):
+        """
+        Remembers the trace ids of persisted readings by sensor id and
+        timestamp, since the database does not store them, so served()
+        finds them. The oldest ones are forgotten past max_keys.
+        """
+        with self._lock:
+            for reading in readings:
+                if 'trace_id' in reading:
+                    key = (int(reading['id']), float(reading['timestamp']))
+                    self._keys[key] = reading['trace_id']
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+
+    def served(self, readings: list[dict]):
+        """
+        Stamps the traced readings returned to a client. A reading is
+        only stamped the first time it is served.
+        """
+        trace_ids = []
+        with self._lock:
+            for reading in readings:
+                key = (int(reading['id']), float(reading['timestamp']))
+                trace_id = self._keys.pop(key, None)
+                if trace_id is None and 'trace_id' in reading:
+                    trace_id = reading['trace_id']
+                if trace_id is not None:
+                    trace_ids.append(trace_id)
+        if trace_ids:
+            self.stamp(trace_ids, 'served')
+
+    def flush(self):
+        """
+        Appends the buffered stamps to the file.
+        """
+        with self._lock:
+            stamps, self._stamps = self._stamps, []
+            if not stamps:
+                return
+            with open(self.path, 'a') as f:
+                f.writelines(f'{{"trace_id": {trace_id}, "stage": "{stage}", '
+                             f'"ns": {ns}}}\n' for trace_id, stage, ns in stamps)
+
+def load_traces(paths: list[str]) -> dict[int, dict[str, int]]:
+    """
+    Reads the stamps files of every process.
+
+    Returns:
+        Stage times of each trace, the first stamp of a stage is kept
+    """
+    traces = collections.defaultdict(dict)
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path) as f:
+            for line in f:
+                stamp = json.loads(line)
+                traces[stamp['trace_id']].setdefault(stamp['stage'], stamp['ns'])
+    return traces
+
+def report(traces: dict[int, dict[str, int]]) -> dict[str, dict]:
+    """
+    Computes the latency distribution of each segment of SEGMENTS over
+    the traces that reached both of its stages.
+
+    Returns:
+        Count, mean, p50, p99, p99.9 and max in ms of each segment, keyed
+        by 'stage -> stage'
+    """
+    histograms = {segment: LatencyHistogram() for segment in SEGMENTS}
+    for stages in traces.values():
+        for (start, end), histogram in histograms.items():
+            if start in stages and end in stages:
+                histogram.record_ns(max(stages[end] - stages[start], 0))
+    return {f"{start} -> {end}": histogram.get()
+            for (start, end), histogram in histograms.items()}
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per stage latency report of traced readings")
+    parser.add_argument('paths', nargs='+',
+                        help="Stamps files of the simulator, consumer and API")
+    args = parser.parse_args()
+
+    traces = load_traces(args.paths)
+    print(f"{len(traces)} traces")
+    print(f"{'segment':>26} {'count':>8} {'mean ms':>9} {'p50 ms':>9} "
+          f"{'p99 ms':>9} {'p99.9 ms':>9} {'max ms':>9}")
+    for segment, s in report(traces).items():
+        print(f"{segment:>26} {s['count']:>8} {s['mean_ms']:>9.2f} "
+              f"{s['p50_ms']:>9.2f} {s['p99_ms']:>9.2f} {s['p999_ms']:>9.2f} "
+              f"{s['max_ms']:>9.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+from src.fastapi.app.cache import QueryCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+    def __call__(self):
+        return self.now
+
+# Test query normalization
+def test_normalize():
+    """
+    Test that the key of a query does not depend on the order of its
+    parameters nor on int or float numbers.
+    """
+    assert QueryCache.normalize('q', start=1, end=2.0, sensor_id=None) == \
+        QueryCache.normalize('q', sensor_id=None, end=2, start=1.0)
+    assert QueryCache.normalize('q', start=1) != QueryCache.normalize('p', start=1)
+
+# Test LRU eviction and TTL
+def test_lru_and_ttl():
+    """
+    Test that the least recently used result is evicted and results
+    expire after the ttl.
+    """
+    clock = FakeClock()
+    cache = QueryCache(max_entries=2, ttl=10, clock=clock)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    clock.now = 11
+    assert cache.get('a') is None
+    assert cache.get_stats() == {'entries': 1, 'hits': 2, 'misses': 2,
+                                 'invalidated': 0}
+
+# Test invalidation by window
+def test_invalidate_window():
+    """
+    Test that ingesting into a window only invalidates the results that
+    cover it.
+    """
+    cache = QueryCache()
+    cache.put('old', 1, 0, 100)
+    cache.put('new', 2, 100, 200)
+    cache.put('open', 3, 150, None)
+    cache.on_write([(0, 'temperature', 160.0, 1.0), (1, 'temperature', 120.0, 1.0)])
+    assert cache.get('old') == 1
+    assert cache.get('new') is None
+    assert cache.get('open') is None
+
+# Test results computed during an ingest
+def test_put_skips_results_invalidated_while_computed():
+    """
+    Test that a result is not cached if its window was invalidated while
+    it was computed, but it is if another window was.
+    """
+    cache = QueryCache()
+    version = cache.version
+    cache.invalidate(50, 60)
+    cache.put('stale', 1, 0, 100, version)
+    cache.put('fresh', 2, 100, 200, version)
+    assert cache.get('stale') is None
+    assert cache.get('fresh') == 2
+
+# Test disabled cache
+def test_disabled_cache():
+    """
+    Test that a ttl of 0 disables the cache.
+    """
+    cache = QueryCache(ttl=0)
+    cache.put('a', 1)
+    assert cache.get('a') is None
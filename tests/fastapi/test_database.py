@@ -0,0 +1,164 @@
+import os
+import pytest
+import random
+
+from src.fastapi.app.compression import (encode_timestamps, decode_timestamps,
+                                         encode_values, decode_values)
+from src.fastapi.app.database import TimeSeriesDatabase
+
+START = 1700000000.0
+
+def make_readings(n_sensors=3, n_ticks=10, period=1.0, start=START):
+    return [{'id': sensor, 'type': 'temperature', 'period': period,
+             'value': round(20 + sensor + tick * 0.1, 2),
+             'timestamp': start + tick * period}
+            for tick in range(n_ticks) for sensor in range(n_sensors)]
+
+# Test timestamps compression
+def test_timestamps_round_trip():
+    """
+    Test that jittered timestamps round trip with microsecond precision
+    and regular ones take about one bit each.
+    """
+    timestamps = [START + i + random.random() * 0.01 for i in range(500)]
+    decoded = decode_timestamps(encode_timestamps(timestamps), 500)
+    assert all(abs(a - b) < 1e-6 for a, b in zip(decoded, timestamps))
+
+    regular = [START + i for i in range(1000)]
+    data = encode_timestamps(regular)
+    assert decode_timestamps(data, 1000) == regular
+    assert len(data) < 16 + 1000 // 8 + 1
+
+# Test values compression
+def test_values_round_trip():
+    """
+    Test that float values round trip exactly and repeated values take
+    about one bit each.
+    """
+    values = [round(random.uniform(-50, 50), 2) for _ in range(500)]
+    values += [0.0, -0.0, float('inf'), 1e-300, 3.0, 3.0]
+    assert decode_values(encode_values(values), len(values)) == values
+    assert len(encode_values([21.5] * 1000)) < 8 + 1000 // 8 + 1
+
+# Test write and query from the head
+def test_write_query(tmp_path):
+    """
+    Test that readings are queried by range, sensor id and type.
+    """
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write(make_readings())
+    readings = db.query(START + 2, START + 5)
+    assert len(readings) == 9
+    assert readings[0] == {'id': 0, 'type': 'temperature',
+                           'timestamp': START + 2, 'value': 20.2}
+    assert [r['timestamp'] for r in db.query(sensor_id=1)] == \
+        [START + i for i in range(10)]
+    assert db.query(sensor_type='humidity') == []
+    db.close()
+
+# Test flush to segments
+def test_flush_segments(tmp_path):
+    """
+    Test that flushed readings are stored in one segment per chunk and
+    the write-ahead log is emptied.
+    """
+    db = TimeSeriesDatabase(str(tmp_path), chunk_duration=5)
+    db.write(make_readings())
+    expected = db.query()
+    db.flush()
+    assert db.get_stats()['segments'] == 2
+    assert db.get_stats()['head_points'] == 0
+    assert os.path.getsize(tmp_path / 'wal.log') == 0
+    assert db.query() == expected
+    db.close()
+
+# Test automatic flush
+def test_flush_when_head_is_full(tmp_path):
+    """
+    Test that the head is flushed once it reaches max_head_points.
+    """
+    db = TimeSeriesDatabase(str(tmp_path), max_head_points=10)
+    db.write(make_readings(n_ticks=3))
+    assert db.get_stats()['head_points'] == 9
+    db.write(make_readings(n_ticks=1, start=START + 3))
+    stats = db.get_stats()
+    assert (stats['chunks'], stats['segments'], stats['head_points']) == (1, 1, 0)
+    assert len(db.query()) == 12
+    db.close()
+
+# Test chunk pruning
+def test_scan_reads_only_needed_chunks(tmp_path):
+    """
+    Test that a range scan only reads the segments of overlapping chunks.
+    """
+    db = TimeSeriesDatabase(str(tmp_path), chunk_duration=10)
+    db.write(make_readings(n_ticks=50))
+    db.flush()
+    assert db.chunks(START + 12, START + 25) == [START + 10, START + 20]
+
+    db = TimeSeriesDatabase(str(tmp_path), chunk_duration=10)
+    list(db.scan(START + 12, START + 25))
+    loaded = [s.chunk_start for s in db.segments.all() if s._index is not None]
+    assert sorted(loaded) == [START + 10, START + 20]
+    db.close()
+
+# Test duplicated and out of order readings
+def test_out_of_order_and_duplicates(tmp_path):
+    """
+    Test that late readings are merged in order and a duplicated
+    timestamp keeps the last written value.
+    """
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write(make_readings(n_sensors=1, n_ticks=5))
+    db.flush()
+    db.write([{'id': 0, 'type': 'temperature', 'timestamp': START + 2.5, 'value': 1.0},
+              {'id': 0, 'type': 'temperature', 'timestamp': START + 1, 'value': 2.0}])
+    readings = db.query(sensor_id=0)
+    assert [r['timestamp'] for r in readings] == \
+        [START, START + 1, START + 2, START + 2.5, START + 3, START + 4]
+    assert readings[1]['value'] == 2.0
+    db.close()
+
+# Test recovery from the write-ahead log
+def test_wal_recovery(tmp_path):
+    """
+    Test that readings not flushed are recovered after a crash, and a
+    torn last record is discarded.
+    """
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write(make_readings(n_ticks=2))
+    db.write(make_readings(n_ticks=1, start=START + 2))
+    db._wal.close()     # Simulate a crash, nothing is flushed
+    with open(tmp_path / 'wal.log', 'ab') as f:
+        f.write(b'\x10\x00\x00\x00garbage')
+
+    db = TimeSeriesDatabase(str(tmp_path))
+    assert len(db.query()) == 9
+    assert db.get_stats()['head_points'] == 9
+    db.close()
+
+# Test recovery of an interrupted flush
+def test_recover_interrupted_flush(tmp_path):
+    """
+    Test that readings of an interrupted flush are flushed when opening.
+    """
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write(make_readings())
+    db._wal.close()
+    os.replace(tmp_path / 'wal.log', tmp_path / 'wal.000000.flushing')
+
+    db = TimeSeriesDatabase(str(tmp_path))
+    assert not os.path.exists(tmp_path / 'wal.000000.flushing')
+    assert db.get_stats()['segments'] == 1
+    assert len(db.query()) == 30
+    db.close()
+
+# Test invalid readings
+def test_write_invalid_reading(tmp_path):
+    """
+    Test that a reading without value is rejected.
+    """
+    db = TimeSeriesDatabase(str(tmp_path))
+    with pytest.raises(ValueError, match="Reading must contain id, type, timestamp and value"):
+        db.write([{'id': 0, 'type': 'temperature', 'timestamp': START}])
+    db.close()
@@ -0,0 +1,105 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+
+from src.fastapi.app.database import TimeSeriesDatabase
+from src.fastapi.app.fanout import FanoutHub, Subscription, topic_matches
+from src.fastapi.app.main import create_app
+from src.fastapi.app.routes import sse_events
+
+def reading(sensor_id, value, sensor_type='temperature'):
+    return {'id': sensor_id, 'type': sensor_type, 'value': value,
+            'timestamp': 1700000000.0 + value}
+
+# Test topic patterns
+def test_topic_matches():
+    """
+    Test MQTT wildcards against reading topics.
+    """
+    assert topic_matches('sensors/+/1', 'sensors/temperature/1')
+    assert topic_matches('sensors/#', 'sensors/temperature/1')
+    assert topic_matches('sensors/temperature/#', 'sensors/temperature')
+    assert not topic_matches('sensors/+', 'sensors/temperature/1')
+    assert not topic_matches('sensors/humidity/+', 'sensors/temperature/1')
+
+# Test conflation
+def test_subscription_conflation():
+    """
+    Test that pending readings keep the latest of each sensor and that
+    the oldest sensor is dropped past max_pending.
+    """
+    async def run():
+        subscription = Subscription(max_pending=2)
+        for value in range(3):
+            subscription.put(reading(0, value))
+        subscription.put(reading(1, 0))
+        subscription.put(reading(2, 0))
+        batch = await subscription.get()
+        subscription.close()
+        return subscription, batch, await subscription.get()
+
+    subscription, batch, closed = asyncio.run(run())
+    assert [(r['id'], r['value']) for r in batch] == [(1, 0), (2, 0)]
+    assert (subscription.conflated, subscription.dropped) == (2, 1)
+    assert closed == []
+    with pytest.raises(ValueError):
+        Subscription(max_pending=0)
+
+# Test fan-out
+def test_hub_dispatch():
+    """
+    Test that published readings reach only the matching subscriptions.
+    """
+    async def run():
+        hub = FanoutHub()
+        hub.start()
+        by_id = hub.subscribe(sensor_ids=[1])
+        by_topic = hub.subscribe(topics=['simulated_sensors/humidity/+'])
+        every = hub.subscribe()
+        await asyncio.to_thread(hub.publish, [
+            reading(0, 1), reading(1, 2), reading(2, 3, 'humidity')])
+        batches = [await s.get() for s in (by_id, by_topic, every)]
+        hub.unsubscribe(every)
+        return hub, batches
+
+    hub, batches = asyncio.run(run())
+    assert [[r['id'] for r in batch] for batch in batches] == \
+        [[1], [2], [0, 1, 2]]
+    stats = hub.get_stats()
+    assert (stats['subscribers'], stats['published'], stats['delivered']) == \
+        (2, 3, 5)
+
+# Test WebSocket endpoint
+def test_websocket(tmp_path):
+    """
+    Test that readings written through the API are pushed to WebSocket
+    subscribers of their sensor.
+    """
+    db = TimeSeriesDatabase(str(tmp_path))
+    with TestClient(create_app(db)) as client:
+        with client.websocket_connect('/ws?sensor_id=1') as websocket:
+            client.post('/readings', json=[reading(0, 1.0), reading(1, 2.0)])
+            assert websocket.receive_json() == [reading(1, 2.0)]
+            assert client.get('/stats').json()['fanout']['subscribers'] == 1
+    db.close()
+
+# Test server-sent events
+def test_sse_events():
+    """
+    Test the event stream of a subscription and its keepalive comments.
+    """
+    async def run():
+        hub = FanoutHub()
+        hub.start()
+        subscription = hub.subscribe()
+        events = sse_events(hub, subscription, keepalive=0.01)
+        keepalive = await anext(events)
+        hub.publish([reading(0, 1.0)])
+        data = await anext(events)
+        await events.aclose()
+        return hub, keepalive, data
+
+    hub, keepalive, data = asyncio.run(run())
+    assert keepalive == b': keepalive\n\n'
+    assert data.startswith(b'data: [{"id": 0')
+    assert len(hub) == 0
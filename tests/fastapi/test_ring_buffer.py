@@ -0,0 +1,79 @@
+import pytest
+
+from src.fastapi.app.database import TimeSeriesDatabase
+from src.fastapi.app.ring_buffer import RingBufferIndex
+
+START = 1700000000.0
+
+def rows(sensor_id, n, start=START, sensor_type='temperature'):
+    return [(sensor_id, sensor_type, start + i, float(i)) for i in range(n)]
+
+# Test latest values
+def test_latest():
+    """
+    Test that the latest value of each sensor is kept, and late readings
+    do not replace it.
+    """
+    index = RingBufferIndex(capacity=4)
+    index.ingest(rows(1, 3) + rows(0, 5))
+    index.ingest([(0, 'temperature', START, -1.0)])
+    assert index.latest() == [
+        {'id': 0, 'type': 'temperature', 'timestamp': START + 4, 'value': 4.0},
+        {'id': 1, 'type': 'temperature', 'timestamp': START + 2, 'value': 2.0}]
+    assert index.latest(sensor_id=1, sensor_type='temperature')[0]['value'] == 2.0
+    assert index.latest(sensor_type='humidity') == []
+
+# Test ring buffer wrap around
+def test_recent_wraps_around():
+    """
+    Test that full buffers keep the last capacity readings in order.
+    """
+    index = RingBufferIndex(capacity=4)
+    index.ingest(rows(0, 10))
+    series = index.recent()
+    assert series[0].timestamps == [START + i for i in range(6, 10)]
+    assert series[0].values == [6.0, 7.0, 8.0, 9.0]
+    assert index.recent(seconds=1.5)[0].values == [8.0, 9.0]
+
+# Test late readings in the window
+def test_recent_sorts_late_readings():
+    """
+    Test that late readings are returned in timestamp order.
+    """
+    index = RingBufferIndex(capacity=8)
+    index.ingest([(0, 'temperature', START + 2, 2.0), (0, 'temperature', START, 0.0),
+                  (0, 'temperature', START + 1, 1.0)])
+    assert index.recent()[0].values == [0.0, 1.0, 2.0]
+
+# Test memory bound
+def test_max_sensors():
+    """
+    Test that readings of sensors beyond max_sensors are dropped and the
+    memory does not grow past the bound.
+    """
+    index = RingBufferIndex(capacity=10, max_sensors=100)
+    index.ingest([(i, 'temperature', START, 1.0) for i in range(150)])
+    stats = index.get_stats()
+    assert stats['sensors'] == 100
+    assert stats['dropped'] == 50
+    assert stats['memory_bytes'] == 100 * 10 * 16 + 100 * 16
+    with pytest.raises(ValueError, match="Capacity must be an int greater than 0."):
+        RingBufferIndex(capacity=0)
+
+# Test warm up from the database
+def test_warm(tmp_path):
+    """
+    Test that the index is loaded with the window of the database and
+    the latest reading of older sensors.
+    """
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write([{'id': 0, 'type': 'temperature', 'timestamp': START + i,
+               'value': float(i)} for i in range(100)])
+    db.write([{'id': 1, 'type': 'humidity', 'timestamp': START - 7200,
+               'value': 5.0}])
+    index = RingBufferIndex(capacity=50)
+    index.warm(db, seconds=10)
+    assert [s.values for s in index.recent(seconds=10)] == \
+        [[float(i) for i in range(89, 100)], []]
+    assert index.latest()[1]['value'] == 5.0
+    db.close()
@@ -0,0 +1,168 @@
+import os
+import pytest
+
+from src.fastapi.app.database import TimeSeriesDatabase
+from src.fastapi.app.rollups import DAY, HOUR, MINUTE, RollupTier
+
+NOW = 1700000000.0
+START = NOW // DAY * DAY - DAY
+
+def make_readings(n_ticks, period=10.0, start=START, n_sensors=2):
+    return [{'id': sensor, 'type': 'temperature', 'period': period,
+             'value': float(tick % 7 + sensor), 'timestamp': start + tick * period}
+            for tick in range(n_ticks) for sensor in range(n_sensors)]
+
+def aggregate_raw(readings, resolution, sensor_id=0):
+    buckets = {}
+    for r in readings:
+        if r['id'] == sensor_id:
+            bucket = r['timestamp'] // resolution * resolution
+            buckets.setdefault(bucket, []).append(r['value'])
+    return {bucket: (min(v), max(v), sum(v) / len(v), len(v), v[-1])
+            for bucket, v in buckets.items()}
+
+def as_dict(rows, sensor_id=0):
+    return {r['timestamp']: (r['min'], r['max'], r['avg'], r['count'], r['last'])
+            for r in rows if r['id'] == sensor_id}
+
+# Test rollups updated by each batch
+def test_rollups_match_raw(tmp_path):
+    """
+    Test that rollups merged across flushes match the raw aggregates.
+    """
+    readings = make_readings(720)
+    db = TimeSeriesDatabase(str(tmp_path))
+    for i in range(0, len(readings), 100):
+        db.write(readings[i:i + 100])
+        if i % 300 == 0:
+            db.flush()
+    for resolution in (MINUTE, 5 * MINUTE, HOUR):
+        rows = db.aggregate(START, START + 2 * HOUR, resolution, now=NOW)
+        assert as_dict(rows) == pytest.approx(aggregate_raw(readings, resolution))
+    db.close()
+
+# Test tier selection
+def test_select_tier(tmp_path):
+    """
+    Test that the coarsest tier that divides the resolution and still
+    covers the start of the range is selected.
+    """
+    db = TimeSeriesDatabase(str(tmp_path))
+    assert db.select_tier(START, 30, now=NOW) is None
+    assert db.select_tier(START, 90, now=NOW) is None
+    assert db.select_tier(START, MINUTE, now=NOW).name == '1m'
+    assert db.select_tier(START, 15 * MINUTE, now=NOW).name == '1m'
+    assert db.select_tier(START, HOUR, now=NOW).name == '1h'
+    assert db.select_tier(START, 7 * DAY, now=NOW).name == '1d'
+    assert db.select_tier(NOW - 60 * DAY, MINUTE, now=NOW) is None
+    assert db.select_tier(NOW - 60 * DAY, HOUR, now=NOW).name == '1h'
+    assert db.select_tier(None, HOUR, now=NOW).name == '1h'
+    assert db.select_tier(None, 30, now=NOW) is None
+    db.close()
+
+# Test aggregates from raw readings
+def test_aggregate_without_tier(tmp_path):
+    """
+    Test that resolutions finer than every tier are aggregated from the
+    raw readings.
+    """
+    readings = make_readings(60)
+    db = TimeSeriesDatabase(str(tmp_path), rollup_tiers=())
+    db.write(readings)
+    rows = db.aggregate(START, START + 600, 30, now=NOW)
+    assert as_dict(rows) == pytest.approx(aggregate_raw(readings, 30))
+    with pytest.raises(ValueError, match="Rollups are disabled."):
+        list(db.scan_rollups('1m'))
+    db.close()
+
+# Test compaction
+def test_compact_retention_and_merge(tmp_path):
+    """
+    Test that compaction drops raw chunks past their retention, merges
+    segments, and keeps the rollups.
+    """
+    tiers = (RollupTier('1m', MINUTE, 30 * DAY), RollupTier('1h', HOUR))
+    db = TimeSeriesDatabase(str(tmp_path), raw_retention=HOUR, rollup_tiers=tiers)
+    readings = make_readings(360, period=20.0)
+    for i in range(0, len(readings), 240):
+        db.write(readings[i:i + 240])
+        db.flush()
+    expected = db.aggregate(START, START + 2 * HOUR, HOUR, now=NOW)
+    assert db.get_stats()['rollup_segments'] > 2
+
+    result = db.compact(now=START + 2 * HOUR + 1)
+    assert result['dropped'] == 2
+    assert db.query(end=START + HOUR) == []
+    assert len(db.query()) == 360
+    stats = db.get_stats()
+    assert stats['segments'] == 1
+    assert stats['rollup_segments'] == 2
+    assert db.aggregate(START, START + 2 * HOUR, HOUR, now=NOW) == expected
+    db.close()
+
+    db = TimeSeriesDatabase(str(tmp_path), raw_retention=HOUR, rollup_tiers=tiers)
+    assert db.aggregate(START, START + 2 * HOUR, HOUR, now=NOW) == expected
+    db.close()
+
+# Test redelivered readings
+def test_redelivery_does_not_count_twice(tmp_path):
+    """
+    Test that readings delivered again, before and after a flush and
+    after reopening the database, are aggregated once by the rollups, as
+    by the raw readings.
+    """
+    readings = make_readings(10, n_sensors=1)
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write(readings)
+    db.write(readings[:5])
+    db.flush()
+    db.write(readings[3:7])
+    db.close()
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write(readings[:2])
+    db.write(make_readings(1, start=START + 100, n_sensors=1))
+    raw = db.aggregate(START, START + HOUR, 10, now=NOW)
+    rollup = db.aggregate(START, START + HOUR, MINUTE, now=NOW)
+    assert sum(r['count'] for r in raw) == 11
+    assert [(r['count'], r['avg']) for r in rollup] == \
+        [(6, pytest.approx(2.5)), (5, pytest.approx(1.8))]
+    db.close()
+
+# Test recovery of an interrupted flush
+def test_interrupted_flush_does_not_count_twice(tmp_path):
+    """
+    Test that rollups written by a flush interrupted before deleting its
+    write-ahead log are replaced, not added, on recovery.
+    """
+    readings = make_readings(30)
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write(readings)
+    expected = db.aggregate(START, START + HOUR, MINUTE, now=NOW)
+    # Simulate a crash after the rollups of the flush were written
+    seq = db._next_seq
+    db._rotate()
+    db._wal.close()
+    os.replace(tmp_path / 'wal.log', tmp_path / f'wal.{seq:06d}.flushing')
+    db.rollups.write_segments(seq)
+
+    db = TimeSeriesDatabase(str(tmp_path))
+    assert db.aggregate(START, START + HOUR, MINUTE, now=NOW) == expected
+    assert len(db.query()) == 60
+    db.close()
+
+# Test background compaction
+def test_compaction_thread(tmp_path):
+    """
+    Test that the compaction thread runs and stops.
+    """
+    db = TimeSeriesDatabase(str(tmp_path), raw_retention=DAY)
+    db.write(make_readings(10, start=1000.0))
+    db.flush()
+    db.start_compaction(interval=0.01)
+    for _ in range(100):
+        if not db.query():
+            break
+        db._compaction_stop.wait(0.01)
+    db.close()
+    assert db._compaction_thread is None
+    assert db.query() == []
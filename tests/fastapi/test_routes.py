@@ -0,0 +1,151 @@
+import json
+import pytest
+from fastapi.testclient import TestClient
+
+from src.fastapi.app.database import TimeSeriesDatabase
+from src.fastapi.app.main import create_app
+from src.fastapi.app.routes import decode_binary_frames
+
+START = 1700000000.0
+
+def make_readings(n_ticks=10, start=START):
+    return [{'id': sensor, 'type': sensor_type, 'value': float(tick + sensor),
+             'timestamp': start + tick}
+            for tick in range(n_ticks)
+            for sensor, sensor_type in ((0, 'temperature'), (1, 'humidity'))]
+
+@pytest.fixture
+def client(tmp_path):
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write(make_readings())
+    with TestClient(create_app(db)) as client:
+        yield client
+    db.close()
+
+# Test range query
+def test_get_readings(client):
+    """
+    Test that readings are queried by range and sensor.
+    """
+    response = client.get('/readings', params={'start': START + 2, 'end': START + 4})
+    assert response.status_code == 200
+    assert len(response.json()) == 4
+    response = client.get('/readings', params={'sensor_type': 'humidity'})
+    assert [r['id'] for r in response.json()] == [1] * 10
+
+# Test streaming formats
+def test_get_readings_streaming(client):
+    """
+    Test that NDJSON and binary streams hold the same readings as JSON.
+    """
+    expected = client.get('/readings').json()
+    response = client.get('/readings', params={'format': 'ndjson'})
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    key = lambda r: (r['timestamp'], r['id'])
+    assert sorted(lines, key=key) == expected
+    response = client.get('/readings', params={'format': 'binary'})
+    assert sorted(decode_binary_frames(response.content), key=key) == expected
+    assert client.get('/readings', params={'format': 'xml'}).status_code == 400
+
+# Test aggregates
+def test_get_aggregates(client):
+    """
+    Test aggregates per sensor and per type.
+    """
+    rows = client.get('/aggregates', params={'start': START, 'resolution': 5,
+                                             'sensor_id': 0}).json()
+    assert [(r['count'], r['min'], r['max'], r['last']) for r in rows] == \
+        [(5, 0.0, 4.0, 4.0), (5, 5.0, 9.0, 9.0)]
+    rows = client.get('/aggregates', params={'resolution': 3600,
+                                             'group_by': 'type'}).json()
+    assert {r['type'] for r in rows} == {'temperature', 'humidity'}
+    assert 'id' not in rows[0]
+    response = client.get('/aggregates', params={'group_by': 'room'})
+    assert response.status_code == 400
+
+# Test latest values
+def test_get_latest(client):
+    """
+    Test that the last reading of each sensor is returned.
+    """
+    rows = client.get('/latest').json()
+    assert [(r['id'], r['timestamp']) for r in rows] == \
+        [(0, START + 9), (1, START + 9)]
+
+# Test latest values of sensors beyond the index
+def test_get_latest_beyond_index(tmp_path):
+    """
+    Test that sensors the index drops are still returned from the database.
+    """
+    db = TimeSeriesDatabase(str(tmp_path))
+    db.write(make_readings())
+    with TestClient(create_app(db, index_max_sensors=1)) as client:
+        rows = client.get('/latest').json()
+        assert [(r['id'], r['timestamp']) for r in rows] == \
+            [(0, START + 9), (1, START + 9)]
+        rows = client.get('/latest', params={'sensor_id': 1}).json()
+        assert [(r['id'], r['type']) for r in rows] == [(1, 'humidity')]
+    db.close()
+
+# Test cache and invalidation
+def test_cache_invalidated_by_ingest(client):
+    """
+    Test that a cached query is invalidated by readings ingested into its
+    window, but not by readings outside of it.
+    """
+    params = {'start': START, 'end': START + 100}
+    assert client.get('/readings', params=params).headers['X-Cache'] == 'miss'
+    assert client.get('/readings', params=params).headers['X-Cache'] == 'hit'
+
+    client.post('/readings', json=make_readings(1, start=START + 500))
+    assert client.get('/readings', params=params).headers['X-Cache'] == 'hit'
+
+    client.post('/readings', json=make_readings(1, start=START + 50))
+    response = client.get('/readings', params=params)
+    assert response.headers['X-Cache'] == 'miss'
+    assert len(response.json()) == 22
+    assert client.get('/stats').json()['cache']['invalidated'] == 1
+
+# Test ingest validation
+def test_post_invalid_readings(client):
+    """
+    Test that readings without value are rejected.
+    """
+    response = client.post('/readings', json=[{'id': 0, 'type': 'temperature',
+                                               'timestamp': START}])
+    assert response.status_code == 422
+
+# Test in-memory recent readings
+def test_get_recent_fed_by_ingest(client):
+    """
+    Test that ingested readings are served by the in-memory index.
+    """
+    client.post('/readings', json=[{'id': 0, 'type': 'temperature',
+                                    'timestamp': START + 10, 'value': 42.0}])
+    assert client.get('/latest', params={'sensor_id': 0}).json()[0]['value'] == 42.0
+    series = client.get('/recent', params={'seconds': 2, 'sensor_id': 0}).json()
+    assert series == [{'id': 0, 'type': 'temperature',
+                       'timestamps': [START + 8, START + 9, START + 10],
+                       'values': [8.0, 9.0, 42.0]}]
+
+# Test served stage of traced readings
+def test_latest_stamps_served(tmp_path):
+    """
+    Test that persisted traced readings are stamped when /latest serves
+    them, only the first time.
+    """
+    from src.sensors.tracing import Tracer, load_traces
+
+    db = TimeSeriesDatabase(str(tmp_path / 'db'))
+    tracer = Tracer(str(tmp_path / 'trace.jsonl'))
+    reading = dict(make_readings(1)[0], trace_id=7)
+    db.write([reading])
+    tracer.remember([reading])
+    with TestClient(create_app(db, tracer=tracer)) as client:
+        client.get('/latest')
+        client.get('/latest')
+    db.close()
+    with open(tmp_path / 'trace.jsonl') as f:
+        assert len(f.readlines()) == 1
+    assert list(load_traces([str(tmp_path / 'trace.jsonl')])[7]) == ['served']
@@ -0,0 +1,138 @@
+import json
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pika
+
+from src.rabbitmq.amqp_consumer import (AMQPIngestionService, BatchConsumer,
+                                        IngestionStats)
+from src.sensors.codecs import BinaryCodec
+
+def reading(id):
+    return {'id': id, 'type': 'humidity', 'period': 1, 'value': 50.0,
+            'timestamp': time.time()}
+
+def deliver(consumer, tag, body):
+    method = MagicMock()
+    method.delivery_tag = tag
+    consumer.on_message(consumer.channel, method, None, body)
+
+# Test batches are persisted and acknowledged at once
+def test_batch_ack_multiple():
+    """
+    Test that a full batch is persisted and acked with multiple=True.
+    """
+    sink, stats = MagicMock(), IngestionStats()
+    consumer = BatchConsumer(MagicMock(), sink, stats, batch_size=3)
+    for tag in range(1, 4):
+        deliver(consumer, tag, json.dumps(reading(tag)).encode())
+    sink.assert_called_once()
+    assert [r['id'] for r in sink.call_args.args[0]] == [1, 2, 3]
+    consumer.channel.basic_ack.assert_called_once_with(
+        delivery_tag=3, multiple=True)
+    snapshot = stats.snapshot()
+    assert snapshot['messages'] == 3 and snapshot['batches'] == 1
+    assert snapshot['lag']['count'] == 3
+
+# Test mixed payload codecs
+def test_batch_decodes_codecs():
+    """
+    Test that json and binary payloads are decoded in the same batch.
+    """
+    sink = MagicMock()
+    consumer = BatchConsumer(MagicMock(), sink, IngestionStats(), batch_size=2)
+    deliver(consumer, 1, json.dumps(reading(1)).encode())
+    deliver(consumer, 2, BinaryCodec().encode_batch([reading(2), reading(3)]))
+    assert [r['id'] for r in sink.call_args.args[0]] == [1, 2, 3]
+
+# Test partial batches are flushed after the timeout
+def test_batch_timeout():
+    """
+    Test that a partial batch is flushed once it expires.
+    """
+    sink = MagicMock()
+    consumer = BatchConsumer(MagicMock(), sink, IngestionStats(),
+                             batch_size=10, batch_timeout=0.01)
+    deliver(consumer, 1, json.dumps(reading(1)).encode())
+    consumer.flush_if_expired()
+    sink.assert_not_called()
+    time.sleep(0.02)
+    consumer.flush_if_expired()
+    sink.assert_called_once()
+
+# Test failed batches are requeued
+def test_batch_sink_failure():
+    """
+    Test that a batch is nacked and requeued when the sink fails.
+    """
+    sink = MagicMock(side_effect=IOError("disk full"))
+    stats = IngestionStats()
+    consumer = BatchConsumer(MagicMock(), sink, stats, batch_size=2)
+    deliver(consumer, 1, json.dumps(reading(1)).encode())
+    deliver(consumer, 2, json.dumps(reading(2)).encode())
+    consumer.channel.basic_nack.assert_called_once_with(
+        delivery_tag=2, multiple=True, requeue=True)
+    consumer.channel.basic_ack.assert_not_called()
+    assert stats.snapshot()['failed_batches'] == 1
+
+# Test undecodable messages are dropped
+def test_batch_decode_error():
+    """
+    Test that undecodable messages are counted and acked with the batch.
+    """
+    sink, stats = MagicMock(), IngestionStats()
+    consumer = BatchConsumer(MagicMock(), sink, stats, batch_size=2)
+    deliver(consumer, 1, b"not json")
+    deliver(consumer, 2, json.dumps(reading(2)).encode())
+    assert len(sink.call_args.args[0]) == 1
+    assert stats.snapshot()['decode_errors'] == 1
+    consumer.channel.basic_ack.assert_called_once()
+
+# Test prefetch validation
+def test_service_prefetch_validation():
+    """
+    Test that the prefetch must fit a full batch.
+    """
+    with pytest.raises(ValueError, match="Prefetch must be greater or equal"):
+        AMQPIngestionService(MagicMock(), prefetch=10, batch_size=100)
+
+# Test the service needs a sink
+def test_service_needs_sink():
+    """
+    Test that a service without a sink is rejected instead of
+    acknowledging readings it does not persist.
+    """
+    with pytest.raises(ValueError, match="A sink is needed"):
+        AMQPIngestionService(None)
+
+# Test consumers reconnect after connection errors
+def test_consumer_reconnects():
+    """
+    Test that a consumer keeps retrying while RabbitMQ is down and after
+    losing its connection, with backoff and counting the reconnections.
+    """
+    connection, calls = MagicMock(), []
+
+    def process_data_events(time_limit):
+        calls.append(time_limit)
+        time.sleep(time_limit)
+        if len(calls) == 1:
+            raise pika.exceptions.ConnectionClosed(320, "Forced close")
+
+    connection.process_data_events.side_effect = process_data_events
+    attempts = [pika.exceptions.AMQPConnectionError("Refused")] * 2 + \
+        [connection, connection]
+    service = AMQPIngestionService(MagicMock(), consumers=1,
+                                   min_reconnect_delay=0.01,
+                                   max_reconnect_delay=0.05)
+    with patch.object(pika, 'BlockingConnection', side_effect=attempts):
+        thread = threading.Thread(target=service.run_consumer, args=(0,))
+        thread.start()
+        time.sleep(0.5)
+        service.stop_event.set()
+        thread.join(2)
+    assert not thread.is_alive()
+    assert service.stats.snapshot()['reconnects'] == 3
+    connection.close.assert_called()
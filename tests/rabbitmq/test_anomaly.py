@@ -0,0 +1,101 @@
+import json
+import random
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.rabbitmq.amqp_consumer import BatchConsumer, IngestionStats
+from src.rabbitmq.anomaly import AlertPublisher, AnomalyDetector
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def readings(id, values, start=0.0, period=1.0, type='temperature'):
+    return [{'id': id, 'type': type, 'period': period, 'value': value,
+             'timestamp': start + i * period} for i, value in enumerate(values)]
+
+# Test incremental statistics
+def test_welford_and_ewma():
+    """
+    Test that the running mean, variance and EWMA match their batch
+    definitions.
+    """
+    detector = AnomalyDetector(ewma_alpha=0.5)
+    values = [random.uniform(20, 100) for _ in range(100)]
+    detector.observe(readings(1, values))
+    state = detector.sensors[1]
+    mean = sum(values) / len(values)
+    variance = sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+    assert state.mean == pytest.approx(mean)
+    assert state.std == pytest.approx(variance ** 0.5)
+    ewma = values[0]
+    for value in values[1:]:
+        ewma += 0.5 * (value - ewma)
+    assert state.ewma == pytest.approx(ewma)
+
+# Test value alerts
+@pytest.mark.parametrize("kind, tail", [
+    ('outlier', [500.0, 60.0]),
+    ('drift', [95.0] * 20),
+    ('rate', [60.0, 99.0]),
+    ('stuck', [42.0] * 10),
+])
+def test_value_alerts(kind, tail):
+    """
+    Test that each kind of alert is raised once per episode, and not by
+    normal readings.
+    """
+    random.seed(1)
+    alert = MagicMock()
+    detector = AnomalyDetector(alert, max_rate={'temperature': 20})
+    normal = [random.gauss(60, 5) for _ in range(100)]
+    detector.observe(readings(1, normal))
+    assert alert.call_count == 0
+    detector.observe(readings(1, tail, start=100))
+    kinds = [c.args[0]['kind'] for c in alert.call_args_list]
+    assert kinds.count(kind) == 1
+    assert detector.get_stats()['raised'][kind] == 1
+
+# Test missed period watchdog
+def test_silent_watchdog():
+    """
+    Test that a sensor without readings for silent_periods of its period
+    raises a silent alert, cleared by its next reading.
+    """
+    clock, alert = FakeClock(), MagicMock()
+    detector = AnomalyDetector(alert, clock=clock)
+    detector.observe(readings(1, [50.0], period=2) + readings(2, [50.0]))
+    clock.now = 5
+    detector.check_silent()
+    detector.check_silent()
+    assert [c.args[0]['id'] for c in alert.call_args_list] == [2]
+    detector.observe(readings(2, [51.0], start=5))
+    assert detector.get_stats()['active']['silent'] == 0
+    clock.now = 7
+    detector.check_silent()
+    assert [c.args[0]['id'] for c in alert.call_args_list] == [2, 1]
+
+# Test analytics stage of the consumer and alert topics
+def test_consumer_analytics_and_publisher():
+    """
+    Test that persisted batches reach the analytics stage and that alerts
+    are published as JSON on their topic.
+    """
+    analytics = MagicMock()
+    consumer = BatchConsumer(MagicMock(), MagicMock(), IngestionStats(),
+                             batch_size=1, analytics=analytics)
+    method = MagicMock(delivery_tag=1)
+    consumer.on_message(consumer.channel, method, None,
+                        json.dumps(readings(3, [1.0])[0]).encode())
+    assert analytics.call_args.args[0][0]['id'] == 3
+
+    publisher = AlertPublisher("test.mosquitto.org", topic="alerts")
+    publisher.client.publish = MagicMock(return_value=MagicMock(rc=0, mid=1))
+    publisher.publish_alert({'id': 3, 'kind': 'stuck', 'value': 1.0})
+    topic, payload, qos, _ = publisher.client.publish.call_args.args
+    assert topic == "alerts/stuck/3" and qos == 1
+    assert json.loads(payload)['kind'] == 'stuck'
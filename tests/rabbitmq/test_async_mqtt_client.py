@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import pytest
+import struct
+
+from src.rabbitmq.async_mqtt_client_base import AsyncMQTTClientBase
+from src.rabbitmq.mqtt_broker import MQTTBroker
+from src.sensors.async_sensor_simulator import AsyncSensorSimulator
+
+async def read_packet(reader):
+    """
+    Reads one MQTT packet and returns its first byte and its body.
+    """
+    header = (await reader.readexactly(1))[0]
+    length, multiplier = 0, 1
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        length += (byte & 0x7F) * multiplier
+        multiplier *= 128
+        if not byte & 0x80:
+            break
+    return header, await reader.readexactly(length)
+
+async def fake_broker(reader, writer):
+    """
+    Minimal broker that acknowledges connections, QoS 1 publications and
+    subscriptions, and sends one message on every subscription.
+    """
+    try:
+        while True:
+            header, body = await read_packet(reader)
+            if header == 0x10:
+                writer.write(b"\x20\x02\x00\x00")
+            elif header & 0xF0 == 0x30 and header & 0x06:
+                topic_length = struct.unpack("!H", body[:2])[0]
+                mid = body[2 + topic_length:4 + topic_length]
+                writer.write(b"\x40\x02" + mid)
+            elif header == 0x82:
+                writer.write(b"\x90\x03" + body[:2] + b"\x00")
+                writer.write(b"\x30\x0a\x00\x03a/bhello")
+            await writer.drain()
+    except asyncio.IncompleteReadError:
+        writer.close()
+
+def run_with_broker(test):
+    """
+    Runs a coroutine test against a fake broker on a free local port.
+    """
+    async def main():
+        server = await asyncio.start_server(fake_broker, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            await test(port)
+    asyncio.run(main())
+
+# Test awaitable publish acknowledgements
+def test_publish_awaits_ack():
+    """
+    Test that publish returns once the broker acknowledges the message.
+    """
+    async def test(port):
+        client = AsyncMQTTClientBase("127.0.0.1", port, "test_client",
+                                     max_inflight=2)
+        await client.connect()
+        mids = await asyncio.gather(
+            *[client.publish("a/b", "payload", qos=1) for _ in range(5)])
+        assert len(set(mids)) == 5
+        assert client.inflight == 0
+        await client.disconnect()
+    run_with_broker(test)
+
+# Test async iteration over received messages
+def test_messages_iteration():
+    """
+    Test that received messages are available through async iteration.
+    """
+    async def test(port):
+        client = AsyncMQTTClientBase("127.0.0.1", port, "test_client")
+        await client.connect()
+        client.subscribe("a/#", qos=0)
+        message = await asyncio.wait_for(anext(aiter(client)), 2)
+        assert message.topic == "a/b"
+        assert message.payload == b"hello"
+        await client.disconnect()
+    run_with_broker(test)
+
+# Test received messages without async iteration
+def test_messages_without_iteration():
+    """
+    Test that messages received with no active iterator are not buffered,
+    so they do not pause the reads and block the acknowledgements.
+    """
+    async def test(port):
+        received = []
+        client = AsyncMQTTClientBase("127.0.0.1", port, "test_client",
+                                     max_received=5)
+        client.on_message = lambda c, u, message: received.append(message)
+        await client.connect()
+        client.subscribe("a/#", qos=1)
+        for i in range(10):
+            await asyncio.wait_for(client.publish("a/b", str(i), qos=1), 2)
+        assert len(received) == 10 and not client._received
+        await client.disconnect()
+
+    with MQTTBroker() as broker:
+        asyncio.run(test(broker.port))
+
+# Test connection refused
+def test_connect_refused():
+    """
+    Test that connect raises when there is no broker.
+    """
+    async def test():
+        client = AsyncMQTTClientBase("127.0.0.1", 1, "test_client")
+        with pytest.raises(ConnectionRefusedError):
+            await client.connect()
+    asyncio.run(test())
+
+# Test AsyncSensorSimulator publishing as tasks
+def test_async_sensor_simulator():
+    """
+    Test that every sensor runs as a task and publishes acknowledged data.
+    """
+    async def test(port):
+        simulator = AsyncSensorSimulator(
+            [('humidity', 0.05), ('temperature', 0.05)], 'mqtt', 
+            'simulator_client', '127.0.0.1', port)
+        await simulator.connect()
+        simulator.run_tasks()
+        assert len(simulator.sensors_tasks) == 2
+        await asyncio.sleep(0.3)
+        await simulator.stop_tasks()
+        stats = simulator.get_sensor_stats()
+        assert stats[0]['ticks'] >= 4 and stats[1]['ticks'] >= 4
+        await simulator.disconnect()
+    run_with_broker(test)
+
+# Test sensor tasks keep running after a failed publication
+def test_async_sensor_simulator_publish_errors():
+    """
+    Test that a failed publication loses its reading but does not stop
+    the task of the sensor.
+    """
+    async def test(port):
+        simulator = AsyncSensorSimulator(
+            [('humidity', 0.05)], 'mqtt', 'simulator_client', '127.0.0.1',
+            port)
+        await simulator.connect()
+        publish, failures = simulator.publish, []
+
+        async def flaky_publish(*args):
+            if len(failures) < 2:
+                failures.append(args)
+                raise ConnectionError("Disconnected before acknowledgement.")
+            return await publish(*args)
+
+        simulator.publish = flaky_publish
+        simulator.run_tasks()
+        await asyncio.sleep(0.3)
+        assert not simulator.sensors_tasks[0].done()
+        await simulator.stop_tasks()
+        assert len(failures) == 2
+        assert simulator.get_sensor_stats()[0]['ticks'] >= 4
+        await simulator.disconnect()
+    run_with_broker(test)
+
+# Test reading and ack logs of AsyncSensorSimulator
+def test_async_sensor_simulator_reading_logs(caplog):
+    """
+    Test that acks are not logged at INFO and that published readings are
+    logged as the reading logs mode says.
+    """
+    async def test(port):
+        simulator = AsyncSensorSimulator(
+            [('humidity', 0.02)], 'mqtt', 'simulator_client', '127.0.0.1',
+            port, reading_logs='sampled', log_rate=1.0)
+        await simulator.connect()
+        simulator.run_tasks()
+        await asyncio.sleep(0.3)
+        await simulator.stop_tasks()
+        assert simulator.get_sensor_stats()[0]['ticks'] >= 5
+        await simulator.disconnect()
+    caplog.set_level(logging.INFO)
+    run_with_broker(test)
+    assert caplog.text.count('data published') == 1
+    assert 'Message published successfully' not in caplog.text
+    with pytest.raises(ValueError, match="Reading logs must be one of"):
+        AsyncSensorSimulator([('humidity', 1)], reading_logs='verbose')
+
+# Test the in-process broker on the running event loop
+def test_async_sensor_simulator_in_loop_broker():
+    """
+    Test that the broker can be started from a running event loop and
+    serve an AsyncSensorSimulator on that same loop.
+    """
+    async def test():
+        async with MQTTBroker() as broker:
+            simulator = AsyncSensorSimulator(
+                [('humidity', 0.05)], 'mqtt', 'simulator_client',
+                broker.host, broker.port, reading_logs='off')
+            await simulator.connect()
+            simulator.run_tasks()
+            await asyncio.sleep(0.3)
+            await simulator.stop_tasks()
+            await simulator.disconnect()
+            assert broker.get_stats()['received'] >= 4
+        with pytest.raises(RuntimeError, match="start_async"):
+            await broker.start_async()
+            broker.stop()
+        await broker.stop_async()
+    asyncio.run(test())
+
+# Test reconnection after a broker restart
+def test_reconnect_after_broker_restart():
+    """
+    Test that the client reconnects and subscribes again after the broker
+    restarts, and that publishing while disconnected fails without
+    queueing messages in paho.
+    """
+    async def test():
+        broker = MQTTBroker()
+        port = await broker.start_async()
+        client = AsyncMQTTClientBase('127.0.0.1', port, 'client',
+                                     min_reconnect_delay=0.05,
+                                     max_reconnect_delay=0.2)
+        await client.connect()
+        client.subscribe('a', 1)
+        await client.publish('a', 'before', qos=1)
+        await broker.stop_async()
+        await asyncio.sleep(0.1)
+        for _ in range(4):
+            with pytest.raises(ConnectionError):
+                await client.publish('a', 'during', qos=1)
+        assert not client.client._out_messages
+
+        broker = MQTTBroker(port=port)
+        await broker.start_async()
+        for _ in range(100):
+            if client.client.is_connected():
+                break
+            await asyncio.sleep(0.02)
+        await client.publish('a', 'after', qos=1)
+        assert client.reconnects == 1
+        assert broker.get_stats()['received'] == 1
+        assert broker.get_stats()['subscriptions'] == 1
+        assert not client.client._out_messages and not client._early_acks
+        await client.disconnect()
+        await broker.stop_async()
+    asyncio.run(test())
@@ -0,0 +1,145 @@
+import time
+
+import pytest
+
+from src.rabbitmq.mqtt_broker import MQTTBroker
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+from src.rabbitmq.mqtt_subscriber import MQTTReadingSubscriber
+from src.sensors.sensor_simulator import SensorSimulator
+
+class RecordingClient(MQTTClientBase):
+    """
+    Client that records the topic and QoS of every message it receives.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.messages = []
+
+    def on_message(self, client, userdata, message):
+        self.messages.append((message.topic, message.qos, time.monotonic()))
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+@pytest.fixture
+def brokers():
+    started = []
+
+    def start(**kwargs):
+        broker = MQTTBroker(**kwargs)
+        broker.start()
+        started.append(broker)
+        return broker
+
+    yield start
+    for broker in started:
+        broker.stop()
+
+# Clients are disconnected before their brokers are stopped
+@pytest.fixture
+def clients(brokers):
+    connected = []
+
+    def connect(broker, client_id, cls=RecordingClient, **kwargs):
+        client = cls("127.0.0.1", port=broker.port, client_id=client_id,
+                     **kwargs)
+        client.connect()
+        client.loop_start()
+        connected.append(client)
+        return client
+
+    yield connect
+    for client in connected:
+        client.disconnect()
+        client.loop_stop()
+
+# Test wildcard routing and QoS of the deliveries
+def test_broker_routing(brokers, clients):
+    """
+    Test that messages reach every matching subscription once, with the
+    lowest QoS of the publication and the subscription, and that
+    unsubscribed filters stop matching.
+    """
+    broker = brokers()
+    single, multi = clients(broker, "single"), clients(broker, "multi")
+    single.subscribe("sensors/+/temperature", 1)
+    multi.subscribe("sensors/#", 0)
+    multi.subscribe("sensors/1/#", 1)
+    assert wait_for(lambda: broker.get_stats()['subscriptions'] == 3)
+
+    publisher = clients(broker, "publisher")
+    publisher.publish("sensors/1/temperature", "21.5", qos=1)
+    publisher.publish("sensors/2/humidity", "40", qos=1)
+    publisher.publish("other/1/temperature", "0", qos=0)
+    assert wait_for(lambda: broker.get_stats()['delivered'] == 3)
+    assert wait_for(lambda: len(multi.messages) == 2)
+    assert [m[:2] for m in single.messages] == \
+        [("sensors/1/temperature", 1)]
+    assert sorted(m[:2] for m in multi.messages) == \
+        [("sensors/1/temperature", 1), ("sensors/2/humidity", 0)]
+
+    single.unsubscribe("sensors/+/temperature")
+    assert wait_for(lambda: broker.get_stats()['subscriptions'] == 2)
+    publisher.publish("sensors/3/temperature", "22", qos=0)
+    assert wait_for(lambda: len(multi.messages) == 3)
+    assert len(single.messages) == 1
+    assert broker.get_stats()['received'] == 4
+
+# Test latency and loss injection
+def test_broker_latency_and_loss(brokers, clients):
+    """
+    Test that deliveries are delayed by the injected latency and that
+    lost deliveries are counted as dropped.
+    """
+    broker = brokers(latency=0.2)
+    subscriber = clients(broker, "subscriber")
+    subscriber.subscribe("#", 0)
+    publisher = clients(broker, "publisher")
+    time.sleep(0.1)
+    sent = time.monotonic()
+    publisher.publish("a", "1")
+    assert wait_for(lambda: subscriber.messages)
+    assert subscriber.messages[0][2] - sent >= 0.2
+
+    broker = brokers(loss=1.0)
+    subscriber = clients(broker, "subscriber")
+    subscriber.subscribe("#", 1)
+    publisher = clients(broker, "publisher")
+    time.sleep(0.1)
+    for _ in range(10):
+        publisher.publish("a", "1", qos=1)
+    assert wait_for(lambda: broker.get_stats()['dropped'] == 10)
+    assert not subscriber.messages
+    rates = broker.report()
+    assert rates['received']['keys'] == 1 and rates['dropped']['keys'] == 1
+
+# Test the simulator and a consumer end to end
+def test_simulator_end_to_end(brokers, clients):
+    """
+    Test that every reading published by the simulator with QoS 1 is
+    acknowledged by the broker and decoded by a subscriber.
+    """
+    readings = []
+    broker = brokers()
+    subscriber = clients(broker, "consumer", MQTTReadingSubscriber,
+                         sink=readings.extend, qos=1)
+    assert wait_for(lambda: broker.get_stats()['subscriptions'] == 1)
+    simulator = SensorSimulator(
+        [('humidity', 0.05), ('temperature', 0.05)], 'mqtt', 'simulator',
+        '127.0.0.1', broker.port, scheduler='heap', qos=1,
+        reading_logs='off')
+    simulator.run_threads()
+    time.sleep(0.5)
+    simulator.stop_threads()
+    stats = simulator.get_publish_stats
+    assert wait_for(lambda: stats()['inflight'] == stats()['queue_depth'] == 0)
+    received = broker.get_stats()['received']
+    assert received >= 10
+    assert wait_for(lambda: len(readings) == received)
+    assert {r['id'] for r in readings} == {0, 1}
+    simulator.disconnect()
+    assert wait_for(lambda: broker.get_stats()['clients'] == 1)
@@ -0,0 +1,106 @@
+import pytest
+import threading
+from unittest.mock import MagicMock
+
+import paho.mqtt.client as mqtt
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+
+def make_client(**kwargs):
+    """
+    Creates a client whose paho publish always succeeds without network.
+    """
+    mqtt_client = MQTTClientBase("test.mosquitto.org", **kwargs)
+    mqtt_client.logger = MagicMock()
+    info = MagicMock()
+    info.rc = mqtt.MQTT_ERR_SUCCESS
+    mqtt_client.client.publish = MagicMock(return_value=info)
+    return mqtt_client
+
+def ack(mqtt_client, n=1):
+    for _ in range(n):
+        mqtt_client._handle_publish(None, None, 0)
+
+# Test messages beyond the in-flight window wait in the queue
+def test_inflight_window():
+    """
+    Test that only max_inflight messages are sent before acknowledgements.
+    """
+    mqtt_client = make_client(max_inflight=2, max_queued=10)
+    for i in range(5):
+        assert mqtt_client.publish("t", str(i), qos=1)
+    assert mqtt_client.client.publish.call_count == 2
+    stats = mqtt_client.get_publish_stats()
+    assert stats['inflight'] == 2 and stats['queue_depth'] == 3
+    ack(mqtt_client, 5)
+    payloads = [c.args[1] for c in mqtt_client.client.publish.call_args_list]
+    assert payloads == ['0', '1', '2', '3', '4']
+    stats = mqtt_client.get_publish_stats()
+    assert stats['acked'] == 5 and stats['inflight'] == 0
+
+# Test drop policies
+@pytest.mark.parametrize("policy, sent", [
+    ('drop_oldest', ['0', '3', '4']),
+    ('drop_newest', ['0', '1', '2']),
+    ('block', ['0', '1', '2']),
+])
+def test_queue_policies(policy, sent):
+    """
+    Test which messages are kept when the outbound queue is full.
+    """
+    mqtt_client = make_client(max_inflight=1, max_queued=2,
+                              queue_policy=policy, block_timeout=0.01)
+    results = [mqtt_client.publish("t", str(i), qos=1) for i in range(5)]
+    ack(mqtt_client, 3)
+    payloads = [c.args[1] for c in mqtt_client.client.publish.call_args_list]
+    assert payloads == sent
+    assert mqtt_client.get_publish_stats()['dropped'] == 2
+    assert results.count(False) == (0 if policy == 'drop_oldest' else 2)
+
+# Test block policy waits for a free slot
+def test_block_policy_waits():
+    """
+    Test that a blocked publish proceeds once a message is acknowledged.
+    """
+    mqtt_client = make_client(max_inflight=1, max_queued=1,
+                              queue_policy='block', block_timeout=None)
+    mqtt_client.publish("t", "0", qos=1)
+    mqtt_client.publish("t", "1", qos=1)
+    thread = threading.Thread(target=mqtt_client.publish, args=("t", "2", 1))
+    thread.start()
+    thread.join(0.05)
+    assert thread.is_alive()
+    ack(mqtt_client)
+    thread.join(1)
+    assert not thread.is_alive()
+    assert mqtt_client.get_publish_stats()['dropped'] == 0
+
+# Test QoS 0 messages without connection release their slot
+def test_qos0_no_connection_dropped():
+    """
+    Test that QoS 0 messages lost without connection are counted.
+    """
+    mqtt_client = make_client(max_inflight=1)
+    mqtt_client.client.publish.return_value.rc = mqtt.MQTT_ERR_NO_CONN
+    mqtt_client.publish("t", "0", qos=0)
+    stats = mqtt_client.get_publish_stats()
+    assert stats['dropped'] == 1 and stats['inflight'] == 0
+
+# Test retried counter on reconnection
+def test_retried_on_reconnect():
+    """
+    Test that in-flight messages are counted as retried on reconnection.
+    """
+    mqtt_client = make_client(max_inflight=5)
+    mqtt_client._handle_connect(None, None, None, 0)
+    mqtt_client.publish("t", "0", qos=1)
+    mqtt_client.publish("t", "1", qos=1)
+    mqtt_client._handle_connect(None, None, None, 0)
+    assert mqtt_client.get_publish_stats()['retried'] == 2
+
+# Test invalid policy
+def test_invalid_queue_policy():
+    """
+    Test that an unknown queue policy is rejected.
+    """
+    with pytest.raises(ValueError, match="Queue policy must be one of"):
+        MQTTClientBase("test.mosquitto.org", queue_policy='invalid')
@@ -0,0 +1,90 @@
+import os
+import time
+from unittest.mock import MagicMock
+
+import paho.mqtt.client as mqtt
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+from src.rabbitmq.outbox import Outbox
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+# Test order, segments and commits of the outbox
+def test_outbox_segments_and_commit(tmp_path):
+    """
+    Test that messages are read in order across segments, that committed
+    segments are deleted and that a reopened outbox resumes from the
+    cursor, reading again what was not committed.
+    """
+    outbox = Outbox(str(tmp_path), segment_size=40)
+    for i in range(20):
+        assert outbox.append(f"t/{i}", str(i) if i % 2 else bytes([i]), 1,
+                             retain=i == 3)
+    assert len(outbox) == 20
+    assert len(os.listdir(tmp_path)) > 3
+    messages = outbox.read(8)
+    assert messages[1] == ("t/1", "1", 1, False)
+    assert messages[2] == ("t/2", b"\x02", 1, False)
+    assert messages[3][3]
+    outbox.commit()
+    assert outbox.read(2)[0][0] == "t/8"
+    outbox.close()
+
+    # A torn record at the end is left out
+    last = sorted(os.listdir(tmp_path))[-2]
+    with open(tmp_path / last, "ab") as f:
+        f.write(Outbox.record.pack(100, 3, 1, 0) + b"t/x")
+    outbox = Outbox(str(tmp_path), segment_size=40)
+    assert len(outbox) == 12
+    assert [m[0] for m in outbox.read(100)] == [f"t/{i}" for i in range(8, 20)]
+    outbox.commit()
+    assert len(outbox) == 0 and outbox.size == 0
+    assert len(os.listdir(tmp_path)) == 2
+
+# Test size limit
+def test_outbox_max_bytes(tmp_path):
+    """
+    Test that appends beyond max_bytes are rejected.
+    """
+    outbox = Outbox(str(tmp_path), max_bytes=50)
+    assert outbox.append("t", "x" * 20, 1)
+    assert not outbox.append("t", "x" * 20, 1)
+    assert len(outbox) == 1
+
+# Test store and forward of MQTTClientBase
+def test_client_store_and_forward(tmp_path):
+    """
+    Test that messages published while disconnected are stored in the
+    outbox and sent in order before new ones once reconnected.
+    """
+    mqtt_client = MQTTClientBase("test.mosquitto.org", max_inflight=2,
+                                 max_queued=3, outbox=Outbox(str(tmp_path)))
+    mqtt_client.logger = MagicMock()
+    sent = []
+
+    def publish(topic, payload, qos, retain):
+        sent.append(payload)
+        mqtt_client._handle_publish(None, None, 0)
+        return MagicMock(rc=mqtt.MQTT_ERR_SUCCESS)
+    mqtt_client.client.publish = MagicMock(side_effect=publish)
+
+    for i in range(10):
+        assert mqtt_client.publish("t", str(i), qos=1)
+    assert not sent
+    assert mqtt_client.get_publish_stats()['outbox_depth'] == 10
+
+    mqtt_client._handle_connect(None, None, None, 0)
+    wait_until(lambda: not mqtt_client._spilling)
+    assert sent == [str(i) for i in range(10)]
+    mqtt_client.publish("t", "10", qos=1)
+    assert sent[-1] == "10"
+
+    mqtt_client._handle_disconnect(None, None, 1)
+    mqtt_client.publish("t", "11", qos=1)
+    assert sent[-1] == "10"
+    stats = mqtt_client.get_publish_stats()
+    assert stats['spilled'] == 11 and stats['drained'] == 10
+    assert stats['outbox_depth'] == 1
@@ -0,0 +1,117 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+import paho.mqtt.client as mqtt
+from src.rabbitmq.publisher_pool import PublisherPool
+from src.sensors.sensor_simulator import SensorSimulator
+
+@pytest.fixture
+def pool():
+    """
+    Fixture with a pool of 3 connected clients whose paho publish always
+    succeeds without network.
+    """
+    pool = PublisherPool("test.mosquitto.org", size=3, client_id="test")
+    for connection in pool.connections:
+        info = MagicMock()
+        info.rc = mqtt.MQTT_ERR_SUCCESS
+        connection.client.publish = MagicMock(return_value=info)
+        connection.logger = MagicMock()
+        connection.on_connect(None, None, None, 0)
+    return pool
+
+# Test unique client ids
+def test_pool_client_ids(pool):
+    """
+    Test that every connection has its own client id.
+    """
+    assert [c.client_id for c in pool.connections] == \
+        ['test_0', 'test_1', 'test_2']
+
+# Test keys are hashed onto the same connection
+def test_pool_hashing(pool):
+    """
+    Test that a key always goes to the same connection and keys spread
+    over every connection.
+    """
+    assert pool.connection_for(42) is pool.connection_for(42)
+    used = {pool.connection_for(id).client_id for id in range(100)}
+    assert len(used) == 3
+
+# Test failover to a healthy connection
+def test_pool_failover(pool):
+    """
+    Test that messages of a disconnected connection go to a healthy one.
+    """
+    connection = pool.connection_for(7)
+    connection.on_disconnect(None, None, 1)
+    assert pool.connection_for(7) is not connection
+    assert pool.connection_for(7).connected.is_set()
+    stats = {s['client_id']: s for s in pool.get_stats()}
+    assert stats[connection.client_id]['connected'] is False
+    assert stats[connection.client_id]['last_error'] is not None
+    connection.on_connect(None, None, None, 0)
+    assert pool.connection_for(7) is connection
+    assert connection.reconnects == 1
+
+# Test messages without key go to the least loaded connection
+def test_pool_least_loaded(pool):
+    """
+    Test that messages without key are balanced by load.
+    """
+    for _ in range(6):
+        pool.publish("t", "payload", qos=1)
+    assert [s['inflight'] for s in pool.get_stats()] == [2, 2, 2]
+
+# Test invalid pool size
+def test_pool_invalid_size():
+    """
+    Test that a pool needs at least one connection.
+    """
+    with pytest.raises(ValueError, match="Pool size must be an int greater than 0."):
+        PublisherPool("test.mosquitto.org", size=0)
+
+# Test SensorSimulator publishing through a pool
+def test_sensor_simulator_pool():
+    """
+    Test that the simulator creates and publishes through a pool.
+    """
+    with patch.object(PublisherPool, 'connect') as mock_connect:
+        sensor_simulator = SensorSimulator(
+            [('humidity', 1)], 'mqtt', 'simulator', pool_size=2)
+        mock_connect.assert_called_once()
+    assert len(sensor_simulator.pool) == 2
+    with patch.object(sensor_simulator.pool, 'publish') as mock_publish:
+        sensor_simulator.publish_sensor_reading('humidity', 1, 0)
+        assert mock_publish.call_args.kwargs == {'key': 0}
+
+# Test SensorSimulator disconnecting its pool
+def test_sensor_simulator_pool_disconnect():
+    """
+    Test that the simulator has no client of its own with a pool and that
+    disconnecting it disconnects the pool.
+    """
+    with patch.object(PublisherPool, 'connect'):
+        sensor_simulator = SensorSimulator(
+            [('humidity', 1)], 'mqtt', 'simulator', pool_size=2)
+    assert sensor_simulator.client is None
+    with patch.object(sensor_simulator.pool, 'disconnect') as mock_disconnect:
+        sensor_simulator.disconnect()
+        mock_disconnect.assert_called_once()
+
+# Test SensorSimulator publish stats with a pool
+def test_sensor_simulator_pool_publish_stats():
+    """
+    Test that the publish stats of the simulator add up its connections.
+    """
+    with patch.object(PublisherPool, 'connect'):
+        sensor_simulator = SensorSimulator(
+            [('humidity', 1)], 'mqtt', 'simulator', pool_size=2)
+    info = MagicMock(rc=mqtt.MQTT_ERR_SUCCESS, mid=1)
+    for connection in sensor_simulator.pool.connections:
+        connection.connected.set()
+        connection.client.publish = MagicMock(return_value=info)
+    for id in range(4):
+        sensor_simulator.publish_sensor_reading('humidity', 1, id)
+    stats = sensor_simulator.get_publish_stats()
+    assert stats['published'] == 4 and stats['inflight'] == 4
@@ -0,0 +1,59 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+from src.rabbitmq.topic_router import TopicRouter
+
+# Test wildcard matching
+def test_topic_router_match():
+    """
+    Test exact, '+' and '#' filters, including '$' topics.
+    """
+    router = TopicRouter()
+    for topic_filter in ('a/b/c', 'a/+/c', 'a/#', '#', '+/b/+', 'a/b/c/#'):
+        router.add(topic_filter, topic_filter)
+    assert sorted(router.match('a/b/c')) == \
+        sorted(['a/b/c', 'a/+/c', 'a/#', '#', '+/b/+', 'a/b/c/#'])
+    assert sorted(router.match('a')) == ['#', 'a/#']
+    assert sorted(router.match('x/b/y')) == ['#', '+/b/+']
+    assert router.match('$SYS/b/c') == []
+    with pytest.raises(ValueError, match="Invalid topic filter"):
+        router.add('a/#/b', 'invalid')
+    with pytest.raises(ValueError, match="Invalid topic filter"):
+        router.add('a/b+', 'invalid')
+
+# Test removal
+def test_topic_router_remove():
+    """
+    Test that removed handlers are not matched and empty nodes pruned.
+    """
+    router = TopicRouter()
+    first, second = MagicMock(), MagicMock()
+    router.add('a/+/c', first)
+    router.add('a/+/c', second)
+    router.remove('a/+/c', first)
+    assert router.match('a/b/c') == [second]
+    router.remove('a/+/c')
+    assert router.match('a/b/c') == [] and len(router) == 0
+    assert router._root.children == {}
+
+# Test MQTTClientBase dispatch
+def test_mqtt_client_handlers():
+    """
+    Test that messages go to the matching handlers, or to on_message.
+    """
+    mqtt_client = MQTTClientBase("test.mosquitto.org")
+    handler = MagicMock()
+    with patch.object(mqtt_client.client, 'subscribe') as mock_subscribe:
+        mqtt_client.subscribe('sensors/+/1', handler=handler)
+        mock_subscribe.assert_called_once_with('sensors/+/1', 0)
+    message = MagicMock(topic='sensors/humidity/1')
+    with patch.object(mqtt_client, 'on_message') as mock_on_message:
+        mqtt_client._handle_message(None, None, message)
+        handler.assert_called_once_with(None, None, message)
+        mock_on_message.assert_not_called()
+        mqtt_client._handle_message(None, None, MagicMock(topic='sensors/humidity/2'))
+        mock_on_message.assert_called_once()
+    with patch.object(mqtt_client.client, 'unsubscribe'):
+        mqtt_client.unsubscribe('sensors/+/1')
+    assert len(mqtt_client.router) == 0
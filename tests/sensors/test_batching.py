@@ -0,0 +1,72 @@
+import json
+import pytest
+import time
+from unittest.mock import patch
+
+from src.sensors.batching import ReadingBatcher, encode_batch, decode_batch
+from src.sensors.sensor_simulator import SensorSimulator
+
+READING = {'id': 0, 'type': 'humidity', 'period': 1, 'value': 42.0,
+           'timestamp': 1700000000.0}
+
+# Test encode and decode of a batch
+def test_encode_decode_batch():
+    """
+    Test that a batch carries the schema header and round trips.
+    """
+    payload = encode_batch([READING, dict(READING, id=1)])
+    message = json.loads(payload)
+    assert message['schema']['name'] == 'sensor_readings'
+    assert message['count'] == 2
+    assert decode_batch(payload) == [READING, dict(READING, id=1)]
+
+# Test decode of a non batch payload
+def test_decode_batch_invalid_payload():
+    """
+    Test that a single reading payload is not decoded as a batch.
+    """
+    with pytest.raises(ValueError, match="Payload is not a sensor readings batch."):
+        decode_batch(json.dumps(READING))
+
+# Test batch flush by size
+def test_batcher_flush_by_size():
+    """
+    Test that a full batch is flushed immediately.
+    """
+    batches = []
+    batcher = ReadingBatcher(batches.append, batch_size=3, linger=10)
+    for _ in range(7):
+        batcher.add(READING)
+    assert [len(batch) for batch in batches] == [3, 3]
+    batcher.stop()
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+# Test batch flush by linger time
+def test_batcher_flush_by_linger():
+    """
+    Test that a partial batch is flushed after the linger time.
+    """
+    batches = []
+    batcher = ReadingBatcher(batches.append, batch_size=100, linger=0.05)
+    batcher.start()
+    batcher.add(READING)
+    time.sleep(0.2)
+    assert [len(batch) for batch in batches] == [1]
+    batcher.stop()
+
+# Test SensorSimulator batched publish
+def test_publish_sensor_reading_batched():
+    """
+    Test that readings are gathered and published as one message.
+    """
+    sensor_simulator = SensorSimulator(
+        [('humidity', 1), ('temperature', 1)], batch_size=2)
+    with patch.object(sensor_simulator.client, 'publish') as mock_publish:
+        sensor_simulator.publish_sensor_reading('humidity', 1, 0)
+        mock_publish.assert_not_called()
+        sensor_simulator.publish_sensor_reading('temperature', 1, 1)
+        mock_publish.assert_called_once()
+        topic, payload, qos, _ = mock_publish.call_args.args
+    assert topic == 'simulated_sensors/'
+    assert qos == 1
+    assert [r['id'] for r in decode_batch(payload)] == [0, 1]
@@ -0,0 +1,63 @@
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.sensors.capture import CaptureReader, CaptureWriter
+from src.sensors.sensor_simulator import SensorSimulator
+
+def readings(n, start=1700000000.0, step=0.1):
+    return [{'id': i % 3, 'type': 'humidity' if i % 2 else 'temperature',
+             'period': 1.0, 'value': 20.0 + i, 'timestamp': start + i * step}
+            for i in range(n)]
+
+# Test capture files
+def test_capture_roundtrip(tmp_path):
+    """
+    Test that readings are read back from a capture file, including types
+    added to the dictionary while recording.
+    """
+    path = str(tmp_path / 'readings.cap')
+    with CaptureWriter(path) as writer:
+        writer.write(readings(10))
+        writer.write([dict(readings(1)[0], type='pressure')])
+    with CaptureReader(path) as reader:
+        assert len(reader) == 11
+        assert list(reader)[:10] == readings(10)
+        assert list(reader.readings(10))[0]['type'] == 'pressure'
+        assert reader.span() == (1700000000.0, 1700000000.0)
+        assert reader.types == ('humidity', 'temperature', 'pressure')
+    (tmp_path / 'other').write_bytes(b'x' * 2048)
+    with pytest.raises(ValueError, match="File is not a capture"):
+        CaptureReader(str(tmp_path / 'other'))
+
+# Test replay mode
+def test_replay(tmp_path):
+    """
+    Test that the simulator publishes the readings of a capture file, as
+    fast as possible or spaced by their timestamps at N times speed.
+    """
+    path = str(tmp_path / 'readings.cap')
+    with CaptureWriter(path) as writer:
+        writer.write(readings(11))
+    simulator = SensorSimulator([], replay_file=path, replay_speed=0,
+                                reading_logs='off', replay_retime=False)
+    with patch.object(simulator.client, 'publish',
+                      return_value=MagicMock(rc=0, mid=1)) as mock_publish:
+        simulator.run_replay(threading.Event())
+        payloads = [json.loads(c.args[1]) for c in mock_publish.call_args_list]
+        assert payloads == readings(11)
+        assert mock_publish.call_args_list[0].args[0] == \
+            'simulated_sensors/temperature/0'
+
+        simulator.replay_speed, simulator.replay_retime = 10, True
+        start = time.time()
+        simulator.run_replay(threading.Event())
+        elapsed = time.time() - start
+    assert 0.09 <= elapsed < 0.5
+    retimed = json.loads(mock_publish.call_args.args[1])['timestamp']
+    assert start <= retimed <= time.time()
+    with pytest.raises(ValueError, match="Replay mode needs a replay file."):
+        SensorSimulator([], mode='replay')
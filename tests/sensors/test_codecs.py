@@ -0,0 +1,84 @@
+import json
+import pytest
+from unittest.mock import patch
+
+from src.sensors.codecs import (BinaryCodec, JSONCodec, decode_payload,
+                                get_codec)
+from src.sensors.sensor_simulator import SensorSimulator
+
+READINGS = [
+    {'id': 3, 'type': 'humidity', 'period': 0.5, 'value': 42.37,
+     'timestamp': 1700000000.123456},
+    {'id': 7, 'type': 'temperature', 'period': 1, 'value': 99.99,
+     'timestamp': 1700000000.000001},
+]
+
+def assert_same_readings(decoded, expected):
+    assert len(decoded) == len(expected)
+    for a, b in zip(decoded, expected):
+        assert a['id'] == b['id']
+        assert a['type'] == b['type']
+        assert a['period'] == b['period']
+        assert a['value'] == b['value']
+        assert a['timestamp'] == pytest.approx(b['timestamp'], abs=1e-6)
+
+# Test json codec round trip
+def test_json_codec_round_trip():
+    """
+    Test json codec with single readings and batches.
+    """
+    codec = JSONCodec()
+    assert json.loads(codec.encode_reading(READINGS[0])) == READINGS[0]
+    assert codec.decode(codec.encode_reading(READINGS[0])) == READINGS[:1]
+    assert codec.decode(codec.encode_batch(READINGS)) == READINGS
+
+# Test binary codec round trip
+@pytest.mark.parametrize("sensor_ids", [None, [7, 3]])
+def test_binary_codec_round_trip(sensor_ids):
+    """
+    Test binary codec with and without a sensor ids dictionary.
+    """
+    codec = BinaryCodec(sensor_ids=sensor_ids)
+    payload = codec.encode_batch(READINGS)
+    record_size = 15 if sensor_ids else 17
+    assert len(payload) == BinaryCodec.header.size + 2 * record_size
+    assert_same_readings(codec.decode(payload), READINGS)
+
+# Test binary codec with mismatched dictionaries
+def test_binary_codec_dictionary_mismatch():
+    """
+    Test that a decoder without the id dictionary rejects the message.
+    """
+    payload = BinaryCodec(sensor_ids=[3, 7]).encode_batch(READINGS)
+    with pytest.raises(ValueError, match="Sensor ids dictionary does not match"):
+        BinaryCodec().decode(payload)
+
+# Test payload codec detection
+def test_decode_payload():
+    """
+    Test that decode_payload detects the codec of the payload.
+    """
+    binary = BinaryCodec().encode_reading(READINGS[0])
+    assert_same_readings(decode_payload(binary), READINGS[:1])
+    assert decode_payload(json.dumps(READINGS[0]).encode()) == READINGS[:1]
+
+# Test unknown codec
+def test_get_codec_invalid():
+    """
+    Test that an unknown codec name is rejected.
+    """
+    with pytest.raises(ValueError, match="Codec must be one of"):
+        get_codec('xml')
+
+# Test SensorSimulator binary publish
+def test_publish_sensor_reading_binary():
+    """
+    Test that the simulator publishes with the configured codec.
+    """
+    sensor_simulator = SensorSimulator([('humidity', 1)], codec='binary')
+    with patch.object(sensor_simulator.client, 'publish') as mock_publish:
+        sensor_simulator.publish_sensor_reading('humidity', 1, 0)
+        payload = mock_publish.call_args.args[1]
+    reading = BinaryCodec().decode(payload)[0]
+    assert reading['id'] == 0
+    assert reading['type'] == 'humidity'
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import threading
+import logging
+
+from src.sensors.fleet import FleetGenerator, SensorTable
+from src.sensors.sensor_simulator import SensorSimulator
+
+SENSORS = [
+    {'id': 0, 'type': 'humidity', 'period': 1},
+    {'id': 1, 'type': 'temperature', 'period': 2},
+    {'id': 2, 'type': 'temperature', 'period': 0.5},
+]
+
+# Test due selection and rescheduling on the period grid
+def test_table_pop_due():
+    """
+    Test that due sensors are selected and rescheduled on their grid.
+    """
+    table = SensorTable(SENSORS, start=0.0)
+    assert list(table.pop_due(0.0)) == [0, 1, 2]
+    assert list(table.next_due) == [1.0, 2.0, 0.5]
+    assert list(table.pop_due(1.2)) == [0, 2]
+    assert list(table.next_due) == [2.0, 2.0, 1.5]
+    assert table.next_deadline() == 1.5
+
+# Test every value model
+@pytest.mark.parametrize("model", FleetGenerator.models)
+def test_generator_models(model):
+    """
+    Test that every model generates bounded columns of values.
+    """
+    table = SensorTable(SENSORS * 100)
+    generator = FleetGenerator(table, model, seed=1)
+    indices = np.arange(len(table))
+    values, timestamps = generator.generate(indices, 1700000000.0)
+    assert values.shape == timestamps.shape == (300,)
+    assert np.all(timestamps == 1700000000.0)
+    assert np.all((values > 0) & (values < 120))
+
+# Test stuck-at faults
+def test_generator_stuck_at_faults():
+    """
+    Test that stuck sensors repeat their last value.
+    """
+    table = SensorTable(SENSORS)
+    generator = FleetGenerator(table, stuck_probability=1.0,
+                               recover_probability=0.0, seed=1)
+    indices = np.arange(len(table))
+    first, _ = generator.generate(indices)
+    second, _ = generator.generate(indices)
+    assert np.all(generator.stuck)
+    assert np.array_equal(first, second)
+
+# Test readings conversion
+def test_generator_readings():
+    """
+    Test that columns are converted to the generate_sensor_data format.
+    """
+    generator = FleetGenerator(SensorTable(SENSORS), seed=1)
+    indices = np.array([1])
+    values, timestamps = generator.generate(indices, 10.0)
+    assert generator.readings(indices, values, timestamps) == [
+        {'id': 1, 'type': 'temperature', 'period': 2.0,
+         'value': values[0], 'timestamp': 10.0}]
+
+# Test invalid model
+def test_generator_invalid_model():
+    """
+    Test that an unknown value model is rejected.
+    """
+    with pytest.raises(ValueError, match="Value model must be one of"):
+        FleetGenerator(SensorTable(SENSORS), 'invalid')
+
+# Test SensorSimulator with the vectorized scheduler
+def test_run_threads_vectorized_scheduler(caplog):
+    """
+    Test that the vectorized scheduler publishes readings from one thread.
+    """
+    caplog.set_level(logging.INFO)
+    sensor_simulator = SensorSimulator(
+        [('humidity', 0.05), ('temperature', 0.05)], scheduler='vectorized',
+        value_model='random_walk')
+    sensor_simulator.run_threads(mode='log')
+    assert len(sensor_simulator.sensors_threads) == 1
+    threading.Event().wait(0.2)
+    sensor_simulator.stop_threads()
+    assert caplog.text.count('data received') >= 4
+
+# Test missed tick policies of the vectorized scheduler
+def test_vectorized_scheduler_missed_tick_policy():
+    """
+    Test that the vectorized scheduler rejects the policies it does not
+    honour.
+    """
+    for policy in ('catch_up', 'skip'):
+        with pytest.raises(ValueError, match="only supports the 'coalesce'"):
+            SensorSimulator([('humidity', 1)], scheduler='vectorized',
+                            missed_tick_policy=policy)
@@ -0,0 +1,70 @@
+import pytest
+import time
+
+from src.sensors.launcher import ShardedLauncher, split_sensors
+
+# Test split of sensors in shards
+def test_split_sensors():
+    """
+    Test that shards are contiguous, balanced and keep the sensor ids.
+    """
+    sensors = [('humidity', 1)] * 5 + [('temperature', 2)] * 5
+    shards = split_sensors(sensors, 3)
+    assert [first_id for first_id, _ in shards] == [0, 4, 7]
+    assert [len(shard) for _, shard in shards] == [4, 3, 3]
+    assert sum((shard for _, shard in shards), []) == sensors
+    assert len(split_sensors(sensors[:2], 4)) == 2
+
+# Test invalid number of workers
+def test_launcher_invalid_workers():
+    """
+    Test that at least one worker is required.
+    """
+    with pytest.raises(ValueError, match="Number of workers must be an int"):
+        ShardedLauncher([('humidity', 1)], 0)
+
+# Test workers run, report stats and are restarted after a crash
+def test_launcher_run_and_restart():
+    """
+    Test coordinated start, stats aggregation and restart of a worker.
+    """
+    sensors = [('humidity', 0.05)] * 4
+    launcher = ShardedLauncher(sensors, 2, stats_interval=0.1,
+                               restart_delay=0, mode='log', 
+                               scheduler='heap')
+    launcher.start()
+    try:
+        time.sleep(0.5)
+        launcher.supervise()
+        stats = launcher.get_stats()
+        assert stats['workers'] == 2
+        assert stats['sensors'] == 4
+        assert stats['readings'] > 0
+
+        launcher.processes[0].kill()
+        launcher.processes[0].join()
+        launcher.supervise()
+        assert launcher.restarts[0] == 1
+        assert launcher.processes[0].is_alive()
+    finally:
+        launcher.stop()
+    assert launcher.processes == {}
+
+# Test readings of the vectorized scheduler are reported
+def test_launcher_vectorized_stats():
+    """
+    Test that the readings of workers with the vectorized scheduler,
+    which keeps no per sensor timers, are counted.
+    """
+    launcher = ShardedLauncher([('humidity', 0.05)] * 20, 2,
+                               stats_interval=0.1, mode='log',
+                               scheduler='vectorized', reading_logs='off')
+    launcher.start()
+    try:
+        time.sleep(0.5)
+        launcher.supervise()
+        stats = launcher.get_stats()
+        assert stats['sensors'] == 20
+        assert stats['readings'] >= 20
+    finally:
+        launcher.stop()
@@ -0,0 +1,127 @@
+import logging
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+from src.sensors.logs import (LazyJSON, RateSummary, SampledLogger,
+                              start_queue_logging, stop_queue_logging)
+from src.sensors.sensor_simulator import SensorSimulator
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# Test rate limited logs
+def test_sampled_logger():
+    """
+    Test that at most rate messages per second are logged and that the
+    suppressed ones are reported.
+    """
+    clock, logger = FakeClock(), MagicMock()
+    sampled = SampledLogger(logger, rate=1, clock=clock)
+    for _ in range(5):
+        sampled.info("reading %s", 1)
+    clock.now = 1.0
+    sampled.info("reading %s", 2)
+    assert [call.args for call in logger.log.call_args_list] == [
+        (logging.INFO, "reading %s", 1),
+        (logging.INFO, "reading %s (%d similar messages suppressed)", 2, 4)]
+    logger.isEnabledFor.return_value = False
+    sampled.info("reading %s", 3)
+    assert logger.log.call_count == 2
+    with pytest.raises(ValueError, match="Rate must be greater or equal than 0."):
+        SampledLogger(rate=-1)
+
+# Test summaries
+def test_rate_summary():
+    """
+    Test rates per event name and key, and their reset after a report.
+    """
+    clock, logger = FakeClock(), MagicMock()
+    summary = RateSummary(logger=logger, clock=clock)
+    for sensor in (0, 0, 0, 1):
+        summary.count('readings', sensor)
+    summary.count('acks', 'a', n=2)
+    clock.now = 2.0
+    rates = summary.report()
+    assert rates['readings'] == {'per_second': 2.0, 'keys': 2,
+                                 'min_per_second': 0.5, 'max_per_second': 1.5}
+    assert rates['acks']['per_second'] == 1.0
+    assert 'readings 2.0/s over 2 keys' in logger.info.call_args.args[2]
+    clock.now = 4.0
+    assert summary.report()['readings']['keys'] == 0
+
+# Test queue logging
+def test_queue_logging(caplog):
+    """
+    Test that records reach the original handlers through the queue, and
+    that arguments are only formatted when logged.
+    """
+    lazy = MagicMock()
+    lazy.__str__.return_value = 'formatted'
+    caplog.set_level(logging.INFO)
+    listener = start_queue_logging()
+    try:
+        logging.debug("not formatted %s", lazy)
+        logging.info("queued %s", LazyJSON({'id': 1}))
+    finally:
+        stop_queue_logging(listener)
+    lazy.__str__.assert_not_called()
+    assert 'queued {"id": 1}' in caplog.text
+    assert caplog.handler in logging.getLogger().handlers
+
+# Test SensorSimulator reading logs
+def test_sensor_simulator_reading_logs(caplog):
+    """
+    Test the sampled and off reading logs modes and the readings summary.
+    """
+    caplog.set_level(logging.INFO)
+    sensor_simulator = SensorSimulator([('humidity', 1)],
+                                       reading_logs='sampled',
+                                       summary_interval=10)
+    for _ in range(10):
+        sensor_simulator.log_sensor_reading('humidity', 1, 0)
+    assert caplog.text.count('data received') == 1
+    assert sensor_simulator.summary.report()['readings']['keys'] == 1
+    sensor_simulator.reading_logs = 'off'
+    sensor_simulator.log_sensor_reading('humidity', 1, 0)
+    assert caplog.text.count('data received') == 1
+    with pytest.raises(ValueError, match="Reading logs must be one of"):
+        SensorSimulator([('humidity', 1)], reading_logs='verbose')
+
+# Test published readings are logged as JSON
+def test_sensor_simulator_published_reading_logs(caplog):
+    """
+    Test that published readings are logged as JSON, as logged readings.
+    """
+    caplog.set_level(logging.INFO)
+    with patch.object(SensorSimulator, 'connect'):
+        sensor_simulator = SensorSimulator([('humidity', 1)], 'mqtt',
+                                           'simulator')
+    with patch.object(sensor_simulator, 'publish'):
+        sensor_simulator.publish_sensor_reading('humidity', 1, 0)
+    assert 'data published: {"id": 0' in caplog.text
+
+# Test acks per topic
+def test_mqtt_client_ack_summary():
+    """
+    Test that acks are counted per topic, also when they arrive before
+    publish returns.
+    """
+    mqtt_client = MQTTClientBase("test.mosquitto.org")
+    mqtt_client.logger = MagicMock()
+    mqtt_client.summary = RateSummary()
+    def publish(topic, payload, qos, retain):
+        if topic == 'early':
+            mqtt_client._handle_publish(None, None, 2)
+        return MagicMock(rc=0, mid=2 if topic == 'early' else 1)
+    with patch.object(mqtt_client.client, 'publish', side_effect=publish):
+        mqtt_client.publish('late', 'payload', qos=1)
+        mqtt_client._handle_publish(None, None, 1)
+        mqtt_client.publish('early', 'payload', qos=1)
+    assert mqtt_client.summary._counts['acks'] == {'late': 1, 'early': 1}
+    assert not mqtt_client._sent and not mqtt_client._early_acks
@@ -0,0 +1,122 @@
+import json
+import logging
+import urllib.request
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.rabbitmq.mqtt_client_base import MQTTClientBase
+from src.sensors.metrics import LatencyHistogram, MetricsRegistry
+from src.sensors.sensor_simulator import SensorSimulator
+
+# Test HDR buckets
+def test_latency_histogram():
+    """
+    Test the bucket bounds and that percentiles are within the relative
+    error of the histogram.
+    """
+    for ns in (0, 31, 64, 1000, 123456789, 2 ** 40 + 12345):
+        index = LatencyHistogram.index(ns)
+        assert LatencyHistogram.lower_bound(index) <= ns
+        assert ns < LatencyHistogram.lower_bound(index + 1)
+    histogram = LatencyHistogram()
+    for us in range(1, 1001):
+        histogram.record(us / 1e6)
+    histogram.record(-1)
+    assert histogram.count == 1001
+    assert histogram.percentile(50) == pytest.approx(500e-6, rel=0.032)
+    assert histogram.percentile(99) == pytest.approx(990e-6, rel=0.032)
+    assert histogram.percentile(100) == 1e-3
+    summary = histogram.get()
+    assert summary['max_ms'] == 1.0
+    assert summary['mean_ms'] == pytest.approx(0.5, rel=0.01)
+
+# Test Prometheus text format
+def test_prometheus_text():
+    """
+    Test counters, gauges read from functions and histogram buckets.
+    """
+    registry = MetricsRegistry()
+    registry.counter('readings_total', 'Readings', client='a').inc(3)
+    registry.gauge('depth', 'Queue depth', function=lambda: 7, client='a')
+    histogram = registry.histogram('ack_seconds', 'Ack latency', client='a')
+    histogram.record(0.002)
+    histogram.record(0.5)
+    text = registry.to_prometheus()
+    assert '# TYPE readings_total counter\nreadings_total{client="a"} 3\n' in text
+    assert 'depth{client="a"} 7\n' in text
+    assert 'ack_seconds_bucket{client="a",le="0.0041943"} 1\n' in text
+    assert 'ack_seconds_bucket{client="a",le="+Inf"} 2\n' in text
+    assert 'ack_seconds_count{client="a"} 2\n' in text
+    assert registry.counter('readings_total', client='a').get() == 3
+    with pytest.raises(ValueError, match="Metric depth is a gauge."):
+        registry.counter('depth')
+    registry.unregister(client='a')
+    assert registry.to_prometheus() == '\n'
+
+# Test HTTP endpoint and snapshots
+def test_serve_and_snapshots(caplog):
+    """
+    Test the /metrics endpoint and the periodic snapshot log.
+    """
+    registry = MetricsRegistry()
+    registry.counter('readings_total').inc()
+    server = registry.serve(port=0, host='127.0.0.1')
+    try:
+        url = f'http://127.0.0.1:{server.server_port}/metrics'
+        with urllib.request.urlopen(url) as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert b'readings_total 1\n' in response.read()
+    finally:
+        registry.stop_serving()
+    caplog.set_level(logging.INFO)
+    registry.start_snapshots(interval=0.01)
+    try:
+        while 'Metrics: ' not in caplog.text:
+            pass
+    finally:
+        registry.stop_snapshots()
+    snapshot = caplog.text.split('Metrics: ')[1].splitlines()[0]
+    assert json.loads(snapshot) == {'readings_total': 1}
+
+# Test MQTTClientBase metrics
+def test_mqtt_client_metrics():
+    """
+    Test the publish counters, ack latency and connection metrics of a
+    client.
+    """
+    registry = MetricsRegistry()
+    mqtt_client = MQTTClientBase("test.mosquitto.org", client_id='c',
+                                 metrics=registry)
+    mqtt_client.logger = MagicMock()
+    mqtt_client.client.publish = MagicMock(return_value=MagicMock(rc=0, mid=1))
+    mqtt_client._handle_connect(None, None, None, 0)
+    mqtt_client.publish('t', 'payload', qos=1)
+    mqtt_client._handle_publish(None, None, 1)
+    mqtt_client._handle_disconnect(None, None, 0)
+    snapshot = registry.snapshot()
+    assert snapshot['mqtt_published_total{client="c"}'] == 1
+    assert snapshot['mqtt_acked_total{client="c"}'] == 1
+    assert snapshot['mqtt_inflight{client="c"}'] == 0
+    assert snapshot['mqtt_connects_total{client="c"}'] == 1
+    assert snapshot['mqtt_disconnects_total{client="c"}'] == 1
+    assert snapshot['mqtt_connected{client="c"}'] == 0
+    assert snapshot['mqtt_publish_seconds{client="c"}']['count'] == 1
+    assert snapshot['mqtt_ack_seconds{client="c"}']['count'] == 1
+    assert not mqtt_client._sent
+
+# Test SensorSimulator metrics
+def test_sensor_simulator_metrics():
+    """
+    Test the readings and sensors metrics of the simulator.
+    """
+    registry = MetricsRegistry()
+    sensor_simulator = SensorSimulator([('humidity', 1), ('temperature', 1)],
+                                       client_id='s', reading_logs='off',
+                                       metrics=registry)
+    for _ in range(3):
+        sensor_simulator.log_sensor_reading('humidity', 1, 0)
+    snapshot = registry.snapshot()
+    assert snapshot['simulator_readings_total{client="s"}'] == 3
+    assert snapshot['simulator_sensors{client="s"}'] == 2
+    assert snapshot['simulator_missed_ticks_total{client="s"}'] == 0
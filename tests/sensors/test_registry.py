@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from src.sensors.registry import SensorRegistry
+from src.sensors.sensor_simulator import SensorSimulator
+
+# Test registering and removing sensors
+def test_registry_extend_and_remove():
+    """
+    Test that sensors get consecutive ids from first_id and that removed
+    sensors keep their slot without being iterated.
+    """
+    registry = SensorRegistry(first_id=10)
+    assert registry.extend([('humidity', 5), ('temperature', 1)]) == range(2)
+    assert registry.extend([('humidity', 0.5)]) == range(2, 3)
+    assert registry[1] == {'id': 11, 'type': 'temperature', 'period': 1.0}
+
+    assert registry.remove(11) == 1
+    assert len(registry) == 2 and registry.slots == 3
+    assert 11 not in registry and 12 in registry
+    assert [s['id'] for s in registry] == [10, 12]
+    with pytest.raises(KeyError):
+        registry.remove(11)
+    with pytest.raises(ValueError, match="Sensor type must be one of"):
+        registry.extend([('pressure', 1)])
+
+# Test bulk load of a sensors file
+def test_registry_load(tmp_path):
+    """
+    Test that a sensors file is loaded skipping its header and comments,
+    and that invalid lines are reported with their number.
+    """
+    path = tmp_path / "sensors.csv"
+    path.write_text("type,period\n# comment\nhumidity,5\n\ntemperature,0.5\n")
+    registry = SensorRegistry()
+    assert registry.load(str(path)) == range(2)
+    assert list(registry)[1] == {'id': 1, 'type': 'temperature',
+                                 'period': 0.5}
+
+    path.write_text("humidity,5\ntemperature\n")
+    with pytest.raises(ValueError, match="line 2"):
+        registry.load(str(path))
+    assert len(registry) == 2
+
+# Test simulators do not share their threads
+def test_simulators_are_independent():
+    """
+    Test that stopping a simulator does not stop the threads of another
+    one in the same process.
+    """
+    first = SensorSimulator([('humidity', 0.05)])
+    second = SensorSimulator([('temperature', 0.05)])
+    first.run_threads(mode='log')
+    second.run_threads(mode='log')
+    assert first.sensors_threads is not second.sensors_threads
+    first.stop_threads()
+    assert all(t.is_alive() for t in second.sensors_threads)
+    second.stop_threads()
+
+# Test sensors added and removed while running
+@pytest.mark.parametrize("scheduler", ['threads', 'heap', 'vectorized'])
+def test_add_and_remove_at_runtime(scheduler):
+    """
+    Test that sensors added to a running simulator start publishing and
+    removed ones stop, without restarting the simulator.
+    """
+    simulator = SensorSimulator([('humidity', 0.05)], scheduler=scheduler)
+    readings = []
+    simulator._log_reading = lambda data: readings.append(data['id'])
+    simulator.run_threads(mode='log')
+    try:
+        assert simulator.add_sensors([('temperature', 0.05)]) == [1]
+        time.sleep(0.3)
+        assert {0, 1} <= set(readings)
+
+        simulator.remove_sensors([0])
+        time.sleep(0.1)
+        readings.clear()
+        time.sleep(0.3)
+        assert readings and set(readings) == {1}
+    finally:
+        simulator.stop_threads()
@@ -0,0 +1,86 @@
+import pytest
+import threading
+import time
+
+from src.sensors.scheduler import SensorScheduler
+from src.sensors.sensor_simulator import SensorSimulator
+
+# Helper to run a scheduler in a background thread for a given time
+def run_for(scheduler, seconds):
+    thread = threading.Thread(target=scheduler.run)
+    thread.start()
+    time.sleep(seconds)
+    scheduler.stop()
+    thread.join()
+
+# Test scheduler dispatches every registered sensor periodically
+def test_scheduler_dispatches_periodically():
+    """
+    Test that every sensor is dispatched roughly once per period.
+    """
+    calls = {'a': 0, 'b': 0}
+    def callback(key):
+        calls[key] += 1
+
+    scheduler = SensorScheduler(callback)
+    scheduler.add('a', 0.05)
+    scheduler.add('b', 0.1)
+    run_for(scheduler, 0.52)
+    assert 9 <= calls['a'] <= 12
+    assert 5 <= calls['b'] <= 7
+
+# Test removed sensors are no longer dispatched
+def test_scheduler_remove():
+    """
+    Test that a removed sensor stops being dispatched.
+    """
+    calls = []
+    scheduler = SensorScheduler(calls.append)
+    scheduler.add('a', 0.05)
+    scheduler.remove('a')
+    assert len(scheduler) == 0
+    run_for(scheduler, 0.2)
+    assert calls == []
+
+# Test sensors share the timing histograms of the scheduler
+def test_scheduler_shared_histograms():
+    """
+    Test that sensors count their own ticks but record their lateness in
+    the histograms of the scheduler, without a dict per timer.
+    """
+    scheduler = SensorScheduler(lambda key: None)
+    a, b = scheduler.add('a', 0.05), scheduler.add('b', 0.1)
+    run_for(scheduler, 0.32)
+    assert a.stats.ticks > b.stats.ticks > 0
+    assert a.stats.lateness is b.stats.lateness is scheduler.lateness
+    assert scheduler.lateness.count == a.stats.ticks + b.stats.ticks
+    assert not hasattr(a, '__dict__') and not hasattr(a.stats, '__dict__')
+
+# Test invalid period
+def test_scheduler_invalid_period():
+    """
+    Test that non positive periods are rejected.
+    """
+    scheduler = SensorScheduler(lambda key: None)
+    with pytest.raises(ValueError, match="Sensor period must be greater than 0."):
+        scheduler.add('a', 0)
+
+# Test SensorSimulator in heap scheduler mode
+def test_run_threads_heap_scheduler():
+    """
+    Test that the heap scheduler drives all sensors from one thread.
+    """
+    sensor_simulator = SensorSimulator(
+        [('humidity', 1), ('temperature', 1)], scheduler='heap')
+    sensor_simulator.run_threads(mode='log')
+    assert len(sensor_simulator.sensors_threads) == 1
+    sensor_simulator.stop_threads()
+    assert sensor_simulator.sensors_threads == []
+
+# Test invalid scheduler
+def test_invalid_scheduler():
+    """
+    Test that an unknown scheduler is rejected.
+    """
+    with pytest.raises(ValueError, match="Scheduler must be one of"):
+        SensorSimulator([('humidity', 1)], scheduler='invalid')
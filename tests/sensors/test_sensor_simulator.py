@@ -45,7 +45,7 @@ def test_validate_sensors_invalid_input_wrong_types(sensor_simulator):
     """
     Test _validate_sensors with invalid input (wrong types).
     """
-    output = "Each tuple must contain a sensor type (string) and sensor period (int)."
+    output = "Each tuple must contain a sensor type (string) and sensor period (int or float)."
     with pytest.raises(ValueError, match=re.escape(output)):
         sensor_simulator._validate_sensors([(5, 'humidity')])
 
@@ -69,7 +69,7 @@ def test_init_sensors(sensor_simulator):
         {'id': 0, 'type': 'humidity', 'period': 5},
         {'id': 1, 'type': 'temperature', 'period': 1}
     ]
-    assert initialized_sensors == expected_sensors
+    assert list(initialized_sensors) == expected_sensors
 
 # Test generate_sensor_data
 def test_generate_sensor_data(sensor_simulator):
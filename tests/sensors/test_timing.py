@@ -0,0 +1,102 @@
+import pytest
+import threading
+
+from src.sensors.timing import Histogram, PeriodicTimer
+from src.sensors.sensor_simulator import SensorSimulator
+
+# Fake monotonic clock controlled by the tests
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+# Test deadlines do not drift with processing time
+def test_timer_absolute_deadlines():
+    """
+    Test that deadlines stay on the period grid when ticks are late.
+    """
+    clock = FakeClock()
+    timer = PeriodicTimer(1.0, clock=clock)
+    for i in range(5):
+        clock.now = i + 0.3
+        assert timer.tick() == 1
+    assert timer.due == 5.0
+    assert timer.stats.ticks == 5
+    assert timer.stats.missed == 0
+
+# Test missed tick policies
+@pytest.mark.parametrize("policy, emitted, missed, due", [
+    ('catch_up', 4, 3, 4.0),
+    ('coalesce', 1, 3, 4.0),
+    ('skip', 0, 4, 4.0),
+])
+def test_timer_missed_tick_policies(policy, emitted, missed, due):
+    """
+    Test each policy when the timer is woken up 3.5 periods late. With
+    catch_up the 3 ticks emitted a full period late count as missed.
+    """
+    clock = FakeClock()
+    timer = PeriodicTimer(1.0, policy, clock=clock)
+    clock.now = 3.5
+    count = 0
+    while timer.due <= clock.now:
+        count += timer.tick()
+    assert count == emitted
+    assert timer.stats.missed == missed
+    assert timer.due == due
+
+# Test invalid policy
+def test_timer_invalid_policy():
+    """
+    Test that an unknown missed tick policy is rejected.
+    """
+    with pytest.raises(ValueError, match="Missed tick policy must be one of"):
+        PeriodicTimer(1.0, 'invalid')
+
+# Test wait is interrupted by the stop event
+def test_timer_wait_stop_event():
+    """
+    Test that wait returns False as soon as the stop event is set.
+    """
+    stop_event = threading.Event()
+    stop_event.set()
+    timer = PeriodicTimer(10.0, start=1e12)
+    assert timer.wait(stop_event) is False
+
+# Test histogram percentiles
+def test_histogram_percentiles():
+    """
+    Test histogram percentiles are upper bounds of the recorded values.
+    """
+    histogram = Histogram()
+    for value in [0.001] * 99 + [0.5]:
+        histogram.record(value)
+    assert histogram.count == 100
+    assert 0.001 <= histogram.percentile(50) < 0.002
+    assert histogram.percentile(100) == 0.5
+    assert histogram.max == 0.5
+
+# Test sub-second periods are accepted
+def test_validate_sensors_float_period():
+    """
+    Test that fractional periods are accepted and non positive rejected.
+    """
+    sensor_simulator = SensorSimulator([('humidity', 0.1)])
+    assert sensor_simulator.sensors[0]['period'] == 0.1
+    with pytest.raises(ValueError, match="Sensor period must be greater than 0."):
+        sensor_simulator._validate_sensors([('humidity', 0)])
+
+# Test per-sensor stats are collected while running
+def test_sensor_stats(caplog):
+    """
+    Test that running sensors record their timing statistics.
+    """
+    sensor_simulator = SensorSimulator([('humidity', 0.05)])
+    sensor_simulator.run_threads()
+    threading.Event().wait(0.3)
+    sensor_simulator.stop_threads()
+    stats = sensor_simulator.get_sensor_stats()[0]
+    assert stats['ticks'] >= 4
+    assert stats['lateness']['count'] >= stats['ticks']
@@ -0,0 +1,47 @@
+import pytest
+from unittest.mock import patch
+
+from src.sensors.sensor_simulator import SensorSimulator
+from src.sensors.topics import TopicScheme, topic_matches, to_routing_key
+
+# Test topic of a reading
+def test_topic_scheme_topic():
+    """
+    Test that readings are published to their type and id topic.
+    """
+    scheme = TopicScheme()
+    assert scheme.topic({'id': 3, 'type': 'humidity'}) == \
+        'simulated_sensors/humidity/3'
+    assert TopicScheme('site/{id}/{type}').topic(
+        {'id': 3, 'type': 'humidity'}) == 'site/3/humidity'
+    with pytest.raises(ValueError, match="Topic fields must be one of"):
+        TopicScheme('sensors/{name}')
+    with pytest.raises(ValueError, match="wildcards"):
+        TopicScheme('sensors/+/{id}')
+
+# Test filters and routing keys
+def test_topic_scheme_filter():
+    """
+    Test filters of a type and/or id and their AMQP routing keys.
+    """
+    scheme = TopicScheme()
+    assert scheme.filter() == 'simulated_sensors/#'
+    assert scheme.filter('temperature') == 'simulated_sensors/temperature/#'
+    assert scheme.filter(sensor_id=7) == 'simulated_sensors/+/7'
+    assert scheme.filter('humidity', 7) == 'simulated_sensors/humidity/7'
+    assert topic_matches(scheme.filter(sensor_id=7), 'simulated_sensors/humidity/7')
+    assert to_routing_key('simulated_sensors/+/7') == 'simulated_sensors.*.7'
+    assert to_routing_key('simulated_sensors/#') == 'simulated_sensors.#'
+
+# Test SensorSimulator topics
+def test_sensor_simulator_topic_scheme():
+    """
+    Test that each reading is published to the topic of its sensor.
+    """
+    sensor_simulator = SensorSimulator(
+        [('humidity', 1), ('temperature', 1)], topic_scheme='site/{type}/{id}')
+    with patch.object(sensor_simulator.client, 'publish') as mock_publish:
+        sensor_simulator.publish_sensor_reading('temperature', 1, 1)
+        sensor_simulator.publish_sensor_reading('humidity', 1, 0, 'other')
+    assert [call.args[0] for call in mock_publish.call_args_list] == \
+        ['site/temperature/1', 'other']
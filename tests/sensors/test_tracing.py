@@ -0,0 +1,101 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from src.rabbitmq.amqp_consumer import BatchConsumer, IngestionStats
+from src.sensors.codecs import BinaryCodec, JSONCodec
+from src.sensors.sensor_simulator import SensorSimulator
+from src.sensors.tracing import Tracer, load_traces, report
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+def reading(sensor_id, trace_id=None):
+    data = {'id': sensor_id, 'type': 'humidity', 'period': 1.0,
+            'value': 50.0, 'timestamp': 1700000000.5 + sensor_id}
+    if trace_id is not None:
+        data['trace_id'] = trace_id
+    return data
+
+# Test stamps and report
+def test_tracer_report(tmp_path):
+    """
+    Test that stamps of several files are joined by trace id and turned
+    into per segment latencies, and that readings are stamped once when
+    served.
+    """
+    clock = FakeClock()
+    simulator = Tracer(str(tmp_path / 'sim.jsonl'), clock=clock)
+    api = Tracer(str(tmp_path / 'api.jsonl'), clock=clock)
+    data = reading(1)
+    simulator.start(data)
+    clock.now = 2_000_000
+    simulator.stamp(data['trace_id'], 'published')
+    clock.now = 5_000_000
+    api.stamp_readings([data, reading(2)], 'consumed')
+    api.remember([data])
+    clock.now = 9_000_000
+    api.served([{'id': 1, 'timestamp': data['timestamp'], 'value': 50.0}])
+    api.served([{'id': 1, 'timestamp': data['timestamp'], 'value': 50.0}])
+    simulator.flush()
+    api.flush()
+    traces = load_traces([str(tmp_path / 'sim.jsonl'),
+                          str(tmp_path / 'api.jsonl')])
+    assert traces == {data['trace_id']: {
+        'generated': 0, 'published': 2_000_000, 'consumed': 5_000_000,
+        'served': 9_000_000}}
+    segments = report(traces)
+    assert segments['generated -> published']['p50_ms'] == \
+        pytest.approx(2.0, rel=0.032)
+    assert segments['published -> consumed']['count'] == 1
+    assert segments['consumed -> persisted']['count'] == 0
+    with pytest.raises(ValueError, match="Sample must be between 0 and 1."):
+        Tracer('unused', sample=2)
+
+# Test trace ids in payloads
+def test_codecs_trace_ids():
+    """
+    Test that trace ids travel in json, batch and binary payloads, and
+    that untraced binary payloads keep their size.
+    """
+    traced = [reading(1, 2 ** 40 + 1), reading(2, 2 ** 40 + 2)]
+    json_codec, binary_codec = JSONCodec(), BinaryCodec()
+    assert json_codec.decode(json_codec.encode_reading(traced[0])) == traced[:1]
+    assert json_codec.decode(json_codec.encode_batch(traced)) == traced
+    decoded = binary_codec.decode(binary_codec.encode_batch(traced))
+    assert [r['trace_id'] for r in decoded] == [2 ** 40 + 1, 2 ** 40 + 2]
+    untraced = binary_codec.encode_batch([reading(1)])
+    assert len(untraced) == binary_codec.header.size + binary_codec.record.size
+    assert 'trace_id' not in binary_codec.decode(untraced)[0]
+    assert 'trace_id' not in json_codec.decode(
+        json_codec.encode_batch([reading(1)]))[0]
+
+# Test simulator and consumer stages
+def test_pipeline_stages(tmp_path):
+    """
+    Test that the simulator stamps readings when generated, published and
+    acked, and the consumer when consumed and persisted.
+    """
+    tracer = Tracer(str(tmp_path / 'trace.jsonl'))
+    sensor_simulator = SensorSimulator([('humidity', 1)], reading_logs='off',
+                                       tracer=tracer)
+    info = MagicMock(rc=0, mid=1)
+    with patch.object(sensor_simulator.client, 'publish',
+                      return_value=info) as mock_publish:
+        sensor_simulator.publish_sensor_reading('humidity', 1, 0)
+        sensor_simulator._handle_publish(None, None, 1)
+    payload = mock_publish.call_args.args[1]
+    consumer = BatchConsumer(MagicMock(), MagicMock(), IngestionStats(),
+                             tracer=tracer)
+    consumer.on_message(None, MagicMock(delivery_tag=1), None, payload)
+    consumer.flush()
+    tracer.flush()
+    (stages,) = load_traces([str(tmp_path / 'trace.jsonl')]).values()
+    assert list(stages) == ['generated', 'published', 'acked', 'consumed',
+                            'persisted']
+    assert consumer.sink.call_args.args[0][0]['trace_id'] in \
+        load_traces([str(tmp_path / 'trace.jsonl')])